@@ -17,12 +17,27 @@ let
   cfg = config.field.trainStation;
   fieldCfg = config.field;
   
-  # Python service for Train Station orchestrator
-  trainStationService = pkgs.writeScriptBin "train-station-orchestrator" ''
-    #!${pkgs.python3}/bin/python3
-    ${builtins.readFile ../services/train-station/orchestrator.py}
+  # Python service for Train Station orchestrator. The whole directory is
+  # copied to the store so orchestrator.py can import its sibling modules,
+  # with its bytecode compiled at build time: the store is read-only, so
+  # otherwise every start (and every reload) compiles each module again.
+  trainStationSrc = pkgs.runCommand "train-station-src" { } ''
+    cp -r ${../services/train-station} $out
+    chmod -R u+w $out
+    ${pkgs.python3}/bin/python3 -m compileall -q --invalidation-mode unchecked-hash $out
+  '';
+  # -m, so orchestrator itself also runs from its compiled bytecode
+  trainStationService = pkgs.writeShellScriptBin "train-station-orchestrator" ''
+    PYTHONPATH=${trainStationSrc} exec ${pkgs.python3}/bin/python3 -m orchestrator "$@"
+  '';
+  # Columnar log analytics (convert / query); the only part that needs numpy
+  trainStationColumns = pkgs.writeShellScriptBin "train-station-columns" ''
+    PYTHONPATH=${trainStationSrc} exec ${pkgs.python3.withPackages (ps: [ ps.numpy ])}/bin/python3 -m log_columns "$@"
   '';
 
+  vertexBackendsFile = pkgs.writeText "train-station-vertex-backends.json"
+    (builtins.toJSON cfg.vertexBackends);
+
 in {
   options.field.trainStation.serviceEnable = mkEnableOption "Train Station Orchestrator Service" // {
     default = fieldCfg.enable;
@@ -39,22 +54,248 @@ in {
     default = "/var/log/SOMA/train-station.log";
     description = "Path to Train Station log file";
   };
+  
+  options.field.trainStation.logFsync = mkOption {
+    type = types.enum [ "none" "interval" "batch" ];
+    default = "interval";
+    description = "fsync policy for the group-commit Train Station log writer";
+  };
+  
+  options.field.trainStation.logSegmentBytes = mkOption {
+    type = types.int;
+    default = 64 * 1024 * 1024;
+    description = "Seal the log into a compressed, indexed segment at this size (0 disables rotation and the /requests endpoints)";
+  };
+  
+  options.field.trainStation.logCompression = mkOption {
+    type = types.enum [ "gzip" "lzma" ];
+    default = "gzip";
+    description = "Codec for sealed log segments";
+  };
+  
+  options.field.trainStation.logRetainSegments = mkOption {
+    type = types.int;
+    default = 0;
+    description = "Sealed log segments to keep (0 keeps all)";
+  };
+  
+  options.field.trainStation.statsPath = mkOption {
+    type = types.nullOr types.str;
+    default = "/var/lib/SOMA/train-station.stats";
+    description = "Snapshot file (plus a .journal beside it) keeping request counters and latency histograms across restarts; null starts from zero every time";
+  };
+  
+  options.field.trainStation.jobsPath = mkOption {
+    type = types.nullOr types.str;
+    default = null;
+    example = "/var/lib/SOMA/train-station.jobs";
+    description = "Journal of jobs scheduled with POST /schedule (delayed and recurring route requests), kept across restarts; null disables /schedule (requires the asyncio server and one worker)";
+  };
+  
+  options.field.trainStation.webhookOutbox = mkOption {
+    type = types.nullOr types.str;
+    default = null;
+    example = "/var/lib/SOMA/train-station.webhooks";
+    description = "Outbox of webhook deliveries: WEBHOOK requests routed to the communication vertex are POSTed to the URLs in their payload, batched and retried, and resent after a restart; null disables delivery (requires the asyncio server)";
+  };
+  
+  options.field.trainStation.routingRules = mkOption {
+    type = types.nullOr types.path;
+    default = null;
+    description = "JSON file of payload-aware routing rules (null routes by request type only)";
+  };
+  
+  options.field.trainStation.routingConfig = mkOption {
+    type = types.nullOr types.str;
+    default = null;
+    example = "/var/lib/SOMA/train-station-routing.json";
+    description = "Writable routing config file (per-type routes and rules): reloaded when it changes and updated by POST /admin/routing. Takes the place of routingRules";
+  };
+  
+  options.field.trainStation.vertexBackends = mkOption {
+    type = types.attrsOf (types.either types.str (types.listOf types.str));
+    default = { };
+    example = { compute = [ "http://10.0.0.11:7410/jobs" "http://10.0.0.12:7410/jobs" ]; storage = "http://127.0.0.1:1740/"; };
+    description = "Vertex backend URL, or list of replica URLs, per vertex; when set, /route forwards requests over pooled connections to the least loaded replica (requires the asyncio server)";
+  };
+  
+  options.field.trainStation.server = mkOption {
+    type = types.enum [ "threaded" "asyncio" ];
+    default = "threaded";
+    description = "HTTP server implementation (asyncio serves keep-alive and pipelined connections)";
+  };
+  
+  options.field.trainStation.dedupTtl = mkOption {
+    type = types.int;
+    default = 300;
+    description = "Seconds a routed request id's result is replayed to retries instead of routing them again; 0 disables dedup";
+  };
+  
+  options.field.trainStation.dedupMaxBytes = mkOption {
+    type = types.int;
+    default = 64 * 1024 * 1024;
+    description = "Memory budget of the dedup cache";
+  };
+  
+  options.field.trainStation.traceSampleRate = mkOption {
+    type = types.str;
+    default = "0";
+    example = "0.01";
+    description = "Fraction of requests traced end to end (capture, validate, route, forward spans); \"0\" disables tracing, otherwise requests arriving with a sampled traceparent are always traced";
+  };
+  
+  options.field.trainStation.traceFormat = mkOption {
+    type = types.enum [ "jsonl" "otlp" ];
+    default = "jsonl";
+    description = "Trace export layout: one span per line, or OTLP/JSON for the OpenTelemetry Collector's file receiver";
+  };
+  
+  options.field.trainStation.statusStreamInterval = mkOption {
+    type = types.str;
+    default = "1";
+    description = "Seconds between GET /status/stream updates, computed once for all subscribers; \"0\" disables the stream (asyncio server only)";
+  };
+  
+  options.field.trainStation.maxBodyBytes = mkOption {
+    type = types.int;
+    default = 1024 * 1024;
+    description = "Largest POST /route body held in memory; larger bodies are refused with 413 unless their payload can be spooled";
+  };
+  
+  options.field.trainStation.maxSpoolBytes = mkOption {
+    type = types.int;
+    default = 1024 * 1024 * 1024;
+    description = "Largest store/archive payload spooled to a temporary file (in the service's private /tmp) instead of held in memory";
+  };
+  
+  options.field.trainStation.binaryPort = mkOption {
+    type = types.port;
+    default = 0;
+    description = "TCP port for the binary route protocol used by local DOJO components; 0 disables it (requires the asyncio server)";
+  };
+  
+  options.field.trainStation.binarySocket = mkOption {
+    type = types.nullOr types.str;
+    default = null;
+    example = "/run/train-station/route.sock";
+    description = "Unix socket path for the binary route protocol (requires the asyncio server)";
+  };
+  
+  options.field.trainStation.workers = mkOption {
+    type = types.int;
+    default = 1;
+    description = "Worker processes sharing the port via SO_REUSEPORT (or the activation socket); reload (SIGHUP) restarts them one at a time (requires the asyncio server). Each worker has its own dedup cache, so a retry that lands on another worker is routed again, and its own log, so /requests only finds what the answering worker logged";
+  };
+  
+  options.field.trainStation.socketActivation = mkOption {
+    type = types.bool;
+    default = true;
+    description = "Listen through systemd socket units, so the ports stay open across restarts and connections wait in the backlog instead of being refused";
+  };
+  
+  options.field.trainStation.fairQueueing = mkOption {
+    type = types.bool;
+    default = false;
+    description = "Queue /route calls per vertex with weighted fair dispatch; full queues answer 503 with Retry-After (requires the asyncio server)";
+  };
+  
+  options.field.trainStation.queueDepth = mkOption {
+    type = types.int;
+    default = 1024;
+    description = "Pending requests allowed per vertex queue";
+  };
+  
+  options.field.trainStation.vertexWeights = mkOption {
+    type = types.attrsOf types.int;
+    default = { monitoring = 4; };
+    description = "Dispatch weight per vertex; unlisted vertices weigh 1";
+  };
 
   config = mkIf (fieldCfg.enable && cfg.serviceEnable) {
+    assertions = [{
+      assertion = cfg.vertexBackends == { } || cfg.server == "asyncio";
+      message = "field.trainStation.vertexBackends requires field.trainStation.server = \"asyncio\"";
+    } {
+      assertion = !cfg.fairQueueing || cfg.server == "asyncio";
+      message = "field.trainStation.fairQueueing requires field.trainStation.server = \"asyncio\"";
+    } {
+      assertion = (cfg.binaryPort == 0 && cfg.binarySocket == null) || cfg.server == "asyncio";
+      message = "field.trainStation.binaryPort/binarySocket require field.trainStation.server = \"asyncio\"";
+    } {
+      assertion = cfg.routingRules == null || cfg.routingConfig == null;
+      message = "Set only one of field.trainStation.routingRules and field.trainStation.routingConfig";
+    } {
+      assertion = cfg.workers == 1 || cfg.server == "asyncio";
+      message = "field.trainStation.workers > 1 requires field.trainStation.server = \"asyncio\"";
+    } {
+      assertion = cfg.jobsPath == null || (cfg.server == "asyncio" && cfg.workers == 1);
+      message = "field.trainStation.jobsPath requires field.trainStation.server = \"asyncio\" and workers = 1";
+    } {
+      assertion = cfg.webhookOutbox == null || cfg.server == "asyncio";
+      message = "field.trainStation.webhookOutbox requires field.trainStation.server = \"asyncio\"";
+    }];
+    
     # Install Train Station service script
     environment.systemPackages = [
       trainStationService
+      trainStationColumns
     ];
     
+    # Listening sockets, held by systemd and passed to the service
+    systemd.sockets.train-station = mkIf cfg.socketActivation {
+      description = "🚂 SOMA Train Station HTTP Socket (852 Hz)";
+      wantedBy = [ "sockets.target" ];
+      listenStreams = [ (toString cfg.port) ];
+      socketConfig = {
+        FileDescriptorName = "http";
+        Backlog = 4096;
+      };
+    };
+    
+    systemd.sockets.train-station-binary = mkIf (cfg.socketActivation && cfg.binaryPort != 0) {
+      description = "🚂 SOMA Train Station Binary Route Socket (852 Hz)";
+      wantedBy = [ "sockets.target" ];
+      listenStreams = [ (toString cfg.binaryPort) ];
+      socketConfig = {
+        FileDescriptorName = "binary";
+        Backlog = 4096;
+        Service = "train-station.service";
+      };
+    };
+    
     # Systemd service for Train Station orchestrator
     systemd.services.train-station = {
       description = "🚂 SOMA Train Station Orchestrator (852 Hz)";
       wantedBy = [ "multi-user.target" ];
-      after = [ "network.target" ];
+      after = [ "network.target" ] ++ optionals cfg.socketActivation
+        ([ "train-station.socket" ] ++ optional (cfg.binaryPort != 0) "train-station-binary.socket");
+      requires = optionals cfg.socketActivation
+        ([ "train-station.socket" ] ++ optional (cfg.binaryPort != 0) "train-station-binary.socket");
       
       serviceConfig = {
         Type = "simple";
-        ExecStart = "${trainStationService}/bin/train-station-orchestrator --port ${toString cfg.port} --log-path ${cfg.logPath}";
+        ExecStart = "${trainStationService}/bin/train-station-orchestrator --port ${toString cfg.port} --log-path ${cfg.logPath} --log-fsync ${cfg.logFsync} --server ${cfg.server}"
+          + " --log-segment-bytes ${toString cfg.logSegmentBytes} --log-compression ${cfg.logCompression} --log-retain-segments ${toString cfg.logRetainSegments}"
+          + " --dedup-ttl ${toString cfg.dedupTtl} --dedup-max-bytes ${toString cfg.dedupMaxBytes}"
+          + " --trace-sample-rate ${cfg.traceSampleRate} --trace-format ${cfg.traceFormat}"
+          + " --status-stream-interval ${cfg.statusStreamInterval}"
+          + " --max-body-bytes ${toString cfg.maxBodyBytes} --max-spool-bytes ${toString cfg.maxSpoolBytes}"
+          + optionalString (cfg.statsPath != null) " --stats-path ${cfg.statsPath}"
+          + optionalString (cfg.jobsPath != null) " --jobs-path ${cfg.jobsPath}"
+          + optionalString (cfg.webhookOutbox != null) " --webhook-outbox ${cfg.webhookOutbox}"
+          + optionalString (cfg.routingRules != null) " --routing-config ${cfg.routingRules}"
+          + optionalString (cfg.routingConfig != null) " --routing-config ${cfg.routingConfig}"
+          + optionalString (cfg.vertexBackends != { }) " --vertex-backends ${vertexBackendsFile}"
+          + optionalString (cfg.binaryPort != 0) " --binary-port ${toString cfg.binaryPort}"
+          + optionalString (cfg.binarySocket != null) " --binary-socket ${cfg.binarySocket}"
+          + optionalString (cfg.workers > 1) " --workers ${toString cfg.workers}"
+          + optionalString cfg.fairQueueing " --fair-queueing --queue-depth ${toString cfg.queueDepth} --vertex-weights ${concatStringsSep "," (mapAttrsToList (name: weight: "${name}=${toString weight}") cfg.vertexWeights)}";
+        Sockets = mkIf cfg.socketActivation
+          ([ "train-station.socket" ] ++ optional (cfg.binaryPort != 0) "train-station-binary.socket");
+        # The supervisor stops its own workers gracefully; SIGHUP rolls them.
+        # A single process drains and re-executes itself on the same sockets
+        KillMode = "mixed";
+        ExecReload = "${pkgs.coreutils}/bin/kill -HUP $MAINPID";
         Restart = "always";
         RestartSec = "10s";
         
@@ -70,6 +311,8 @@ in {
         # State directory for logs
         StateDirectory = "SOMA";
         LogsDirectory = "SOMA";
+        # /run/train-station for the binary route socket
+        RuntimeDirectory = "train-station";
       };
       
       environment = {
@@ -0,0 +1,670 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Async HTTP Server
+====================================
+🚂 asyncio HTTP/1.1 transport for the Train Station API (852 Hz)
+
+Single-threaded event-loop server with persistent connections and request
+pipelining. Each connection is an asyncio.Protocol that parses requests out of
+its receive buffer and answers them strictly in order, so one slow client never
+blocks routing for the others.
+
+The server knows nothing about routing: it calls an ``app`` callable
+``app(method, path, body) -> (status, data)`` and serialises ``data`` as JSON
+(a ``str`` ``data`` is sent as plain text, with any ``Content-Type`` header
+the app supplies).
+
+The result may also be ``(status, data, headers)`` to add response headers,
+or an awaitable resolving to either form or to a ``StreamingResponse``. While
+an awaitable response is outstanding, later pipelined requests on the same
+connection wait in the receive buffer so responses stay in order.
+
+An app with a true ``accepts_headers`` attribute is called as
+``app(method, path, body, headers)``, with lower-cased header names.
+
+If the app also has ``open_stream(method, path)`` and it returns a handler for
+a request, the body is not buffered: each received chunk goes to
+``handler.feed(bytes) -> bytes`` and ``handler.finish() -> bytes`` at the end,
+and whatever they return is streamed back with chunked transfer-encoding
+using ``handler.status`` and ``handler.content_type``.
+
+Likewise ``open_body(method, path, headers, length)`` may return a sink for
+a body the app wants to consume as it arrives (length is None for a chunked
+body): its ``limit`` caps the body, ``feed(bytes)`` takes each piece,
+``finish()`` returns the response as ``app()`` would, and ``close()`` is
+called when the request is over or abandoned. A sink may raise BodyRejected
+to refuse the body early.
+
+Bodies may come with Content-Length or ``Transfer-Encoding: chunked``. A
+body over its limit is refused with 413 as soon as that is known: from
+Content-Length before any of it is read, or once the received bytes pass
+the limit, and then the connection is closed.
+"""
+
+import asyncio
+import json
+import logging
+import signal
+import socket
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from body_reader import (MAX_BODY_BYTES, MAX_STREAM_BODY_BYTES, BodyRejected,
+                         ChunkedDecoder, body_length)
+
+
+logger = logging.getLogger(__name__)
+
+# app(method, path, body[, headers]) -> (status_code, json_data[, headers]) or awaitable
+App = Callable[[str, str, bytes], Any]
+
+MAX_HEADER_BYTES = 64 * 1024
+KEEPALIVE_TIMEOUT = 75.0
+# Seconds a graceful shutdown waits for requests in progress
+DRAIN_TIMEOUT = 10.0
+
+
+_STATUS_LINES: Dict[Tuple[bytes, int], bytes] = {}
+
+
+def _status_line(version: bytes, status: int) -> bytes:
+    """Build (and cache) the status line for a response."""
+    line = _STATUS_LINES.get((version, status))
+    if line is None:
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        line = b"%s %d %s\r\n" % (version, status, reason.encode("latin-1"))
+        _STATUS_LINES[(version, status)] = line
+    return line
+
+
+class StreamingResponse:
+    """
+    Response whose body is produced by an async iterator of bytes.
+
+    An endless body (an event stream) never finishes on its own; a draining
+    server ends it at the next chunk it yields, so such bodies should yield
+    (empty chunks will do) every so often.
+    """
+
+    def __init__(self, status: int, body: AsyncIterator[bytes],
+                 content_type: str = "application/json",
+                 headers: Optional[Dict[str, str]] = None,
+                 content_length: Optional[int] = None,
+                 endless: bool = False):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.content_length = content_length
+        self.endless = endless
+
+
+def _header_lines(headers: Optional[Dict[str, str]]) -> bytes:
+    if not headers:
+        return b""
+    return b"".join(
+        b"%s: %s\r\n" % (name.encode("latin-1"), str(value).encode("latin-1"))
+        for name, value in headers.items()
+    )
+
+
+class HTTPProtocol(asyncio.Protocol):
+    """One HTTP/1.1 connection: keep-alive, pipelining, in-order responses."""
+
+    def __init__(self, app: App, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                 max_body: int = MAX_BODY_BYTES,
+                 max_stream_body: int = MAX_STREAM_BODY_BYTES,
+                 connections: Optional[set] = None):
+        self.app = app
+        # Apps that set accepts_headers get the request headers as well
+        self._pass_headers = getattr(app, "accepts_headers", False)
+        self.connections = connections
+        self._draining = False
+        # Requests started on this connection
+        self._requests = 0
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body = max_body
+        self.max_stream_body = max_stream_body
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray()
+        self._paused = False
+        self._closing = False
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self._last_activity = 0.0
+
+        # Parsed head of a request whose body is still arriving
+        self._head: Optional[Tuple] = None
+        # Its body: chunked decoder, sink (see App.open_body), cap, progress
+        self._decoder: Optional[ChunkedDecoder] = None
+        self._sink = None
+        self._limit = 0
+        self._received = 0
+        self._body = bytearray()
+        # Streaming-body request in progress (see App.open_stream)
+        self._stream = None
+        self._stream_remaining = 0
+        self._stream_chunked = False
+        self._stream_keep_alive = False
+        # Awaitable response in progress; pipelined requests wait behind it
+        self._waiting: Optional[asyncio.Task] = None
+        self._writable: Optional[asyncio.Future] = None
+
+    # -- asyncio.Protocol callbacks -------------------------------------
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.connections is not None:
+            self.connections.add(self)
+        loop = asyncio.get_running_loop()
+        self._last_activity = loop.time()
+        self._idle_handle = loop.call_later(self.keepalive_timeout, self._on_idle)
+
+    def connection_lost(self, exc):
+        self._closing = True
+        if self.connections is not None:
+            self.connections.discard(self)
+        if self._idle_handle:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._waiting:
+            self._waiting.cancel()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        if self._writable and not self._writable.done():
+            self._writable.set_result(None)
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        self._last_activity = asyncio.get_running_loop().time()
+        self._process()
+
+    def pause_writing(self):
+        # Client is not reading its responses; stop parsing pipelined requests
+        self._paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self._paused = False
+        self.transport.resume_reading()
+        if self._writable and not self._writable.done():
+            self._writable.set_result(None)
+        self._process()
+
+    def drain(self):
+        """Finish the request in progress, then close the connection."""
+        self._draining = True
+        # A connection accepted just now is about to send its first
+        # request: answer it rather than drop it
+        idle = (self._requests and self._head is None and self._stream is None
+                and self._waiting is None and not self._buffer)
+        if idle and self.transport and not self._closing:
+            self._close()
+
+    # -- request handling -----------------------------------------------
+
+    def _on_idle(self):
+        # Re-arm instead of resetting a timer on every read
+        loop = asyncio.get_running_loop()
+        remaining = self._last_activity + self.keepalive_timeout - loop.time()
+        if self._waiting is not None:
+            # Still answering (e.g. a long-lived stream); not idle
+            remaining = self.keepalive_timeout
+        if remaining > 0:
+            self._idle_handle = loop.call_later(remaining, self._on_idle)
+            return
+        self._idle_handle = None
+        if self.transport and not self._closing:
+            self.transport.close()
+
+    def _process(self):
+        """Answer every complete request currently in the buffer."""
+        while not self._paused and not self._closing and self._waiting is None:
+            if self._stream is not None:
+                if not self._continue_stream():
+                    return
+                continue
+
+            if self._head is None:
+                if not self._read_head():
+                    return
+                continue
+
+            method, path, version, headers, length, keep_alive = self._head
+            try:
+                body = self._take_body(length)
+            except BodyRejected as e:
+                self._reject_body(version, e.status, e.message)
+                return
+            except Exception as e:
+                logger.error(f"Error reading body of {method} {path}: {e}")
+                self._reject_body(version, 500, str(e))
+                return
+            if body is None:
+                return
+            self._head = None
+
+            try:
+                if self._sink is not None:
+                    sink, self._sink = self._sink, None
+                    try:
+                        result = sink.finish()
+                    finally:
+                        sink.close()
+                elif self._pass_headers:
+                    result = self.app(method, path, body, headers)
+                else:
+                    result = self.app(method, path, body)
+            except BodyRejected as e:
+                result = (e.status, {"error": e.message})
+            except Exception as e:
+                logger.error(f"Error handling {method} {path}: {e}")
+                result = (500, {"error": str(e)})
+
+            keep_alive = keep_alive and not self._draining
+            if not isinstance(result, tuple):
+                self._waiting = asyncio.get_running_loop().create_task(
+                    self._respond_async(result, method, path, version, keep_alive)
+                )
+                return
+
+            self._write_response(version, *result, keep_alive=keep_alive)
+            if not keep_alive:
+                self._close()
+                return
+
+    def _take_body(self, length: Optional[int]) -> Optional[bytes]:
+        """
+        Move the body of the request in _head out of the buffer. Returns
+        the body once complete (b"" if a sink took it), else None.
+        """
+        buffer, sink = self._buffer, self._sink
+        if self._decoder is None:
+            if sink is None:
+                if len(buffer) < length:
+                    return None
+                body = bytes(buffer[:length])
+                del buffer[:length]
+                return body
+            take = min(len(buffer), length - self._received)
+            if take:
+                self._received += take
+                sink.feed(bytes(buffer[:take]))
+                del buffer[:take]
+            return b"" if self._received == length else None
+
+        data = self._decoder.feed(buffer)
+        if data:
+            self._received += len(data)
+            if self._received > self._limit:
+                raise BodyRejected(413, f"Body over {self._limit} bytes")
+            if sink is None:
+                self._body += data
+            else:
+                sink.feed(data)
+        if not self._decoder.done:
+            return None
+        body, self._body = bytes(self._body), bytearray()
+        return body
+
+    def _reject_body(self, version: bytes, status: int, message: str):
+        """Refuse a body part-way through; the rest of it is not read."""
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        self._head = None
+        self._send_error(status, version, message)
+
+    async def _respond_async(self, awaitable, method: str, path: str,
+                             version: bytes, keep_alive: bool):
+        """Await an app response, write it, then resume the pipeline."""
+        try:
+            try:
+                result = await awaitable
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error handling {method} {path}: {e}")
+                result = (500, {"error": str(e)})
+
+            if isinstance(result, StreamingResponse):
+                keep_alive = await self._write_streaming(version, result, keep_alive)
+            else:
+                self._write_response(version, *result, keep_alive=keep_alive)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            # Headers may already be out; cut the response short
+            logger.error(f"Error streaming response for {method} {path}: {e}")
+            keep_alive = False
+
+        self._waiting = None
+        if self._closing:
+            return
+        if not keep_alive or self._draining:
+            self._close()
+            return
+        self._process()
+
+    async def _write_streaming(self, version: bytes, response: StreamingResponse,
+                               keep_alive: bool) -> bool:
+        """Write a StreamingResponse; returns whether the connection stays open."""
+        if response.content_length is not None:
+            framing = b"Content-Length: %d\r\n" % response.content_length
+            use_chunks = False
+        elif version == b"HTTP/1.1":
+            framing = b"Transfer-Encoding: chunked\r\n"
+            use_chunks = True
+        else:
+            # HTTP/1.0 without a length: the body ends at connection close
+            framing = b""
+            use_chunks = False
+            keep_alive = False
+
+        self.transport.write(
+            _status_line(version, response.status)
+            + b"Content-Type: %s\r\n" % response.content_type.encode("latin-1")
+            + _header_lines(response.headers)
+            + framing
+            + (b"Connection: keep-alive\r\n" if keep_alive
+               else b"Connection: close\r\n")
+            + b"\r\n"
+        )
+
+        body = response.body
+        try:
+            async for chunk in body:
+                if self._closing:
+                    return False
+                if response.endless and self._draining:
+                    break
+                if chunk:
+                    if use_chunks:
+                        self.transport.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    else:
+                        self.transport.write(chunk)
+                if self._paused:
+                    self._writable = asyncio.get_running_loop().create_future()
+                    await self._writable
+        finally:
+            aclose = getattr(body, "aclose", None)
+            if aclose:
+                await aclose()
+
+        if use_chunks:
+            self.transport.write(b"0\r\n\r\n")
+        return keep_alive
+
+    def _read_head(self) -> bool:
+        """Parse the next request head out of the buffer, if complete."""
+        header_end = self._buffer.find(b"\r\n\r\n")
+        if header_end < 0:
+            if len(self._buffer) > MAX_HEADER_BYTES:
+                self._send_error(431, b"HTTP/1.1")
+            return False
+
+        try:
+            method, path, version, headers = self._parse_head(
+                bytes(self._buffer[:header_end])
+            )
+        except ValueError:
+            self._send_error(400, b"HTTP/1.1")
+            return False
+        del self._buffer[:header_end + 4]
+        self._requests += 1
+
+        try:
+            # None for a chunked body
+            length = body_length(headers)
+        except BodyRejected as e:
+            self._send_error(e.status, version, e.message)
+            return False
+
+        connection = headers.get("connection", "").lower()
+        if version == b"HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+
+        open_stream = getattr(self.app, "open_stream", None)
+        stream = open_stream(method, path) if open_stream else None
+        sink = None
+        if stream is not None:
+            limit = self.max_stream_body
+        else:
+            open_body = getattr(self.app, "open_body", None)
+            sink = open_body(method, path, headers, length) if open_body else None
+            limit = sink.limit if sink is not None else self.max_body
+        if length is not None and length > limit:
+            if sink is not None:
+                sink.close()
+            self._send_error(413, version, f"Body over {limit} bytes")
+            return False
+        self._decoder = ChunkedDecoder() if length is None else None
+        self._limit = limit
+        self._received = 0
+
+        if headers.get("expect", "").lower() == "100-continue":
+            self.transport.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        if stream is not None:
+            self._start_stream(stream, version, length, keep_alive)
+        else:
+            self._sink = sink
+            self._head = (method, path, version, headers, length, keep_alive)
+        return True
+
+    # -- streaming bodies ------------------------------------------------
+
+    def _start_stream(self, stream, version: bytes, length: Optional[int],
+                      keep_alive: bool):
+        """Send the response head for a streamed body."""
+        self._stream = stream
+        self._stream_remaining = length or 0
+        self._stream_chunked = version == b"HTTP/1.1"
+        # Without chunked encoding the response ends at connection close
+        self._stream_keep_alive = (keep_alive and self._stream_chunked
+                                   and not self._draining)
+        self.transport.write(
+            _status_line(version, stream.status)
+            + b"Content-Type: %s\r\n" % stream.content_type.encode("latin-1")
+            + (b"Transfer-Encoding: chunked\r\n" if self._stream_chunked
+               else b"")
+            + (b"Connection: keep-alive\r\n" if self._stream_keep_alive
+               else b"Connection: close\r\n")
+            + b"\r\n"
+        )
+
+    def _continue_stream(self) -> bool:
+        """Feed buffered body bytes to the stream; True once it is done."""
+        stream = self._stream
+        try:
+            if self._decoder is None:
+                take = min(len(self._buffer), self._stream_remaining)
+                if take:
+                    data = bytes(self._buffer[:take])
+                    del self._buffer[:take]
+                    self._stream_remaining -= take
+                    self._write_chunk(stream.feed(data))
+                if self._stream_remaining > 0:
+                    return False
+            else:
+                data = self._decoder.feed(self._buffer)
+                if data:
+                    self._received += len(data)
+                    if self._received > self._limit:
+                        raise BodyRejected(413, f"Body over {self._limit} bytes")
+                    self._write_chunk(stream.feed(data))
+                if not self._decoder.done:
+                    return False
+            self._write_chunk(stream.finish())
+        except Exception as e:
+            # The status line is already sent; all we can do is cut it short
+            logger.error(f"Error streaming response: {e}")
+            self._close()
+            return False
+
+        if self._stream_chunked:
+            self.transport.write(b"0\r\n\r\n")
+        self._stream = None
+        if not self._stream_keep_alive:
+            self._close()
+            return False
+        return True
+
+    def _write_chunk(self, data: bytes):
+        if not data:
+            return
+        if self._stream_chunked:
+            self.transport.write(b"%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self.transport.write(data)
+
+    @staticmethod
+    def _parse_head(head: bytes) -> Tuple[str, str, bytes, Dict[str, str]]:
+        """Parse request line and headers; raise ValueError if malformed."""
+        lines = head.split(b"\r\n")
+        method, path, version = lines[0].split(b" ", 2)
+        if not version.startswith(b"HTTP/1."):
+            raise ValueError("unsupported HTTP version")
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(b":")
+            if not sep:
+                raise ValueError("malformed header")
+            headers[name.strip().lower().decode("latin-1")] = (
+                value.strip().decode("latin-1")
+            )
+        return method.decode("ascii"), path.decode("latin-1"), version, headers
+
+    def _write_response(self, version: bytes, status: int, data: Any,
+                        headers: Optional[Dict[str, str]] = None,
+                        keep_alive: bool = True):
+        if isinstance(data, str):
+            # Plain text (e.g. /metrics); headers may carry its Content-Type
+            headers = dict(headers or {})
+            content_type = headers.pop("Content-Type", "text/plain; charset=utf-8")
+            body = data.encode("utf-8")
+        else:
+            content_type = "application/json"
+            body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        head = (
+            _status_line(version, status)
+            + b"Content-Type: %s\r\n" % content_type.encode("latin-1")
+            + _header_lines(headers)
+            + b"Content-Length: %d\r\n" % len(body)
+            + (b"Connection: keep-alive\r\n" if keep_alive
+               else b"Connection: close\r\n")
+            + b"\r\n"
+        )
+        self.transport.write(head + body)
+
+    def _send_error(self, status: int, version: bytes, message: Optional[str] = None):
+        self._write_response(version, status,
+                             {"error": message or HTTPStatus(status).phrase},
+                             keep_alive=False)
+        self._close()
+
+    def _close(self):
+        self._closing = True
+        self._buffer.clear()
+        self.transport.close()
+
+
+async def serve(app: App, host: str = "", port: int = 8520,
+                backlog: int = 4096,
+                keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                reuse_port: bool = False,
+                connections: Optional[set] = None,
+                sock: Optional[socket.socket] = None
+                ) -> asyncio.AbstractServer:
+    """
+    Create and start the asyncio HTTP server, on host and port or on an
+    already-listening sock. With reuse_port, several processes can listen
+    on the same port (SO_REUSEPORT) and the kernel spreads connections over
+    them. Live connections are tracked in connections, if given, so drain()
+    can close them gracefully.
+    """
+    loop = asyncio.get_running_loop()
+    factory = lambda: HTTPProtocol(app, keepalive_timeout=keepalive_timeout,
+                                   connections=connections)
+    if sock is not None:
+        return await loop.create_server(factory, sock=sock, backlog=backlog)
+    server = await loop.create_server(
+        factory,
+        host=host or None,
+        port=port,
+        backlog=backlog,
+        reuse_address=True,
+        reuse_port=reuse_port or None,
+    )
+    return server
+
+
+async def drain(server: asyncio.AbstractServer, connections: set,
+                timeout: float = DRAIN_TIMEOUT) -> None:
+    """
+    Stop accepting, let requests in progress finish, then close. Idle
+    keep-alive connections close at once; busy ones after their response.
+    """
+    server.close()
+    for connection in list(connections):
+        connection.drain()
+    deadline = asyncio.get_running_loop().time() + timeout
+    while connections and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    for connection in list(connections):
+        if connection.transport:
+            connection.transport.abort()
+    await server.wait_closed()
+
+
+def run(app: App, host: str = "", port: int = 8520, backlog: int = 4096,
+        reuse_port: bool = False, drain_timeout: float = DRAIN_TIMEOUT,
+        on_ready: Optional[Callable[[], None]] = None,
+        listeners: Sequence[Callable[[set], Awaitable[asyncio.AbstractServer]]] = (),
+        sock: Optional[socket.socket] = None,
+        reload: bool = False
+        ) -> bool:
+    """
+    Run the asyncio HTTP server until SIGINT/SIGTERM, then drain it.
+    on_ready is called once the port is listening. Each of listeners is
+    called with the connection set to start another server on the same
+    loop (the binary route protocol); those are drained together.
+
+    With reload, SIGHUP stops and drains the server the same way and run()
+    returns True, for the caller to restart; otherwise it returns False.
+    """
+
+    async def _main():
+        connections: set = set()
+        server = await serve(app, host=host, port=port, backlog=backlog,
+                             reuse_port=reuse_port, connections=connections, sock=sock)
+        others = [await listen(connections) for listen in listeners]
+        stop = asyncio.Event()
+        reloading = False
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        if reload:
+            def on_reload():
+                nonlocal reloading
+                reloading = True
+                stop.set()
+            loop.add_signal_handler(signal.SIGHUP, on_reload)
+        if on_ready:
+            on_ready()
+
+        await stop.wait()
+        for other in others:
+            other.close()
+        await drain(server, connections, drain_timeout)
+        for other in others:
+            await other.wait_closed()
+        return reloading
+
+    return asyncio.run(_main())
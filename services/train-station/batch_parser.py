@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Batch Parser
+===============================
+🚂 Incremental parser for POST /route/batch bodies (852 Hz)
+
+Accepts either a JSON array of request objects or newline-delimited JSON
+(NDJSON). The body is pushed in arbitrary chunks with ``feed()`` and complete
+items are returned as soon as they are available, so multi-megabyte batches
+are routed while they are still arriving and never held in memory whole.
+
+The format is detected from the first non-whitespace byte: ``[`` selects the
+JSON array form, anything else NDJSON.
+"""
+
+import codecs
+import json
+from typing import Any, Dict, List, Optional, Union
+
+
+MAX_ITEM_BYTES = 16 * 1024 * 1024
+
+_WHITESPACE = " \t\r\n"
+
+
+class BatchItemError:
+    """Placeholder for one batch item that could not be parsed."""
+
+    def __init__(self, message: str):
+        self.message = message
+
+    def __repr__(self) -> str:
+        return f"BatchItemError({self.message!r})"
+
+
+BatchItem = Union[Dict[str, Any], BatchItemError]
+
+
+class BatchParser:
+    """Push parser yielding request objects from a JSON array or NDJSON body."""
+
+    def __init__(self, max_item_bytes: int = MAX_ITEM_BYTES):
+        self.max_item_bytes = max_item_bytes
+        self.mode: Optional[str] = None      # "array" or "ndjson"
+        self.count = 0
+
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        # Array text: parsed from _buf; chunks since then wait in _parts
+        self._buf = ""
+        self._parts: List[str] = []
+        self._parts_size = 0
+        # NDJSON bytes after the last complete line; _scanned of them hold no newline
+        self._bytes = bytearray()
+        self._scanned = 0
+
+        # Array state: expecting a value, or a ',' / ']' after one
+        self._opened = False
+        self._expect_value = True
+        self._first = True
+        self._done = False
+        self._retry_size = 0
+
+    def feed(self, data: bytes) -> List[BatchItem]:
+        """Consume a chunk of the body and return the items it completed."""
+        if self.mode is None:
+            stripped = data.lstrip()
+            if not stripped:
+                return []
+            self.mode = "array" if stripped[:1] == b"[" else "ndjson"
+
+        if self.mode == "ndjson":
+            return self._feed_ndjson(data, final=False)
+        text = self._text_decoder.decode(data)
+        self._parts.append(text)
+        self._parts_size += len(text)
+        # Until enough arrived to complete the pending item, don't copy
+        # the buffer together or parse it again
+        if len(self._buf) + self._parts_size < self._retry_size:
+            return []
+        return self._parse_array(final=False)
+
+    def close(self) -> List[BatchItem]:
+        """Signal end of body and return any remaining items."""
+        if self.mode is None:
+            return []
+        if self.mode == "ndjson":
+            return self._feed_ndjson(b"", final=True)
+        self._parts.append(self._text_decoder.decode(b"", final=True))
+        items = self._parse_array(final=True)
+        if not self._done:
+            raise ValueError("Unterminated JSON array")
+        return items
+
+    # -- NDJSON ------------------------------------------------------------
+
+    def _feed_ndjson(self, data: bytes, final: bool) -> List[BatchItem]:
+        buf = self._bytes
+        buf += data
+        # Only the new bytes can hold a newline not seen before
+        end = len(buf) if final else buf.rfind(b"\n", self._scanned)
+        if end < 0:
+            self._scanned = len(buf)
+            if len(buf) > self.max_item_bytes:
+                raise ValueError("Batch item exceeds size limit")
+            return []
+        lines = bytes(buf[:end]).split(b"\n")
+        # Drop the consumed lines; what is left is part of the next one
+        del buf[:end + 1]
+        self._scanned = len(buf)
+        if len(buf) > self.max_item_bytes:
+            raise ValueError("Batch item exceeds size limit")
+
+        items = []
+        for line in lines:
+            if line.strip():
+                try:
+                    items.append(self._item(json.loads(line)))
+                except ValueError as e:
+                    items.append(BatchItemError(f"Invalid JSON: {e}"))
+        return items
+
+    # -- JSON array --------------------------------------------------------
+
+    def _parse_array(self, final: bool) -> List[BatchItem]:
+        items = []
+        buf = self._buf = "".join([self._buf] + self._parts)
+        self._parts = []
+        self._parts_size = 0
+        pos = 0
+
+        if not self._opened:
+            pos = self._skip(buf, pos)
+            if pos >= len(buf):
+                return items
+            pos += 1  # the '[' that selected array mode
+            self._opened = True
+
+        while not self._done:
+            pos = self._skip(buf, pos)
+            if pos >= len(buf):
+                break
+
+            if not self._expect_value:
+                char = buf[pos]
+                if char == ",":
+                    self._expect_value = True
+                    pos += 1
+                    continue
+                if char == "]":
+                    self._done = True
+                    pos += 1
+                    break
+                raise ValueError(f"Expected ',' or ']' at offset {pos}")
+
+            if self._first and buf[pos] == "]":
+                self._first = False
+                self._done = True
+                pos += 1
+                break
+
+            # Only retry an incomplete value once enough new data arrived,
+            # so a large item is not re-parsed for every small chunk
+            pending = len(buf) - pos
+            if not final and pending < self._retry_size:
+                break
+            try:
+                value, end = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if final:
+                    raise ValueError(f"Invalid JSON in batch: {e}")
+                if pending > self.max_item_bytes:
+                    raise ValueError("Batch item exceeds size limit")
+                self._retry_size = pending * 2
+                break
+            if end >= len(buf) and not final:
+                # A value ending exactly at the buffer edge may be a number
+                # that continues in the next chunk
+                self._retry_size = pending + 1
+                break
+
+            self._retry_size = 0
+            self._first = False
+            self._expect_value = False
+            pos = end
+            items.append(self._item(value))
+
+        if self._done:
+            rest = self._skip(buf, pos)
+            if rest < len(buf):
+                raise ValueError("Unexpected data after JSON array")
+
+        # Drop consumed text so memory stays bounded by one item
+        self._buf = buf[pos:]
+        return items
+
+    @staticmethod
+    def _skip(buf: str, pos: int) -> int:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def _item(self, value: Any) -> BatchItem:
+        self.count += 1
+        if not isinstance(value, dict):
+            return BatchItemError("Batch item is not a JSON object")
+        return value
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Forwarding proxy benchmark
+==========================
+🚂 Train Station forwarding mode vs. direct calls to a vertex backend
+
+Starts a stand-in vertex backend and a Train Station (asyncio server,
+forwarding mode) in separate processes, then drives load from this process:
+
+- direct-fresh      new connection per request straight to the backend
+                    (what every caller does today)
+- direct-keepalive  persistent connections straight to the backend
+- forwarded         persistent connections to the Train Station, which routes
+                    and forwards over its pooled backend connections
+
+Prints one JSON line per mode with throughput and latency percentiles.
+
+Usage: python3 benchmarks/bench_forwarding.py [--concurrency 32] [--requests 5000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_backend(port: int) -> None:
+    """Stand-in vertex backend: acknowledge every request."""
+    import async_server
+
+    def app(method, path, body):
+        request = json.loads(body) if body else {}
+        return 200, {"accepted": True, "request_id": request.get("id")}
+
+    async_server.run(app, host="127.0.0.1", port=port)
+
+
+def run_train_station(port: int, backend_port: int, pool_size: int, log_dir: str) -> None:
+    logging.disable(logging.INFO)
+    from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex
+    from vertex_proxy import VertexProxy
+    import async_server
+
+    orchestrator = TrainStationOrchestrator(log_path=Path(log_dir) / "ts.log")
+    proxy = VertexProxy(
+        {vertex: f"http://127.0.0.1:{backend_port}/route" for vertex in Vertex},
+        size=pool_size,
+    )
+    async_server.run(TrainStationAPI(orchestrator, proxy), host="127.0.0.1", port=port)
+
+
+async def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def read_response(reader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return int(head.split(b" ", 2)[1])
+
+
+def build_request(port: int, i: int, keepalive: bool) -> bytes:
+    body = json.dumps({"id": f"bench-{i}", "type": "compute", "source": "bench"}).encode()
+    return (
+        f"POST /route HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keepalive else 'close'}\r\n\r\n"
+    ).encode() + body
+
+
+async def drive(port: int, concurrency: int, total: int, keepalive: bool) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        conn = None
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = await asyncio.open_connection("127.0.0.1", port)
+                reader, writer = conn
+                writer.write(build_request(port, i, keepalive))
+                status = await read_response(reader)
+                if status != 200:
+                    errors += 1
+                if not keepalive:
+                    writer.close()
+                    conn = None
+            except (OSError, asyncio.IncompleteReadError):
+                errors += 1
+                conn = None
+                continue
+            latencies.append(time.perf_counter() - start)
+        if conn:
+            conn[1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3, 3)
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--pool-size", type=int, default=16)
+    args = parser.parse_args()
+
+    backend_port, station_port = free_port(), free_port()
+    log_dir = tempfile.mkdtemp(prefix="train-station-bench-")
+    processes = [
+        multiprocessing.Process(target=run_backend, args=(backend_port,), daemon=True),
+        multiprocessing.Process(
+            target=run_train_station,
+            args=(station_port, backend_port, args.pool_size, log_dir),
+            daemon=True,
+        ),
+    ]
+    for process in processes:
+        process.start()
+
+    async def bench():
+        await wait_for_port(backend_port)
+        await wait_for_port(station_port)
+        modes = [
+            ("direct-fresh", backend_port, False),
+            ("direct-keepalive", backend_port, True),
+            ("forwarded", station_port, True),
+        ]
+        for name, port, keepalive in modes:
+            await drive(port, args.concurrency, min(500, args.requests), keepalive)
+            result = await drive(port, args.concurrency, args.requests, keepalive)
+            print(json.dumps({"mode": name, "concurrency": args.concurrency, **result}))
+
+    try:
+        asyncio.run(bench())
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
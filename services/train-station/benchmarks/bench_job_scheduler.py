@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Job scheduler benchmark
+=======================
+🚂 Timer wheel insert/cancel rates, and firing jitter under routing load
+
+Three parts:
+
+- wheel: inserts --timers timers spread over a day, cancels half of them
+  and reports the rates, then inserts as many again into the wheel still
+  holding the other half (O(1): the wheel does no more work per insert;
+  what the rate loses is the garbage collector and the CPU caches), plus
+  advancing through a busy minute
+- heap: the same inserts and cancels on a heapq with lazy deletion, the
+  usual alternative, for comparison
+- jitter: --jobs one-off jobs due over --seconds through JobScheduler on
+  an idle asyncio loop, then on one routing POST /route calls flat out
+  meanwhile; reports how late jobs fired (p50/p99/max ms) and the route
+  rate. Under load most of the lateness is the log writer thread's turns
+  on the GIL, not the wheel
+
+Usage: python3 benchmarks/bench_job_scheduler.py [--timers 1000000] [--jobs 2000]
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from job_scheduler import JobScheduler, TimerWheel, now_ms
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+DAY_MS = 86_400_000
+
+
+def rate(count: int, seconds: float) -> int:
+    return round(count / seconds)
+
+
+def bench_wheel(timers: int, rng: random.Random) -> dict:
+    start = 1_700_000_000_000
+    delays = [rng.randrange(1, DAY_MS) for _ in range(timers)]
+    wheel = TimerWheel(start)
+    began = time.perf_counter()
+    for key, delay in enumerate(delays):
+        wheel.add(key, start + delay)
+    inserted = time.perf_counter() - began
+    began = time.perf_counter()
+    for key in range(0, timers, 2):
+        wheel.cancel(key)
+    cancelled = time.perf_counter() - began
+    # Same again with the wheel already holding the other half
+    began = time.perf_counter()
+    for key, delay in enumerate(delays[:timers // 2]):
+        wheel.add(timers + key, start + delay)
+    inserted_full = time.perf_counter() - began
+    # A busy minute: everything due in it fires
+    busy = TimerWheel(start)
+    for key in range(timers // 10):
+        busy.add(key, start + rng.randrange(1, 60_000))
+    began = time.perf_counter()
+    fired = 0
+    while len(busy):
+        fired += len(busy.advance(busy.next_expiry()))
+    advanced = time.perf_counter() - began
+    return {"timers": timers, "insert_per_s": rate(timers, inserted),
+            "cancel_per_s": rate(timers // 2, cancelled),
+            "insert_into_full_per_s": rate(timers // 2, inserted_full),
+            "fire_per_s_busy_minute": rate(fired, advanced)}
+
+
+def bench_heap(timers: int, rng: random.Random) -> dict:
+    delays = [rng.randrange(1, DAY_MS) for _ in range(timers)]
+    heap, live = [], {}
+    began = time.perf_counter()
+    for key, delay in enumerate(delays):
+        entry = [delay, key, True]
+        live[key] = entry
+        heapq.heappush(heap, entry)
+    inserted = time.perf_counter() - began
+    began = time.perf_counter()
+    for key in range(0, timers, 2):
+        live.pop(key)[2] = False
+    cancelled = time.perf_counter() - began
+    return {"heap_insert_per_s": rate(timers, inserted),
+            "heap_cancel_per_s": rate(timers // 2, cancelled)}
+
+
+def bench_jitter(directory: Path, jobs: int, seconds: float, load: bool) -> dict:
+    orchestrator = TrainStationOrchestrator(log_path=directory / f"jitter-{load}.log")
+    scheduler = JobScheduler(directory / f"jitter-{load}.jobs", fsync=False)
+    api = TrainStationAPI(orchestrator, jobs=scheduler)
+    late = []
+
+    def route_job(data):
+        due = int(data["id"].rsplit("@", 1)[1])
+        late.append(now_ms() - due)
+        return api.route_job(data)
+
+    bodies = [json.dumps({"type": t, "source": "bench"}).encode()
+              for t in ("build", "compute", "store", "api_call")]
+
+    async def main():
+        scheduler.start(route_job)
+        rng = random.Random(852)
+        first = time.time() + 0.5
+        for i in range(jobs):
+            api.handle("POST", "/schedule", json.dumps({
+                "id": f"j{i}", "run_at": first + rng.random() * seconds,
+                "request": {"type": "monitor", "source": "bench"}}).encode())
+        routed = 0
+        began = time.perf_counter()
+        # Keep the loop busy the way a stream of requests does: route a
+        # few, then give other callbacks (the scheduler) their turn
+        while len(late) < jobs and time.perf_counter() - began < seconds + 5:
+            if not load:
+                await asyncio.sleep(0.1)
+                continue
+            for i in range(8):
+                api.handle("POST", "/route", bodies[i % len(bodies)])
+            routed += 8
+            await asyncio.sleep(0)
+        return routed / (time.perf_counter() - began)
+
+    route_rps = asyncio.run(main())
+    scheduler.close()
+    orchestrator.close()
+    late.sort()
+    return {"jobs": len(late), "route_rps_meanwhile": round(route_rps),
+            "late_ms_p50": round(late[len(late) // 2], 2),
+            "late_ms_p99": round(late[int(len(late) * 0.99)], 2),
+            "late_ms_max": round(late[-1], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--timers", type=int, default=1_000_000)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=852)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(json.dumps(bench_wheel(args.timers, random.Random(args.seed))))
+    print(json.dumps(bench_heap(args.timers, random.Random(args.seed))))
+    with tempfile.TemporaryDirectory(prefix="train-station-bench-") as directory:
+        for load in (False, True):
+            print(json.dumps(bench_jitter(Path(directory), args.jobs, args.seconds, load)))
+
+
+if __name__ == "__main__":
+    main()
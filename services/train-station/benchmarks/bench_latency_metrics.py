@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Latency histogram recording microbenchmark
+==========================================
+🚂 Per-observation cost of LatencyHistograms.observe()
+
+Records synthetic durations spread over several series and reports the mean
+cost of one observation, plus the cost of a full /metrics rendering.
+
+Usage: python3 benchmarks/bench_latency_metrics.py [--observations 1000000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from latency_metrics import LatencyHistograms
+
+
+PHASES = ["capture", "validate", "route", "handshake", "respond"]
+TYPES = ["build", "compute", "health_check", "store"]
+VERTICES = ["transformation", "compute", "monitoring", "storage"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=852)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keys = [(p, t, v) for p in PHASES for t, v in zip(TYPES, VERTICES)]
+    samples = [
+        (rng.choice(keys), int(rng.lognormvariate(10, 2)))
+        for _ in range(min(args.observations, 100_000))
+    ]
+
+    histograms = LatencyHistograms()
+    observe = histograms.observe
+    done = 0
+    start = time.perf_counter()
+    while done < args.observations:
+        for key, value in samples:
+            observe(key, value)
+        done += len(samples)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = histograms.prometheus("bench_duration_seconds", "Benchmark.")
+    render = time.perf_counter() - start
+
+    print(json.dumps({
+        "observations": done,
+        "series": len(keys),
+        "ns_per_observation": round(elapsed / done * 1e9, 1),
+        "render_ms": round(render * 1e3, 2),
+        "exposition_bytes": len(text),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Columnar log analytics benchmark
+================================
+🚂 Converter throughput and group-by query time over log columns
+
+Two parts:
+
+- convert: writes --requests synthetic handshakes (capture, validate and
+  route records) to a JSONL log and converts it, reporting records/s.
+  The JSON-per-line parse it replaces is the same cost a Python script
+  pays for every query.
+- query: writes --rows handshake records straight to columns (partitions
+  of --partition-rows, about one 64 MiB segment each), spread over
+  --days, then times "routes per vertex per minute" and "records per
+  type and phase per hour over the last day".
+
+Usage: python3 benchmarks/bench_log_columns.py [--rows 20000000] [--requests 100000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from log_columns import CATEGORICAL, ColumnStore, convert, parse_time
+
+PHASES = ["capture", "validate", "route"]
+TYPES = ["build", "compile", "deploy", "compute", "api_call", "webhook", "store", "monitor"]
+VERTICES = ["transformation", "compute", "communication", "storage", "monitoring"]
+SOURCES = [f"dojo-{i}" for i in range(40)]
+START = "2026-01-01T00:00:00"
+
+
+def bench_convert(directory: Path, requests: int, rng: random.Random) -> dict:
+    log = directory / "convert.log"
+    moment = parse_time(START)
+    with open(log, "w") as f:
+        for i in range(requests):
+            moment += rng.randrange(1000, 20000)
+            ts = (f"2026-01-01T{moment // 3_600_000_000 % 24:02d}:"
+                  f"{moment // 60_000_000 % 60:02d}:{moment // 1_000_000 % 60:02d}."
+                  f"{moment % 1_000_000:06d}")
+            request_id = f"req-{i}"
+            f.write(json.dumps({"timestamp": ts, "data": {
+                "phase": "capture", "request_id": request_id, "type": rng.choice(TYPES),
+                "source": rng.choice(SOURCES), "timestamp": ts}}) + "\n")
+            f.write(json.dumps({"timestamp": ts, "data": {
+                "phase": "validate", "request_id": request_id, "success": True}}) + "\n")
+            f.write(json.dumps({"timestamp": ts, "data": {
+                "phase": "route", "request_id": request_id, "vertex": rng.choice(VERTICES),
+                "frequency": 528, "chakra": "Heart", "rule": None,
+                "config_version": 1}}) + "\n")
+    size = log.stat().st_size
+    start = time.perf_counter()
+    result = convert(log, active=True)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    counts = {}
+    with open(log, "rb") as f:
+        for line in f:
+            data = json.loads(line)["data"]
+            if data["phase"] == "route":
+                counts[data["vertex"]] = counts.get(data["vertex"], 0) + 1
+    scan = time.perf_counter() - start
+    return {"records": result["rows"], "log_mb": round(size / 2**20, 1),
+            "convert_records_per_s": round(result["rows"] / elapsed),
+            "json_scan_records_per_s": round(result["rows"] / scan)}
+
+
+def write_columns(directory: Path, rows: int, partition_rows: int, days: float,
+                  seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    start = parse_time(START)
+    span = int(days * 86400e6)
+    dictionaries = {
+        "phase": [""] + PHASES, "type": [""] + TYPES, "source": [""] + SOURCES,
+        "vertex": [""] + VERTICES, "rule": [""], "reason": [""],
+    }
+    for number, first in enumerate(range(0, rows, partition_rows)):
+        n = min(partition_rows, rows - first)
+        part = directory / f"bench.{number:08d}"
+        part.mkdir()
+        lo = start + span * first // rows
+        hi = start + span * (first + n) // rows
+        ts = np.sort(rng.integers(lo, hi, n, dtype=np.int64))
+        phase = np.tile(np.arange(1, 4, dtype=np.uint8), n // 3 + 1)[:n]
+        columns = {
+            "ts": ts,
+            "phase": phase,
+            "type": rng.integers(1, len(TYPES) + 1, n, dtype=np.uint8),
+            "source": rng.integers(1, len(SOURCES) + 1, n, dtype=np.uint8),
+            "vertex": np.where(phase == 3, rng.integers(1, len(VERTICES) + 1, n),
+                               0).astype(np.uint8),
+            "rule": np.zeros(n, dtype=np.uint8),
+            "reason": np.zeros(n, dtype=np.uint8),
+            "success": np.where(phase == 2, 1, -1).astype(np.int8),
+        }
+        dtypes = {}
+        for name, values in columns.items():
+            values.tofile(part / f"{name}.bin")
+            dtypes[name] = values.dtype.str
+        with open(part / "meta.json", "w") as f:
+            json.dump({"source": part.name, "rows": n, "first_ts": int(ts[0]),
+                       "last_ts": int(ts[-1]), "dtypes": dtypes,
+                       "dictionaries": {name: dictionaries[name] for name in CATEGORICAL}}, f)
+
+
+def timed(function) -> tuple:
+    start = time.perf_counter()
+    result = function()
+    return result, round(time.perf_counter() - start, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--partition-rows", type=int, default=370_000)
+    parser.add_argument("--days", type=float, default=7.0)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=852)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="train-station-bench-") as directory:
+        directory = Path(directory)
+        print(json.dumps(bench_convert(directory, args.requests, random.Random(args.seed))))
+
+        columns = directory / "bench.log.columns"
+        columns.mkdir()
+        _, written = timed(lambda: write_columns(columns, args.rows, args.partition_rows,
+                                                 args.days, args.seed))
+        store = ColumnStore([columns])
+        per_minute, first = timed(lambda: store.count(
+            by=["vertex"], bucket=60_000_000, where={"phase": ["route"]}))
+        _, again = timed(lambda: store.count(
+            by=["vertex"], bucket=60_000_000, where={"phase": ["route"]}))
+        last_day = parse_time(START) + int((args.days - 1) * 86400e6)
+        per_hour, hourly = timed(lambda: ColumnStore([columns]).count(
+            by=["type", "phase"], bucket=3_600_000_000, since=last_day))
+        print(json.dumps({
+            "rows": store.rows, "partitions": len(store.partitions),
+            "columns_written_s": written,
+            "routes_per_vertex_per_minute_s": first, "groups": len(per_minute),
+            "same_query_again_s": again,
+            "per_type_phase_hourly_last_day_s": hourly, "hourly_groups": len(per_hour),
+            "rows_per_s": round(store.rows / first),
+        }))
+
+
+if __name__ == "__main__":
+    main()
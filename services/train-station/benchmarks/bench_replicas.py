@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Replica selection benchmark
+===========================
+🚂 Least-loaded (P2C + EWMA) vs. round-robin across vertex replicas
+
+Starts stand-in compute replicas and a Train Station (asyncio server,
+forwarding mode) in separate processes. Each replica serves a few requests
+at a time with a fixed service time; one of them is degraded (slower), as
+when a host is overloaded or its disk is failing. The same load is driven
+through the Train Station with each selection policy:
+
+- round-robin   replicas in turn, regardless of load
+- p2c-ewma      the Train Station's ReplicaSet.choose
+
+Prints one JSON line per policy with throughput and latency percentiles.
+
+Usage: python3 benchmarks/bench_replicas.py [--replicas 3] [--concurrency 24]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_forwarding import drive, free_port, wait_for_port
+
+
+def run_replica(port: int, service_time: float, capacity: int) -> None:
+    """Stand-in compute replica: capacity requests at a time, service_time each."""
+    import async_server
+
+    slots = None
+
+    async def work():
+        nonlocal slots
+        slots = slots or asyncio.Semaphore(capacity)
+        async with slots:
+            await asyncio.sleep(service_time)
+        return 200, {"accepted": True}
+
+    async_server.run(lambda method, path, body: work(), host="127.0.0.1", port=port)
+
+
+def run_train_station(port: int, replica_ports, policy: str, log_dir: str) -> None:
+    logging.disable(logging.INFO)
+    from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex
+    from vertex_proxy import VertexProxy
+    import async_server
+
+    orchestrator = TrainStationOrchestrator(log_path=Path(log_dir) / f"{policy}.log")
+    proxy = VertexProxy(
+        {Vertex.SOUTH_741: [f"http://127.0.0.1:{p}/jobs" for p in replica_ports]},
+        size=64, max_in_flight=1024,
+    )
+    if policy == "round-robin":
+        for replicas in proxy.replicas.values():
+            replicas.choose = itertools.cycle(replicas.replicas).__next__
+    async_server.run(TrainStationAPI(orchestrator, proxy), host="127.0.0.1", port=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=24)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--service-ms", type=float, default=2.0)
+    parser.add_argument("--degraded-ms", type=float, default=40.0,
+                        help="Service time of the degraded replica")
+    parser.add_argument("--capacity", type=int, default=8,
+                        help="Requests each replica serves at once")
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix="train-station-bench-")
+    replica_ports = [free_port() for _ in range(args.replicas)]
+    processes = [
+        multiprocessing.Process(
+            target=run_replica,
+            args=(port, (args.degraded_ms if i == 0 else args.service_ms) / 1000,
+                  args.capacity),
+            daemon=True,
+        )
+        for i, port in enumerate(replica_ports)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        for policy in ("round-robin", "p2c-ewma"):
+            port = free_port()
+            station = multiprocessing.Process(
+                target=run_train_station, args=(port, replica_ports, policy, log_dir),
+                daemon=True,
+            )
+            station.start()
+
+            async def bench():
+                for replica_port in replica_ports:
+                    await wait_for_port(replica_port)
+                await wait_for_port(port)
+                await drive(port, args.concurrency, min(500, args.requests), True)
+                return await drive(port, args.concurrency, args.requests, True)
+
+            try:
+                result = asyncio.run(bench())
+            finally:
+                station.terminate()
+                station.join()
+            print(json.dumps({"policy": policy, "replicas": args.replicas,
+                              "concurrency": args.concurrency, **result}))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Restart benchmark
+=================
+🚂 What clients see while the Train Station restarts
+
+Runs the Train Station (asyncio server) as a separate process, drives
+/route load at it with one connection per request, and restarts it a few
+times during the run, three ways:
+
+- restart         SIGTERM, then start a new process, which binds the port
+                  again (a redeploy without socket activation)
+- socket-unit     the same, but this benchmark holds the listening socket
+                  and passes it to each process (LISTEN_FDS), as a systemd
+                  socket unit does
+- sighup          SIGHUP: the process drains and re-executes itself on the
+                  same socket
+
+For each it prints the failed requests (refused or reset connections) and
+the time to first route: from the stop signal until the new process
+(told apart by ``started`` in /health) has answered a route.
+
+Usage: python3 benchmarks/bench_restart.py [--restarts 5] [--concurrency 8]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_forwarding import free_port, wait_for_port
+
+SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BODY = b'{"type": "compute", "source": "bench"}'
+REQUEST = (b"POST /route HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n"
+           b"Content-Length: %d\r\n\r\n%s" % (len(BODY), BODY))
+
+
+class Station:
+    """The Train Station process, restarted according to mode."""
+
+    def __init__(self, mode: str, port: int, log_dir: str):
+        self.mode = mode
+        self.port = port
+        # As the NixOS service starts it: from cached bytecode, via -m
+        self.command = [sys.executable, "-m", "orchestrator", "--server", "asyncio",
+                        "--port", str(port), "--log-path", os.path.join(log_dir, "ts.log"),
+                        "--dedup-ttl", "0", "--status-stream-interval", "0"]
+        self.sock = None
+        if mode == "socket-unit":
+            self.sock = socket.create_server(("127.0.0.1", port), backlog=4096)
+        self.process = self._start()
+
+    def _start(self) -> subprocess.Popen:
+        if self.sock is None:
+            return subprocess.Popen(self.command, cwd=SOURCE, stderr=subprocess.DEVNULL)
+        # LISTEN_PID must be the Train Station's; exec keeps the shell's pid
+        os.set_inheritable(self.sock.fileno(), True)
+        script = (f'exec 3<&{self.sock.fileno()}; LISTEN_PID=$$ LISTEN_FDS=1 '
+                  f'LISTEN_FDNAMES=http exec "$@"')
+        return subprocess.Popen(["/bin/sh", "-c", script, "sh"] + self.command,
+                                pass_fds=[self.sock.fileno()], cwd=SOURCE,
+                                stderr=subprocess.DEVNULL)
+
+    def restart(self) -> float:
+        """Restart; returns when the stop signal was sent (perf_counter)."""
+        sent = time.perf_counter()
+        if self.mode == "sighup":
+            self.process.send_signal(signal.SIGHUP)
+            return sent
+        self.process.terminate()
+        self.process.wait()
+        self.process = self._start()
+        return sent
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.wait()
+        if self.sock is not None:
+            self.sock.close()
+
+
+async def request(port: int, data: bytes) -> bytes:
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(data)
+        response = await reader.read()
+        writer.close()
+        return response
+    except OSError:
+        return b""
+
+
+async def route(port: int) -> bool:
+    return (await request(port, REQUEST)).startswith(b"HTTP/1.1 200")
+
+
+async def started(port: int) -> str:
+    """When the process answering on port started, or "" if none answered."""
+    response = await request(port, b"GET /health HTTP/1.1\r\nHost: bench\r\n"
+                                   b"Connection: close\r\n\r\n")
+    if not response.startswith(b"HTTP/1.1 200"):
+        return ""
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])["started"]
+
+
+async def bench(station: Station, restarts: int, concurrency: int, interval: float):
+    stop = asyncio.Event()
+    counts = {"ok": 0, "failed": 0}
+
+    async def client():
+        while not stop.is_set():
+            counts["ok" if await route(station.port) else "failed"] += 1
+
+    async def first_route(began: float, old: str) -> float:
+        while await started(station.port) in ("", old):
+            await asyncio.sleep(0.001)
+        while not await route(station.port):
+            await asyncio.sleep(0.001)
+        return (time.perf_counter() - began) * 1000
+
+    await wait_for_port(station.port)
+    clients = [asyncio.create_task(client()) for _ in range(concurrency)]
+    first = []
+    for _ in range(restarts):
+        await asyncio.sleep(interval)
+        old = await started(station.port)
+        # Off the event loop: a plain restart waits for the old process
+        sent = await asyncio.get_running_loop().run_in_executor(None, station.restart)
+        first.append(await first_route(sent, old))
+    await asyncio.sleep(interval)
+    stop.set()
+    await asyncio.gather(*clients)
+    first.sort()
+    return {"requests": counts["ok"] + counts["failed"], "failed": counts["failed"],
+            "first_route_ms_median": round(first[len(first) // 2], 1),
+            "first_route_ms_max": round(first[-1], 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--restarts", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds of load between restarts")
+    parser.add_argument("--modes", default="restart,socket-unit,sighup")
+    args = parser.parse_args()
+
+    log_dir = tempfile.mkdtemp(prefix="train-station-bench-")
+    for mode in args.modes.split(","):
+        station = Station(mode, free_port(), log_dir)
+        try:
+            result = asyncio.run(bench(station, args.restarts, args.concurrency,
+                                       args.interval))
+        finally:
+            station.stop()
+        print(json.dumps({"mode": mode, "restarts": args.restarts, **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Binary route protocol benchmark
+===============================
+🚂 Route calls over HTTP vs. the binary route protocol
+
+Starts Train Stations in separate processes and drives the same route calls
+through each transport from this process:
+
+- http-threaded   TrainStationHTTPHandler, one connection per request
+- http-asyncio    asyncio server, persistent keep-alive connections
+- binary-tcp      binary route protocol over TCP, every call multiplexed
+                  on one connection
+- binary-unix     binary route protocol over a Unix socket, one connection
+
+Prints one JSON line per mode with throughput and latency percentiles.
+
+Usage: python3 benchmarks/bench_route_protocol.py [--concurrency 32] [--requests 5000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socketserver
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_forwarding import build_request, free_port, read_response, wait_for_port
+
+
+def run_threaded(port: int, log_dir: str) -> None:
+    logging.disable(logging.INFO)
+    from orchestrator import TrainStationOrchestrator, TrainStationAPI
+    from threaded_server import TrainStationHTTPHandler
+
+    TrainStationHTTPHandler.api = TrainStationAPI(TrainStationOrchestrator(
+        log_path=Path(log_dir) / "threaded.log"
+    ))
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer(("127.0.0.1", port), TrainStationHTTPHandler) as httpd:
+        httpd.serve_forever()
+
+
+def run_asyncio(port: int, binary_port: int, binary_path: str, log_dir: str) -> None:
+    logging.disable(logging.INFO)
+    from orchestrator import TrainStationOrchestrator, TrainStationAPI
+    import async_server
+    import route_protocol
+
+    api = TrainStationAPI(TrainStationOrchestrator(log_path=Path(log_dir) / "asyncio.log"))
+    unix_socket = route_protocol.bind_unix_socket(binary_path)
+    async_server.run(api, host="127.0.0.1", port=port, listeners=[
+        lambda connections: route_protocol.serve(
+            api.route_message, host="127.0.0.1", port=binary_port, connections=connections),
+        lambda connections: route_protocol.serve(
+            api.route_message, sock=unix_socket, connections=connections),
+    ])
+
+
+async def drive_http(port: int, concurrency: int, total: int, keepalive: bool) -> list:
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        conn = None
+        for i in counter:
+            start = time.perf_counter()
+            if conn is None:
+                conn = await asyncio.open_connection("127.0.0.1", port)
+            reader, writer = conn
+            writer.write(build_request(port, i, keepalive))
+            if keepalive:
+                await read_response(reader)
+            else:
+                # HTTP/1.0 handler: the body ends when the connection closes
+                await reader.read()
+                writer.close()
+                conn = None
+            latencies.append(time.perf_counter() - start)
+        if conn:
+            conn[1].close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def drive_binary(client, concurrency: int, total: int) -> list:
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            await client.route(id=f"bench-{i}", type="compute", source="bench")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def summarize(latencies: list, total: int, elapsed: float) -> dict:
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3, 3)
+
+    return {
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    from route_client import RouteClient
+
+    threaded_port, asyncio_port, binary_port = free_port(), free_port(), free_port()
+    log_dir = tempfile.mkdtemp(prefix="train-station-bench-")
+    binary_path = os.path.join(log_dir, "route.sock")
+    processes = [
+        multiprocessing.Process(target=run_threaded, args=(threaded_port, log_dir), daemon=True),
+        multiprocessing.Process(
+            target=run_asyncio,
+            args=(asyncio_port, binary_port, binary_path, log_dir),
+            daemon=True,
+        ),
+    ]
+    for process in processes:
+        process.start()
+
+    async def bench():
+        for port in (threaded_port, asyncio_port, binary_port):
+            await wait_for_port(port)
+        tcp = await RouteClient.connect("127.0.0.1", binary_port)
+        unix = await RouteClient.connect_unix(binary_path)
+        modes = [
+            ("http-threaded", lambda n: drive_http(threaded_port, args.concurrency, n, False)),
+            ("http-asyncio", lambda n: drive_http(asyncio_port, args.concurrency, n, True)),
+            ("binary-tcp", lambda n: drive_binary(tcp, args.concurrency, n)),
+            ("binary-unix", lambda n: drive_binary(unix, args.concurrency, n)),
+        ]
+        for name, drive in modes:
+            await drive(min(500, args.requests))
+            start = time.perf_counter()
+            latencies = await drive(args.requests)
+            result = summarize(latencies, args.requests, time.perf_counter() - start)
+            print(json.dumps({"mode": name, "concurrency": args.concurrency, **result}))
+        await tcp.close()
+        await unix.close()
+
+    try:
+        asyncio.run(bench())
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
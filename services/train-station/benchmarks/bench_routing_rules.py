@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Routing rule evaluation microbenchmark
+======================================
+🚂 Per-request cost of the compiled rule index vs. a linear rule scan
+
+Generates synthetic rule sets of increasing size (one rule per
+(type, source, payload) combination plus a few wildcard rules) and reports
+the mean time per RuleSet.match() call next to a naive first-match scan
+over the same rules.
+
+Usage: python3 benchmarks/bench_routing_rules.py [--sizes 10 100 1000 10000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from orchestrator import RequestType, Request, resolve_vertex
+from routing_rules import compile_rules
+
+
+VERTICES = ["monitoring", "communication", "transformation",
+            "compute", "transmutation", "storage"]
+TYPES = [t.value for t in RequestType if t is not RequestType.UNKNOWN]
+
+
+def make_rules(count: int, rng: random.Random) -> dict:
+    sources = max(1, count // (len(TYPES) * 4))
+    rules = []
+    for i in range(count):
+        rules.append({
+            "name": f"r{i}",
+            "match": {
+                "type": TYPES[i % len(TYPES)],
+                "source": f"src-{(i // len(TYPES)) % sources}",
+                "payload.tier": {"in": [i % 4, (i + 1) % 4]},
+                "priority": {"gte": i % 10},
+            },
+            "vertex": rng.choice(VERTICES),
+        })
+    # Wildcards that apply to every slot
+    rules.append({"name": "big", "match": {"size": {"gt": 4096}}, "vertex": "storage"})
+    rules.append({"name": "gpu", "match": {"payload.gpu": True}, "vertex": "compute"})
+    return {"rules": rules}, sources
+
+
+def make_requests(count: int, sources: int, rng: random.Random) -> list:
+    return [
+        Request(
+            id=f"req-{i}",
+            type=RequestType(rng.choice(TYPES)),
+            payload={"tier": rng.randrange(4), "gpu": rng.random() < 0.1},
+            source=f"src-{rng.randrange(sources * 2)}",
+            timestamp="",
+            priority=rng.randrange(10),
+        )
+        for i in range(count)
+    ]
+
+
+def linear_match(rules, request):
+    memo = {}
+    for rule in rules:
+        type_ok = rule.keys["type"] is None or request.type.value in rule.keys["type"]
+        source_ok = rule.keys["source"] is None or request.source in rule.keys["source"]
+        if type_ok and source_ok and rule.matches(request, memo):
+            return rule
+    return None
+
+
+def time_per_call(fn, requests, min_time=0.5) -> float:
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for request in requests:
+            fn(request)
+        calls += len(requests)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=852)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        spec, sources = make_rules(size, rng)
+
+        start = time.perf_counter()
+        ruleset = compile_rules(spec, resolve_vertex)
+        compile_s = time.perf_counter() - start
+
+        requests = make_requests(args.requests, sources, rng)
+        for request in requests:
+            assert ruleset.match(request) is linear_match(ruleset.rules, request)
+
+        indexed = time_per_call(ruleset.match, requests)
+        linear = time_per_call(lambda r: linear_match(ruleset.rules, r), requests,
+                               min_time=0.2)
+        results.append({
+            "rules": len(ruleset),
+            "compile_ms": round(compile_s * 1e3, 2),
+            "indexed_us_per_request": round(indexed * 1e6, 3),
+            "linear_us_per_request": round(linear * 1e6, 3),
+        })
+        print(json.dumps(results[-1]))
+
+
+if __name__ == "__main__":
+    main()
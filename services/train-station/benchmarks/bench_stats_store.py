@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Stats store benchmark
+=====================
+🚂 Recovery time against uptime, and what saving stats costs routing
+
+Simulates uptime by running journal/snapshot cycles (one snapshot per
+--journals-per-snapshot journal records, as a minute of one-a-second
+records) with histograms spread over realistic series, then reports:
+
+- the time to restore the counters after 1, 10 and 100 snapshot cycles
+  (plus a partly filled journal), which should not grow with uptime
+- the cost of one journal record and one snapshot
+- /route throughput through TrainStationAPI with the store saving every
+  10 ms on its thread, against no store
+
+Usage: python3 benchmarks/bench_stats_store.py [--requests 20000]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from latency_metrics import LatencyHistograms
+from shared_counters import CounterBlock
+from stats_store import StatsStore
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+PHASES = ["capture", "validate", "route", "handshake", "forward"]
+TYPES = ["build", "compute", "health_check", "store", "api_call", "webhook"]
+VERTICES = ["transformation", "compute", "monitoring", "storage", "intelligence",
+            "communication"]
+
+
+def recovery(directory: Path, cycles: int, journals: int, rng: random.Random) -> dict:
+    path = directory / f"uptime-{cycles}.stats"
+    counters = CounterBlock(TrainStationOrchestrator.COUNTERS)
+    latency = LatencyHistograms()
+    keys = [(p, t, v) for p in PHASES for t, v in zip(TYPES, VERTICES)]
+    store = StatsStore(path, counters, latency)
+    journal_ms, snapshot_ms = [], []
+    # Every cycle but the last ends with a snapshot; the last one is cut
+    # short by a crash halfway through the journal
+    for cycle in range(cycles):
+        records = journals if cycle < cycles - 1 else journals // 2
+        for _ in range(records):
+            for _ in range(50):
+                counters.add(rng.randrange(len(counters.names)))
+                latency.observe(rng.choice(keys), int(rng.lognormvariate(12, 1.5)))
+            start = time.perf_counter()
+            store.journal()
+            journal_ms.append((time.perf_counter() - start) * 1000)
+        if cycle < cycles - 1:
+            start = time.perf_counter()
+            store.snapshot()
+            snapshot_ms.append((time.perf_counter() - start) * 1000)
+
+    restored = StatsStore(path, CounterBlock(TrainStationOrchestrator.COUNTERS),
+                          LatencyHistograms())
+    assert restored.counters.totals() == counters.totals()
+    result = {
+        "snapshot_cycles": cycles,
+        "recovery_ms": round(restored.recovery_ms, 2),
+        "snapshot_bytes": path.stat().st_size if path.exists() else 0,
+        "journal_bytes": store.journal_path.stat().st_size,
+        "journal_ms_median": round(sorted(journal_ms)[len(journal_ms) // 2], 3),
+    }
+    if snapshot_ms:
+        result["snapshot_ms_median"] = round(sorted(snapshot_ms)[len(snapshot_ms) // 2], 3)
+    return result
+
+
+def route_throughput(directory: Path, requests: int, with_store: bool) -> float:
+    orchestrator = TrainStationOrchestrator(log_path=directory / f"route-{with_store}.log")
+    if with_store:
+        orchestrator.stats_store = StatsStore(
+            directory / "route.stats", orchestrator.counters, orchestrator.latency,
+            snapshot_interval=0.1, journal_interval=0.01,
+        )
+        orchestrator.stats_store.start()
+    api = TrainStationAPI(orchestrator)
+    bodies = [json.dumps({"type": t, "source": "bench"}).encode() for t in TYPES]
+    start = time.perf_counter()
+    for i in range(requests):
+        api.handle("POST", "/route", bodies[i % len(bodies)])
+    elapsed = time.perf_counter() - start
+    orchestrator.close()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--journals-per-snapshot", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=852)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="train-station-bench-") as directory:
+        directory = Path(directory)
+        for cycles in (1, 10, 100):
+            print(json.dumps(recovery(directory, cycles, args.journals_per_snapshot, rng)))
+        without = route_throughput(directory, args.requests, with_store=False)
+        saving = route_throughput(directory, args.requests, with_store=True)
+        print(json.dumps({"route_rps_without_store": round(without),
+                          "route_rps_saving_every_10ms": round(saving)}))
+
+
+if __name__ == "__main__":
+    main()
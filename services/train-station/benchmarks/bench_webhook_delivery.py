@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Webhook delivery benchmark
+==========================
+🚂 Delivered webhooks per second and latency against local receivers
+
+Starts --receivers stand-in receivers (async_server apps answering 200
+after --receiver-ms) on this host, then routes --events WEBHOOK requests
+through TrainStationAPI, each fanned out to --fanout of the receivers'
+URLs, and waits for every delivery. Reports deliveries per second, POSTs
+made, and delivery latency (routed to answered: p50/p99/max ms; the
+events come as one burst, so most of it is waiting behind earlier ones),
+for:
+
+- batch: deliveries batched per endpoint (max_batch 100)
+- single: one delivery per POST (max_batch 1), the batch size a sender
+  without batching uses, with the same parallelism
+- endpoints: batched, to --endpoints distinct URLs (each its own
+  endpoint, sharing the receivers' connection pools)
+
+The receivers run on the same loop as the sender, so the rates are a
+floor for a single CPU; with a remote receiver the sender gets the CPU
+to itself.
+
+Usage: python3 benchmarks/bench_webhook_delivery.py [--events 5000] [--fanout 4]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+from webhook_delivery import WebhookDelivery
+
+
+def percentile(values, fraction):
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 2)
+
+
+def bench(directory: Path, name: str, events: int, fanout: int, receivers: int,
+          endpoints: int, receiver_ms: float, max_batch: int) -> dict:
+    orchestrator = TrainStationOrchestrator(log_path=directory / f"{name}.log")
+    webhooks = orchestrator.webhooks = WebhookDelivery(
+        directory / f"{name}.outbox", max_batch=max_batch)
+    api = TrainStationAPI(orchestrator)
+    latencies = []
+    posts = 0
+
+    async def receiver(method, path, body):
+        nonlocal posts
+        posts += 1
+        if receiver_ms:
+            await asyncio.sleep(receiver_ms / 1000)
+        now = time.time()
+        latencies.extend((now - event["event"]["sent"]) * 1000 for event in json.loads(body))
+        return 200, {}
+
+    async def main():
+        servers = [await async_server.serve(receiver, host="127.0.0.1", port=0)
+                   for _ in range(receivers)]
+        urls = [f"http://127.0.0.1:{servers[n % receivers].sockets[0].getsockname()[1]}/hook/{n}"
+                for n in range(endpoints)]
+        webhooks.start()
+        began = time.perf_counter()
+        for i in range(events):
+            chosen = [urls[(i + k) % endpoints] for k in range(fanout)]
+            api.handle("POST", "/route", json.dumps({
+                "id": f"e{i}", "type": "webhook",
+                "payload": {"urls": chosen, "event": {"n": i, "sent": time.time()}},
+            }).encode())
+            if i % 64 == 63:
+                # Let deliveries go out while events keep arriving
+                await asyncio.sleep(0)
+        while webhooks.pending:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - began
+        for server in servers:
+            server.close()
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    stats = webhooks.stats()
+    orchestrator.close()
+    latencies.sort()
+    return {"mode": name, "deliveries": stats["delivered"], "endpoints": endpoints,
+            "max_batch": max_batch, "posts": posts,
+            "deliveries_per_s": round(stats["delivered"] / elapsed),
+            "latency_ms_p50": percentile(latencies, 0.5),
+            "latency_ms_p99": percentile(latencies, 0.99),
+            "latency_ms_max": round(latencies[-1], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--receivers", type=int, default=4)
+    parser.add_argument("--endpoints", type=int, default=256)
+    parser.add_argument("--receiver-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    runs = [("batch", args.fanout, 100), ("single", args.fanout, 1),
+            ("endpoints", args.endpoints, 100)]
+    with tempfile.TemporaryDirectory(prefix="train-station-bench-") as directory:
+        for name, endpoints, max_batch in runs:
+            print(json.dumps(bench(Path(directory), name, args.events, args.fanout,
+                                   args.receivers, endpoints, args.receiver_ms, max_batch)))
+
+
+if __name__ == "__main__":
+    main()
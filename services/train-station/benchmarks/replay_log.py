@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Train Station log replay
+========================
+🚂 Replay captured train-station.log traffic for capacity testing
+
+Reads the CAPTURE records of a Train Station log (the active file, its
+rotated segments in ``<log>.segments/``, or explicit .jsonl/.gz/.xz files)
+and rebuilds the request stream: id, type, source and inter-arrival times.
+Payloads are not logged, so replayed requests carry an empty payload.
+
+The stream is replayed at 1x, Nx (--speed N) or as fast as possible
+(--speed 0) against a running Train Station over HTTP keep-alive
+connections, or in-process against a fresh TrainStationOrchestrator:
+
+- open loop    requests are released on the recorded schedule whatever the
+               server does; latency is measured from the scheduled send
+               time, so queueing behind a slow server is counted
+- closed loop  each worker sends its next request only after the previous
+               response (and not before its scheduled time)
+
+With --timeout-ms every request carries a ``deadline``: its scheduled send
+time plus the timeout, as a caller that gives up after it would send (the
+replay and the Train Station are assumed to share a clock). The report
+then adds goodput: answers that came back 200 within the timeout, per
+second. --no-deadlines keeps the timeout for judging goodput but does not
+send deadlines, for comparison.
+
+Prints one JSON report (throughput, goodput, latency percentiles, status
+counts, error rate). With --baseline, the report is compared to an earlier one and
+the exit status is 1 if throughput or p99 latency regressed more than
+--tolerance.
+
+Usage:
+    python3 benchmarks/replay_log.py /var/log/SOMA/train-station.log \\
+        --target http://127.0.0.1:8520 --speed 10 --workers 64 --loop open
+    python3 benchmarks/replay_log.py ts.log --target inprocess --speed 0 \\
+        --output run.json --baseline previous.json
+    python3 benchmarks/replay_log.py ts.log --speed 20 --timeout-ms 200 \\
+        --loop open --workers 256
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import lzma
+import os
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@dataclass
+class ReplayRequest:
+    """One captured request and when it arrived, relative to the first."""
+    offset: float
+    id: str
+    type: str
+    source: str
+    # Unix time the caller stops waiting, if it sends one
+    deadline: Optional[float] = None
+
+    def fields(self) -> Dict[str, Any]:
+        fields = {"id": self.id, "type": self.type, "source": self.source, "payload": {}}
+        if self.deadline is not None:
+            fields["deadline"] = self.deadline
+        return fields
+
+    def body(self) -> bytes:
+        return json.dumps(self.fields()).encode("utf-8")
+
+
+# -- reading logs ------------------------------------------------------------
+
+def log_files(path: Path) -> List[Path]:
+    """A log file's sealed and pending segments (oldest first), then itself."""
+    segments_dir = path.with_name(path.name + ".segments")
+    files = []
+    if segments_dir.is_dir():
+        sealed = []
+        for meta_path in segments_dir.glob("*.meta.json"):
+            meta = json.loads(meta_path.read_text())
+            sealed.append((meta["seq"], segments_dir / meta["file"]))
+        pending = []
+        for plain in segments_dir.glob("*.jsonl"):
+            match = re.search(r"\.(\d+)\.jsonl$", plain.name)
+            if match:
+                pending.append((int(match.group(1)), plain))
+        files = [file for _, file in sorted(sealed + pending)]
+    if path.exists():
+        files.append(path)
+    return files
+
+
+def read_lines(path: Path) -> Iterator[bytes]:
+    if path.suffix == ".gz":
+        opener = gzip.open
+    elif path.suffix == ".xz":
+        opener = lzma.open
+    else:
+        opener = open
+    with opener(path, "rb") as f:
+        yield from f
+
+
+def load_requests(paths: List[Path]) -> List[ReplayRequest]:
+    """Rebuild the request stream from CAPTURE records, in arrival order."""
+    files: List[Path] = []
+    for path in paths:
+        if path.suffix in (".gz", ".xz", ".jsonl"):
+            files.append(path)
+        else:
+            files.extend(log_files(path))
+
+    captured = []
+    for file in files:
+        for line in read_lines(file):
+            try:
+                record = json.loads(line)
+                data = record["data"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if not isinstance(data, dict) or data.get("phase") != "capture":
+                continue
+            stamp = data.get("timestamp") or record.get("timestamp")
+            try:
+                arrived = datetime.fromisoformat(stamp).timestamp()
+            except (TypeError, ValueError):
+                continue
+            captured.append((arrived, len(captured), data))
+
+    captured.sort()
+    if not captured:
+        return []
+    first = captured[0][0]
+    return [
+        ReplayRequest(
+            offset=arrived - first,
+            id=str(data.get("request_id", f"replay-{n}")),
+            type=str(data.get("type", "unknown")),
+            source=str(data.get("source", "replay")),
+        )
+        for arrived, n, data in captured
+    ]
+
+
+# -- targets -----------------------------------------------------------------
+
+class HTTPTarget:
+    """POST /route over persistent HTTP/1.1 connections, one per worker."""
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 8520
+        self.timeout = timeout
+
+    def connection(self) -> "_HTTPConnection":
+        return _HTTPConnection(self)
+
+    def close(self) -> None:
+        pass
+
+
+class _HTTPConnection:
+    def __init__(self, target: HTTPTarget):
+        self.target = target
+        self.streams = None
+
+    async def send(self, request: ReplayRequest) -> int:
+        target = self.target
+        body = request.body()
+        head = (
+            f"POST /route HTTP/1.1\r\nHost: {target.host}:{target.port}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1")
+        try:
+            if self.streams is None:
+                self.streams = await asyncio.wait_for(
+                    asyncio.open_connection(target.host, target.port), target.timeout
+                )
+            reader, writer = self.streams
+            writer.write(head + body)
+            return await asyncio.wait_for(self._read(reader), target.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _read(self, reader: asyncio.StreamReader) -> int:
+        raw = await reader.readuntil(b"\r\n\r\n")
+        lines = raw.split(b"\r\n")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+        if b"content-length" in headers:
+            await reader.readexactly(int(headers[b"content-length"]))
+        elif headers.get(b"transfer-encoding", b"").lower() == b"chunked":
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            # HTTP/1.0 (threaded server): the body ends with the connection
+            await reader.read()
+            self.close()
+        return int(lines[0].split(b" ", 2)[1])
+
+    def close(self) -> None:
+        if self.streams is not None:
+            self.streams[1].close()
+            self.streams = None
+
+
+class InProcessTarget:
+    """Run the Triadic Handshake directly on a fresh orchestrator."""
+
+    def __init__(self, log_dir: Optional[Path] = None):
+        from orchestrator import TrainStationOrchestrator, parse_request
+        self._parse = parse_request
+        self._log_dir = log_dir or Path(tempfile.mkdtemp(prefix="train-station-replay-"))
+        self.orchestrator = TrainStationOrchestrator(log_path=self._log_dir / "replay.log")
+
+    def connection(self) -> "InProcessTarget":
+        return self
+
+    async def send(self, request: ReplayRequest) -> int:
+        # Same status the HTTP API gives: failed handshakes are still a 200
+        result = self.orchestrator.route_request(self._parse(request.fields()))
+        return 504 if result.expired else 200
+
+    def close(self) -> None:
+        self.orchestrator.close()
+
+
+# -- replay ------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self, timeout: Optional[float] = None):
+        self.latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+        # Answers in time to be of use to a caller with this timeout
+        self.timeout = timeout
+        self.on_time = 0
+
+    def record(self, status: Optional[int], latency: float) -> None:
+        key = str(status) if status is not None else "error"
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if status == 200 and self.timeout is not None and latency <= self.timeout:
+            self.on_time += 1
+        if status is None or status >= 500:
+            self.errors += 1
+        else:
+            self.latencies.append(latency)
+
+
+async def _send(connection, request: ReplayRequest, recorder: Recorder,
+                started: float) -> None:
+    try:
+        status = await connection.send(request)
+    except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        status = None
+    recorder.record(status, time.perf_counter() - started)
+
+
+async def replay(requests: List[ReplayRequest], target, speed: float = 1.0,
+                 workers: int = 32, loop_mode: str = "open",
+                 timeout: Optional[float] = None,
+                 send_deadlines: bool = False) -> Dict[str, Any]:
+    """Replay requests against target and return the report."""
+    recorder = Recorder(timeout)
+    clock = time.perf_counter
+    begin = clock()
+    wall_offset = time.time() - begin
+
+    def due(request: ReplayRequest) -> float:
+        scheduled = begin + request.offset / speed if speed > 0 else begin
+        if send_deadlines:
+            request.deadline = wall_offset + scheduled + timeout
+        return scheduled
+
+    if loop_mode == "open":
+        pending: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            connection = target.connection()
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                request, scheduled = item
+                await _send(connection, request, recorder, scheduled)
+
+        tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+        for request in requests:
+            delay = due(request) - clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            pending.put_nowait((request, due(request)))
+        for _ in tasks:
+            pending.put_nowait(None)
+        await asyncio.gather(*tasks)
+    else:
+        stream = iter(requests)
+
+        async def worker():
+            connection = target.connection()
+            for request in stream:
+                delay = due(request) - clock()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await _send(connection, request, recorder, clock())
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    elapsed = clock() - begin
+    return report(requests, recorder, elapsed, speed, workers, loop_mode)
+
+
+def report(requests: List[ReplayRequest], recorder: Recorder, elapsed: float,
+           speed: float, workers: int, loop_mode: str) -> Dict[str, Any]:
+    latencies = sorted(recorder.latencies)
+
+    def pct(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3, 3)
+
+    span = requests[-1].offset if requests else 0.0
+    goodput = {}
+    if recorder.timeout is not None:
+        goodput = {
+            "timeout_ms": round(recorder.timeout * 1e3, 3),
+            "on_time": recorder.on_time,
+            "goodput_rps": round(recorder.on_time / elapsed, 1) if elapsed else None,
+        }
+    return {
+        "loop": loop_mode,
+        "speed": speed if speed > 0 else "max",
+        "workers": workers,
+        "requests": len(requests),
+        "completed": len(latencies),
+        "errors": recorder.errors,
+        "error_rate": round(recorder.errors / len(requests), 6) if requests else 0.0,
+        "statuses": dict(sorted(recorder.statuses.items())),
+        "duration_s": round(elapsed, 3),
+        "offered_rps": round(len(requests) / (span / speed), 1) if span and speed > 0 else None,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        **goodput,
+        "latency_ms": {
+            "p50": pct(0.50), "p90": pct(0.90), "p95": pct(0.95),
+            "p99": pct(0.99), "p999": pct(0.999),
+            "max": round(latencies[-1] * 1e3, 3) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies) * 1e3, 3) if latencies else None,
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float) -> List[str]:
+    """Regressions of current against baseline beyond tolerance (a fraction)."""
+    regressions = []
+    if current.get("throughput_rps") and baseline.get("throughput_rps"):
+        if current["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"throughput {current['throughput_rps']} < {baseline['throughput_rps']} rps"
+            )
+    p99, base_p99 = current["latency_ms"].get("p99"), baseline["latency_ms"].get("p99")
+    if p99 is not None and base_p99 is not None and p99 > base_p99 * (1 + tolerance):
+        regressions.append(f"p99 {p99} > {base_p99} ms")
+    if current["error_rate"] > baseline["error_rate"] * (1 + tolerance) + 0.001:
+        regressions.append(
+            f"error rate {current['error_rate']} > {baseline['error_rate']}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("logs", type=Path, nargs="+",
+                        help="train-station.log (its segments are included) "
+                             "or individual segment files")
+    parser.add_argument("--target", default="http://127.0.0.1:8520",
+                        help="Train Station URL, or 'inprocess'")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed multiplier; 0 replays as fast as possible")
+    parser.add_argument("--loop", choices=["open", "closed"], default="open")
+    parser.add_argument("--workers", type=int, default=32,
+                        help="Concurrent connections / workers")
+    parser.add_argument("--limit", type=int, default=0,
+                        help="Replay at most this many requests")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--timeout-ms", type=float,
+                        help="Callers' timeout: requests carry the deadline it "
+                             "gives, and answers later than it are not goodput")
+    parser.add_argument("--no-deadlines", action="store_true",
+                        help="With --timeout-ms, judge goodput but do not send it")
+    parser.add_argument("--output", type=Path, help="Also write the report here")
+    parser.add_argument("--baseline", type=Path,
+                        help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed regression as a fraction (default: 0.10)")
+    args = parser.parse_args()
+
+    requests = load_requests(args.logs)
+    if args.limit:
+        requests = requests[:args.limit]
+    if not requests:
+        parser.error("No CAPTURE records found")
+
+    if args.target == "inprocess":
+        # Per-phase INFO logging would dominate the measurement
+        logging.disable(logging.INFO)
+        target = InProcessTarget()
+    else:
+        target = HTTPTarget(args.target, args.timeout)
+    try:
+        timeout = args.timeout_ms / 1000 if args.timeout_ms is not None else None
+        result = asyncio.run(replay(requests, target, args.speed, args.workers, args.loop,
+                                    timeout, timeout is not None and not args.no_deadlines))
+    finally:
+        target.close()
+    result["target"] = args.target
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n")
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Body Reader
+==============================
+🚂 Streaming request bodies: chunked transfer-coding, caps, spooling (852 Hz)
+
+Request bodies are consumed as they arrive instead of being read whole:
+
+- ChunkedDecoder       incremental ``Transfer-Encoding: chunked`` decoder
+                       over the asyncio server's receive buffer
+- iter_body            the same for a blocking ``rfile`` (http.server),
+                       with Content-Length or chunked framing
+- RouteBodyParser      incremental scan of a POST /route JSON object: the
+                       top-level fields are kept (and capped), while the
+                       ``payload`` value is copied as raw bytes into a
+                       SpooledTemporaryFile that moves to disk past
+                       ``spool_memory`` bytes
+
+A spooled payload is never decoded: the scanner only checks that its
+brackets balance and its strings end, and it is forwarded to the vertex
+backend byte for byte (StreamedBody). Small payloads are decoded as usual,
+so payload-aware routing rules still see them; a spooled payload only
+offers its size.
+
+Limits are enforced while reading: a body over its cap is refused with a
+BodyRejected (413) as soon as the cap is passed, not after the whole body
+has been read. Peak memory is the spool threshold plus one receive buffer,
+whatever the size of the body.
+"""
+
+import json
+import re
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Union
+
+
+# Longest chunk-size or trailer line accepted
+MAX_CHUNK_LINE = 4096
+READ_CHUNK = 64 * 1024
+
+# Bodies the HTTP servers buffer whole, and streamed (/route/batch) bodies
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_STREAM_BODY_BYTES = 1024 * 1024 * 1024
+
+# Defaults for POST /route bodies
+MAX_INLINE_BYTES = 1024 * 1024           # fields and payloads kept in memory
+MAX_SPOOL_BYTES = 1024 * 1024 * 1024     # spooled payloads
+SPOOL_MEMORY = 1024 * 1024               # spool size before it moves to disk
+
+_CHUNK_SIZE = re.compile(rb"[0-9A-Fa-f]{1,16}")
+# Top level: everything that can start or end a field
+_STRUCTURAL = re.compile(rb'["{}\[\],:]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+# Nested values: skip plain runs and complete strings (possessive, so an
+# unterminated string at the end of a piece cannot backtrack)
+_NESTED_SKIP = re.compile(rb'(?:[^"\[\]{}]++|"(?:[^"\\]++|\\.)*+")*+', re.DOTALL)
+_WHITESPACE = b" \t\r\n"
+
+
+class BodyRejected(Exception):
+    """A request body refused while it was being read (status 413 or 400)."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _chunk_size(line: bytes) -> int:
+    size = line.split(b";", 1)[0].strip()
+    if not _CHUNK_SIZE.fullmatch(size):
+        raise BodyRejected(400, "Malformed chunk size")
+    return int(size, 16)
+
+
+class ChunkedDecoder:
+    """Incremental decoder of a chunked request body."""
+
+    _SIZE, _DATA, _DATA_END, _TRAILER, _DONE = range(5)
+
+    def __init__(self):
+        self._state = self._SIZE
+        self._remaining = 0
+        self.done = False
+
+    def feed(self, buffer: bytearray) -> bytes:
+        """
+        Decode what buffer holds, consuming it in place; bytes after the
+        end of the body (a pipelined request) are left in buffer.
+        """
+        out: List[bytes] = []
+        while True:
+            state = self._state
+            if state == self._DATA:
+                take = min(len(buffer), self._remaining)
+                if not take:
+                    break
+                out.append(bytes(buffer[:take]))
+                del buffer[:take]
+                self._remaining -= take
+                if not self._remaining:
+                    self._state = self._DATA_END
+            elif state == self._SIZE or state == self._TRAILER:
+                end = buffer.find(b"\r\n")
+                if end < 0:
+                    if len(buffer) > MAX_CHUNK_LINE:
+                        raise BodyRejected(400, "Chunk line too long")
+                    break
+                line = bytes(buffer[:end])
+                del buffer[:end + 2]
+                if state == self._TRAILER:
+                    # Trailer fields are ignored; an empty line ends the body
+                    if not line:
+                        self._state = self._DONE
+                        self.done = True
+                        break
+                    continue
+                size = _chunk_size(line)
+                if size:
+                    self._remaining = size
+                    self._state = self._DATA
+                else:
+                    self._state = self._TRAILER
+            elif state == self._DATA_END:
+                if len(buffer) < 2:
+                    break
+                if buffer[:2] != b"\r\n":
+                    raise BodyRejected(400, "Malformed chunk")
+                del buffer[:2]
+                self._state = self._SIZE
+            else:
+                break
+        return b"".join(out)
+
+
+def body_length(headers: Dict[str, str]) -> Optional[int]:
+    """
+    Content-Length of a request from its (lower-cased) headers, or None
+    for a chunked body. BodyRejected for framing the server cannot trust.
+    """
+    coding = headers.get("transfer-encoding")
+    if coding is not None:
+        if coding.strip().lower() != "chunked":
+            raise BodyRejected(501, f"Unsupported transfer-coding: {coding}")
+        if "content-length" in headers:
+            # Either one could be the real framing (request smuggling)
+            raise BodyRejected(400, "Both Transfer-Encoding and Content-Length")
+        return None
+    length = headers.get("content-length", "0")
+    if not length.isdigit():
+        raise BodyRejected(400, "Invalid Content-Length")
+    return int(length)
+
+
+def iter_body(rfile: BinaryIO, length: Optional[int],
+              limit: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Body pieces read from a blocking stream: length bytes, or a chunked
+    body when length is None. BodyRejected past limit or on bad framing.
+    """
+    received = 0
+    if length is not None:
+        if limit is not None and length > limit:
+            raise BodyRejected(413, f"Body over {limit} bytes")
+        while received < length:
+            data = rfile.read(min(length - received, READ_CHUNK))
+            if not data:
+                raise BodyRejected(400, "Body ended early")
+            received += len(data)
+            yield data
+        return
+
+    while True:
+        line = rfile.readline(MAX_CHUNK_LINE + 1)
+        if not line.endswith(b"\r\n"):
+            raise BodyRejected(400, "Malformed chunk line")
+        size = _chunk_size(line[:-2])
+        if not size:
+            break
+        received += size
+        if limit is not None and received > limit:
+            raise BodyRejected(413, f"Body over {limit} bytes")
+        while size:
+            data = rfile.read(min(size, READ_CHUNK))
+            if not data:
+                raise BodyRejected(400, "Body ended early")
+            size -= len(data)
+            yield data
+        if rfile.read(2) != b"\r\n":
+            raise BodyRejected(400, "Malformed chunk")
+    while True:
+        line = rfile.readline(MAX_CHUNK_LINE + 1)
+        if line in (b"\r\n", b""):
+            return
+        if not line.endswith(b"\r\n"):
+            raise BodyRejected(400, "Malformed trailer")
+
+
+class SpooledPayload:
+    """A request payload held as raw JSON bytes in a spool file."""
+
+    def __init__(self, spool: BinaryIO, size: int):
+        self.spool = spool
+        self.size = size
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self.spool, "_rolled", True))
+
+    def chunks(self, chunk_size: int = READ_CHUNK) -> Iterator[bytes]:
+        """The payload's JSON text, from the start, in pieces."""
+        self.spool.seek(0)
+        while True:
+            data = self.spool.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+    def close(self) -> None:
+        """Drop the spool (and its file)."""
+        self.spool.close()
+
+    def __repr__(self) -> str:
+        return f"SpooledPayload({self.size} bytes)"
+
+
+class StreamedBody:
+    """A request body of bytes and spooled payloads, sent without joining them."""
+
+    def __init__(self, parts: Sequence[Union[bytes, SpooledPayload]]):
+        self.parts = parts
+
+    def __len__(self) -> int:
+        return sum(part.size if isinstance(part, SpooledPayload) else len(part)
+                   for part in self.parts)
+
+    def chunks(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, SpooledPayload):
+                yield from part.chunks()
+            else:
+                yield part
+
+
+def json_with_payload(fields: Dict[str, Any], payload: SpooledPayload) -> StreamedBody:
+    """fields as a JSON object with the spooled payload as its "payload"."""
+    head = json.dumps(fields)
+    return StreamedBody([head[:-1].encode("utf-8") + b', "payload": ', payload, b"}"])
+
+
+class BodyLimits:
+    """Caps and spooling for POST /route bodies."""
+
+    __slots__ = ("spool_types", "max_inline", "max_spool", "spool_memory", "spool_dir")
+
+    def __init__(self, spool_types: Sequence[str] = (),
+                 max_inline: int = MAX_INLINE_BYTES,
+                 max_spool: int = MAX_SPOOL_BYTES,
+                 spool_memory: int = SPOOL_MEMORY,
+                 spool_dir: Optional[str] = None):
+        self.spool_types = spool_types
+        self.max_inline = max_inline
+        self.max_spool = max_spool
+        self.spool_memory = spool_memory
+        self.spool_dir = spool_dir
+
+    @property
+    def max_body(self) -> int:
+        """Largest whole body: the fields plus a spooled payload."""
+        return self.max_inline + self.max_spool
+
+    def parser(self) -> "RouteBodyParser":
+        return RouteBodyParser(self.spool_types, self.max_inline, self.max_spool,
+                               self.spool_memory, self.spool_dir)
+
+
+class RouteBodyParser:
+    """
+    Push parser for a POST /route JSON object, spooling its payload.
+
+    feed() takes body bytes; close() returns (fields, payload) where
+    payload is the decoded value when it fits in max_inline bytes, a
+    SpooledPayload when the request type allows spooling, and otherwise
+    the body is refused. The type is checked as soon as both it and a
+    too-large payload have been seen.
+    """
+
+    def __init__(self, spool_types: Sequence[str] = (),
+                 max_inline: int = MAX_INLINE_BYTES,
+                 max_spool: int = MAX_SPOOL_BYTES,
+                 spool_memory: int = SPOOL_MEMORY,
+                 spool_dir: Optional[str] = None):
+        self.spool_types = set(spool_types)
+        self.max_inline = max_inline
+        self.max_spool = max_spool
+        self.spool_memory = spool_memory
+        self.spool_dir = spool_dir
+
+        # Everything but the payload value, which is replaced by null
+        self._head = bytearray()
+        self._spool: Optional[BinaryIO] = None
+        self.payload_bytes = 0
+        self.type: Optional[str] = None
+
+        self._started = False
+        self._finished = False
+        self._stack = bytearray()      # open brackets
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key: Optional[bytearray] = None
+        self._key_from = 0
+        self._current_key = b""
+        self._value_start = 0          # offset in _head of a top-level value
+        self._in_payload = False
+        self._seen_payload = False
+
+    # -- output ------------------------------------------------------------
+
+    def _to_head(self, data: bytes) -> None:
+        if len(self._head) + len(data) > self.max_inline:
+            raise BodyRejected(413, f"Request fields over {self.max_inline} bytes")
+        self._head += data
+
+    def _to_payload(self, data: bytes) -> None:
+        if not data:
+            return
+        self.payload_bytes += len(data)
+        if self.payload_bytes > self.max_inline:
+            if self.payload_bytes > self.max_spool:
+                raise BodyRejected(413, f"Payload over {self.max_spool} bytes")
+            self._check_spoolable()
+        if self._spool is None:
+            self._spool = tempfile.SpooledTemporaryFile(
+                max_size=self.spool_memory, dir=self.spool_dir
+            )
+        self._spool.write(data)
+
+    def _check_spoolable(self) -> None:
+        if self.type is not None and self.type not in self.spool_types:
+            raise BodyRejected(
+                413, f"Payload over {self.max_inline} bytes for type {self.type!r}"
+            )
+
+    # -- scanning ----------------------------------------------------------
+
+    def feed(self, data: bytes) -> None:
+        """Consume the next piece of the body."""
+        if not self._started:
+            stripped = data.lstrip(_WHITESPACE)
+            if not stripped:
+                return
+            if stripped[:1] != b"{":
+                raise BodyRejected(400, "Request body must be a JSON object")
+            self._started = True
+        elif self._finished:
+            if data.strip(_WHITESPACE):
+                raise BodyRejected(400, "Data after the request object")
+            return
+
+        # Bytes from mark go to the head or the payload, whichever is current
+        mark = pos = 0
+        end = len(data)
+        if self._escape:
+            self._escape = False
+            pos = 1
+        stack = self._stack
+        while pos < end:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(data, pos)
+                if match is None:
+                    break
+                pos = match.start()
+                if data[pos] == 0x5C:  # backslash: the next byte is escaped
+                    if pos + 1 == end:
+                        self._escape = True
+                    pos += 2
+                    continue
+                self._in_string = False
+                if self._key is not None:
+                    self._key += data[self._key_from:pos]
+                    self._current_key = bytes(self._key)
+                    self._key = None
+                pos += 1
+                continue
+
+            if len(stack) > 1:
+                # Inside a nested value: only brackets and strings matter,
+                # and whole strings and runs between brackets are skipped
+                # in one regex step
+                pos = _NESTED_SKIP.match(data, pos).end()
+                if pos == end:
+                    break
+                char = data[pos]
+                if char == 0x22:
+                    # A string that goes on in the next piece
+                    self._in_string = True
+                elif char == 0x7B or char == 0x5B:
+                    stack.append(char)
+                elif stack[-1] != (0x7B if char == 0x7D else 0x5B):
+                    raise BodyRejected(400, "Malformed JSON: unbalanced brackets")
+                else:
+                    stack.pop()
+                pos += 1
+                continue
+
+            match = _STRUCTURAL.search(data, pos)
+            if match is None:
+                break
+            pos = match.start()
+            char = data[pos]
+            depth = len(stack)
+            if char == 0x22:
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key = bytearray()
+                    self._key_from = pos + 1
+                    self._expect_key = False
+            elif char == 0x7B or char == 0x5B:
+                stack.append(char)
+                if depth == 0:
+                    self._expect_key = True
+            elif char == 0x7D or char == 0x5D:
+                if not stack or stack[-1] != (0x7B if char == 0x7D else 0x5B):
+                    raise BodyRejected(400, "Malformed JSON: unbalanced brackets")
+                mark = self._end_value(data, mark, pos)
+                stack.pop()
+                self._to_head(data[mark:pos + 1])
+                mark = pos + 1
+                self._finished = True
+                if data[mark:].strip(_WHITESPACE):
+                    raise BodyRejected(400, "Data after the request object")
+                return
+            elif depth == 1:
+                if char == 0x2C:  # ,
+                    mark = self._end_value(data, mark, pos)
+                    self._expect_key = True
+                elif char == 0x3A:  # :
+                    self._to_head(data[mark:pos + 1])
+                    mark = pos + 1
+                    self._value_start = len(self._head)
+                    if self._current_key == b"payload":
+                        if self._seen_payload:
+                            raise BodyRejected(400, "Duplicate payload")
+                        self._seen_payload = self._in_payload = True
+            pos += 1
+
+        if self._key is not None:
+            # A key split across pieces
+            self._key += data[self._key_from:]
+            self._key_from = 0
+        if self._in_payload:
+            self._to_payload(data[mark:])
+        else:
+            self._to_head(data[mark:])
+
+    def _end_value(self, data: bytes, mark: int, pos: int) -> int:
+        """A top-level value ends at pos; returns the new mark."""
+        if self._in_payload:
+            self._to_payload(data[mark:pos])
+            self._in_payload = False
+            self._to_head(b"null")
+        else:
+            self._to_head(data[mark:pos])
+            if self._current_key == b"type":
+                try:
+                    value = json.loads(bytes(self._head[self._value_start:]))
+                except ValueError:
+                    raise BodyRejected(400, "Malformed request type") from None
+                self.type = value if isinstance(value, str) else None
+                if self.payload_bytes > self.max_inline:
+                    self._check_spoolable()
+        self._current_key = b""
+        return pos
+
+    def close(self) -> "tuple[Dict[str, Any], Any]":
+        """End of body: the top-level fields and the payload."""
+        if not self._finished:
+            self.discard()
+            raise BodyRejected(400, "Request body ended inside the JSON object")
+        try:
+            fields = json.loads(bytes(self._head))
+        except ValueError as e:
+            self.discard()
+            raise BodyRejected(400, f"Invalid JSON: {e}") from None
+        fields.pop("payload", None)
+
+        if self._spool is None:
+            return fields, {}
+        if self.payload_bytes <= self.max_inline:
+            self._spool.seek(0)
+            raw = self._spool.read()
+            self.discard()
+            try:
+                return fields, json.loads(raw)
+            except ValueError as e:
+                raise BodyRejected(400, f"Invalid JSON payload: {e}") from None
+        self.type = fields.get("type")
+        try:
+            self._check_spoolable()
+        except BodyRejected:
+            self.discard()
+            raise
+        spool, self._spool = self._spool, None
+        spool.flush()
+        return fields, SpooledPayload(spool, self.payload_bytes)
+
+    def discard(self) -> None:
+        """Drop anything spooled so far."""
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
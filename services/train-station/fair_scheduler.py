@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Fair Scheduler
+=================================
+🚂 Per-vertex bounded queues with deficit round-robin dispatch (852 Hz)
+
+Every vertex has its own bounded queue of pending route jobs. A dispatcher
+running on the event loop starts at most ``max_concurrent`` jobs at a time
+and picks them by deficit round-robin: on each turn a vertex earns its
+weight in credit and may start one job per whole credit. A flood of BUILD or
+ML_TRAINING work therefore only fills its own vertex queue, while
+HEALTH_CHECK and MONITOR traffic keeps getting its share of dispatch slots.
+
+Within a vertex queue jobs run earliest deadline first. A job submitted
+without a deadline is ordered as if it had one ``horizon`` seconds after it
+was queued, so it still runs in turn and is never starved by a stream of
+jobs with deadlines; jobs without deadlines keep their FIFO order. (The
+job itself drops a request whose deadline has passed by the time it runs.)
+
+A full queue rejects immediately with QueueFull, carrying a Retry-After
+estimate, instead of letting latency grow without bound.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+
+# Seconds until the effective deadline of a job queued without one
+DEFAULT_HORIZON = 30.0
+
+
+class QueueFull(Exception):
+    """A vertex queue is at capacity."""
+
+    def __init__(self, key: Hashable, retry_after: int):
+        super().__init__(f"Queue for {getattr(key, 'vertex_name', key)} is full")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class _VertexQueue:
+    __slots__ = ("jobs", "capacity", "weight", "deficit", "in_turn",
+                 "admitted", "rejected", "completed", "cancelled", "drain_rate",
+                 "window_start", "window_count")
+
+    def __init__(self, capacity: int, weight: float):
+        # Heap of (deadline, sequence, job, future)
+        self.jobs: List = []
+        self.capacity = capacity
+        self.weight = weight
+        self.deficit = 0.0
+        self.in_turn = False
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.cancelled = 0
+        # Jobs/second over the last window, for Retry-After estimates
+        self.drain_rate = 0.0
+        self.window_start = 0.0
+        self.window_count = 0
+
+
+class FairScheduler:
+    """Weighted fair (deficit round-robin) dispatcher over per-key queues."""
+
+    def __init__(self, weights: Optional[Dict[Hashable, float]] = None,
+                 capacity: int = 1024, max_concurrent: int = 64,
+                 default_weight: float = 1.0, horizon: float = DEFAULT_HORIZON):
+        self.weights = dict(weights or {})
+        self.capacity = capacity
+        self.max_concurrent = max_concurrent
+        self.default_weight = default_weight
+        self.horizon = horizon
+        self._sequence = itertools.count()
+
+        self._queues: Dict[Hashable, _VertexQueue] = {}
+        self._active: Deque[Hashable] = deque()
+        self._running = 0
+        self._dispatch_pending = False
+
+    def _queue(self, key: Hashable) -> _VertexQueue:
+        queue = self._queues.get(key)
+        if queue is None:
+            weight = self.weights.get(key, self.default_weight)
+            if weight <= 0:
+                raise ValueError(f"Weight for {key} must be positive")
+            queue = self._queues[key] = _VertexQueue(self.capacity, weight)
+        return queue
+
+    # -- admission ---------------------------------------------------------
+
+    def submit(self, key: Hashable, job: Callable[[], Any],
+               deadline: Optional[float] = None) -> asyncio.Future:
+        """
+        Queue job for key, ordered by deadline (event loop time); the
+        returned future resolves to job()'s result (awaited if job()
+        returns an awaitable). Raises QueueFull when the key's queue is at
+        capacity.
+        """
+        queue = self._queue(key)
+        if len(queue.jobs) >= queue.capacity:
+            queue.rejected += 1
+            raise QueueFull(key, self._retry_after(queue))
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not queue.jobs and not queue.in_turn:
+            self._active.append(key)
+        if deadline is None:
+            deadline = loop.time() + self.horizon
+        heapq.heappush(queue.jobs, (deadline, next(self._sequence), job, future))
+        queue.admitted += 1
+
+        if not self._dispatch_pending:
+            self._dispatch_pending = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    def _retry_after(self, queue: _VertexQueue) -> int:
+        if queue.drain_rate <= 0:
+            return 1
+        return max(1, math.ceil(len(queue.jobs) / queue.drain_rate))
+
+    # -- dispatch ----------------------------------------------------------
+
+    def _next(self):
+        """Pop the next (key, job, future) in deficit round-robin order."""
+        while self._active:
+            key = self._active[0]
+            queue = self._queues[key]
+            if not queue.in_turn:
+                queue.deficit += queue.weight
+                queue.in_turn = True
+            if queue.jobs and queue.deficit >= 1:
+                queue.deficit -= 1
+                _, _, job, future = heapq.heappop(queue.jobs)
+                return key, job, future
+
+            # Turn over: idle queues leave the rotation and lose credit
+            queue.in_turn = False
+            self._active.popleft()
+            if queue.jobs:
+                self._active.append(key)
+            else:
+                queue.deficit = 0.0
+        return None
+
+    def _dispatch(self) -> None:
+        self._dispatch_pending = False
+        while self._running < self.max_concurrent:
+            item = self._next()
+            if item is None:
+                return
+            key, job, future = item
+            if future.cancelled():
+                self._queues[key].cancelled += 1
+                continue
+            self._start(key, job, future)
+
+    def _start(self, key: Hashable, job: Callable[[], Any],
+               future: asyncio.Future) -> None:
+        try:
+            result = job()
+        except Exception as e:
+            future.set_exception(e)
+            self._completed(key)
+            return
+
+        if not asyncio.isfuture(result) and not asyncio.iscoroutine(result):
+            future.set_result(result)
+            self._completed(key)
+            return
+
+        self._running += 1
+        task = asyncio.ensure_future(result)
+
+        def done(task):
+            self._running -= 1
+            if not future.cancelled():
+                if task.cancelled():
+                    future.cancel()
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+            self._completed(key)
+            self._dispatch()
+
+        task.add_done_callback(done)
+
+    def _completed(self, key: Hashable) -> None:
+        queue = self._queues[key]
+        queue.completed += 1
+        queue.window_count += 1
+        now = asyncio.get_running_loop().time()
+        if not queue.window_start:
+            queue.window_start = now
+            return
+        elapsed = now - queue.window_start
+        if elapsed >= 1.0:
+            queue.drain_rate = queue.window_count / elapsed
+            queue.window_start = now
+            queue.window_count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-queue counters for the status endpoint."""
+        return {
+            "running": self._running,
+            "max_concurrent": self.max_concurrent,
+            "queues": {
+                getattr(key, "vertex_name", str(key)): {
+                    "depth": len(queue.jobs),
+                    "capacity": queue.capacity,
+                    "weight": queue.weight,
+                    "admitted": queue.admitted,
+                    "rejected": queue.rejected,
+                    "completed": queue.completed,
+                    "cancelled": queue.cancelled,
+                }
+                for key, queue in self._queues.items()
+            },
+        }
+
+    def prometheus(self) -> str:
+        """Queue depths and admission counters in Prometheus text format."""
+        queues = self.stats()["queues"]
+        lines = []
+        for metric, kind, field, help_text in (
+            ("train_station_queue_depth", "gauge", "depth",
+             "Requests waiting in the vertex queue."),
+            ("train_station_queue_admitted_total", "counter", "admitted",
+             "Requests admitted to the vertex queue."),
+            ("train_station_queue_rejected_total", "counter", "rejected",
+             "Requests rejected because the vertex queue was full."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for vertex, stats in queues.items():
+                lines.append(f'{metric}{{vertex="{vertex}"}} {stats[field]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Job Scheduler
+================================
+🚂 Delayed and recurring route requests (852 Hz)
+
+POST /schedule registers a job: a route request body (``request``) and
+when to route it, one of
+
+- ``run_at``       once, at a Unix time in seconds or an ISO timestamp
+- ``interval_ms``  every interval, from ``run_at`` if given (otherwise
+                   one interval after the job was added)
+- ``cron``         a five-field cron expression, in local time
+
+When a job comes due its request takes the same handshake as a POST
+/route call, with the id ``<job id>@<due time in ms>``, so the dedup cache
+and the log tell its runs apart.
+
+Pending jobs sit in a hierarchical timer wheel with 1 ms ticks: five
+levels of 256 slots, the first level covering the next 256 ms and each
+further one 256 times as much (about 34 years in all). A timer goes into
+the slot of the level its delay falls in, and cancelling takes it out of
+that slot again, both O(1) however many are pending. When a lower level
+comes round, the timers of the next higher slot move down (cascade), so a
+timer is moved at most four times before it fires. The scheduler sleeps
+on the event loop until the next occupied tick, stepping over empty ticks
+and levels at once.
+
+Jobs survive restarts in an append-only journal of JSON lines (``add``
+and ``remove`` records), fsynced before POST /schedule answers and
+rewritten with the live jobs only once most of it is removed jobs. On
+startup it is replayed: one-off jobs that came due while the Train Station
+was down run at once; recurring ones carry on from their next occurrence,
+without catching up on those missed. A one-off job is removed from the
+journal after it was routed, so a crash in between routes it again on
+restart (at least once).
+
+Jobs fire on the asyncio loop, the thread that routes every other
+request, so routing them needs no locks.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+import request_ids
+from json_journal import JsonJournal
+
+
+logger = logging.getLogger(__name__)
+
+SLOT_BITS = 8
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 5
+# Longest delay the wheel holds; later timers wait in the top level and
+# are put back there until they are within reach
+MAX_DELAY = (1 << (SLOT_BITS * LEVELS)) - 1
+
+# (name, lowest, highest) of the cron fields; 7 is Sunday as well as 0
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31),
+               ("month", 1, 12), ("day of week", 0, 7))
+CRON_SEARCH_YEARS = 5
+
+Fired = Tuple[int, Hashable, Any]
+
+
+def now_ms() -> float:
+    """Unix time in milliseconds, the wheel's clock."""
+    return time.time() * 1000
+
+
+class _Timer:
+    __slots__ = ("key", "expires", "value", "slot", "slot_level")
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel with 1 ms ticks (see the module docstring).
+
+    Times are integer ticks on the caller's clock; ``now`` is the last
+    tick processed. Timers are addressed by key: adding a key again
+    replaces its timer. Not thread-safe; the scheduler drives it from the
+    event loop.
+    """
+
+    def __init__(self, now: int):
+        self.now = now
+        self._levels = [[{} for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self._counts = [0] * LEVELS
+        self._timers: Dict[Hashable, _Timer] = {}
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def add(self, key: Hashable, expires: int, value: Any = None) -> None:
+        """Fire key at tick expires (the next tick if that has passed)."""
+        self.cancel(key)
+        timer = _Timer()
+        timer.key, timer.expires, timer.value = key, expires, value
+        self._timers[key] = timer
+        self._place(timer, self.now + 1)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Remove key's timer; False if it has none."""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        del timer.slot[key]
+        self._counts[timer.slot_level] -= 1
+        return True
+
+    def _place(self, timer: _Timer, earliest: int) -> None:
+        tick = max(timer.expires, earliest)
+        delta = tick - self.now
+        if delta < SLOTS:
+            level = 0
+        elif delta <= MAX_DELAY:
+            level = (delta.bit_length() - 1) // SLOT_BITS
+        else:
+            level, tick = LEVELS - 1, self.now + MAX_DELAY
+        slot = self._levels[level][(tick >> (SLOT_BITS * level)) & SLOT_MASK]
+        slot[timer.key] = timer
+        timer.slot, timer.slot_level = slot, level
+        self._counts[level] += 1
+
+    def _cascade(self) -> None:
+        # self.now has just come round to slot 0 of level 0: move each
+        # level's current slot down, up to the first level not at slot 0
+        for level in range(1, LEVELS):
+            index = (self.now >> (SLOT_BITS * level)) & SLOT_MASK
+            slot = self._levels[level][index]
+            if slot:
+                self._counts[level] -= len(slot)
+                timers = list(slot.values())
+                slot.clear()
+                for timer in timers:
+                    self._place(timer, self.now)
+            if index:
+                break
+
+    def _lowest_level(self) -> Optional[int]:
+        """The lowest level above 0 holding timers."""
+        for level in range(1, LEVELS):
+            if self._counts[level]:
+                return level
+        return None
+
+    def advance(self, now: int) -> List[Fired]:
+        """
+        Process every tick up to now and return the timers that fired, as
+        (expires, key, value) in firing order.
+        """
+        fired: List[Fired] = []
+        wheel, counts = self._levels[0], self._counts
+        while self.now < now:
+            if counts[0]:
+                self.now += 1
+            else:
+                # Nothing in level 0: skip to where the lowest occupied
+                # level cascades next
+                level = self._lowest_level()
+                if level is None:
+                    self.now = now
+                    break
+                shift = SLOT_BITS * level
+                boundary = ((self.now >> shift) + 1) << shift
+                if boundary > now:
+                    self.now = now
+                    break
+                self.now = boundary
+            index = self.now & SLOT_MASK
+            if not index:
+                self._cascade()
+            slot = wheel[index]
+            if slot:
+                counts[0] -= len(slot)
+                for key, timer in slot.items():
+                    del self._timers[key]
+                    fired.append((timer.expires, key, timer.value))
+                slot.clear()
+        return fired
+
+    def next_expiry(self) -> Optional[int]:
+        """The next tick at which advance() has something to do, if any."""
+        limit = None
+        level = self._lowest_level()
+        if level is not None:
+            shift = SLOT_BITS * level
+            limit = ((self.now >> shift) + 1) << shift
+        if self._counts[0]:
+            wheel = self._levels[0]
+            end = self.now + SLOTS if limit is None else min(limit, self.now + SLOTS)
+            for tick in range(self.now + 1, end):
+                if wheel[tick & SLOT_MASK]:
+                    return tick
+        return limit
+
+
+def _cron_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        spec, slash, step = part.partition("/")
+        try:
+            step = int(step) if slash else 1
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(v) for v in spec.split("-", 1))
+            else:
+                start = int(spec)
+                # "5/15": from 5 on, every 15
+                end = high if slash else start
+        except ValueError:
+            raise ValueError(f"Invalid cron {name} field: {text!r}") from None
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid cron {name} field: {text!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """
+    Five-field cron expression: minute hour day-of-month month day-of-week,
+    each ``*``, a number, a range ``a-b``, a step ``*/n`` or ``a-b/n``, or a
+    comma list of those. As in cron, when both day fields are restricted a
+    day matching either one will do.
+    """
+
+    def __init__(self, text: str):
+        fields = text.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Cron expression needs 5 fields, not {len(fields)}: {text!r}")
+        self.text = " ".join(fields)
+        (self.minutes, self.hours, self.days, self.months, weekdays) = (
+            _cron_field(value, *spec) for value, spec in zip(fields, CRON_FIELDS)
+        )
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self._any_day = fields[2].startswith("*")
+        self._any_weekday = fields[4].startswith("*")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # cron counts weekdays from Sunday, Python from Monday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp: float) -> float:
+        """The first matching minute after timestamp, as a Unix time."""
+        moment = (datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0)
+                  + timedelta(minutes=1))
+        last_year = moment.year + CRON_SEARCH_YEARS
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0)
+                          + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"Cron expression never matches: {self.text!r}")
+
+
+@dataclass
+class Job:
+    """A scheduled route request. Times are Unix milliseconds."""
+    id: str
+    request: Dict[str, Any]
+    created: int
+    run_at: Optional[int] = None
+    interval_ms: Optional[int] = None
+    cron: Optional[CronExpression] = None
+    next_run: Optional[int] = None
+    runs: int = 0
+
+    @property
+    def recurring(self) -> bool:
+        return self.interval_ms is not None or self.cron is not None
+
+    def occurrence_after(self, after: float) -> int:
+        """A recurring job's first occurrence later than after."""
+        if self.cron is not None:
+            return math.ceil(self.cron.next_after(after / 1000) * 1000)
+        start = self.run_at if self.run_at is not None else self.created + self.interval_ms
+        if start > after:
+            return start
+        return start + (int(after - start) // self.interval_ms + 1) * self.interval_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The job as POST /schedule takes it (and as the journal keeps it)."""
+        return {
+            "id": self.id,
+            "request": self.request,
+            "run_at": self.run_at / 1000 if self.run_at is not None else None,
+            "interval_ms": self.interval_ms,
+            "cron": self.cron.text if self.cron else None,
+            "created": self.created / 1000,
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        """to_dict plus the run state, for the API."""
+        return dict(self.to_dict(),
+                    next_run=self.next_run / 1000 if self.next_run is not None else None,
+                    runs=self.runs)
+
+
+def _run_at_ms(value: Any) -> int:
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value).timestamp()
+    return math.ceil(float(value) * 1000)
+
+
+def parse_job(data: Any, created: Optional[float] = None) -> Job:
+    """Build a Job from a POST /schedule body; ValueError if it is invalid."""
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    request = data.get("request")
+    if not isinstance(request, dict):
+        raise ValueError("'request' must be a route request object")
+    job_id = data.get("id")
+    if job_id is None:
+        job_id = "job-" + request_ids.new_request_id()[len(request_ids.PREFIX):]
+    elif not isinstance(job_id, str) or not job_id or "/" in job_id:
+        raise ValueError("'id' must be a non-empty string without '/'")
+    run_at, interval, cron = data.get("run_at"), data.get("interval_ms"), data.get("cron")
+    if run_at is None and interval is None and cron is None:
+        raise ValueError("one of 'run_at', 'interval_ms' or 'cron' is required")
+    if cron is not None and (run_at is not None or interval is not None):
+        raise ValueError("'cron' does not combine with 'run_at' or 'interval_ms'")
+    created = now_ms() if created is None else float(created) * 1000
+    job = Job(id=job_id, request=request, created=math.floor(created))
+    if run_at is not None:
+        job.run_at = _run_at_ms(run_at)
+    if interval is not None:
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval < 1:
+            raise ValueError("'interval_ms' must be a positive number")
+        job.interval_ms = int(interval)
+    if cron is not None:
+        job.cron = CronExpression(str(cron))
+        # Rejects expressions that never match, such as 30 February
+        job.cron.next_after(time.time())
+    return job
+
+
+class JobScheduler:
+    """
+    Jobs in a TimerWheel, journaled to path (see the module docstring).
+
+    The journal is replayed in the constructor; jobs fire once start()
+    has been called on the event loop with the function routing their
+    requests (it takes the request body and returns whether routing
+    succeeded).
+    """
+
+    def __init__(self, path: Path, fsync: bool = True):
+        self.path = Path(path)
+        self.jobs: Dict[str, Job] = {}
+        self.wheel = TimerWheel(math.floor(now_ms()))
+        self.fired = 0
+        self.failed = 0
+        self.late_ms_max = 0.0
+        self._late_ms_total = 0.0
+        self._route: Optional[Callable[[Dict[str, Any]], bool]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._armed: Optional[int] = None
+        self._started = 0.0
+
+        started = time.perf_counter()
+        self.journal = JsonJournal(self.path, fsync=fsync)
+        for record in self.journal.replay():
+            try:
+                if record["op"] == "add":
+                    job = parse_job(record["job"], created=record["job"]["created"])
+                    self.jobs[job.id] = job
+                elif record["op"] == "remove":
+                    self.jobs.pop(record["id"], None)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Skipping unreadable job record in {self.path}: {e}")
+        now = now_ms()
+        for job in self.jobs.values():
+            self._plan(job, now)
+        if self.journal.needs_compaction(len(self.jobs)):
+            self.compact()
+        logger.info(f"Job scheduler: {len(self.jobs)} jobs from {self.path} "
+                    f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+    # -- journal -------------------------------------------------------------
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self.journal.append(record)
+        if self.journal.needs_compaction(len(self.jobs)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the journal with one add record per live job."""
+        self.journal.rewrite({"op": "add", "job": job.to_dict()}
+                             for job in self.jobs.values())
+
+    # -- jobs ----------------------------------------------------------------
+
+    def _plan(self, job: Job, now: float) -> None:
+        """Put job on the wheel at its next run."""
+        if job.recurring:
+            job.next_run = job.occurrence_after(now - 1)
+        else:
+            # Overdue one-off jobs run at once
+            job.next_run = job.run_at
+        self.wheel.add(job.id, job.next_run, job)
+
+    def add(self, data: Any) -> Job:
+        """Schedule a job from a POST /schedule body, replacing one with its id."""
+        job = parse_job(data)
+        self._append({"op": "add", "job": job.to_dict()})
+        self.jobs[job.id] = job
+        self._plan(job, now_ms())
+        self._arm()
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Remove a pending job; None if there is none by that id."""
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return None
+        self.wheel.cancel(job_id)
+        self._append({"op": "remove", "id": job_id})
+        return job
+
+    def _run(self, job: Job, due: int) -> None:
+        # Jobs overdue from before start() are not late on the loop's account
+        late = now_ms() - max(due, self._started)
+        self._late_ms_total += late
+        self.late_ms_max = max(self.late_ms_max, late)
+        job.runs += 1
+        try:
+            routed = self._route(dict(job.request, id=f"{job.id}@{due}"))
+        except Exception as e:
+            logger.error(f"Job {job.id} failed to route: {e}")
+            routed = False
+        if routed:
+            self.fired += 1
+        else:
+            self.failed += 1
+        if job.recurring:
+            # Skips occurrences missed while the loop was busy
+            job.next_run = job.occurrence_after(max(due, now_ms()))
+            self.wheel.add(job.id, job.next_run, job)
+        elif self.jobs.get(job.id) is job:
+            del self.jobs[job.id]
+            self._append({"op": "remove", "id": job.id})
+
+    # -- event loop ----------------------------------------------------------
+
+    def start(self, route: Callable[[Dict[str, Any]], bool]) -> None:
+        """Start firing jobs on the running loop through route."""
+        self._route = route
+        self._started = now_ms()
+        self._loop = asyncio.get_running_loop()
+        self._arm()
+
+    def _arm(self) -> None:
+        """Wake up at the wheel's next expiry, unless already due earlier."""
+        if self._loop is None:
+            return
+        expiry = self.wheel.next_expiry()
+        if expiry is None or (self._armed is not None and self._armed <= expiry):
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+        delay = (expiry - now_ms()) / 1000
+        self._armed = expiry
+        self._handle = self._loop.call_at(self._loop.time() + max(delay, 0), self._tick)
+
+    def _tick(self) -> None:
+        # The loop may wake a hair before the tick it was armed for
+        now = max(math.floor(now_ms()), self._armed)
+        self._handle = self._armed = None
+        for due, _, job in self.wheel.advance(now):
+            self._run(job, due)
+        self._arm()
+
+    def close(self) -> None:
+        """Stop firing and close the journal."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = self._armed = None
+        self._loop = None
+        self.journal.close()
+
+    # -- reporting -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the status endpoint."""
+        runs = self.fired + self.failed
+        return {
+            "pending": len(self.jobs),
+            "fired": self.fired,
+            "failed": self.failed,
+            "late_ms": {
+                "mean": round(self._late_ms_total / runs, 3) if runs else 0.0,
+                "max": round(self.late_ms_max, 3),
+            },
+            "journal_records": self.journal.records,
+        }
+
+    def prometheus(self) -> str:
+        """Pending jobs and runs in Prometheus text format."""
+        return "\n".join([
+            "# HELP train_station_jobs_pending Scheduled jobs waiting to run.",
+            "# TYPE train_station_jobs_pending gauge",
+            f"train_station_jobs_pending {len(self.jobs)}",
+            "# HELP train_station_job_runs_total Scheduled job runs by outcome.",
+            "# TYPE train_station_job_runs_total counter",
+            f'train_station_job_runs_total{{result="routed"}} {self.fired}',
+            f'train_station_job_runs_total{{result="failed"}} {self.failed}',
+        ]) + "\n"
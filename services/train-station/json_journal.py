@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station JSON Journal
+===============================
+🚂 Append-only files of JSON records, one per line (852 Hz)
+
+The state the Train Station keeps across restarts as a sequence of
+changes (scheduled jobs, the webhook outbox) goes to a journal: each
+change is a JSON object on a line of its own, appended and flushed to
+the OS at once, so it survives the process dying. ``fsync`` makes it
+survive a power cut as well: after every record, or, with ``fsync=False``,
+whenever the owner calls ``sync()`` (once per batch of records).
+
+On startup the owner replays the records. A record torn by a crash (no
+final newline, or not valid JSON) is cut off, with anything after it.
+Once most records are about things that are gone, the owner rewrites the
+journal with one record per live item (written to a temporary file and
+renamed over the journal, so it is always whole).
+
+An owner that may share a journal with another process (a prefork worker
+taking over the outbox of the worker it replaced) lock()s it first: an
+flock on ``<journal>.lock``, held until close() or the process exits.
+"""
+
+import fcntl
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator
+
+
+logger = logging.getLogger(__name__)
+
+# Records beyond twice the live items before a journal is worth rewriting
+COMPACT_SLACK = 1024
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class JsonJournal:
+    """One journal file; replay() it before appending."""
+
+    def __init__(self, path: Path, fsync: bool = True):
+        self.path = Path(path)
+        self.fsync = fsync
+        # Records in the file, live or not
+        self.records = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = None
+        self._lock = None
+        self._unsynced = False
+
+    def lock(self, wait: bool = True) -> bool:
+        """
+        Take the journal's lock, held until close(). Without wait, returns
+        False at once if another process (or journal) holds it.
+        """
+        if self._lock is None:
+            self._lock = open(self.path.with_name(self.path.name + ".lock"), "ab")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Yield the records on disk, then open the journal for appending."""
+        kept = 0
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("torn")
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    kept += len(line)
+                    self.records += 1
+                    yield record
+                size = f.seek(0, os.SEEK_END)
+            if kept < size:
+                logger.warning(f"Cutting torn record off {self.path} at {kept}")
+                os.truncate(self.path, kept)
+        except FileNotFoundError:
+            pass
+        self._file = open(self.path, "ab")
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Append one record; fsynced now if fsync, else at the next sync()."""
+        self._file.write(_encode(record))
+        self._file.flush()
+        self.records += 1
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        else:
+            self._unsynced = True
+
+    def sync(self) -> None:
+        """fsync records appended since the last sync."""
+        if self._unsynced:
+            self._unsynced = False
+            os.fsync(self._file.fileno())
+
+    def needs_compaction(self, live: int) -> bool:
+        return self.records > 2 * live + COMPACT_SLACK
+
+    def rewrite(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Replace the journal with records."""
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        count = 0
+        with open(temporary, "wb") as f:
+            for record in records:
+                f.write(_encode(record))
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        directory = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.records = count
+        self._unsynced = False
+        if self._file is not None:
+            self._file.close()
+            self._file = open(self.path, "ab")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+        if self._lock is not None:
+            # Closing the file releases the flock
+            self._lock.close()
+            self._lock = None
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Latency Metrics
+==================================
+🚂 Per-phase latency histograms for the Triadic Handshake (852 Hz)
+
+Durations are recorded in nanoseconds into fixed log-linear buckets: every
+power of two is split into four linear sub-buckets, so any bucket is at most
+25% wide relative to its lower bound. Bucket boundaries never change, which
+keeps recording to a bit_length() and one list increment.
+
+Each thread records into its own shard of counters, so observations never
+take a lock; readers merge the shards when exporting. Series are keyed by
+(phase, request type, vertex).
+
+Exports:
+- prometheus()   Prometheus text format histograms, one bucket per octave
+- summary()      p50/p95/p99 in milliseconds for /status
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Four linear sub-buckets per power of two
+SUB_BUCKET_BITS = 2
+_SUB_COUNT = 1 << SUB_BUCKET_BITS
+_LINEAR_LIMIT = 1 << (SUB_BUCKET_BITS + 1)
+
+# Values of 2**MAX_BITS ns (~18 minutes) and above share the last bucket
+MAX_BITS = 40
+BUCKET_COUNT = ((MAX_BITS - SUB_BUCKET_BITS - 1) << SUB_BUCKET_BITS) + _SUB_COUNT + 1
+_SUM = BUCKET_COUNT  # slot holding the running sum, after the buckets
+
+# Prometheus buckets are the octave edges from ~1 µs up
+EXPORT_MIN_BITS = 10
+
+SeriesKey = Tuple[str, str, str]
+
+
+def bucket_index(value: int) -> int:
+    """Bucket holding a duration of value nanoseconds."""
+    if value < _LINEAR_LIMIT:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift >= MAX_BITS - SUB_BUCKET_BITS - 1:
+        return BUCKET_COUNT - 1
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def bucket_upper_bound(index: int) -> int:
+    """Exclusive upper bound, in nanoseconds, of a bucket."""
+    if index < _LINEAR_LIMIT:
+        return index + 1
+    shift = (index - _SUB_COUNT) >> SUB_BUCKET_BITS
+    top = index - (shift << SUB_BUCKET_BITS)
+    return (top + 1) << shift
+
+
+class LatencyHistograms:
+    """Lock-free, thread-sharded latency histograms keyed by series."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict[SeriesKey, List[int]]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[SeriesKey, List[int]]:
+        shard: Dict[SeriesKey, List[int]] = {}
+        self._local.shard = shard
+        with self._shards_lock:
+            self._shards.append(shard)
+        return shard
+
+    def observe(self, key: SeriesKey, value: int) -> None:
+        """Record a duration of value nanoseconds for the series key."""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (BUCKET_COUNT + 1)
+        # bucket_index(), inlined
+        if value < _LINEAR_LIMIT:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - SUB_BUCKET_BITS - 1
+            if shift >= MAX_BITS - SUB_BUCKET_BITS - 1:
+                index = BUCKET_COUNT - 1
+            else:
+                index = (shift << SUB_BUCKET_BITS) + (value >> shift)
+        counts[index] += 1
+        counts[_SUM] += value
+
+    def restore(self, counts: Dict[SeriesKey, List[int]]) -> None:
+        """Add bucket counts (as returned by snapshot()) saved by an earlier process."""
+        shard = {key: list(values) for key, values in counts.items()}
+        with self._shards_lock:
+            self._shards.append(shard)
+
+    # -- reading -----------------------------------------------------------
+
+    def snapshot(self) -> Dict[SeriesKey, List[int]]:
+        """Merged bucket counts (plus trailing sum) per series."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[SeriesKey, List[int]] = {}
+        for shard in shards:
+            for key, counts in list(shard.items()):
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = list(counts)
+                else:
+                    for i, count in enumerate(counts):
+                        total[i] += count
+        return merged
+
+    def summary(self, group_by: int = 0,
+                where: Optional[Tuple[int, str]] = None) -> Dict[str, Dict]:
+        """
+        Percentiles per value of one key component (0 phase, 1 type,
+        2 vertex), optionally restricted to series whose component
+        where[0] equals where[1].
+        """
+        groups: Dict[str, List[int]] = {}
+        for key, counts in self.snapshot().items():
+            if where is not None and key[where[0]] != where[1]:
+                continue
+            total = groups.get(key[group_by])
+            if total is None:
+                groups[key[group_by]] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    total[i] += count
+        return {name: _percentiles(counts) for name, counts in sorted(groups.items())}
+
+    def prometheus(self, name: str, help_text: str,
+                   labels: Iterable[str] = ("phase", "type", "vertex")) -> str:
+        """Render every series as a Prometheus histogram in seconds."""
+        labels = tuple(labels)
+        edges = range(EXPORT_MIN_BITS, MAX_BITS + 1)
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, counts in sorted(self.snapshot().items()):
+            label_text = ",".join(
+                f'{label}="{_escape(value)}"' for label, value in zip(labels, key)
+            )
+            cumulative = 0
+            index = 0
+            for bits in edges:
+                limit = 1 << bits
+                while index < BUCKET_COUNT - 1 and bucket_upper_bound(index) <= limit:
+                    cumulative += counts[index]
+                    index += 1
+                lines.append(
+                    f'{name}_bucket{{{label_text},le="{limit / 1e9:.9g}"}} {cumulative}'
+                )
+            count = sum(counts[:BUCKET_COUNT])
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{label_text}}} {counts[_SUM] / 1e9:.9g}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _percentiles(counts: List[int]) -> Dict[str, float]:
+    count = sum(counts[:BUCKET_COUNT])
+    result = {"count": count}
+    for label, quantile in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        result[label] = _quantile(counts, count, quantile) / 1e6
+    return result
+
+
+def _quantile(counts: List[int], count: int, quantile: float) -> int:
+    """Upper bound of the bucket holding the quantile, in nanoseconds."""
+    if not count:
+        return 0
+    rank = max(1, int(count * quantile + 0.5))
+    seen = 0
+    for index in range(BUCKET_COUNT):
+        seen += counts[index]
+        if seen >= rank:
+            return bucket_upper_bound(index)
+    return bucket_upper_bound(BUCKET_COUNT - 1)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
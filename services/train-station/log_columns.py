@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Log Columns
+==============================
+🚂 Columnar copy of train-station.log for capacity analytics (852 Hz)
+
+``convert`` turns the log's segments into typed, array-backed columns,
+one partition per segment, in ``<log>.columns/``:
+
+    train-station.00000042/
+        meta.json       rows, time range, column dtypes and dictionaries
+        ts.bin          record time, int64 microseconds since 1970-01-01
+                        on the log's own (local) clock
+        phase.bin       dictionary codes, uint8/16/32 by cardinality,
+        type.bin        indexing meta["dictionaries"][column]
+        source.bin
+        vertex.bin
+        rule.bin
+        reason.bin
+        success.bin     int8: 1 / 0 as logged by validate, -1 elsewhere
+
+Every .bin file is a bare little-endian array, so a query maps it with
+numpy.memmap and only reads the columns it uses. Code 0 is always the
+empty string (not logged). Records take their request's type and source
+from its capture record, so route records can be grouped by type as well.
+
+Sealed segments never change and are converted once; the active file is
+converted again on every run with --active (and dropped without it, as
+its records reach a segment later). A request whose capture record lies
+in a segment converted by an earlier run has no type or source on its
+later records.
+
+``query`` counts records grouped by categorical columns and time bucket,
+with numpy: per partition, each record's group is packed into one integer
+and counted with bincount, then only the distinct groups are decoded and
+merged. Partitions outside --since/--until are skipped by their time
+range.
+
+    python3 log_columns.py convert /var/log/SOMA/train-station.log --active
+    python3 log_columns.py query /var/log/SOMA/train-station.log.columns \\
+        --where phase=route --by vertex --bucket 1m --since 2026-01-01
+
+This tool needs numpy; the Train Station itself does not.
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from log_segments import read_sealed
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Dictionary-encoded columns, besides ts and success
+CATEGORICAL = ("phase", "type", "source", "vertex", "rule", "reason")
+# Requests remembered for their capture record's type and source
+MAX_CAPTURED = 200_000
+
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Name of the partition converted from the (still growing) active file
+ACTIVE = "active"
+
+
+def timestamp_us(value: str) -> int:
+    """Microseconds since 1970-01-01 of an ISO timestamp, on the log's clock."""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        # The log is written in local time
+        moment = moment.astimezone().replace(tzinfo=None)
+    return (moment - EPOCH) // MICROSECOND
+
+
+def parse_time(value: str) -> int:
+    """--since/--until: an ISO timestamp or Unix seconds, as microseconds."""
+    try:
+        seconds = float(value)
+    except ValueError:
+        return timestamp_us(value)
+    return timestamp_us(datetime.fromtimestamp(seconds).isoformat())
+
+
+def parse_bucket(value: str) -> int:
+    """A bucket width such as 30s, 1m, 1h or 1d, in microseconds."""
+    number, unit = value[:-1], value[-1:]
+    if unit not in BUCKET_UNITS or not number.isdigit() or int(number) < 1:
+        raise ValueError(f"Invalid bucket {value!r} (expected e.g. 30s, 5m, 1h, 1d)")
+    return int(number) * BUCKET_UNITS[unit] * 1_000_000
+
+
+def format_time(microseconds: int) -> str:
+    return (EPOCH + microseconds * MICROSECOND).isoformat()
+
+
+def _code_dtype(size: int) -> str:
+    if size <= 1 << 8:
+        return "<u1"
+    if size <= 1 << 16:
+        return "<u2"
+    return "<u4"
+
+
+# -- conversion ----------------------------------------------------------------
+
+class PartitionBuilder:
+    """The columns of one partition, built record by record."""
+
+    def __init__(self):
+        self.ts = array("q")
+        self.success = array("b")
+        self.codes = {name: array("I") for name in CATEGORICAL}
+        self.dictionaries: Dict[str, Dict[str, int]] = {name: {"": 0} for name in CATEGORICAL}
+
+    def add(self, record: Any, captured: Dict[str, Tuple[str, str]]) -> bool:
+        """Add one log record; False if it is not a handshake record."""
+        if not isinstance(record, dict) or not isinstance(record.get("data"), dict):
+            return False
+        try:
+            ts = timestamp_us(record["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        data = record["data"]
+        phase = str(data.get("phase") or "")
+        request_id = str(data.get("request_id"))
+        if phase == "capture":
+            known = (str(data.get("type") or ""), str(data.get("source") or ""))
+            captured[request_id] = known
+            if len(captured) > MAX_CAPTURED:
+                del captured[next(iter(captured))]
+        else:
+            known = captured.get(request_id, ("", ""))
+        success = data.get("success")
+
+        self.ts.append(ts)
+        self.success.append(1 if success is True else 0 if success is False else -1)
+        for name, value in (("phase", phase), ("type", known[0]), ("source", known[1]),
+                            ("vertex", data.get("vertex")), ("rule", data.get("rule")),
+                            ("reason", data.get("reason"))):
+            value = "" if value is None else str(value)
+            dictionary = self.dictionaries[name]
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            self.codes[name].append(code)
+        return True
+
+    def write(self, directory: Path, source: str) -> int:
+        """Write the partition to directory (replacing it); returns its rows."""
+        temporary = directory.with_name(directory.name + ".tmp")
+        shutil.rmtree(temporary, ignore_errors=True)
+        temporary.mkdir(parents=True)
+        dtypes = {"ts": "<i8", "success": "<i1"}
+        np.frombuffer(self.ts, dtype=np.int64).astype("<i8").tofile(temporary / "ts.bin")
+        np.frombuffer(self.success, dtype=np.int8).tofile(temporary / "success.bin")
+        for name in CATEGORICAL:
+            dtypes[name] = _code_dtype(len(self.dictionaries[name]))
+            codes = np.frombuffer(self.codes[name], dtype=np.uint32)
+            codes.astype(dtypes[name]).tofile(temporary / f"{name}.bin")
+        ts = np.frombuffer(self.ts, dtype=np.int64)
+        meta = {
+            "source": source,
+            "rows": len(self.ts),
+            "first_ts": int(ts.min()) if len(ts) else 0,
+            "last_ts": int(ts.max()) if len(ts) else 0,
+            "dtypes": dtypes,
+            "dictionaries": {name: list(self.dictionaries[name]) for name in CATEGORICAL},
+        }
+        with open(temporary / "meta.json", "w") as f:
+            json.dump(meta, f)
+        # A partition directory is only ever seen whole
+        old = directory.with_name(directory.name + ".old")
+        if directory.exists():
+            os.replace(directory, old)
+        os.replace(temporary, directory)
+        shutil.rmtree(old, ignore_errors=True)
+        return len(self.ts)
+
+
+def _lines(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    for block in blocks:
+        yield from block.splitlines()
+
+
+def _plain_lines(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        for line in f:
+            # A torn last line is being written, or was by a crash
+            if line.endswith(b"\n"):
+                yield line
+
+
+def _sources(log_path: Path) -> List[Tuple[str, Callable[[], Iterator[bytes]], bool]]:
+    """(partition, lines, complete) for the log's segments, oldest first."""
+    segments = log_path.with_name(log_path.name + ".segments")
+    found = []
+    if segments.is_dir():
+        for meta_path in segments.glob(f"{log_path.stem}.*.meta.json"):
+            name = meta_path.name[:-len(".meta.json")]
+            found.append((name, lambda meta_path=meta_path: _lines(read_sealed(meta_path))))
+        for plain in segments.glob(f"{log_path.stem}.*.jsonl"):
+            # Sealed, waiting for compression
+            found.append((plain.name[:-len(".jsonl")], lambda plain=plain: _plain_lines(plain)))
+    found.sort(key=lambda source: source[0])
+    return [(name, lines, True) for name, lines in found]
+
+
+def convert(log_path: Path, columns: Optional[Path] = None,
+            active: bool = False) -> Dict[str, int]:
+    """
+    Convert the log's segments that have no partition yet under columns
+    (default ``<log>.columns``), and the active file too with active.
+    """
+    log_path = Path(log_path)
+    columns = Path(columns) if columns else log_path.with_name(log_path.name + ".columns")
+    columns.mkdir(parents=True, exist_ok=True)
+    sources = _sources(log_path)
+    if active and log_path.exists():
+        sources.append((ACTIVE, lambda: _plain_lines(log_path), False))
+    elif (columns / ACTIVE).exists():
+        shutil.rmtree(columns / ACTIVE)
+
+    result = {"partitions": 0, "skipped": 0, "rows": 0, "bad_lines": 0}
+    captured: Dict[str, Tuple[str, str]] = {}
+    for name, lines, complete in sources:
+        if complete and (columns / name / "meta.json").exists():
+            result["skipped"] += 1
+            # Its captures are not known to the next segment; see above
+            captured.clear()
+            continue
+        builder = PartitionBuilder()
+        for line in lines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not builder.add(record, captured):
+                result["bad_lines"] += 1
+        result["rows"] += builder.write(columns / name, name)
+        result["partitions"] += 1
+    return result
+
+
+# -- queries -------------------------------------------------------------------
+
+class Partition:
+    """One converted segment, its columns memory-mapped on first use."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        with open(directory / "meta.json") as f:
+            meta = json.load(f)
+        self.rows: int = meta["rows"]
+        self.first_ts: int = meta["first_ts"]
+        self.last_ts: int = meta["last_ts"]
+        self.dtypes: Dict[str, str] = meta["dtypes"]
+        self.dictionaries: Dict[str, List[str]] = meta["dictionaries"]
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def column(self, name: str) -> np.ndarray:
+        array_ = self._columns.get(name)
+        if array_ is None:
+            dtype = np.dtype(self.dtypes[name])
+            if self.rows:
+                array_ = np.memmap(self.directory / f"{name}.bin", dtype=dtype,
+                                   mode="r", shape=(self.rows,))
+            else:
+                array_ = np.empty(0, dtype=dtype)
+            self._columns[name] = array_
+        return array_
+
+    def codes(self, name: str, values: Sequence[str]) -> List[int]:
+        """This partition's codes for values of a categorical column."""
+        dictionary = self.dictionaries[name]
+        wanted = set(values)
+        return [code for code, value in enumerate(dictionary) if value in wanted]
+
+
+class ColumnStore:
+    """Counting queries over the partitions of one or more columns directories."""
+
+    def __init__(self, directories: Iterable[Path]):
+        self.partitions: List[Partition] = []
+        for directory in directories:
+            for child in sorted(Path(directory).iterdir()):
+                if child.suffix not in (".tmp", ".old") and (child / "meta.json").exists():
+                    self.partitions.append(Partition(child))
+
+    @property
+    def rows(self) -> int:
+        return sum(partition.rows for partition in self.partitions)
+
+    def count(self, by: Sequence[str] = (), bucket: Optional[int] = None,
+              where: Optional[Dict[str, Sequence[str]]] = None,
+              since: Optional[int] = None, until: Optional[int] = None
+              ) -> Dict[Tuple, int]:
+        """
+        Records per group: a tuple of the bucket's start (microseconds,
+        with a bucket width in microseconds) followed by the values of the
+        by columns. where restricts categorical columns to some values;
+        since/until (microseconds) to a time range, until excluded.
+        """
+        for name in list(by) + list(where or {}):
+            if name not in CATEGORICAL:
+                raise ValueError(f"Not a categorical column: {name} ({', '.join(CATEGORICAL)})")
+        totals: Dict[Tuple, int] = {}
+        for partition in self.partitions:
+            if not partition.rows:
+                continue
+            if since is not None and partition.last_ts < since:
+                continue
+            if until is not None and partition.first_ts >= until:
+                continue
+            self._count_partition(partition, by, bucket, where or {}, since, until, totals)
+        return totals
+
+    @staticmethod
+    def _count_partition(partition: Partition, by: Sequence[str], bucket: Optional[int],
+                         where: Dict[str, Sequence[str]], since: Optional[int],
+                         until: Optional[int], totals: Dict[Tuple, int]) -> None:
+        mask = None
+
+        def narrow(match: np.ndarray) -> None:
+            nonlocal mask
+            mask = match if mask is None else mask & match
+
+        for name, values in where.items():
+            codes = partition.codes(name, values)
+            if not codes:
+                return
+            column = partition.column(name)
+            narrow(column == codes[0] if len(codes) == 1 else np.isin(column, codes))
+        if since is not None and partition.first_ts < since:
+            narrow(partition.column("ts") >= since)
+        if until is not None and partition.last_ts >= until:
+            narrow(partition.column("ts") < until)
+        index = None
+        if mask is not None:
+            index = np.flatnonzero(mask)
+            if not len(index):
+                return
+
+        def values(name: str) -> np.ndarray:
+            column = partition.column(name)
+            return column if index is None else column[index]
+
+        # Group keys as (codes, radix, decode) per component
+        keys = []
+        if bucket:
+            buckets = values("ts") // bucket
+            low = int(buckets.min())
+            keys.append((buckets - low, int(buckets.max()) - low + 1,
+                         lambda code, low=low: (low + code) * bucket))
+        for name in by:
+            dictionary = partition.dictionaries[name]
+            keys.append((values(name), len(dictionary), dictionary.__getitem__))
+
+        rows = partition.rows if index is None else len(index)
+        if not keys:
+            groups, counts = [()], [rows]
+        else:
+            radix_product = 1
+            for _, radix, _ in keys:
+                radix_product *= radix
+            if radix_product < 1 << 62:
+                packed = keys[0][0].astype(np.int64)
+                for codes, radix, _ in keys[1:]:
+                    packed *= radix
+                    packed += codes
+                if radix_product <= max(4 * rows, 1 << 16):
+                    counted = np.bincount(packed, minlength=radix_product)
+                    present = np.flatnonzero(counted)
+                    counts = counted[present].tolist()
+                else:
+                    present, counts = np.unique(packed, return_counts=True)
+                    counts = counts.tolist()
+                groups = []
+                for key in present.tolist():
+                    group = []
+                    for _, radix, decode in reversed(keys):
+                        key, code = divmod(key, radix)
+                        group.append(decode(code))
+                    groups.append(tuple(reversed(group)))
+            else:
+                stacked = np.stack([codes.astype(np.int64) for codes, _, _ in keys], axis=1)
+                present, counts = np.unique(stacked, axis=0, return_counts=True)
+                counts = counts.tolist()
+                groups = [tuple(decode(code) for (_, _, decode), code in zip(keys, row))
+                          for row in present.tolist()]
+        for group, count in zip(groups, counts):
+            totals[group] = totals.get(group, 0) + count
+
+
+# -- command line --------------------------------------------------------------
+
+def _where(items: Sequence[str]) -> Dict[str, List[str]]:
+    where: Dict[str, List[str]] = {}
+    for item in items:
+        name, sep, values = item.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid --where {item!r} (expected column=value[,value...])")
+        where.setdefault(name.strip(), []).extend(values.split(","))
+    return where
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="SOMA Train Station log analytics")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser("convert", help="Convert log segments to columns")
+    convert_parser.add_argument("log", type=Path, nargs="+",
+                                help="Log file(s), e.g. train-station.log or the "
+                                     "prefork train-station.worker-*.log")
+    convert_parser.add_argument("--columns", type=Path, default=None,
+                                help="Output directory (default: <log>.columns; "
+                                     "one log only)")
+    convert_parser.add_argument("--active", action="store_true",
+                                help="Also convert the active file, again on every run")
+
+    query_parser = commands.add_parser("query", help="Count records by group and time bucket")
+    query_parser.add_argument("columns", type=Path, nargs="+", help="Columns directories")
+    query_parser.add_argument("--by", default="",
+                              help=f"Comma-separated columns to group by ({', '.join(CATEGORICAL)})")
+    query_parser.add_argument("--bucket", default=None, help="Time bucket, e.g. 30s, 1m, 1h, 1d")
+    query_parser.add_argument("--where", action="append", default=[],
+                              help="column=value[,value...]; repeatable")
+    query_parser.add_argument("--since", default=None, help="ISO timestamp or Unix seconds")
+    query_parser.add_argument("--until", default=None, help="ISO timestamp or Unix seconds (excluded)")
+    query_parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        if args.columns and len(args.log) > 1:
+            parser.error("--columns takes a single log")
+        for log in args.log:
+            result = convert(log, args.columns, active=args.active)
+            print(json.dumps({"log": str(log), **result}))
+        return
+
+    try:
+        by = [name.strip() for name in args.by.split(",") if name.strip()]
+        bucket = parse_bucket(args.bucket) if args.bucket else None
+        where = _where(args.where)
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+        totals = ColumnStore(args.columns).count(by, bucket, where, since, until)
+    except ValueError as e:
+        parser.error(str(e))
+
+    header = (["time"] if bucket else []) + by + ["count"]
+    rows = [
+        ([format_time(group[0])] + list(group[1:]) if bucket else list(group)) + [count]
+        for group, count in sorted(totals.items())
+    ]
+    if args.format == "json":
+        print(json.dumps([dict(zip(header, row)) for row in rows], indent=2))
+    elif args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        writer.writerows(rows)
+    else:
+        widths = [max([len(str(cell)) for cell in column] + [1])
+                  for column in zip(header, *rows)]
+        for row in [header] + rows:
+            print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Log Segments
+===============================
+🚂 Rotating, compressed, indexed segments for train-station.log (852 Hz)
+
+The log writer keeps appending JSONL to the active log file. When a group
+commit leaves it past max_bytes, or open for max_age seconds, it is sealed:
+renamed into ``<log>.segments/`` and compressed there by a background thread.
+
+A sealed segment is three files:
+
+    train-station.00000042.jsonl.gz   gzip members (or .xz streams), one per
+                                      ~256 KiB block of lines, so one block
+                                      can be read without the rest; zcat/xzcat
+                                      still read the whole file
+    train-station.00000042.idx        sorted (request_id hash, block) pairs,
+                                      binary-searched through mmap
+    train-station.00000042.meta.json  block table: offset, length, time range
+                                      and vertices of each block
+
+The active and not-yet-compressed segments keep the same index in memory, so
+a request lookup costs one binary search per segment plus decoding the few
+blocks that mention it, whatever the total log size. Time/vertex queries skip
+every segment and block whose time range or vertex set cannot match.
+
+The writer thread calls committed(), due() and seal(); lookup(), query()
+and stats() may be called from any thread.
+
+Opening a store does not wait for its index: loading the sealed segments'
+metadata and re-reading the active file (up to max_bytes of JSON) happen on
+the background thread, so a restarted Train Station logs and routes at
+once. Records committed meanwhile are indexed when the load finishes;
+lookup() and query() wait for it, and ``ready`` tells whether they would.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import lzma
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Lines are grouped into blocks of about this many uncompressed bytes
+BLOCK_BYTES = 256 * 1024
+
+# .idx entries: 64-bit request_id hash, block number
+_INDEX_ENTRY = struct.Struct("<QI")
+
+
+class Compression(Enum):
+    """Codec for sealed segments."""
+    GZIP = "gzip"
+    LZMA = "lzma"
+
+
+_SUFFIX = {Compression.GZIP: ".jsonl.gz", Compression.LZMA: ".jsonl.xz"}
+
+
+def _compress(data: bytes, compression: Compression) -> bytes:
+    if compression is Compression.GZIP:
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return lzma.compress(data, preset=6)
+
+
+def _decompress(data: bytes, compression: Compression) -> bytes:
+    if compression is Compression.GZIP:
+        return gzip.decompress(data)
+    return lzma.decompress(data)
+
+
+def request_hash(request_id: str) -> int:
+    """64-bit hash of a request id, as stored in .idx files."""
+    return int.from_bytes(
+        hashlib.blake2b(request_id.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class _Block:
+    __slots__ = ("start", "end", "first_ts", "last_ts", "vertices")
+
+    def __init__(self, start: int, first_ts: str):
+        self.start = start
+        self.end = start
+        self.first_ts = first_ts
+        self.last_ts = first_ts
+        self.vertices = set()
+
+
+def _truncate_torn_tail(path: Path) -> int:
+    """Drop a partial last line left by a crash; returns the file's size."""
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = end = f.seek(0, os.SEEK_END)
+        keep = 0
+        while end > 0:
+            start = max(0, end - BLOCK_BYTES)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                keep = start + newline + 1
+                break
+            end = start
+        if keep != size:
+            f.truncate(keep)
+        return keep
+
+
+class _OpenSegment:
+    """Block table and request index of a plain JSONL segment, in memory."""
+
+    def __init__(self, path: Path, seq: int):
+        self.path = path
+        self.seq = seq
+        self.blocks: List[_Block] = []
+        self.ids: Dict[str, List[int]] = {}
+        self.size = 0
+        self.records = 0
+        self.opened = time.monotonic()
+
+    def add(self, record: Dict[str, Any], length: int) -> None:
+        timestamp = record.get("timestamp", "")
+        data = record.get("data")
+        if not isinstance(data, dict):
+            data = {}
+        block = self.blocks[-1] if self.blocks else None
+        if block is None or block.end - block.start >= BLOCK_BYTES:
+            block = _Block(self.size, timestamp)
+            self.blocks.append(block)
+        block.end += length
+        block.last_ts = max(block.last_ts, timestamp)
+        if "vertex" in data:
+            block.vertices.add(data["vertex"])
+        request_id = data.get("request_id")
+        if request_id is not None:
+            blocks = self.ids.setdefault(str(request_id), [])
+            if not blocks or blocks[-1] != len(self.blocks) - 1:
+                blocks.append(len(self.blocks) - 1)
+        self.size += length
+        self.records += 1
+
+    @classmethod
+    def scan(cls, path: Path, seq: int, limit: Optional[int] = None) -> "_OpenSegment":
+        """Rebuild the index of an existing plain segment (its first limit bytes)."""
+        segment = cls(path, seq)
+        with open(path, "rb+") as f:
+            for line in f:
+                if limit is not None and segment.size >= limit:
+                    break
+                if not line.endswith(b"\n"):
+                    # Torn final line from a crash; drop it
+                    f.truncate(segment.size)
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = {}
+                segment.add(record if isinstance(record, dict) else {}, len(line))
+        return segment
+
+    def read_block(self, number: int) -> bytes:
+        block = self.blocks[number]
+        with open(self.path, "rb") as f:
+            f.seek(block.start)
+            return f.read(block.end - block.start)
+
+    def block_ranges(self) -> List[Tuple[str, str, Sequence[str]]]:
+        return [(b.first_ts, b.last_ts, b.vertices) for b in self.blocks]
+
+
+class _SealedSegment:
+    """A compressed segment with its on-disk block table and .idx."""
+
+    def __init__(self, data_path: Path, index_path: Path, meta_path: Path):
+        self.path = data_path
+        self.index_path = index_path
+        self.meta_path = meta_path
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.seq = meta["seq"]
+        self.compression = Compression(meta["compression"])
+        self.records = meta["records"]
+        self.blocks = meta["blocks"]  # [offset, length, first_ts, last_ts, vertices]
+        self.last_ts = max((block[3] for block in self.blocks), default="")
+        self._index_file = open(index_path, "rb")
+        size = os.fstat(self._index_file.fileno()).st_size
+        self._entries = size // _INDEX_ENTRY.size
+        self._index = (mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                       if size else None)
+
+    def find_blocks(self, key: int) -> List[int]:
+        """Blocks holding records whose request_id hashes to key."""
+        index, entry = self._index, _INDEX_ENTRY
+        lo, hi = 0, self._entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if entry.unpack_from(index, mid * entry.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        blocks = []
+        while lo < self._entries:
+            found, block = entry.unpack_from(index, lo * entry.size)
+            if found != key:
+                break
+            blocks.append(block)
+            lo += 1
+        return blocks
+
+    def read_block(self, number: int) -> bytes:
+        offset, length = self.blocks[number][:2]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return _decompress(f.read(length), self.compression)
+
+    def block_ranges(self) -> List[Tuple[str, str, Sequence[str]]]:
+        return [(b[2], b[3], b[4]) for b in self.blocks]
+
+    def close(self) -> None:
+        if self._index is not None:
+            self._index.close()
+        self._index_file.close()
+
+    def remove(self) -> None:
+        self.close()
+        for path in (self.meta_path, self.index_path, self.path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def read_sealed(meta_path: Path) -> Iterator[bytes]:
+    """The blocks of a sealed segment, decompressed (whole JSONL lines), in order."""
+    with open(meta_path) as f:
+        meta = json.load(f)
+    compression = Compression(meta["compression"])
+    with open(Path(meta_path).with_name(meta["file"]), "rb") as f:
+        for offset, length, *_ in meta["blocks"]:
+            f.seek(offset)
+            yield _decompress(f.read(length), compression)
+
+
+class SegmentStore:
+    """Rotation, compression and request index for one JSONL log file."""
+
+    def __init__(self, path: Path, max_bytes: int = 64 * 1024 * 1024,
+                 max_age: float = 3600.0,
+                 compression: Compression = Compression.GZIP,
+                 retain: int = 0):
+        self.path = Path(path)
+        self.directory = self.path.with_name(self.path.name + ".segments")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.retain = retain
+
+        self.segments_sealed = 0
+        self.segments_removed = 0
+        self.seal_errors = 0
+
+        self._lock = threading.Lock()
+        self._sealed: List[_SealedSegment] = []
+        self._pending: List[_OpenSegment] = []
+        self._jobs: "queue.Queue[Optional[_OpenSegment]]" = queue.Queue()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # The writer may append as soon as we return, so the active file
+        # must end on a whole line now; indexing it can wait
+        self._loaded_size = _truncate_torn_tail(self.path)
+        self._active = _OpenSegment(self.path, 0)
+        # (records, lines, offset) committed before the index was loaded
+        self._backlog: List[Tuple[Sequence[Dict[str, Any]], Sequence[bytes], int]] = []
+        self._ready = threading.Event()
+        self._disabled = False
+
+        self._thread = threading.Thread(
+            target=self._run, name="train-station-log-segments", daemon=True
+        )
+        self._thread.start()
+
+    def _segment_path(self, seq: int, suffix: str) -> Path:
+        return self.directory / f"{self.path.stem}.{seq:08d}{suffix}"
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has been loaded."""
+        return self._ready.is_set()
+
+    def _open(self) -> None:
+        """Load the segment directory and index the active file."""
+        next_seq = self._load()
+        if self.path.exists():
+            active = _OpenSegment.scan(self.path, next_seq, limit=self._loaded_size)
+        else:
+            active = _OpenSegment(self.path, next_seq)
+        with self._lock:
+            self._active = active
+            for records, lines, offset in self._backlog:
+                self._index(records, lines, offset)
+            self._backlog = []
+            self._ready.set()
+
+    def _load(self) -> int:
+        """Open sealed segments and requeue any left uncompressed."""
+        pattern = re.compile(re.escape(self.path.stem) + r"\.(\d{8})\.jsonl$")
+        seqs = []
+        for meta_path in sorted(self.directory.glob("*.meta.json")):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                segment = _SealedSegment(
+                    self.directory / meta["file"],
+                    meta_path.with_name(meta_path.name[:-len(".meta.json")] + ".idx"),
+                    meta_path,
+                )
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Skipping unreadable log segment {meta_path}: {e}")
+                continue
+            self._sealed.append(segment)
+            seqs.append(segment.seq)
+        self._sealed.sort(key=lambda segment: segment.seq)
+
+        for plain in sorted(self.directory.glob("*.jsonl")):
+            match = pattern.match(plain.name)
+            if not match:
+                continue
+            segment = _OpenSegment.scan(plain, int(match.group(1)))
+            self._pending.append(segment)
+            self._jobs.put(segment)
+            seqs.append(segment.seq)
+        return max(seqs, default=0) + 1
+
+    # -- writer thread -----------------------------------------------------
+
+    def committed(self, records: Sequence[Dict[str, Any]],
+                  lines: Sequence[bytes], offset: int) -> None:
+        """Index records just appended to the active file at offset."""
+        with self._lock:
+            if self._disabled:
+                return
+            if not self._ready.is_set():
+                self._backlog.append((records, lines, offset))
+                return
+            self._index(records, lines, offset)
+
+    def _index(self, records: Sequence[Dict[str, Any]],
+               lines: Sequence[bytes], offset: int) -> None:
+        active = self._active
+        if active.size != offset:
+            # Someone else wrote to the file; resynchronise
+            self._active = _OpenSegment.scan(self.path, active.seq)
+            return
+        for record, line in zip(records, lines):
+            active.add(record, len(line))
+
+    def due(self) -> bool:
+        """Whether the active file should be sealed now."""
+        if not self._ready.is_set() or self._disabled:
+            return False
+        active = self._active
+        if not active.records:
+            return False
+        return (active.size >= self.max_bytes
+                or time.monotonic() - active.opened >= self.max_age)
+
+    def seal(self) -> None:
+        """
+        Move the active file into the segment directory for compression and
+        start a new one. The caller must have closed its handle on the file.
+        """
+        self._ready.wait()
+        with self._lock:
+            active = self._active
+            if not active.records:
+                return
+            target = self._segment_path(active.seq, ".jsonl")
+            os.replace(self.path, target)
+            active.path = target
+            self._pending.append(active)
+            self._active = _OpenSegment(self.path, active.seq + 1)
+        self._jobs.put(active)
+
+    # -- compression thread ------------------------------------------------
+
+    def _run(self) -> None:
+        try:
+            self._open()
+        except Exception as e:
+            # Logging goes on in the active file, without rotation or index
+            logger.error(f"Failed to load the log index for {self.path}: {e}")
+            with self._lock:
+                self._disabled = True
+                self._backlog = []
+                self._ready.set()
+        while True:
+            segment = self._jobs.get()
+            if segment is None:
+                return
+            try:
+                sealed = self._compress(segment)
+            except Exception as e:
+                # The plain segment stays pending and searchable; retried on
+                # the next start
+                self.seal_errors += 1
+                logger.error(f"Failed to compress log segment {segment.path}: {e}")
+                continue
+            with self._lock:
+                self._pending.remove(segment)
+                self._sealed.append(sealed)
+                self._sealed.sort(key=lambda s: s.seq)
+                segment.path.unlink()
+                self.segments_sealed += 1
+                while self.retain and len(self._sealed) > self.retain:
+                    self._sealed.pop(0).remove()
+                    self.segments_removed += 1
+
+    def _compress(self, segment: _OpenSegment) -> _SealedSegment:
+        data_path = self._segment_path(segment.seq, _SUFFIX[self.compression])
+        index_path = self._segment_path(segment.seq, ".idx")
+        meta_path = self._segment_path(segment.seq, ".meta.json")
+
+        blocks = []
+        offset = 0
+        with open(segment.path, "rb") as src, open(str(data_path) + ".tmp", "wb") as dst:
+            for block in segment.blocks:
+                src.seek(block.start)
+                member = _compress(src.read(block.end - block.start), self.compression)
+                dst.write(member)
+                blocks.append([offset, len(member), block.first_ts, block.last_ts,
+                               sorted(block.vertices)])
+                offset += len(member)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        entries = sorted(
+            (request_hash(request_id), number)
+            for request_id, numbers in segment.ids.items()
+            for number in numbers
+        )
+        with open(str(index_path) + ".tmp", "wb") as f:
+            f.write(b"".join(_INDEX_ENTRY.pack(*entry) for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+        meta = {
+            "seq": segment.seq,
+            "file": data_path.name,
+            "compression": self.compression.value,
+            "records": segment.records,
+            "first_ts": blocks[0][2] if blocks else "",
+            "last_ts": max((b[3] for b in blocks), default=""),
+            "blocks": blocks,
+        }
+        with open(str(meta_path) + ".tmp", "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(str(data_path) + ".tmp", data_path)
+        os.replace(str(index_path) + ".tmp", index_path)
+        # The meta file is written last: its presence marks a complete segment
+        os.replace(str(meta_path) + ".tmp", meta_path)
+        return _SealedSegment(data_path, index_path, meta_path)
+
+    # -- readers -----------------------------------------------------------
+
+    def lookup(self, request_id: str,
+               since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Every indexed record of one request, oldest first. With since (ISO
+        timestamp), sealed segments that end before it are not searched.
+        """
+        self._ready.wait()
+        key = request_hash(request_id)
+        records = []
+        with self._lock:
+            sealed = list(self._sealed)
+            for segment in self._pending + [self._active]:
+                for number in segment.ids.get(request_id, ()):
+                    records.extend(self._matching(segment.read_block(number), request_id))
+        found = []
+        for segment in sealed:
+            if since and segment.last_ts < since:
+                continue
+            try:
+                for number in segment.find_blocks(key):
+                    found.extend(self._matching(segment.read_block(number), request_id))
+            except (OSError, ValueError):
+                continue  # removed by retention meanwhile
+        return found + records
+
+    @staticmethod
+    def _matching(block: bytes, request_id: str) -> Iterator[Dict[str, Any]]:
+        needle = json.dumps(request_id).encode("utf-8")
+        for line in block.splitlines():
+            if needle in line:
+                record = json.loads(line)
+                if record.get("data", {}).get("request_id") == request_id:
+                    yield record
+
+    def query(self, since: Optional[str] = None, vertex: Optional[str] = None,
+              limit: int = 100) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Records at or after since (ISO timestamp), optionally only those
+        routed to vertex, oldest first. Returns (records, truncated).
+        """
+        self._ready.wait()
+        results: List[Dict[str, Any]] = []
+        with self._lock:
+            sealed = list(self._sealed)
+        for segment in sealed:
+            if self._scan(segment, since, vertex, limit, results):
+                return results, True
+        with self._lock:
+            for segment in self._pending + [self._active]:
+                if self._scan(segment, since, vertex, limit, results):
+                    return results, True
+        return results, False
+
+    def _scan(self, segment, since, vertex, limit, results) -> bool:
+        """Append matching records from segment; True once limit is passed."""
+        for number, (first_ts, last_ts, vertices) in enumerate(segment.block_ranges()):
+            if since and last_ts < since:
+                continue
+            if vertex and vertex not in vertices:
+                continue
+            try:
+                block = segment.read_block(number)
+            except (OSError, ValueError):
+                return False
+            for line in block.splitlines():
+                record = json.loads(line)
+                if since and record.get("timestamp", "") < since:
+                    continue
+                if vertex and record.get("data", {}).get("vertex") != vertex:
+                    continue
+                if len(results) >= limit:
+                    return True
+                results.append(record)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Segment counters for the status endpoint."""
+        with self._lock:
+            return {
+                "active_bytes": self._active.size,
+                "active_records": self._active.records,
+                "pending": len(self._pending),
+                "sealed": len(self._sealed),
+                "sealed_records": sum(segment.records for segment in self._sealed),
+                "removed": self.segments_removed,
+                "errors": self.seal_errors,
+                "compression": self.compression.value,
+                "loading": not self._ready.is_set(),
+            }
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Finish queued compression and release index maps."""
+        self._jobs.put(None)
+        self._thread.join(timeout)
+        with self._lock:
+            for segment in self._sealed:
+                segment.close()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Log Writer
+=============================
+🚂 Group-commit structured log writer (852 Hz)
+
+Handshake phases hand their log records to an in-memory queue and return
+immediately. A background writer thread drains the queue, serialises every
+record to JSONL and commits the whole batch with a single append, so route
+latency no longer depends on disk latency.
+
+Policies:
+- flush_interval: how long the writer lets records accumulate between appends
+- fsync: none (page cache only), interval (at most every fsync_interval
+  seconds) or batch (after every append)
+- overflow: when max_queue records are pending, drop new records or block the
+  producer until the writer catches up
+
+With a SegmentStore the writer also indexes each committed batch and seals
+the file into a compressed segment when the store says rotation is due.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from log_segments import SegmentStore
+
+
+logger = logging.getLogger(__name__)
+
+
+class FsyncPolicy(Enum):
+    """When the writer forces appended batches to stable storage."""
+    NONE = "none"
+    INTERVAL = "interval"
+    BATCH = "batch"
+
+
+class OverflowPolicy(Enum):
+    """What producers do when the queue is full."""
+    DROP = "drop"
+    BLOCK = "block"
+
+
+class LogWriter:
+    """Bounded queue drained by a background thread into batched appends."""
+
+    def __init__(
+        self,
+        path: Path,
+        flush_interval: float = 0.05,
+        fsync: FsyncPolicy = FsyncPolicy.INTERVAL,
+        fsync_interval: float = 1.0,
+        max_queue: int = 65536,
+        overflow: OverflowPolicy = OverflowPolicy.DROP,
+        segments: Optional[SegmentStore] = None,
+    ):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.segments = segments
+
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._closed = False
+        self._flush_requested = False
+
+        # Sequence numbers let flush() wait for everything enqueued before it
+        self._enqueued = 0
+        self._committed = 0
+
+        self.records_written = 0
+        self.records_dropped = 0
+        self.batches_written = 0
+        self.write_errors = 0
+
+        self._file = None
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._run, name="train-station-log-writer", daemon=True
+        )
+        self._thread.start()
+
+    # -- producer side ---------------------------------------------------
+
+    def write(self, record: Dict[str, Any]) -> bool:
+        """Queue one record; returns False if it was dropped."""
+        with self._lock:
+            if not self._reserve(1):
+                return False
+            self._queue.append(record)
+            self._enqueued += 1
+        return True
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Queue several records as one unit; returns how many were kept."""
+        records = list(records)
+        with self._lock:
+            if not self._reserve(len(records)):
+                return 0
+            self._queue.extend(records)
+            self._enqueued += len(records)
+        return len(records)
+
+    def _reserve(self, count: int) -> bool:
+        """Make room for count records (lock held) according to policy."""
+        if self._closed:
+            self.records_dropped += count
+            return False
+        while len(self._queue) + count > self.max_queue:
+            if self.overflow is OverflowPolicy.DROP or count > self.max_queue:
+                self.records_dropped += count
+                return False
+            self._wakeup.notify()
+            self._not_full.wait()
+            if self._closed:
+                self.records_dropped += count
+                return False
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every record queued so far has been appended."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            target = self._enqueued
+            self._flush_requested = True
+            self._wakeup.notify()
+            while self._committed < target and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+            return self._committed >= target
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Flush pending records, stop the writer thread and close the file."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+        if self.segments is not None:
+            self.segments.close(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Writer counters for the status endpoint."""
+        return {
+            "queued": len(self._queue),
+            "written": self.records_written,
+            "dropped": self.records_dropped,
+            "batches": self.batches_written,
+            "errors": self.write_errors,
+            "fsync": self.fsync.value,
+            "overflow": self.overflow.value,
+            **({"segments": self.segments.stats()} if self.segments else {}),
+        }
+
+    # -- writer thread ---------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                # Let records accumulate into one group commit unless a
+                # flush, a blocked producer or shutdown needs us now
+                if not self._closed and not self._flush_requested:
+                    self._wakeup.wait(self.flush_interval)
+                batch = list(self._queue)
+                self._queue.clear()
+                closing = self._closed
+                self._flush_requested = False
+                self._not_full.notify_all()
+
+            if batch:
+                self._commit(batch)
+            elif self._dirty:
+                self._sync()
+
+            with self._lock:
+                self._committed += len(batch)
+                self._drained.notify_all()
+                if closing and not self._queue:
+                    break
+
+        self._sync(force=True)
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _commit(self, batch) -> None:
+        """Serialise and append one batch with a single write."""
+        try:
+            if self.segments is None:
+                data = "".join(json.dumps(record) + "\n" for record in batch).encode("utf-8")
+            else:
+                lines = [(json.dumps(record) + "\n").encode("utf-8") for record in batch]
+                data = b"".join(lines)
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            self._dirty = True
+            self.records_written += len(batch)
+            self.batches_written += 1
+            self._sync(force=self.fsync is FsyncPolicy.BATCH)
+            if self.segments is not None:
+                self.segments.committed(batch, lines, offset)
+                if self.segments.due():
+                    self._rotate()
+        except Exception as e:
+            self.write_errors += 1
+            self.records_dropped += len(batch)
+            logger.error(f"Failed to write to log file: {e}")
+            if self._file:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+    def _rotate(self) -> None:
+        """Close the active file and hand it to the segment store."""
+        self._sync(force=True)
+        self._file.close()
+        self._file = None
+        self.segments.seal()
+
+    def _sync(self, force: bool = False) -> None:
+        """fsync appended data according to the fsync policy."""
+        if self._file is None or not self._dirty or self.fsync is FsyncPolicy.NONE:
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            try:
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                self.write_errors += 1
+                logger.error(f"Failed to fsync log file: {e}")
+            self._dirty = False
+            self._last_fsync = now
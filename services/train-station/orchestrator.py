@@ -14,15 +14,42 @@ Function: Orchestration hub, not a service endpoint
 
 import json
 import logging
+import math
+import os
+import signal
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Dict, Optional, List, Any
-import http.server
-import socketserver
-from urllib.parse import urlparse, parse_qs
+from typing import Dict, Optional, List, Any, Tuple, Iterable
+from urllib.parse import urlparse, parse_qs, unquote
+
+import async_server
+import request_ids
+import route_protocol
+from batch_parser import BatchParser, BatchItemError
+from body_reader import (MAX_INLINE_BYTES, MAX_SPOOL_BYTES, BodyLimits,
+                         RouteBodyParser, SpooledPayload, json_with_payload)
+from log_writer import LogWriter, FsyncPolicy, OverflowPolicy
+from log_segments import SegmentStore, Compression
+from routing_rules import Rule, RuleError, RuleSet
+from routing_table import RoutingConfig, RoutingTable, VersionConflict
+from fair_scheduler import FairScheduler, QueueFull
+from job_scheduler import JobScheduler
+from latency_metrics import LatencyHistograms
+from shared_counters import CounterBlock
+from stats_store import StatsStore
+from dedup_cache import DedupCache
+from rate_limiter import RateLimiter, retry_after_seconds
+from status_stream import CONTENT_TYPE as EVENT_STREAM, StatusStream
+from tracing import SPAN_KIND_CLIENT, Trace, TraceFormat, Tracer, new_span_id
+from prefork import PreforkSupervisor, partner_slot
+from socket_activation import Listeners
+from route_protocol import RouteRejected
+from vertex_proxy import VertexProxy, UpstreamError, PoolSaturated
+from webhook_delivery import WebhookDelivery, parse_webhook
 
 
 # Configure logging
@@ -50,6 +77,14 @@ class RequestType(Enum):
     UNKNOWN = "unknown"
 
 
+# Request types whose large payloads are spooled rather than refused
+SPOOL_TYPES = (RequestType.STORE.value, RequestType.ARCHIVE.value)
+
+# Where a request with a deadline can be dropped: before each handshake
+# phase, and before it is forwarded to a vertex backend
+DEADLINE_PHASES = ("capture", "validate", "route", "forward")
+
+
 class Vertex(Enum):
     """SOMA octahedron vertices with frequencies."""
     TOP_963 = ("monitoring", 963, "Crown")
@@ -70,9 +105,15 @@ class Request:
     """Represents a request passing through Train Station."""
     id: str
     type: RequestType
-    payload: Dict[str, Any]
+    # Decoded JSON, or a SpooledPayload for a large STORE/ARCHIVE upload
+    payload: Any
     source: str
     timestamp: str
+    priority: int = 0
+    # The id was made up by the Train Station, so retries cannot repeat it
+    generated_id: bool = False
+    # time.monotonic() after which the caller no longer waits for an answer
+    deadline: Optional[float] = None
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON serialization."""
@@ -81,7 +122,8 @@ class Request:
             "type": self.type.value,
             "payload": self.payload,
             "source": self.source,
-            "timestamp": self.timestamp
+            "timestamp": self.timestamp,
+            "priority": self.priority
         }
 
 
@@ -92,6 +134,15 @@ class RoutingResult:
     vertex: Optional[Vertex]
     message: str
     request_id: str
+    rule: Optional[str] = None
+    # Replayed from the dedup cache: a retry of an already routed request
+    duplicate: bool = False
+    # Version of the routing config that made the decision
+    config_version: Optional[int] = None
+    # Rate limited: seconds until the source may send again
+    retry_after: Optional[float] = None
+    # Dropped because its deadline passed before the handshake finished
+    expired: bool = False
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON serialization."""
@@ -101,10 +152,25 @@ class RoutingResult:
             "frequency": self.vertex.frequency if self.vertex else None,
             "chakra": self.vertex.chakra if self.vertex else None,
             "message": self.message,
-            "request_id": self.request_id
+            "request_id": self.request_id,
+            "rule": self.rule,
+            "duplicate": self.duplicate,
+            "config_version": self.config_version,
+            "retry_after": self.retry_after,
+            "expired": self.expired
         }
 
 
+def resolve_vertex(name: str) -> Vertex:
+    """Look up a vertex by enum name (SOUTH_741) or vertex name (compute)."""
+    if name in Vertex.__members__:
+        return Vertex[name]
+    for vertex in Vertex:
+        if vertex.vertex_name == name:
+            return vertex
+    raise KeyError(name)
+
+
 class TrainStationOrchestrator:
     """
     🚂 Train Station at SOMA center (852 Hz)
@@ -127,31 +193,83 @@ class TrainStationOrchestrator:
         RequestType.HEALTH_CHECK: Vertex.TOP_963,
     }
     
-    def __init__(self, log_path: Path = Path("/var/log/SOMA/train-station.log")):
+    # Counter block columns: total requests, then one per vertex
+    COUNTERS = ["requests"] + [vertex.vertex_name for vertex in Vertex]
+    
+    def __init__(self, log_path: Path = Path("/var/log/SOMA/train-station.log"),
+                 log_writer: Optional[LogWriter] = None,
+                 routing_rules: Optional[RuleSet] = None,
+                 counters: Optional[CounterBlock] = None,
+                 dedup: Optional[DedupCache] = None,
+                 routing: Optional[RoutingConfig] = None,
+                 tracer: Optional[Tracer] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         self.frequency = 852
         self.position = "center"
         self.symbol = "🚂"
         self.log_path = log_path
-        self.request_count = 0
-        self.vertex_counts = {vertex: 0 for vertex in Vertex}
+        
+        # Request and per-vertex counters; shared between prefork workers
+        # when a shared CounterBlock is passed in
+        self.counters = counters or CounterBlock(self.COUNTERS)
+        self._vertex_column = {vertex: i + 1 for i, vertex in enumerate(Vertex)}
         
         # Ensure log directory exists
         self.log_path.parent.mkdir(parents=True, exist_ok=True)
         
+        # Structured log records are group-committed off the request path
+        self.log_writer = log_writer or LogWriter(self.log_path)
+        
+        # Live routing table: payload-aware rules checked before the
+        # per-type routes (ROUTING_MAP unless the config overrides it).
+        # Reloads swap routing.current; requests never take a lock
+        self.routing = routing or RoutingConfig(
+            self.ROUTING_MAP, RequestType, resolve_vertex, rules=routing_rules
+        )
+        
+        # Token buckets per source and (source, type); the limits come
+        # from the routing table, the bucket state lives here
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        
+        # Per-phase latency, keyed by (phase, request type, vertex)
+        self.latency = LatencyHistograms()
+        
+        # Results of recently routed request ids, replayed to retries
+        self.dedup = dedup
+        
+        # Sampled handshake spans (opt-in); None costs one check per request
+        self.tracer = tracer
+        
+        # When this process started routing; changes with every restart
+        self.started = datetime.now().isoformat()
+        
+        # Saves counters and latency across restarts (set up by main()
+        # with --stats-path); closed with the orchestrator
+        self.stats_store: Optional[StatsStore] = None
+        
+        # Delivers WEBHOOK requests routed to NORTH_639 (set up by main()
+        # with --webhook-outbox); closed with the orchestrator
+        self.webhooks: Optional[WebhookDelivery] = None
+        
+        # Requests dropped because their deadline passed, by the phase
+        # they would have entered next
+        self.expired = {phase: 0 for phase in DEADLINE_PHASES}
+        
         logger.info(f"Train Station Orchestrator initialized")
         logger.info(f"Position: {self.position}")
         logger.info(f"Frequency: {self.frequency} Hz (Crown Base)")
         logger.info(f"Symbol: {self.symbol}")
         logger.info(f"Log path: {self.log_path}")
     
-    def capture(self, request: Request) -> Request:
+    def capture(self, request: Request,
+                log_batch: Optional[List[Dict]] = None) -> Request:
         """
         Step 1 of Triadic Handshake: CAPTURE
         Receive request from DOJO or internal source.
         """
-        logger.info(f"CAPTURE: Request {request.id} from {request.source}")
-        logger.info(f"  Type: {request.type.value}")
-        self.request_count += 1
+        logger.debug("CAPTURE: Request %s from %s", request.id, request.source)
+        logger.debug("  Type: %s", request.type.value)
+        self.counters.add(0)
         
         # Log to file
         self._log_to_file({
@@ -160,68 +278,114 @@ class TrainStationOrchestrator:
             "type": request.type.value,
             "source": request.source,
             "timestamp": request.timestamp
-        })
+        }, log_batch)
         
         return request
     
-    def validate(self, request: Request) -> bool:
+    def validate(self, request: Request,
+                 log_batch: Optional[List[Dict]] = None,
+                 table: Optional[RoutingTable] = None) -> bool:
         """
         Step 2 of Triadic Handshake: VALIDATE
         Check geometric coherence, permissions, dependencies.
         """
-        logger.info(f"VALIDATE: Request {request.id}")
+        return self._validate(request, log_batch, table) is None
+    
+    def _validate(self, request: Request, log_batch: Optional[List[Dict]],
+                  table: Optional[RoutingTable]) -> Optional[float]:
+        """
+        VALIDATE, returning None if the request passed; otherwise how many
+        seconds a rate-limited source should wait, or 0 for other failures.
+        """
+        logger.debug("VALIDATE: Request %s", request.id)
         
         # Basic validation: check if request type is known
         if request.type == RequestType.UNKNOWN:
-            logger.warning(f"  Unknown request type, validation failed")
+            logger.warning("  Unknown request type, validation failed")
             self._log_to_file({
                 "phase": "validate",
                 "request_id": request.id,
                 "success": False,
                 "reason": "unknown_request_type"
-            })
-            return False
+            }, log_batch)
+            return 0.0
         
         # Check if we have a routing rule for this request type
-        if request.type not in self.ROUTING_MAP:
-            logger.warning(f"  No routing rule for type {request.type.value}")
+        table = table or self.routing.current
+        if request.type not in table.routes:
+            logger.warning("  No routing rule for type %s", request.type.value)
             self._log_to_file({
                 "phase": "validate",
                 "request_id": request.id,
                 "success": False,
                 "reason": "no_routing_rule"
-            })
-            return False
+            }, log_batch)
+            return 0.0
+        
+        # With webhook delivery on, a webhook must say what to deliver where
+        if self.webhooks is not None and request.type == RequestType.WEBHOOK:
+            try:
+                parse_webhook(request.id, request.payload, 0.0)
+            except ValueError as e:
+                logger.warning("  Invalid webhook: %s", e)
+                self._log_to_file({
+                    "phase": "validate",
+                    "request_id": request.id,
+                    "success": False,
+                    "reason": "invalid_webhook"
+                }, log_batch)
+                return 0.0
         
-        logger.info(f"  Validation passed")
+        # Per-source and per-(source, type) token buckets
+        if table.limits is not None:
+            limited = self.rate_limiter.check(request.source, request.type.value, table.limits)
+            if limited is not None:
+                scope, retry_after = limited
+                logger.warning("  Rate limited (%s) source %s", scope, request.source)
+                self._log_to_file({
+                    "phase": "validate",
+                    "request_id": request.id,
+                    "success": False,
+                    "reason": "rate_limited",
+                    "scope": scope
+                }, log_batch)
+                return retry_after
+        
+        logger.debug("  Validation passed")
         self._log_to_file({
             "phase": "validate",
             "request_id": request.id,
             "success": True
-        })
-        return True
+        }, log_batch)
+        return None
     
-    def route(self, request: Request) -> RoutingResult:
+    def route(self, request: Request,
+              log_batch: Optional[List[Dict]] = None,
+              table: Optional[RoutingTable] = None) -> RoutingResult:
         """
         Step 3 of Triadic Handshake: ROUTE
-        Forward to appropriate vertex based on request type.
+        Forward to appropriate vertex: the first matching routing rule,
+        otherwise the default vertex for the request type.
         """
-        vertex = self.ROUTING_MAP.get(request.type)
+        table = table or self.routing.current
+        vertex, rule = table.select(request)
         
         if not vertex:
-            logger.error(f"ROUTE: No vertex found for {request.type.value}")
+            logger.error("ROUTE: No vertex found for %s", request.type.value)
             return RoutingResult(
                 success=False,
                 vertex=None,
                 message=f"No routing rule for request type: {request.type.value}",
-                request_id=request.id
+                request_id=request.id,
+                config_version=table.version
             )
         
-        logger.info(f"ROUTE: Request {request.id} → {vertex.vertex_name}")
-        logger.info(f"  Vertex: {vertex.vertex_name} ({vertex.frequency} Hz - {vertex.chakra})")
+        logger.debug("ROUTE: Request %s → %s", request.id, vertex.vertex_name)
+        logger.debug("  Vertex: %s (%s Hz - %s)",
+                     vertex.vertex_name, vertex.frequency, vertex.chakra)
         
         # Update vertex routing counter
-        self.vertex_counts[vertex] += 1
+        self.counters.add(self._vertex_column[vertex])
         
         # Log to file
         self._log_to_file({
@@ -229,34 +393,245 @@ class TrainStationOrchestrator:
             "request_id": request.id,
             "vertex": vertex.vertex_name,
             "frequency": vertex.frequency,
-            "chakra": vertex.chakra
-        })
+            "chakra": vertex.chakra,
+            "rule": rule.name if rule else None,
+            "config_version": table.version
+        }, log_batch)
         
         return RoutingResult(
             success=True,
             vertex=vertex,
             message=f"Routed to {vertex.vertex_name} vertex",
-            request_id=request.id
+            request_id=request.id,
+            rule=rule.name if rule else None,
+            config_version=table.version
         )
     
-    def route_request(self, request: Request) -> RoutingResult:
+    @property
+    def request_count(self) -> int:
+        """Requests captured (by every worker, in prefork mode)."""
+        return self.counters.total(0)
+    
+    @property
+    def vertex_counts(self) -> Dict[Vertex, int]:
+        """Requests routed per vertex (by every worker, in prefork mode)."""
+        totals = self.counters.totals()
+        return {vertex: totals[column] for vertex, column in self._vertex_column.items()}
+    
+    def check_deadline(self, request: Request, phase: str,
+                       table: Optional[RoutingTable] = None,
+                       log_batch: Optional[List[Dict]] = None,
+                       reserve: float = 0.0) -> Optional[RoutingResult]:
+        """
+        The expired result for a request whose deadline has passed before
+        phase, or will have within ``reserve`` seconds (the time the phase
+        is expected to take); None if it still has time (or no deadline).
+        """
+        if request.deadline is None or time.monotonic() + reserve < request.deadline:
+            return None
+        self.expired[phase] += 1
+        logger.info("EXPIRED: Request %s deadline passed before %s", request.id, phase)
+        if phase != "capture":
+            # Captured requests log why their handshake stopped
+            self._log_to_file({
+                "phase": phase,
+                "request_id": request.id,
+                "success": False,
+                "reason": "deadline_exceeded"
+            }, log_batch)
+        return RoutingResult(
+            success=False,
+            vertex=None,
+            message=f"Deadline exceeded before {phase}",
+            request_id=request.id,
+            config_version=(table or self.routing.current).version,
+            expired=True
+        )
+    
+    def select_vertex(self, request: Request) -> Tuple[Optional[Vertex], Optional[Rule]]:
+        """Pick the target vertex (and the rule that chose it) without routing."""
+        return self.routing.current.select(request)
+    
+    def route_request(self, request: Request,
+                      log_batch: Optional[List[Dict]] = None,
+                      trace: Optional[Trace] = None) -> RoutingResult:
         """
         Complete Triadic Handshake: Capture → Validate → Route
+        
+        A retry of a request id routed within the dedup TTL gets the stored
+        result back, marked duplicate, without another handshake. With a
+        sampled trace, each phase is recorded as a span. A request with a
+        deadline is dropped (expired) at the first phase it reaches too late.
         """
+        dedup = self.dedup if not request.generated_id else None
+        if dedup is not None:
+            replay = dedup.get(request.id)
+            if replay is not None:
+                logger.debug("DEDUP: Request %s already routed, replaying result", request.id)
+                return replay
+        
+        clock = time.perf_counter_ns
+        started = clock()
+        # One routing table for the whole handshake, even if a reload lands
+        table = self.routing.current
+        deadline = request.deadline
+        if deadline is not None:
+            expired = self.check_deadline(request, "capture", table)
+            if expired is not None:
+                return expired
+        
         # Step 1: Capture
-        captured = self.capture(request)
+        captured = self.capture(request, log_batch)
+        captured_at = clock()
+        if deadline is not None:
+            expired = self.check_deadline(request, "validate", table, log_batch)
+            if expired is not None:
+                return expired
         
         # Step 2: Validate
-        if not self.validate(captured):
-            return RoutingResult(
+        routed_at = None
+        rejected = self._validate(captured, log_batch, table)
+        if rejected is not None:
+            validated_at = clock()
+            self._observe_phases(request, None, started, captured_at, validated_at)
+            result = RoutingResult(
                 success=False,
                 vertex=None,
-                message="Validation failed",
-                request_id=request.id
+                message="Rate limited" if rejected else "Validation failed",
+                request_id=request.id,
+                config_version=table.version,
+                retry_after=rejected or None
             )
+        else:
+            validated_at = clock()
+            if deadline is not None:
+                expired = self.check_deadline(request, "route", table, log_batch)
+                if expired is not None:
+                    return expired
+            
+            # Step 3: Route
+            result = self.route(captured, log_batch, table)
+            if (self.webhooks is not None and result.vertex is Vertex.NORTH_639
+                    and request.type == RequestType.WEBHOOK):
+                # Into the outbox; delivered from the event loop
+                deliveries = self.webhooks.submit(request.id, request.payload)
+                self._log_to_file({
+                    "phase": "webhook",
+                    "request_id": request.id,
+                    "deliveries": deliveries
+                }, log_batch)
+            routed_at = clock()
+            self._observe_phases(request, result.vertex, started, captured_at,
+                                 validated_at, routed_at)
+        
+        if trace is not None:
+            self._trace_phases(trace, request, result, started, captured_at,
+                               validated_at, routed_at)
         
-        # Step 3: Route
-        return self.route(captured)
+        if dedup is not None and result.retry_after is None:
+            # A rate-limited request has not been routed; its retry may be
+            dedup.put(request.id, replace(result, duplicate=True))
+        return result
+    
+    def _observe_phases(self, request: Request, vertex: Optional[Vertex],
+                        started: int, captured_at: int, validated_at: int,
+                        routed_at: Optional[int] = None) -> None:
+        """Record handshake phase durations (perf_counter_ns timestamps)."""
+        type_name = request.type.value
+        vertex_name = vertex.vertex_name if vertex else "none"
+        observe = self.latency.observe
+        observe(("capture", type_name, vertex_name), captured_at - started)
+        observe(("validate", type_name, vertex_name), validated_at - captured_at)
+        if routed_at is not None:
+            observe(("route", type_name, vertex_name), routed_at - validated_at)
+        observe(("handshake", type_name, vertex_name), (routed_at or validated_at) - started)
+    
+    def _trace_phases(self, trace: Trace, request: Request, result: RoutingResult,
+                      started: int, captured_at: int, validated_at: int,
+                      routed_at: Optional[int]) -> None:
+        """Record handshake phases as spans, reusing the histogram timestamps."""
+        trace.span("capture", started, captured_at, {
+            "request.id": request.id,
+            "request.type": request.type.value,
+            "request.source": request.source,
+        })
+        trace.span("validate", captured_at, validated_at,
+                   {"success": routed_at is not None})
+        if routed_at is not None:
+            trace.span("route", validated_at, routed_at, {
+                "vertex": result.vertex.vertex_name if result.vertex else "none",
+                "rule": result.rule or "",
+                "config_version": result.config_version,
+            })
+    
+    def start_trace(self, traceparent: Optional[str] = None) -> Optional[Trace]:
+        """Head sampling decision for a request entering the Train Station."""
+        if self.tracer is None:
+            return None
+        return self.tracer.start(traceparent)
+    
+    def observe_respond(self, request: Request, vertex: Optional[Vertex],
+                        started: int) -> None:
+        """Record the respond phase, from the end of the handshake until the
+        response is ready to send."""
+        self.latency.observe(
+            ("respond", request.type.value, vertex.vertex_name if vertex else "none"),
+            time.perf_counter_ns() - started
+        )
+    
+    def metrics(self) -> str:
+        """Prometheus text exposition of counters and latency histograms."""
+        lines = [
+            "# HELP train_station_requests_total Requests captured by the Train Station.",
+            "# TYPE train_station_requests_total counter",
+            f"train_station_requests_total {self.request_count}",
+            "# HELP train_station_vertex_routed_total Requests routed to each vertex.",
+            "# TYPE train_station_vertex_routed_total counter",
+        ]
+        for vertex, count in self.vertex_counts.items():
+            lines.append(f'train_station_vertex_routed_total{{vertex="{vertex.vertex_name}"}} {count}')
+        lines += [
+            "# HELP train_station_rate_limited_total Requests rejected by rate limits, by bucket scope.",
+            "# TYPE train_station_rate_limited_total counter",
+        ]
+        for scope, count in self.rate_limiter.rejected.items():
+            lines.append(f'train_station_rate_limited_total{{scope="{scope}"}} {count}')
+        lines += [
+            "# HELP train_station_expired_total Requests dropped past their deadline, by the phase they missed.",
+            "# TYPE train_station_expired_total counter",
+        ]
+        for phase, count in self.expired.items():
+            lines.append(f'train_station_expired_total{{phase="{phase}"}} {count}')
+        if self.dedup:
+            lines += [
+                "# HELP train_station_dedup_lookups_total Dedup cache lookups by outcome.",
+                "# TYPE train_station_dedup_lookups_total counter",
+                f'train_station_dedup_lookups_total{{result="hit"}} {self.dedup.hits}',
+                f'train_station_dedup_lookups_total{{result="miss"}} {self.dedup.misses}',
+            ]
+        text = "\n".join(lines) + "\n" + self.latency.prometheus(
+            "train_station_phase_duration_seconds",
+            "Triadic Handshake phase latency."
+        )
+        if self.webhooks:
+            text += self.webhooks.prometheus()
+        return text
+    
+    def route_batch(self, requests: Iterable[Request]) -> List[RoutingResult]:
+        """
+        Triadic Handshake over a batch of requests in one pass.
+        Log entries for the whole batch are committed as a single unit.
+        """
+        log_batch: List[Dict] = []
+        results = []
+        for request in requests:
+            trace = self.start_trace()
+            result = self.route_request(request, log_batch, trace)
+            if trace is not None:
+                trace.finish("route_batch_item", {"request.id": request.id})
+            results.append(result)
+        self.log_writer.write_many(log_batch)
+        return results
     
     def get_status(self) -> Dict[str, Any]:
         """Get Train Station status and statistics."""
@@ -272,7 +647,20 @@ class TrainStationOrchestrator:
                 "vertex_routing": {
                     vertex.vertex_name: count 
                     for vertex, count in self.vertex_counts.items()
-                }
+                },
+                "log_writer": self.log_writer.stats(),
+                "dedup": self.dedup.stats() if self.dedup else None,
+                "rate_limits": self.rate_limiter.stats(),
+                "expired": dict(self.expired),
+                "persisted": self.stats_store.stats() if self.stats_store else None
+            },
+            "webhooks": self.webhooks.stats() if self.webhooks else None,
+            "routing": self.routing.stats(),
+            "tracing": self.tracer.stats() if self.tracer else None,
+            "latency": {
+                "phases": self.latency.summary(0),
+                "vertices": self.latency.summary(2, where=(0, "handshake")),
+                "types": self.latency.summary(1, where=(0, "handshake"))
             },
             "octahedron": {
                 "vertices": 6,
@@ -283,105 +671,636 @@ class TrainStationOrchestrator:
             "timestamp": datetime.now().isoformat()
         }
     
-    def _log_to_file(self, data: Dict) -> None:
-        """Log structured data to file."""
-        try:
-            with open(self.log_path, 'a') as f:
-                log_entry = {
-                    "timestamp": datetime.now().isoformat(),
-                    "data": data
-                }
-                f.write(json.dumps(log_entry) + "\n")
-        except Exception as e:
-            logger.error(f"Failed to write to log file: {e}")
-
-
-class TrainStationHTTPHandler(http.server.SimpleHTTPRequestHandler):
-    """HTTP handler for Train Station API."""
-    
-    orchestrator: Optional[TrainStationOrchestrator] = None
+    def live_statistics(self) -> Dict[str, Any]:
+        """The statistics pushed by GET /status/stream, without the static parts."""
+        return {
+            "request_count": self.request_count,
+            "vertex_routing": {
+                vertex.vertex_name: count
+                for vertex, count in self.vertex_counts.items()
+            },
+            "latency": {
+                "phases": self.latency.summary(0),
+                "vertices": self.latency.summary(2, where=(0, "handshake"))
+            },
+            "config_version": self.routing.current.version
+        }
     
-    def do_GET(self):
-        """Handle GET requests."""
-        parsed_path = urlparse(self.path)
-        
-        if parsed_path.path == '/health':
-            self._handle_health()
-        elif parsed_path.path == '/status':
-            self._handle_status()
-        else:
-            self._send_response(404, {"error": "Not found"})
+    def close(self) -> None:
+        """Flush pending log records and stop the log writer."""
+        self.routing.close()
+        if self.tracer:
+            self.tracer.close()
+        if self.stats_store:
+            self.stats_store.close()
+        if self.webhooks:
+            self.webhooks.close()
+        self.log_writer.close()
     
-    def do_POST(self):
-        """Handle POST requests."""
-        parsed_path = urlparse(self.path)
-        
-        if parsed_path.path == '/route':
-            self._handle_route()
+    def _log_to_file(self, data: Dict,
+                     log_batch: Optional[List[Dict]] = None) -> None:
+        """
+        Queue structured data for the group-commit log writer, or collect it
+        in log_batch when the caller commits a whole batch at once.
+        """
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "data": data
+        }
+        if log_batch is not None:
+            log_batch.append(entry)
         else:
-            self._send_response(404, {"error": "Not found"})
+            self.log_writer.write(entry)
+
+
+class TrainStationAPI:
+    """
+    Transport-independent Train Station HTTP API.
+
+    Shared by the threaded ``http.server`` server and the asyncio server so
+    both expose exactly the same /health, /status and /route behaviour.
+    Endpoints that consume their body incrementally (POST /route/batch) are
+    served through ``open_stream`` instead of ``handle``.
     
-    def _handle_health(self):
+    With a VertexProxy (forwarding mode, asyncio server only) POST /route
+    delivers the request to the chosen vertex backend and streams the
+    backend's response back instead of returning the RoutingResult.
+
+    With a StatusStream (asyncio server only) GET /status/stream is a
+    server-sent event feed of live statistics.
+
+    With a JobScheduler (asyncio server only) /schedule takes delayed and
+    recurring route requests, routed through ``route_job`` when due.
+    """
+
+    def __init__(self, orchestrator: Optional[TrainStationOrchestrator],
+                 proxy: Optional[VertexProxy] = None,
+                 scheduler: Optional[FairScheduler] = None,
+                 status_stream: Optional[StatusStream] = None,
+                 body_limits: Optional[BodyLimits] = None,
+                 jobs: Optional[JobScheduler] = None):
+        self.orchestrator = orchestrator
+        self.proxy = proxy
+        self.scheduler = scheduler
+        self.status_stream = status_stream
+        self.jobs = jobs
+        self.body_limits = body_limits or BodyLimits(SPOOL_TYPES)
+        # Set in prefork mode: which worker answered
+        self.worker: Optional[Dict[str, int]] = None
+
+    def open_stream(self, method: str, path: str) -> Optional["BatchRouteStream"]:
+        """Return a streaming body handler for this request, if it has one."""
+        if (method == 'POST' and self.orchestrator
+                and urlparse(path).path == '/route/batch'):
+            return BatchRouteStream(self.orchestrator)
+        return None
+
+    def open_body(self, method: str, path: str, headers: Dict[str, str],
+                  length: Optional[int]) -> Optional["RouteBody"]:
+        """
+        Return an incremental reader for a POST /route body that is chunked
+        or too large to buffer; small bodies are read whole and go to handle.
+        """
+        if (method == 'POST' and urlparse(path).path == '/route'
+                and (length is None or length > self.body_limits.max_inline)):
+            return RouteBody(self, self.body_limits.parser(), headers.get('traceparent'))
+        return None
+
+    # Tells async_server to pass request headers (lower-cased names)
+    accepts_headers = True
+
+    def handle(self, method: str, path: str, body: bytes,
+               headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict]:
+        """Dispatch one request and return (status code, JSON data)."""
+        route = urlparse(path).path
+
+        if method == 'GET':
+            if route == '/health':
+                return self.health()
+            if route == '/status':
+                return self.status()
+            if route == '/status/stream':
+                return self.stream_status()
+            if route == '/metrics':
+                return self.metrics()
+            if route == '/requests':
+                return self.requests(parse_qs(urlparse(path).query))
+            if route.startswith('/requests/'):
+                return self.request_history(unquote(route[len('/requests/'):]))
+            if route == '/admin/routing':
+                return self.routing_config()
+            if route == '/schedule':
+                return self.list_jobs(parse_qs(urlparse(path).query))
+            if route.startswith('/schedule/'):
+                return self.job(unquote(route[len('/schedule/'):]))
+        elif method == 'POST':
+            if route == '/route':
+                return self.route(body, (headers or {}).get('traceparent'))
+            if route == '/admin/routing':
+                return self.update_routing(body)
+            if route == '/admin/routing/reload':
+                return self.reload_routing()
+            if route == '/schedule':
+                return self.add_job(body)
+        elif method == 'DELETE':
+            if route.startswith('/schedule/'):
+                return self.cancel_job(unquote(route[len('/schedule/'):]))
+
+        return 404, {"error": "Not found"}
+
+    __call__ = handle
+
+    def health(self) -> Tuple[int, Dict]:
         """Health check endpoint."""
-        response = {
+        return 200, {
             "status": "healthy",
             "service": "train-station",
             "frequency": "852 Hz",
-            "position": "center"
+            "position": "center",
+            "started": self.orchestrator.started if self.orchestrator else None
         }
-        self._send_response(200, response)
-    
-    def _handle_status(self):
+
+    def status(self) -> Tuple[int, Dict]:
         """Status endpoint."""
-        if self.orchestrator:
-            status = self.orchestrator.get_status()
-            self._send_response(200, status)
+        if not self.orchestrator:
+            return 500, {"error": "Orchestrator not initialized"}
+        status = self.orchestrator.get_status()
+        if self.proxy:
+            status["forwarding"] = self.proxy.stats()
+        if self.scheduler:
+            status["scheduler"] = self.scheduler.stats()
+        if self.status_stream:
+            status["status_stream"] = self.status_stream.stats()
+        if self.jobs:
+            status["jobs"] = self.jobs.stats()
+        if self.worker:
+            status["worker"] = self.worker
+        return 200, status
+
+    def stream_status(self) -> Tuple[int, Dict]:
+        """Server-sent events: a statistics snapshot, then deltas each tick."""
+        if not self.status_stream:
+            return 404, {"error": "Status stream not enabled"}
+
+        async def respond():
+            return async_server.StreamingResponse(
+                200, self.status_stream.subscribe(),
+                content_type=EVENT_STREAM,
+                headers={"Cache-Control": "no-cache"},
+                endless=True
+            )
+        return respond()
+
+    def metrics(self) -> Tuple[int, str, Dict[str, str]]:
+        """Prometheus metrics endpoint."""
+        if not self.orchestrator:
+            return 500, {"error": "Orchestrator not initialized"}
+        text = self.orchestrator.metrics()
+        if self.proxy:
+            text += self.proxy.prometheus()
+        if self.scheduler:
+            text += self.scheduler.prometheus()
+        if self.jobs:
+            text += self.jobs.prometheus()
+        return 200, text, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    def routing_config(self) -> Tuple[int, Dict]:
+        """The live routing config document and its version."""
+        if not self.orchestrator:
+            return 500, {"error": "Orchestrator not initialized"}
+        table = self.orchestrator.routing.current
+        return 200, dict(table.describe(), config=table.spec)
+
+    def update_routing(self, body: bytes) -> Tuple[int, Dict]:
+        """Validate, compile and swap in a new routing config document."""
+        if not self.orchestrator:
+            return 500, {"error": "Orchestrator not initialized"}
+        try:
+            spec = json.loads(body.decode('utf-8'))
+            table, persisted = self.orchestrator.routing.update(spec)
+        except VersionConflict as e:
+            return 409, {"error": str(e),
+                         "version": self.orchestrator.routing.current.version}
+        except (RuleError, ValueError) as e:
+            return 400, {"error": f"Invalid routing config: {e}"}
+        return 200, dict(table.describe(), persisted=persisted)
+
+    def reload_routing(self) -> Tuple[int, Dict]:
+        """Re-read the routing config file."""
+        if not self.orchestrator:
+            return 500, {"error": "Orchestrator not initialized"}
+        routing = self.orchestrator.routing
+        if routing.path is None:
+            return 404, {"error": "No routing config file"}
+        failures = routing.failures
+        changed = routing.reload()
+        if routing.failures > failures:
+            return 400, {"error": "Routing config file rejected; see the log",
+                         "version": routing.current.version}
+        return 200, dict(routing.current.describe(), changed=changed)
+
+    def _log_store(self) -> Optional[SegmentStore]:
+        # In prefork mode this is the answering worker's own log only
+        if not self.orchestrator:
+            return None
+        return self.orchestrator.log_writer.segments
+
+    def request_history(self, request_id: str) -> Tuple[int, Dict]:
+        """Logged handshake records of one request."""
+        store = self._log_store()
+        if store is None:
+            return 404, {"error": "Request index not enabled"}
+        # A generated id tells when its records were logged
+        records = store.lookup(request_id, since=request_ids.logged_since(request_id))
+        if not records:
+            return 404, {"error": "Request not found", "request_id": request_id}
+        return 200, {"request_id": request_id, "records": records}
+
+    def requests(self, query: Dict[str, List[str]]) -> Tuple[int, Dict]:
+        """Logged records since a time, optionally for one vertex."""
+        store = self._log_store()
+        if store is None:
+            return 404, {"error": "Request index not enabled"}
+        since = query.get('since', [None])[0]
+        vertex = query.get('vertex', [None])[0]
+        try:
+            limit = max(1, min(int(query.get('limit', ['100'])[0]), 10000))
+            if since is not None:
+                try:
+                    # Epoch seconds or an ISO timestamp
+                    since = datetime.fromtimestamp(float(since)).isoformat()
+                except ValueError:
+                    since = datetime.fromisoformat(since).isoformat()
+            if vertex is not None:
+                vertex = resolve_vertex(vertex).vertex_name
+        except (KeyError, ValueError) as e:
+            return 400, {"error": f"Invalid query: {e}"}
+        records, truncated = store.query(since=since, vertex=vertex, limit=limit)
+        return 200, {"records": records, "count": len(records), "truncated": truncated}
+
+    def add_job(self, body: bytes) -> Tuple[int, Dict]:
+        """Schedule a delayed or recurring route request."""
+        if not self.jobs:
+            return 404, {"error": "Job scheduler not enabled"}
+        try:
+            job = self.jobs.add(json.loads(body.decode('utf-8')))
+        except ValueError as e:
+            return 400, {"error": f"Invalid job: {e}"}
+        return 201, job.describe()
+
+    def list_jobs(self, query: Dict[str, List[str]]) -> Tuple[int, Dict]:
+        """Pending jobs, in the order they were added."""
+        if not self.jobs:
+            return 404, {"error": "Job scheduler not enabled"}
+        try:
+            limit = max(1, min(int(query.get('limit', ['100'])[0]), 10000))
+        except ValueError as e:
+            return 400, {"error": f"Invalid query: {e}"}
+        jobs = self.jobs.jobs
+        listed = [job.describe() for _, job in zip(range(limit), jobs.values())]
+        return 200, {"jobs": listed, "count": len(jobs), "truncated": len(jobs) > limit}
+
+    def job(self, job_id: str) -> Tuple[int, Dict]:
+        """One pending job."""
+        if not self.jobs:
+            return 404, {"error": "Job scheduler not enabled"}
+        job = self.jobs.jobs.get(job_id)
+        if job is None:
+            return 404, {"error": "Job not found", "id": job_id}
+        return 200, job.describe()
+
+    def cancel_job(self, job_id: str) -> Tuple[int, Dict]:
+        """Cancel a pending job."""
+        if not self.jobs:
+            return 404, {"error": "Job scheduler not enabled"}
+        job = self.jobs.cancel(job_id)
+        if job is None:
+            return 404, {"error": "Job not found", "id": job_id}
+        return 200, dict(job.describe(), cancelled=True)
+
+    def route_job(self, data: Dict[str, Any]) -> bool:
+        """Route a due job's request; whether the handshake succeeded."""
+        return self.orchestrator.route_request(parse_request(data)).success
+
+    def route(self, body: bytes, traceparent: Optional[str] = None) -> Tuple[int, Dict]:
+        """Route request endpoint."""
+        try:
+            return self.route_data(json.loads(body.decode('utf-8')), traceparent)
+        except Exception as e:
+            logger.error(f"Error handling route request: {e}")
+            return 500, {"error": str(e)}
+
+    def route_data(self, data: Dict[str, Any], traceparent: Optional[str] = None):
+        """Route a decoded POST /route body."""
+        try:
+            request = parse_request(data)
+        except ValueError as e:
+            return 400, {"error": f"Invalid request: {e}"}
+        if not self.orchestrator:
+            return 500, {"error": "Orchestrator not initialized"}
+        trace = self.orchestrator.start_trace(traceparent)
+        if self.scheduler:
+            return self.schedule(request, trace)
+        return self.route_now(request, trace)
+
+    def route_now(self, request: Request, trace: Optional[Trace] = None):
+        """Run the handshake, forwarding the request when a backend is set."""
+        result = self.orchestrator.route_request(request, trace=trace)
+        handshake_done = time.perf_counter_ns()
+        if (self.proxy and result.success and not result.duplicate
+                and self.proxy.has(result.vertex)):
+            # Forwarding only pays off if the backend can answer in time
+            expired = self.orchestrator.check_deadline(
+                request, "forward", reserve=self.proxy.expected_latency(result.vertex))
+            if expired is None:
+                return self.forward(request, result, handshake_done, trace)
+            self._not_delivered(request)
+            result = replace(result, success=False, message=expired.message, expired=True)
+        if result.expired:
+            response = 504, result.to_dict()
+        elif result.retry_after is not None:
+            response = 429, result.to_dict(), {
+                "Retry-After": str(retry_after_seconds(result.retry_after))
+            }
         else:
-            self._send_response(500, {"error": "Orchestrator not initialized"})
+            response = 200, result.to_dict()
+        self.orchestrator.observe_respond(request, result.vertex, handshake_done)
+        if trace is not None:
+            trace.finish("POST /route", {"request.id": request.id,
+                                         "http.status_code": response[0]})
+        return response
+
+    def _not_delivered(self, request: Request) -> None:
+        """Forget the cached result, so a retry is routed and forwarded again."""
+        if self.orchestrator.dedup is not None:
+            self.orchestrator.dedup.discard(request.id)
     
-    def _handle_route(self):
-        """Route request endpoint."""
+    def schedule(self, request: Request, trace: Optional[Trace] = None):
+        """Queue the request on its vertex for weighted fair dispatch."""
+        vertex, _ = self.orchestrator.select_vertex(request)
+        if vertex is None:
+            # Nothing to queue on; let the handshake reject it
+            return self.route_now(request, trace)
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            # Parse request
-            request_type_str = data.get('type', 'unknown')
-            try:
-                request_type = RequestType(request_type_str)
-            except ValueError:
-                request_type = RequestType.UNKNOWN
-            
-            request = Request(
-                id=data.get('id', f"req-{int(time.time())}"),
-                type=request_type,
-                payload=data.get('payload', {}),
-                source=data.get('source', 'unknown'),
-                timestamp=datetime.now().isoformat()
-            )
-            
-            # Route through orchestrator
-            if self.orchestrator:
-                result = self.orchestrator.route_request(request)
-                self._send_response(200, result.to_dict())
+            return self.scheduler.submit(vertex, lambda: self.route_now(request, trace),
+                                         deadline=request.deadline)
+        except QueueFull as e:
+            if trace is not None:
+                trace.finish("POST /route", {"request.id": request.id, "http.status_code": 503})
+            return 503, {
+                "error": str(e),
+                "vertex": vertex.vertex_name,
+                "request_id": request.id
+            }, {"Retry-After": str(e.retry_after)}
+
+    def route_message(self, data: Dict[str, Any]):
+        """
+        Route one binary-protocol request. Returns the RoutingResult dict, or
+        a future of it with fair queueing; a full queue raises RouteRejected.
+        The routing decision is answered directly, even in forwarding mode.
+        A ROUTE_TIMED frame's timeout arrives as timeout_ms, as on POST /route.
+        """
+        if not self.orchestrator:
+            raise RouteRejected(500, "Orchestrator not initialized")
+        try:
+            request = parse_request(data)
+        except ValueError as e:
+            raise RouteRejected(400, f"Invalid request: {e}") from None
+        trace = self.orchestrator.start_trace()
+        if self.scheduler:
+            vertex, _ = self.orchestrator.select_vertex(request)
+            if vertex is not None:
+                try:
+                    return self.scheduler.submit(
+                        vertex, lambda: self._route_result(request, trace),
+                        deadline=request.deadline)
+                except QueueFull as e:
+                    raise RouteRejected(503, str(e), e.retry_after) from None
+        return self._route_result(request, trace)
+
+    def _route_result(self, request: Request, trace: Optional[Trace] = None) -> Dict:
+        result = self.orchestrator.route_request(request, trace=trace)
+        handshake_done = time.perf_counter_ns()
+        response = result.to_dict()
+        self.orchestrator.observe_respond(request, result.vertex, handshake_done)
+        if trace is not None:
+            trace.finish("route_message", {"request.id": request.id})
+        if result.expired:
+            raise RouteRejected(504, result.message)
+        if result.retry_after is not None:
+            raise RouteRejected(429, result.message, retry_after_seconds(result.retry_after))
+        return response
+
+    async def forward(self, request: Request, result: RoutingResult,
+                      handshake_done: int, trace: Optional[Trace] = None):
+        """Deliver a routed request to its vertex backend (forwarding mode)."""
+        headers = {
+            "X-Request-Id": request.id,
+            "X-Train-Station-Vertex": result.vertex.vertex_name,
+        }
+        if trace is not None:
+            span_id = new_span_id()
+            headers["traceparent"] = trace.traceparent(span_id)
+        if request.deadline is not None:
+            # The backend can give up when the caller does
+            remaining = max(0, int((request.deadline - time.monotonic()) * 1000))
+            headers["X-Request-Timeout-Ms"] = str(remaining)
+        if isinstance(request.payload, SpooledPayload):
+            fields = request.to_dict()
+            del fields["payload"]
+            body = json_with_payload(fields, request.payload)
+        else:
+            body = json.dumps(request.to_dict()).encode('utf-8')
+        status = 0
+        try:
+            response = await self.proxy.forward(result.vertex, body, headers)
+            status = response.status
+            return response
+        except PoolSaturated as e:
+            status = 503
+            self._not_delivered(request)
+            return 503, {"error": str(e), "routing": result.to_dict()}, {"Retry-After": "1"}
+        except UpstreamError as e:
+            status = 502
+            logger.error(f"Forwarding {request.id} to {result.vertex.vertex_name} failed: {e}")
+            self._not_delivered(request)
+            return 502, {"error": str(e), "routing": result.to_dict()}
+        finally:
+            # Until the backend's response head arrives; the body streams after
+            self.orchestrator.observe_respond(request, result.vertex, handshake_done)
+            if trace is not None:
+                attributes = {"vertex": result.vertex.vertex_name, "http.status_code": status}
+                trace.span("forward", handshake_done, time.perf_counter_ns(), attributes,
+                           span_id=span_id, kind=SPAN_KIND_CLIENT)
+                trace.finish("POST /route", dict(attributes, **{"request.id": request.id}))
+
+
+class BatchRouteStream:
+    """
+    POST /route/batch: route a JSON array or NDJSON body while it streams in.
+
+    Each ``feed()`` routes the items completed by that chunk as one batch and
+    returns their RoutingResults as NDJSON lines, in request order.
+    """
+
+    status = 200
+    content_type = "application/x-ndjson"
+
+    def __init__(self, orchestrator: TrainStationOrchestrator):
+        self.orchestrator = orchestrator
+        self.parser = BatchParser()
+        self.index = 0
+        self.failed = False
+
+    def feed(self, data: bytes) -> bytes:
+        """Consume a body chunk; return response lines for completed items."""
+        if self.failed:
+            return b""
+        try:
+            items = self.parser.feed(data)
+        except ValueError as e:
+            return self._fail(e)
+        return self._route(items)
+
+    def finish(self) -> bytes:
+        """End of body; return response lines for any remaining items."""
+        if self.failed:
+            return b""
+        try:
+            items = self.parser.close()
+        except ValueError as e:
+            return self._fail(e)
+        return self._route(items)
+
+    def _route(self, items: List) -> bytes:
+        if not items:
+            return b""
+
+        parsed = []
+        for item in items:
+            if not isinstance(item, BatchItemError):
+                try:
+                    item = parse_request(item)
+                except (TypeError, ValueError) as e:
+                    item = BatchItemError(f"Invalid request: {e}")
+            parsed.append(item)
+        items = parsed
+
+        requests = [item for item in items if not isinstance(item, BatchItemError)]
+        results = iter(self.orchestrator.route_batch(requests))
+
+        lines = []
+        for item in items:
+            if isinstance(item, BatchItemError):
+                line = {"success": False, "error": item.message, "index": self.index}
             else:
-                self._send_response(500, {"error": "Orchestrator not initialized"})
-        
+                line = next(results).to_dict()
+            lines.append(json.dumps(line))
+            self.index += 1
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+    def _fail(self, error: Exception) -> bytes:
+        logger.error(f"Error parsing batch route request: {error}")
+        self.failed = True
+        line = {"success": False, "error": str(error), "index": self.index}
+        return (json.dumps(line) + "\n").encode('utf-8')
+
+
+class RouteBody:
+    """
+    A POST /route body read as it arrives (``open_body`` sink): the fields
+    are kept, and a payload too large to hold in memory is spooled when the
+    request type allows it (SPOOL_TYPES); see body_reader.
+    """
+
+    def __init__(self, api: "TrainStationAPI", parser: RouteBodyParser,
+                 traceparent: Optional[str] = None):
+        self.api = api
+        self.parser = parser
+        self.limit = parser.max_inline + parser.max_spool
+        self.traceparent = traceparent
+
+    def feed(self, data: bytes) -> None:
+        self.parser.feed(data)
+
+    def finish(self):
+        """Route the request; the spooled payload is dropped once answered."""
+        fields, payload = self.parser.close()
+        result = self._route(dict(fields, payload=payload))
+        if not isinstance(payload, SpooledPayload):
+            return result
+        if isinstance(result, tuple):
+            payload.close()
+            return result
+
+        async def respond():
+            try:
+                return await result
+            finally:
+                payload.close()
+        return respond()
+
+    def _route(self, data: Dict[str, Any]):
+        try:
+            return self.api.route_data(data, self.traceparent)
         except Exception as e:
             logger.error(f"Error handling route request: {e}")
-            self._send_response(500, {"error": str(e)})
-    
-    def _send_response(self, status_code: int, data: Dict):
-        """Send JSON response."""
-        self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode('utf-8'))
-    
-    def log_message(self, format, *args):
-        """Override to use our logger."""
-        logger.info(f"HTTP: {format % args}")
+            return 500, {"error": str(e)}
+
+    def close(self) -> None:
+        self.parser.discard()
+
+
+def parse_request(data: Dict[str, Any]) -> Request:
+    """Build a Request from the decoded JSON body of a route call."""
+    request_type_str = data.get('type', 'unknown')
+    try:
+        request_type = RequestType(request_type_str)
+    except ValueError:
+        request_type = RequestType.UNKNOWN
+
+    # Callers without an id get a time-ordered snowflake id
+    request_id = data.get('id')
+    return Request(
+        id=request_id or request_ids.new_request_id(),
+        type=request_type,
+        payload=data.get('payload', {}),
+        source=data.get('source', 'unknown'),
+        timestamp=datetime.now().isoformat(),
+        priority=int(data.get('priority', 0)),
+        generated_id=not request_id,
+        deadline=parse_deadline(data)
+    )
+
+
+def parse_deadline(data: Dict[str, Any]) -> Optional[float]:
+    """
+    The request's deadline on the monotonic clock, from ``timeout_ms``
+    (counted from now) and/or ``deadline`` (Unix time in seconds, which
+    also covers time spent before the request reached us); the earlier
+    of the two. None if neither is given; ValueError unless each given one
+    is a finite number.
+    """
+    timeout_ms, deadline = data.get('timeout_ms'), data.get('deadline')
+    if timeout_ms is None and deadline is None:
+        return None
+    now = time.monotonic()
+    candidates = []
+    if timeout_ms is not None:
+        candidates.append(now + _finite('timeout_ms', timeout_ms) / 1000)
+    if deadline is not None:
+        candidates.append(now + _finite('deadline', deadline) - time.time())
+    return min(candidates)
+
+
+def _finite(name: str, value: Any) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = math.nan
+    if isinstance(value, bool) or not math.isfinite(number):
+        raise ValueError(f"{name} must be a finite number, got {value!r}")
+    return number
 
 
 def main():
@@ -403,29 +1322,579 @@ def main():
         default=Path("/var/log/SOMA/train-station.log"),
         help="Path to log file"
     )
+    parser.add_argument(
+        "--server",
+        choices=["threaded", "asyncio"],
+        default="threaded",
+        help="HTTP server implementation (default: threaded). 'asyncio' "
+             "serves keep-alive and pipelined connections on one event loop"
+    )
+    parser.add_argument(
+        "--log-flush-interval",
+        type=float,
+        default=0.05,
+        help="Seconds log records accumulate before a group commit (default: 0.05)"
+    )
+    parser.add_argument(
+        "--log-fsync",
+        choices=[policy.value for policy in FsyncPolicy],
+        default=FsyncPolicy.INTERVAL.value,
+        help="fsync policy for the log file (default: interval)"
+    )
+    parser.add_argument(
+        "--log-queue-size",
+        type=int,
+        default=65536,
+        help="Maximum log records held in memory (default: 65536)"
+    )
+    parser.add_argument(
+        "--log-overflow",
+        choices=[policy.value for policy in OverflowPolicy],
+        default=OverflowPolicy.DROP.value,
+        help="Drop records or block requests when the log queue is full (default: drop)"
+    )
+    parser.add_argument(
+        "--log-segment-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Seal the log into a compressed, indexed segment at this size; "
+             "0 disables rotation and the /requests endpoints (default: 64 MiB)"
+    )
+    parser.add_argument(
+        "--log-segment-age",
+        type=float,
+        default=3600.0,
+        help="Also seal the log after this many seconds (default: 3600)"
+    )
+    parser.add_argument(
+        "--log-compression",
+        choices=[codec.value for codec in Compression],
+        default=Compression.GZIP.value,
+        help="Codec for sealed log segments (default: gzip)"
+    )
+    parser.add_argument(
+        "--log-retain-segments",
+        type=int,
+        default=0,
+        help="Delete the oldest sealed segments beyond this count (default: 0, keep all)"
+    )
+    
+    parser.add_argument(
+        "--dedup-ttl",
+        type=float,
+        default=300.0,
+        help="Seconds a routed request id's result is replayed to retries "
+             "instead of routing them again; 0 disables dedup (default: 300)"
+    )
+    parser.add_argument(
+        "--dedup-max-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Memory budget of the dedup cache; the oldest ids are dropped "
+             "first (default: 64 MiB)"
+    )
+    
+    parser.add_argument(
+        "--trace-sample-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests traced (head sampling); requests with a "
+             "sampled traceparent are always traced once tracing is on "
+             "(default: 0, tracing off)"
+    )
+    parser.add_argument(
+        "--trace-path",
+        type=Path,
+        default=None,
+        help="Span export file (default: traces.jsonl next to the log); "
+             "enables tracing of sampled traceparent requests even at rate 0"
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=[fmt.value for fmt in TraceFormat],
+        default=TraceFormat.JSONL.value,
+        help="Span export format: one span per line, or OTLP/JSON "
+             "(default: jsonl)"
+    )
+    parser.add_argument(
+        "--status-stream-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between GET /status/stream updates, computed once for "
+             "all subscribers; 0 disables the stream (default: 1, asyncio server)"
+    )
+    parser.add_argument(
+        "--max-body-bytes",
+        type=int,
+        default=MAX_INLINE_BYTES,
+        help="Largest POST /route body (without a spooled payload) held in "
+             "memory; bigger bodies are refused with 413 (default: 1 MiB)"
+    )
+    parser.add_argument(
+        "--max-spool-bytes",
+        type=int,
+        default=MAX_SPOOL_BYTES,
+        help="Largest store/archive payload spooled to a temporary file "
+             "(default: 1 GiB)"
+    )
+    parser.add_argument(
+        "--spool-dir",
+        default=None,
+        help="Directory for spooled payloads (default: the system temp dir)"
+    )
+    parser.add_argument(
+        "--stats-path",
+        type=Path,
+        default=None,
+        help="Keep request counters and latency histograms across restarts "
+             "in this snapshot file, plus a .journal next to it (default: off)"
+    )
+    parser.add_argument(
+        "--stats-snapshot-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between stats snapshots; changes in between go to the "
+             "journal every second (default: 60)"
+    )
+    parser.add_argument(
+        "--jobs-path",
+        type=Path,
+        default=None,
+        help="Enable /schedule for delayed and recurring route requests, kept "
+             "across restarts in this journal (asyncio server, one worker; "
+             "default: off)"
+    )
+    parser.add_argument(
+        "--webhook-outbox",
+        type=Path,
+        default=None,
+        help="Deliver WEBHOOK requests routed to the communication vertex to "
+             "their payload's URLs, from this outbox (asyncio server; "
+             "default: off)"
+    )
+    parser.add_argument(
+        "--webhook-max-parallel",
+        type=int,
+        default=64,
+        help="Webhook batches in flight at once across endpoints (default: 64)"
+    )
+    parser.add_argument(
+        "--webhook-max-batch",
+        type=int,
+        default=100,
+        help="Webhook deliveries sent to one endpoint in one request (default: 100)"
+    )
+    parser.add_argument(
+        "--webhook-max-attempts",
+        type=int,
+        default=12,
+        help="Failed attempts before a webhook delivery is dropped (default: 12)"
+    )
+    
+    parser.add_argument(
+        "--routing-config", "--routing-rules",
+        dest="routing_config",
+        type=Path,
+        default=None,
+        help="JSON routing config: per-type routes and payload-aware rules. "
+             "Reloaded when it changes and written by POST /admin/routing "
+             "(default: route by type only)"
+    )
+    parser.add_argument(
+        "--routing-reload-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between checks of the routing config file for changes; "
+             "0 only reloads on POST /admin/routing/reload (default: 2)"
+    )
+    
+    parser.add_argument(
+        "--vertex-backends",
+        type=Path,
+        default=None,
+        help="JSON file mapping vertices to a backend URL or a list of "
+             "replica URLs; enables forwarding mode (asyncio server only)"
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=8,
+        help="Persistent connections per vertex backend (default: 8)"
+    )
+    parser.add_argument(
+        "--pool-idle-timeout",
+        type=float,
+        default=30.0,
+        help="Seconds before an idle backend connection is closed (default: 30)"
+    )
+    parser.add_argument(
+        "--pool-max-in-flight",
+        type=int,
+        default=256,
+        help="Forwarded requests admitted per backend before 503 (default: 256)"
+    )
+    parser.add_argument(
+        "--replica-max-failures",
+        type=int,
+        default=5,
+        help="Consecutive failures that eject a backend replica (default: 5)"
+    )
+    parser.add_argument(
+        "--replica-ejection-time",
+        type=float,
+        default=5.0,
+        help="Seconds a replica is first ejected for; doubles while it keeps "
+             "failing (default: 5)"
+    )
+    
+    parser.add_argument(
+        "--binary-port",
+        type=int,
+        default=0,
+        help="Also serve route calls over the binary route protocol on this "
+             "TCP port; 0 disables it (asyncio server only)"
+    )
+    parser.add_argument(
+        "--binary-socket",
+        default=None,
+        help="Unix socket path for the binary route protocol (asyncio server only)"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Prefork this many asyncio worker processes sharing the port "
+             "via SO_REUSEPORT; SIGHUP restarts them one by one (default: 1)"
+    )
+    parser.add_argument(
+        "--fair-queueing",
+        action="store_true",
+        help="Queue /route calls per vertex with weighted fair dispatch "
+             "(asyncio server only)"
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=1024,
+        help="Pending requests per vertex queue before 503 (default: 1024)"
+    )
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=64,
+        help="Route jobs in progress at once across all vertices (default: 64)"
+    )
+    parser.add_argument(
+        "--vertex-weights",
+        default="monitoring=4",
+        help="Comma-separated vertex=weight dispatch weights; unlisted "
+             "vertices weigh 1 (default: monitoring=4)"
+    )
     
     args = parser.parse_args()
     
-    # Create orchestrator
-    orchestrator = TrainStationOrchestrator(log_path=args.log_path)
-    TrainStationHTTPHandler.orchestrator = orchestrator
+    if args.workers > 1 and args.server != "asyncio":
+        parser.error("--workers requires --server asyncio")
+    if (args.binary_port or args.binary_socket) and args.server != "asyncio":
+        parser.error("--binary-port/--binary-socket require --server asyncio")
+    if args.jobs_path and (args.server != "asyncio" or args.workers > 1):
+        parser.error("--jobs-path requires --server asyncio and a single worker")
+    if args.webhook_outbox and args.server != "asyncio":
+        parser.error("--webhook-outbox requires --server asyncio")
+    if args.max_body_bytes < 1 or args.max_spool_bytes < 0:
+        parser.error("--max-body-bytes must be positive and --max-spool-bytes not negative")
+    body_limits = BodyLimits(SPOOL_TYPES, max_inline=args.max_body_bytes,
+                             max_spool=args.max_spool_bytes, spool_dir=args.spool_dir)
+    
+    scheduler = None
+    if args.fair_queueing:
+        if args.server != "asyncio":
+            parser.error("--fair-queueing requires --server asyncio")
+        weights = {}
+        for item in filter(None, args.vertex_weights.split(",")):
+            name, _, weight = item.partition("=")
+            try:
+                weights[resolve_vertex(name.strip())] = float(weight)
+            except (KeyError, ValueError):
+                parser.error(f"Invalid --vertex-weights entry: {item}")
+        scheduler = FairScheduler(
+            weights,
+            capacity=args.queue_depth,
+            max_concurrent=args.max_concurrent,
+        )
+        logger.info(f"Fair queueing: depth {args.queue_depth}, weights {args.vertex_weights}")
+    
+    proxy = None
+    if args.vertex_backends:
+        if args.server != "asyncio":
+            parser.error("--vertex-backends requires --server asyncio")
+        with open(args.vertex_backends) as f:
+            backends = json.load(f)
+        proxy = VertexProxy(
+            {resolve_vertex(name): urls for name, urls in backends.items()},
+            max_failures=args.replica_max_failures,
+            ejection_time=args.replica_ejection_time,
+            size=args.pool_size,
+            idle_timeout=args.pool_idle_timeout,
+            max_in_flight=args.pool_max_in_flight,
+        )
+        replicas = sum(len(r.replicas) for r in proxy.replicas.values())
+        logger.info(f"Forwarding mode: {len(backends)} vertex backends, {replicas} replicas")
+    
+    def create_orchestrator(log_path: Path,
+                            counters: Optional[CounterBlock] = None,
+                            slot: Optional[int] = None
+                            ) -> TrainStationOrchestrator:
+        segments = None
+        if args.log_segment_bytes > 0:
+            segments = SegmentStore(
+                log_path,
+                max_bytes=args.log_segment_bytes,
+                max_age=args.log_segment_age,
+                compression=Compression(args.log_compression),
+                retain=args.log_retain_segments,
+            )
+        log_writer = LogWriter(
+            log_path,
+            flush_interval=args.log_flush_interval,
+            fsync=FsyncPolicy(args.log_fsync),
+            max_queue=args.log_queue_size,
+            overflow=OverflowPolicy(args.log_overflow),
+            segments=segments,
+        )
+        dedup = None
+        if args.dedup_ttl > 0:
+            dedup = DedupCache(ttl=args.dedup_ttl, max_bytes=args.dedup_max_bytes)
+        routing = RoutingConfig(
+            TrainStationOrchestrator.ROUTING_MAP, RequestType, resolve_vertex,
+            path=args.routing_config
+        )
+        routing.watch(args.routing_reload_interval)
+        tracer = None
+        if args.trace_sample_rate > 0 or args.trace_path:
+            trace_path = args.trace_path or args.log_path.with_name("traces.jsonl")
+            if slot is not None:
+                trace_path = worker_path(trace_path, slot)
+            tracer = Tracer(
+                LogWriter(trace_path, flush_interval=1.0, fsync=FsyncPolicy.NONE),
+                sample_rate=args.trace_sample_rate,
+                format=TraceFormat(args.trace_format),
+            )
+        orchestrator = TrainStationOrchestrator(
+            log_path=log_path,
+            log_writer=log_writer,
+            counters=counters,
+            dedup=dedup,
+            routing=routing,
+            tracer=tracer
+        )
+        if args.stats_path and slot is None:
+            # Prefork workers' counters are saved by the supervisor
+            orchestrator.stats_store = StatsStore(
+                args.stats_path, orchestrator.counters, orchestrator.latency,
+                snapshot_interval=args.stats_snapshot_interval,
+            )
+            orchestrator.stats_store.start()
+        if args.webhook_outbox:
+            outbox = args.webhook_outbox
+            orchestrator.webhooks = WebhookDelivery(
+                outbox if slot is None else worker_path(outbox, slot),
+                adopt=None if slot is None
+                else worker_path(outbox, partner_slot(slot, args.workers)),
+                max_parallel=args.webhook_max_parallel,
+                max_batch=args.webhook_max_batch,
+                max_attempts=args.webhook_max_attempts,
+            )
+        return orchestrator
     
     # Start HTTP server
-    logger.info(f"Starting Train Station HTTP server on port {args.port}")
+    logger.info(f"Starting Train Station {args.server} HTTP server on port {args.port}")
     logger.info(f"Endpoints:")
     logger.info(f"  GET  /health  - Health check")
     logger.info(f"  GET  /status  - Status and statistics")
+    logger.info(f"  GET  /status/stream - Live statistics (server-sent events)")
+    logger.info(f"  GET  /metrics - Prometheus metrics")
+    logger.info(f"  GET  /requests/{{id}} - Logged handshake of one request")
+    logger.info(f"  GET  /requests?since=&vertex= - Logged records by time / vertex")
     logger.info(f"  POST /route   - Route request")
+    logger.info(f"  POST /route/batch - Route JSON array / NDJSON batch")
+    logger.info(f"  GET|POST /admin/routing - Routing config (POST swaps in a new version)")
+    if args.jobs_path:
+        logger.info(f"  GET|POST /schedule, GET|DELETE /schedule/{{id}} - Scheduled jobs")
+    if args.binary_port:
+        logger.info(f"Binary route protocol on port {args.binary_port}")
+    if args.binary_socket:
+        logger.info(f"Binary route protocol on {args.binary_socket}")
+    # Listening sockets come first, inherited from systemd or a previous
+    # process when there are any, so the port is open before anything
+    # else starts. Prefork workers share inherited sockets; otherwise each
+    # binds its own with SO_REUSEPORT. The Unix socket is bound before any
+    # fork so workers share it.
+    listeners = Listeners()
+    shared = args.workers == 1
+    if shared or listeners.inherited("http"):
+        listeners.tcp("http", args.port)
+    if args.binary_port and (shared or listeners.inherited("binary")):
+        listeners.tcp("binary", args.binary_port)
+    if args.binary_socket:
+        listeners.unix("binary-unix", args.binary_socket)
+    listeners.close_unused()
+    
+    if args.workers > 1:
+        run_prefork(args, create_orchestrator, proxy, scheduler, listeners, body_limits)
+        return
     
+    # Create orchestrator
+    orchestrator = create_orchestrator(args.log_path)
+    jobs = JobScheduler(args.jobs_path) if args.jobs_path else None
+    
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+    
+    # systemd stops us with SIGTERM; shut down through the same path as Ctrl-C
+    # so pending log records are flushed
+    signal.signal(signal.SIGTERM, _terminate)
+    
+    reload = False
     try:
-        with socketserver.TCPServer(("", args.port), TrainStationHTTPHandler) as httpd:
+        if args.server == "asyncio":
             logger.info(f"🚂 Train Station listening on port {args.port}")
-            httpd.serve_forever()
+            api = TrainStationAPI(orchestrator, proxy, scheduler,
+                                  status_stream(orchestrator, args), body_limits, jobs)
+            
+            def on_ready():
+                # Webhooks are sent and jobs fire once the loop runs
+                if orchestrator.webhooks:
+                    orchestrator.webhooks.start()
+                if jobs:
+                    jobs.start(api.route_job)
+            
+            reload = async_server.run(
+                api, sock=listeners.duplicate("http"), reload=True, on_ready=on_ready,
+                listeners=binary_listeners(api, args, listeners))
+        else:
+            # Imported here so the asyncio server starts without http.server
+            import threaded_server
+            api = TrainStationAPI(orchestrator, body_limits=body_limits)
+            with threaded_server.server(api, listeners.duplicate("http")) as httpd:
+                
+                def _reload(signum, frame):
+                    nonlocal reload
+                    reload = True
+                    # Returns once the request in progress is answered
+                    threading.Thread(target=httpd.shutdown, daemon=True).start()
+                
+                signal.signal(signal.SIGHUP, _reload)
+                logger.info(f"🚂 Train Station listening on port {args.port}")
+                httpd.serve_forever()
     except KeyboardInterrupt:
         logger.info("Train Station shutting down")
     except Exception as e:
         logger.error(f"Train Station error: {e}")
         raise
+    finally:
+        if jobs:
+            jobs.close()
+        orchestrator.close()
+    
+    if reload:
+        # Same PID, same sockets: connections arriving meanwhile wait in
+        # the listen backlog until the new process accepts them
+        logger.info("Train Station drained; restarting")
+        listeners.reexec()
+
+
+
+def binary_listeners(api: TrainStationAPI, args, sockets: Listeners) -> List:
+    """
+    async_server.run listeners for the binary route protocol, if enabled:
+    on the sockets in sockets, or on a port of its own (SO_REUSEPORT) for a
+    prefork worker when the binary port is not shared.
+    """
+    listeners = []
+    if args.binary_port:
+        if sockets.has("binary"):
+            listeners.append(lambda connections: route_protocol.serve(
+                api.route_message, sock=sockets.duplicate("binary"),
+                connections=connections))
+        else:
+            listeners.append(lambda connections: route_protocol.serve(
+                api.route_message, port=args.binary_port, reuse_port=True,
+                connections=connections))
+    if args.binary_socket:
+        listeners.append(lambda connections: route_protocol.serve(
+            api.route_message, sock=sockets.duplicate("binary-unix"),
+            connections=connections))
+    return listeners
+
+
+def status_stream(orchestrator: TrainStationOrchestrator, args) -> Optional[StatusStream]:
+    """The GET /status/stream ticker, unless disabled with an interval of 0."""
+    if args.status_stream_interval <= 0:
+        return None
+    return StatusStream(orchestrator.live_statistics, interval=args.status_stream_interval)
+
+
+def worker_path(path: Path, slot: int) -> Path:
+    """Per-worker file name in prefork mode: train-station.worker-<slot>.log."""
+    return path.with_name(f"{path.stem}.worker-{slot}{path.suffix}")
+
+
+def run_prefork(args, create_orchestrator, proxy: Optional[VertexProxy],
+                scheduler: Optional[FairScheduler], listeners: Listeners,
+                body_limits: Optional[BodyLimits] = None) -> None:
+    """
+    Serve with args.workers asyncio worker processes on one port. Request
+    and vertex counters live in a shared-memory CounterBlock so /status is
+    global; each worker logs to its own file, train-station.worker-<slot>.log.
+    Workers accept on the inherited socket if there is one, otherwise each
+    binds the port itself with SO_REUSEPORT.
+    
+    With --stats-path the supervisor saves the shared counters from its own
+    loop (it forks, so it starts no threads); latency histograms are per
+    worker and not saved. With --webhook-outbox each worker delivers the
+    webhooks it routed, from an outbox of its own slot, and adopts the
+    partner slot's outbox once its worker has exited: after a rolling
+    restart the replacement sends what the old worker left undelivered.
+    """
+    counters = CounterBlock(
+        TrainStationOrchestrator.COUNTERS, slots=2 * args.workers, shared=True
+    )
+    # Restored into row 0, before any worker is forked
+    stats = None
+    if args.stats_path:
+        stats = StatsStore(args.stats_path, counters,
+                           snapshot_interval=args.stats_snapshot_interval)
+    
+    def run_worker(slot: int, ready) -> None:
+        counters.bind(slot)
+        request_ids.bind_worker(slot, 2 * args.workers)
+        orchestrator = create_orchestrator(worker_path(args.log_path, slot), counters, slot)
+        api = TrainStationAPI(orchestrator, proxy, scheduler,
+                              status_stream(orchestrator, args), body_limits)
+        api.worker = {"slot": slot, "pid": os.getpid(), "workers": args.workers}
+        
+        def on_ready():
+            if orchestrator.webhooks:
+                orchestrator.webhooks.start()
+            ready()
+        
+        try:
+            async_server.run(
+                api, port=args.port, reuse_port=True, on_ready=on_ready,
+                sock=listeners.duplicate("http") if listeners.has("http") else None,
+                listeners=binary_listeners(api, args, listeners),
+            )
+        finally:
+            orchestrator.close()
+    
+    logger.info(f"🚂 Train Station prefork: {args.workers} workers on port {args.port}")
+    PreforkSupervisor(args.workers, run_worker,
+                      on_tick=stats.tick if stats else None).run()
+    if stats:
+        stats.close()
+    logger.info("Train Station shutting down")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Prefork Supervisor
+=====================================
+🚂 N worker processes on one port, with graceful rolling restarts (852 Hz)
+
+The supervisor forks ``workers`` processes. Each one builds its own
+orchestrator and event loop and listens on the shared port with
+SO_REUSEPORT, so the kernel spreads connections across them and routing
+runs on as many cores as there are workers.
+
+Every worker is assigned a slot. There are twice as many slots as workers:
+during a restart, worker i's replacement starts in the other slot of the
+pair (i, i + workers) while the old process drains, so no two live
+processes ever share a slot. Slots index the shared counter block row and
+the per-worker log file.
+
+Signals to the supervisor:
+- SIGHUP           rolling restart: one worker at a time, start the
+                   replacement, wait until it listens, then SIGTERM the old
+                   one so it drains its connections and exits
+- SIGTERM, SIGINT  stop every worker gracefully and exit
+
+Workers that die unexpectedly are restarted in the same slot.
+"""
+
+import logging
+import os
+import select
+import signal
+import time
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a replacement worker gets to start listening
+READY_TIMEOUT = 30.0
+# Minimum seconds between restarts of a crashing slot
+RESTART_BACKOFF = 1.0
+
+
+def partner_slot(slot: int, workers: int) -> int:
+    """The slot a worker in slot is replaced into, and vice versa."""
+    return (slot + workers) % (2 * workers)
+
+
+class PreforkSupervisor:
+    """Fork, watch and restart worker processes."""
+
+    def __init__(self, workers: int,
+                 run_worker: Callable[[int, Callable[[], None]], None],
+                 stop_timeout: float = 30.0,
+                 on_tick: Optional[Callable[[], None]] = None):
+        """
+        run_worker(slot, ready) runs one worker until it is told to stop; it
+        must call ready() once it is accepting connections. on_tick(), if
+        given, is called from the supervision loop a few times a second.
+        """
+        if workers < 1:
+            raise ValueError("Need at least one worker")
+        self.workers = workers
+        self.slots = 2 * workers
+        self.run_worker = run_worker
+        self.stop_timeout = stop_timeout
+        self.on_tick = on_tick
+
+        self._pids: Dict[int, int] = {}        # slot -> pid
+        self._started: Dict[int, float] = {}   # slot -> monotonic start time
+        self._restart = False
+        self._stop = False
+        self.restarts = 0
+
+    # -- worker processes --------------------------------------------------
+
+    def _spawn(self, slot: int) -> Optional[int]:
+        """Fork a worker into slot and wait until it is listening."""
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                signal.signal(sig, signal.SIG_DFL)
+
+            def ready():
+                os.write(ready_w, b"1")
+                os.close(ready_w)
+
+            status = 0
+            try:
+                self.run_worker(slot, ready)
+            except BaseException as e:
+                logger.error(f"Worker {slot} failed: {e!r}")
+                status = 1
+            finally:
+                logging.shutdown()
+                os._exit(status)
+
+        os.close(ready_w)
+        self._pids[slot] = pid
+        self._started[slot] = time.monotonic()
+        try:
+            readable, _, _ = select.select([ready_r], [], [], READY_TIMEOUT)
+            ok = bool(readable) and os.read(ready_r, 1) == b"1"
+        finally:
+            os.close(ready_r)
+        if not ok:
+            logger.error(f"Worker {slot} (pid {pid}) did not become ready")
+            self._terminate(slot, signal.SIGKILL)
+            return None
+        logger.info(f"Worker {slot} started (pid {pid})")
+        return pid
+
+    def _terminate(self, slot: int, sig: int = signal.SIGTERM,
+                   wait: bool = True) -> None:
+        pid = self._pids.pop(slot, None)
+        if pid is None:
+            return
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+        if wait:
+            self._wait(pid, self.stop_timeout)
+
+    def _wait(self, pid: int, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            if time.monotonic() > deadline:
+                logger.warning(f"Worker pid {pid} did not drain in time; killing it")
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                return
+            time.sleep(0.05)
+
+    def _partner(self, slot: int) -> int:
+        return partner_slot(slot, self.workers)
+
+    # -- supervision -------------------------------------------------------
+
+    def rolling_restart(self) -> None:
+        """Replace every worker, one at a time, without closing the port."""
+        logger.info("Rolling restart of Train Station workers")
+        for slot in sorted(self._pids):
+            replacement = self._partner(slot)
+            if self._spawn(replacement) is None:
+                logger.error(f"Restart aborted; worker {slot} keeps running")
+                return
+            self._terminate(slot)
+            self.restarts += 1
+
+    def _reap(self) -> None:
+        """Restart workers that exited on their own."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            slot = next((s for s, p in self._pids.items() if p == pid), None)
+            if slot is None:
+                continue
+            del self._pids[slot]
+            logger.error(f"Worker {slot} (pid {pid}) exited with status {status}")
+            if not self._stop:
+                delay = self._started[slot] + RESTART_BACKOFF - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._spawn(slot)
+
+    def run(self) -> None:
+        """Start the workers and supervise them until SIGTERM/SIGINT."""
+        def on_restart(signum, frame):
+            self._restart = True
+
+        def on_stop(signum, frame):
+            self._stop = True
+
+        signal.signal(signal.SIGHUP, on_restart)
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+
+        for slot in range(self.workers):
+            if self._spawn(slot) is None:
+                self._stop = True
+                break
+
+        while not self._stop:
+            if self._restart:
+                self._restart = False
+                self.rolling_restart()
+            self._reap()
+            if self.on_tick:
+                self.on_tick()
+            time.sleep(0.2)
+
+        logger.info("Stopping Train Station workers")
+        pids = list(self._pids.values())
+        for slot in list(self._pids):
+            self._terminate(slot, wait=False)
+        deadline = time.monotonic() + self.stop_timeout
+        for pid in pids:
+            self._wait(pid, max(0.0, deadline - time.monotonic()))
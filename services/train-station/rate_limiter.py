@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Rate Limiter
+===============================
+🚂 Per-source token buckets for the VALIDATE phase (852 Hz)
+
+Limits are part of the routing config document:
+
+    {
+      "limits": {
+        "source": {"rate": 100, "burst": 200},
+        "sources": {"dojo-ci": {"rate": 1000}, "canary": null},
+        "types": {"ml_training": {"rate": 2, "burst": 5}},
+        "max_buckets": 100000
+      }
+    }
+
+- source       default limit for every source (requests per second, and the
+               bucket size; burst defaults to max(1, rate))
+- sources      per-source overrides; null exempts a source
+- types        limit on each (source, type) pair for these request types,
+               checked as well as the source's own limit
+- max_buckets  buckets kept in memory (default 100000)
+
+A request is admitted only if every bucket it draws from has a token, and
+then takes one from each. Buckets are refilled lazily from the time since
+they were last touched, so there is no timer and an idle source costs
+nothing but its entry. Entries live in an LRU: past max_buckets the least
+recently seen source is forgotten, and comes back with a full bucket, which
+is what it would have refilled to while idle anyway (unless a flood of new
+sources pushes out an active one before its bucket refills).
+
+Bucket state belongs to the RateLimiter and survives config reloads; a
+new document only changes the rates applied to it. Every lookup is a dict
+operation, so the cost does not grow with the number of sources.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from routing_rules import RuleError
+
+
+DEFAULT_MAX_BUCKETS = 100_000
+LIMIT_KEYS = {"source", "sources", "types", "max_buckets"}
+
+# Scopes of a rejection, as reported in metrics
+SCOPE_SOURCE = "source"
+SCOPE_SOURCE_TYPE = "source_type"
+
+
+class RateLimit:
+    """Token refill rate (per second) and bucket size."""
+
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+
+
+class LimitPolicy:
+    """The compiled "limits" section of a routing config."""
+
+    __slots__ = ("source", "sources", "types", "max_buckets")
+
+    def __init__(self, source: Optional[RateLimit], sources: Dict[str, Optional[RateLimit]],
+                 types: Dict[str, RateLimit], max_buckets: int = DEFAULT_MAX_BUCKETS):
+        self.source = source
+        self.sources = sources
+        self.types = types
+        self.max_buckets = max_buckets
+
+
+def _compile_limit(spec: Any, where: str) -> RateLimit:
+    if not isinstance(spec, dict) or "rate" not in spec or set(spec) - {"rate", "burst"}:
+        raise RuleError(f"{where}: expected {{\"rate\": n[, \"burst\": n]}}")
+    rate, burst = spec["rate"], spec.get("burst")
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate <= 0:
+        raise RuleError(f"{where}: rate must be a positive number")
+    if burst is not None and (isinstance(burst, bool) or not isinstance(burst, (int, float))
+                              or burst < 1):
+        raise RuleError(f"{where}: burst must be a number of at least 1")
+    return RateLimit(float(rate), float(burst) if burst is not None else None)
+
+
+def compile_limits(spec: Any, resolve_type: Callable[[str], Any]) -> LimitPolicy:
+    """Validate and compile a "limits" section."""
+    if not isinstance(spec, dict):
+        raise RuleError("'limits' must be an object")
+    unknown = set(spec) - LIMIT_KEYS
+    if unknown:
+        raise RuleError(f"Unknown limits keys: {', '.join(sorted(unknown))}")
+
+    source = spec.get("source")
+    source = _compile_limit(source, "limits.source") if source is not None else None
+
+    sources = spec.get("sources", {})
+    if not isinstance(sources, dict):
+        raise RuleError("'limits.sources' must be an object of source -> limit")
+    sources = {
+        name: _compile_limit(limit, f"limits.sources.{name}") if limit is not None else None
+        for name, limit in sources.items()
+    }
+
+    types = spec.get("types", {})
+    if not isinstance(types, dict):
+        raise RuleError("'limits.types' must be an object of request type -> limit")
+    compiled_types = {}
+    for type_name, limit in types.items():
+        try:
+            resolve_type(type_name)
+        except (KeyError, ValueError):
+            raise RuleError(f"Unknown request type {type_name!r} in limits") from None
+        compiled_types[type_name] = _compile_limit(limit, f"limits.types.{type_name}")
+
+    max_buckets = spec.get("max_buckets", DEFAULT_MAX_BUCKETS)
+    if isinstance(max_buckets, bool) or not isinstance(max_buckets, int) or max_buckets < 1:
+        raise RuleError("'limits.max_buckets' must be a positive integer")
+    return LimitPolicy(source, sources, compiled_types, max_buckets)
+
+
+class RateLimiter:
+    """Token buckets keyed by source and by (source, type), in an LRU."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        # key -> [tokens, last refill]; least recently used first
+        self._buckets: "OrderedDict[Any, list]" = OrderedDict()
+        self.admitted = 0
+        self.rejected = {SCOPE_SOURCE: 0, SCOPE_SOURCE_TYPE: 0}
+        self.evicted = 0
+
+    def _bucket(self, key: Any, limit: RateLimit, now: float, max_buckets: int) -> list:
+        buckets = self._buckets
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [limit.burst, now]
+            if len(buckets) > max_buckets:
+                buckets.popitem(last=False)
+                self.evicted += 1
+            return bucket
+        buckets.move_to_end(key)
+        tokens = bucket[0] + (now - bucket[1]) * limit.rate
+        bucket[0] = tokens if tokens < limit.burst else limit.burst
+        bucket[1] = now
+        return bucket
+
+    def check(self, source: str, type_name: str,
+              policy: LimitPolicy) -> Optional[Tuple[str, float]]:
+        """
+        Take a token for the request, or return (scope, seconds until one
+        is available) if a bucket is empty.
+        """
+        source_limit = policy.sources.get(source, policy.source)
+        type_limit = policy.types.get(type_name)
+        if source_limit is None and type_limit is None:
+            return None
+        now = self.clock()
+
+        source_bucket = type_bucket = None
+        if source_limit is not None:
+            source_bucket = self._bucket(source, source_limit, now, policy.max_buckets)
+            if source_bucket[0] < 1:
+                self.rejected[SCOPE_SOURCE] += 1
+                return SCOPE_SOURCE, (1 - source_bucket[0]) / source_limit.rate
+        if type_limit is not None:
+            type_bucket = self._bucket((source, type_name), type_limit, now,
+                                       policy.max_buckets)
+            if type_bucket[0] < 1:
+                self.rejected[SCOPE_SOURCE_TYPE] += 1
+                return SCOPE_SOURCE_TYPE, (1 - type_bucket[0]) / type_limit.rate
+
+        if source_bucket is not None:
+            source_bucket[0] -= 1
+        if type_bucket is not None:
+            type_bucket[0] -= 1
+        self.admitted += 1
+        return None
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self._buckets),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "evicted": self.evicted,
+        }
+
+
+def retry_after_seconds(seconds: float) -> int:
+    """Retry-After value: whole seconds, at least 1."""
+    return max(1, math.ceil(seconds))
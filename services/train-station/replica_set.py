@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Replica Sets
+===============================
+🚂 Least-loaded choice among the replicas of one vertex backend (852 Hz)
+
+In forwarding mode a vertex may have several backend instances. Each
+request goes to one of them, chosen by the power of two choices: pick two
+available replicas at random and take the one with the lower cost
+
+    cost = (in flight + 1) x latency EWMA
+
+where the EWMA is "peak" weighted: a slower response raises it at once,
+and faster ones bring it down with a time constant of ``decay`` seconds.
+A replica that has not answered yet costs nothing while idle and a lot
+while busy, so a new or re-admitted replica gets one probe at a time until
+its latency is known. Two random choices avoid the herding of always
+taking the least loaded replica (every caller piling onto the same one
+between updates) at O(1) cost per request.
+
+Failures are tracked passively from real traffic, with no health-check
+requests:
+
+- ``max_failures`` consecutive failures (connection errors, bad or 5xx
+  responses) eject a replica for ``ejection_time`` seconds, doubling with
+  each ejection in a row up to ``max_ejection_time``
+- when that time is up it is re-admitted on probation: its next success
+  clears its record, its next failure ejects it again
+- if every replica is ejected they are all used anyway, since a possibly
+  bad replica is better than none
+"""
+
+import math
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+MAX_FAILURES = 5
+EJECTION_TIME = 5.0
+MAX_EJECTION_TIME = 300.0
+EWMA_DECAY = 10.0
+# Cost of a busy replica without a latency sample yet
+UNKNOWN_COST = 1e9
+
+
+class Replica:
+    """One backend instance of a vertex and its passive health record."""
+
+    __slots__ = ("pool", "ewma", "last_sample", "failures", "ejections",
+                 "ejected_until", "probation", "ejected_total")
+
+    def __init__(self, pool: Any):
+        # A VertexConnectionPool (anything with in_flight and stats())
+        self.pool = pool
+        self.ewma: Optional[float] = None
+        self.last_sample = 0.0
+        self.failures = 0             # consecutive
+        self.ejections = 0            # in a row, for the back-off
+        self.ejected_until = 0.0
+        self.probation = False
+        self.ejected_total = 0
+
+    def cost(self) -> float:
+        in_flight = self.pool.in_flight
+        if self.ewma is None:
+            return in_flight * UNKNOWN_COST
+        return (in_flight + 1) * self.ewma
+
+
+class ReplicaSet:
+    """The replicas of one vertex: power-of-two-choices and passive ejection."""
+
+    def __init__(self, pools: Sequence[Any],
+                 max_failures: int = MAX_FAILURES,
+                 ejection_time: float = EJECTION_TIME,
+                 max_ejection_time: float = MAX_EJECTION_TIME,
+                 decay: float = EWMA_DECAY,
+                 clock: Callable[[], float] = time.monotonic,
+                 rng: Optional[random.Random] = None):
+        if not pools:
+            raise ValueError("A replica set needs at least one backend")
+        self.replicas = [Replica(pool) for pool in pools]
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.decay = decay
+        self.clock = clock
+        self._random = rng or random.Random()
+
+    def choose(self) -> Replica:
+        """The replica for the next request."""
+        return self.choose_two()[0]
+
+    def choose_two(self) -> Tuple[Replica, Optional[Replica]]:
+        """
+        The replica for the next request and the other of the two choices,
+        to fall back on if the first cannot take it (None if there is only
+        one to choose from).
+        """
+        replicas = self.replicas
+        if len(replicas) == 1:
+            return replicas[0], None
+        now = self.clock()
+        available = [r for r in replicas if r.ejected_until <= now] or replicas
+        if len(available) == 1:
+            return available[0], None
+        first, second = self._random.sample(available, 2)
+        return (first, second) if first.cost() <= second.cost() else (second, first)
+
+    def expected_latency(self) -> float:
+        """Latency EWMA of the fastest available replica (0 if none is known)."""
+        now = self.clock()
+        known = [r.ewma for r in self.replicas
+                 if r.ewma is not None and r.ejected_until <= now]
+        return min(known) if known else 0.0
+
+    def observe(self, replica: Replica, latency: float, ok: bool) -> None:
+        """Record the outcome of a request sent to replica."""
+        now = self.clock()
+        if ok:
+            if replica.ewma is None or latency > replica.ewma:
+                replica.ewma = latency
+            else:
+                weight = math.exp(-(now - replica.last_sample) / self.decay)
+                replica.ewma = replica.ewma * weight + latency * (1 - weight)
+            replica.last_sample = now
+            replica.failures = 0
+            if replica.probation:
+                replica.probation = False
+                replica.ejections = 0
+            return
+
+        replica.failures += 1
+        if replica.ejected_until > now:
+            return  # already out; a request that was under way
+        if replica.probation or replica.failures >= self.max_failures:
+            self._eject(replica, now)
+
+    def _eject(self, replica: Replica, now: float) -> None:
+        duration = min(self.ejection_time * 2 ** replica.ejections, self.max_ejection_time)
+        replica.ejected_until = now + duration
+        replica.ejections += 1
+        replica.ejected_total += 1
+        replica.probation = True
+        replica.failures = 0
+        # Latency from before the ejection says little about the replica
+        # that comes back
+        replica.ewma = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals over the replicas, and each replica's pool and health."""
+        now = self.clock()
+        replicas: List[Dict[str, Any]] = []
+        totals: Dict[str, Any] = {}
+        for replica in self.replicas:
+            pool = replica.pool.stats()
+            for key, value in pool.items():
+                if isinstance(value, int):
+                    totals[key] = totals.get(key, 0) + value
+            replicas.append(dict(
+                pool,
+                latency_ewma_ms=(round(replica.ewma * 1000, 3)
+                                 if replica.ewma is not None else None),
+                ejected=replica.ejected_until > now,
+                probation=replica.probation,
+                ejections=replica.ejected_total,
+            ))
+        totals["ejected"] = sum(1 for r in replicas if r["ejected"])
+        totals["replicas"] = replicas
+        return totals
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Route Client
+===============================
+🚂 Python client for the binary route protocol (852 Hz)
+
+    client = await RouteClient.connect("127.0.0.1", 8521)
+    result = await client.route(type="build", source="dojo")
+    results = await asyncio.gather(*(client.route(type=t) for t in types))
+    await client.close()
+
+RouteClient multiplexes any number of concurrent route() calls over one
+connection; each call resolves when its own answer arrives, whatever the
+order. BlockingRouteClient is the same over a plain socket for code that
+has no event loop: route_many() pipelines a whole list of requests.
+
+Results are the same dicts POST /route returns. A request the Train Station
+refuses (queue full, invalid request) raises RouteRejected, whose status
+and retry_after mirror the HTTP status code and Retry-After header.
+"""
+
+import asyncio
+import itertools
+import socket
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from route_protocol import (
+    ERROR, HEADER, RESULT, ProtocolError, RouteRejected,
+    decode_error, decode_result, request_frame, split_frames,
+)
+
+
+DEFAULT_PORT = 8521
+
+
+def _stream_ids():
+    # 0 is reserved for connection-level errors from the server
+    return itertools.cycle(range(1, 2 ** 32))
+
+
+def _request(type: str = "unknown", source: str = "unknown",
+             payload: Optional[Dict[str, Any]] = None, id: Optional[str] = None,
+             priority: int = 0, timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+    return {"id": id, "type": type, "source": source,
+            "payload": payload, "priority": priority, "timeout_ms": timeout_ms}
+
+
+def _answer(kind: int, payload: bytes) -> Union[Dict[str, Any], RouteRejected]:
+    if kind == RESULT:
+        return decode_result(payload)
+    if kind == ERROR:
+        return decode_error(payload)
+    raise ProtocolError(f"Unexpected frame kind {kind}")
+
+
+class RouteClient:
+    """asyncio client; route() calls may run concurrently on one connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._ids = _stream_ids()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._closed: Optional[Exception] = None
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> "RouteClient":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @classmethod
+    async def connect_unix(cls, path: str) -> "RouteClient":
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    async def route(self, type: str = "unknown", source: str = "unknown",
+                    payload: Optional[Dict[str, Any]] = None, id: Optional[str] = None,
+                    priority: int = 0, timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Route one request; returns its RoutingResult dict. With timeout_ms
+        the Train Station drops it (RouteRejected, 504) once that has passed.
+        """
+        if self._closed:
+            raise ConnectionError(f"Route connection closed: {self._closed}")
+        stream = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[stream] = future
+        self._writer.write(request_frame(
+            stream, _request(type, source, payload, id, priority, timeout_ms)))
+        try:
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(stream, None)
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                head = await self._reader.readexactly(HEADER.size)
+                length, kind, stream = HEADER.unpack(head)
+                answer = _answer(kind, await self._reader.readexactly(length))
+                if stream == 0:
+                    raise answer if isinstance(answer, Exception) else ProtocolError("Bad answer")
+                future = self._pending.get(stream)
+                if future is None or future.done():
+                    continue
+                if isinstance(answer, Exception):
+                    future.set_exception(answer)
+                else:
+                    future.set_result(answer)
+        except asyncio.CancelledError:
+            self._closed = ConnectionError("closed by client")
+        except Exception as e:
+            self._closed = e
+        error = self._closed
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"Route connection closed: {error}"))
+
+    async def close(self) -> None:
+        self._receiver.cancel()
+        try:
+            await self._receiver
+        except asyncio.CancelledError:
+            pass
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def __aenter__(self) -> "RouteClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+class BlockingRouteClient:
+    """Blocking client over a plain socket; one caller at a time."""
+
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+        self._ids = _stream_ids()
+        self._buffer = bytearray()
+
+    @classmethod
+    def connect(cls, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                timeout: Optional[float] = 30.0) -> "BlockingRouteClient":
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(sock)
+
+    @classmethod
+    def connect_unix(cls, path: str, timeout: Optional[float] = 30.0) -> "BlockingRouteClient":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+        return cls(sock)
+
+    def route(self, type: str = "unknown", source: str = "unknown",
+              payload: Optional[Dict[str, Any]] = None, id: Optional[str] = None,
+              priority: int = 0, timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Route one request; returns its RoutingResult dict (see RouteClient.route)."""
+        (answer,) = self.route_many([_request(type, source, payload, id, priority,
+                                              timeout_ms)])
+        if isinstance(answer, RouteRejected):
+            raise answer
+        return answer
+
+    def route_many(self, requests: Iterable[Dict[str, Any]]
+                   ) -> List[Union[Dict[str, Any], RouteRejected]]:
+        """
+        Send every request before reading any answer (dicts as POST /route
+        takes them, timeout_ms and deadline included). Returns the answers in
+        request order; refused requests appear as RouteRejected instances.
+        """
+        streams = []
+        frames = []
+        for request in requests:
+            stream = next(self._ids)
+            streams.append(stream)
+            frames.append(request_frame(stream, request))
+        self._sock.sendall(b"".join(frames))
+
+        answers: Dict[int, Any] = {}
+        while len(answers) < len(streams):
+            data = self._sock.recv(65536)
+            if not data:
+                raise ConnectionError("Route connection closed by the Train Station")
+            self._buffer += data
+            for kind, stream, payload in split_frames(self._buffer):
+                answer = _answer(kind, payload)
+                if stream == 0:
+                    raise answer if isinstance(answer, Exception) else ProtocolError("Bad answer")
+                answers[stream] = answer
+        return [answers[stream] for stream in streams]
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def __enter__(self) -> "BlockingRouteClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
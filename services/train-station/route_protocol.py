@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Binary Route Protocol
+========================================
+🚂 Length-prefixed, multiplexed route calls over TCP or a Unix socket (852 Hz)
+
+A second transport for local DOJO components that route at high rates and
+should not pay for HTTP parsing and JSON encoding on every call.
+
+Every frame is a 9-byte header followed by its payload:
+
+    length  u32   payload bytes
+    kind    u8    ROUTE, ROUTE_TIMED, RESULT or ERROR
+    stream  u32   id chosen by the client, echoed in the answer
+
+All integers are big-endian. Strings are a u16 length plus UTF-8 bytes; the
+length 0xFFFF stands for None.
+
+    ROUTE   priority i16, id, type, source, then the payload as compact JSON
+            (empty means {})
+    ROUTE_TIMED
+            timeout_ms u32, then a ROUTE payload: a request with a deadline,
+            which is dropped with a 504 ERROR once it has waited that long
+            and queues earliest deadline first. Clients send it only for
+            requests with a timeout_ms or deadline, so a server that
+            predates it still serves every other request
+    RESULT  flags u8 (1 = success, 2 = duplicate), frequency u16 (0 = none),
+            config version u32 (0xFFFFFFFF = none), vertex, chakra, message,
+            request_id, rule
+    ERROR   status u16, retry_after u32 (seconds, 0 = none), message
+
+A client may have many ROUTE frames outstanding on one connection. Answers
+carry the stream id of their request and are written as soon as they are
+ready, so they can arrive out of order (for instance when fair queueing
+holds one vertex's requests back while another's are answered).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">IBI")
+ROUTE = 1
+RESULT = 2
+ERROR = 3
+ROUTE_TIMED = 4
+
+# Larger frames are a protocol error and close the connection
+MAX_FRAME_BYTES = 1024 * 1024
+# Unanswered requests per connection before we stop reading from it
+MAX_PENDING = 1024
+
+_NONE = 0xFFFF
+_NO_VERSION = 0xFFFFFFFF
+_U16 = struct.Struct(">H")
+_ROUTE_HEAD = struct.Struct(">h")
+_TIMEOUT = struct.Struct(">I")
+_RESULT_HEAD = struct.Struct(">BHI")
+_ERROR_HEAD = struct.Struct(">HI")
+_TIMEOUT_MAX = 0xFFFFFFFF
+_SUCCESS = 1
+_DUPLICATE = 2
+
+
+class ProtocolError(ValueError):
+    """Malformed frame."""
+
+
+class RouteRejected(Exception):
+    """A route call answered with an ERROR frame instead of a result."""
+
+    def __init__(self, status: int, message: str, retry_after: int = 0):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+# -- codec -------------------------------------------------------------------
+
+def _pack_str(value: Optional[str]) -> bytes:
+    if value is None:
+        return _U16.pack(_NONE)
+    data = value.encode("utf-8")
+    if len(data) >= _NONE:
+        raise ValueError("String too long for the route protocol")
+    return _U16.pack(len(data)) + data
+
+
+def _unpack_strs(data: bytes, offset: int, count: int) -> Tuple[List[Optional[str]], int]:
+    values = []
+    try:
+        for _ in range(count):
+            (size,) = _U16.unpack_from(data, offset)
+            offset += 2
+            if size == _NONE:
+                values.append(None)
+                continue
+            if offset + size > len(data):
+                raise ProtocolError("Truncated string")
+            values.append(data[offset:offset + size].decode("utf-8"))
+            offset += size
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ProtocolError(f"Bad string field: {e}") from None
+    return values, offset
+
+
+def frame(kind: int, stream: int, payload: bytes) -> bytes:
+    """Header plus payload."""
+    return HEADER.pack(len(payload), kind, stream) + payload
+
+
+def encode_request(request: Dict[str, Any]) -> bytes:
+    """ROUTE payload for a request dict (the JSON body of POST /route)."""
+    payload = request.get("payload")
+    return b"".join((
+        _ROUTE_HEAD.pack(int(request.get("priority", 0))),
+        _pack_str(request.get("id")),
+        _pack_str(request.get("type", "unknown")),
+        _pack_str(request.get("source", "unknown")),
+        json.dumps(payload, separators=(",", ":")).encode("utf-8") if payload else b"",
+    ))
+
+
+def timeout_ms(request: Dict[str, Any]) -> Optional[int]:
+    """
+    Milliseconds left to a request dict's timeout_ms and/or deadline (Unix
+    time), the earlier of the two; None if it has neither.
+    """
+    candidates = []
+    if request.get("timeout_ms") is not None:
+        candidates.append(float(request["timeout_ms"]))
+    if request.get("deadline") is not None:
+        candidates.append((float(request["deadline"]) - time.time()) * 1000)
+    if not candidates:
+        return None
+    return min(_TIMEOUT_MAX, max(0, int(min(candidates))))
+
+
+def request_frame(stream: int, request: Dict[str, Any]) -> bytes:
+    """ROUTE frame for a request dict, or ROUTE_TIMED if it has a deadline."""
+    timeout = timeout_ms(request)
+    if timeout is None:
+        return frame(ROUTE, stream, encode_request(request))
+    return frame(ROUTE_TIMED, stream, _TIMEOUT.pack(timeout) + encode_request(request))
+
+
+def decode_request(data: bytes, timed: bool = False) -> Dict[str, Any]:
+    """
+    Request dict from a ROUTE payload, or a ROUTE_TIMED one if timed (its
+    timeout as timeout_ms); a missing id is left out.
+    """
+    timeout = None
+    try:
+        if timed:
+            (timeout,) = _TIMEOUT.unpack_from(data, 0)
+            data = data[_TIMEOUT.size:]
+        (priority,) = _ROUTE_HEAD.unpack_from(data, 0)
+    except struct.error:
+        raise ProtocolError("Truncated ROUTE frame") from None
+    (request_id, request_type, source), offset = _unpack_strs(data, _ROUTE_HEAD.size, 3)
+    request = {"type": request_type, "source": source, "priority": priority}
+    if request_id is not None:
+        request["id"] = request_id
+    if timeout is not None:
+        request["timeout_ms"] = timeout
+    if offset < len(data):
+        try:
+            request["payload"] = json.loads(data[offset:])
+        except ValueError as e:
+            raise ProtocolError(f"Bad payload: {e}") from None
+    return request
+
+
+def encode_result(result: Dict[str, Any]) -> bytes:
+    """RESULT payload for a RoutingResult dict."""
+    return b"".join((
+        _RESULT_HEAD.pack((_SUCCESS if result["success"] else 0)
+                          | (_DUPLICATE if result.get("duplicate") else 0),
+                          result.get("frequency") or 0,
+                          _NO_VERSION if result.get("config_version") is None
+                          else result["config_version"]),
+        _pack_str(result.get("vertex")),
+        _pack_str(result.get("chakra")),
+        _pack_str(result.get("message")),
+        _pack_str(result.get("request_id")),
+        _pack_str(result.get("rule")),
+    ))
+
+
+def decode_result(data: bytes) -> Dict[str, Any]:
+    """RoutingResult dict (as returned by POST /route) from a RESULT payload."""
+    try:
+        flags, frequency, version = _RESULT_HEAD.unpack_from(data, 0)
+    except struct.error:
+        raise ProtocolError("Truncated RESULT frame") from None
+    (vertex, chakra, message, request_id, rule), _ = _unpack_strs(data, _RESULT_HEAD.size, 5)
+    return {
+        "success": bool(flags & _SUCCESS),
+        "vertex": vertex,
+        "frequency": frequency or None,
+        "chakra": chakra,
+        "message": message,
+        "request_id": request_id,
+        "rule": rule,
+        "duplicate": bool(flags & _DUPLICATE),
+        "config_version": None if version == _NO_VERSION else version,
+    }
+
+
+def encode_error(status: int, message: str, retry_after: int = 0) -> bytes:
+    """ERROR payload."""
+    return _ERROR_HEAD.pack(status, retry_after) + message.encode("utf-8")
+
+
+def decode_error(data: bytes) -> RouteRejected:
+    """The RouteRejected an ERROR payload describes."""
+    try:
+        status, retry_after = _ERROR_HEAD.unpack_from(data, 0)
+    except struct.error:
+        raise ProtocolError("Truncated ERROR frame") from None
+    message = data[_ERROR_HEAD.size:].decode("utf-8", "replace")
+    return RouteRejected(status, message, retry_after)
+
+
+def split_frames(buffer: bytearray) -> List[Tuple[int, int, bytes]]:
+    """
+    Remove every complete frame from the front of buffer and return them as
+    (kind, stream, payload). Raises ProtocolError on an oversized frame.
+    """
+    frames = []
+    offset = 0
+    end = len(buffer)
+    while end - offset >= HEADER.size:
+        length, kind, stream = HEADER.unpack_from(buffer, offset)
+        if length > MAX_FRAME_BYTES:
+            raise ProtocolError(f"Frame of {length} bytes exceeds {MAX_FRAME_BYTES}")
+        start = offset + HEADER.size
+        if end - start < length:
+            break
+        frames.append((kind, stream, bytes(buffer[start:start + length])))
+        offset = start + length
+    if offset:
+        del buffer[:offset]
+    return frames
+
+
+# -- server ------------------------------------------------------------------
+
+# handler(request dict) -> RoutingResult dict, or an awaitable of one; raises
+# RouteRejected to answer with an ERROR frame
+RouteHandler = Callable[[Dict[str, Any]], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]]
+
+
+class RouteProtocol(asyncio.Protocol):
+    """One binary-protocol connection: many route calls in flight."""
+
+    def __init__(self, handler: RouteHandler, connections: Optional[set] = None):
+        self.handler = handler
+        self.connections = connections
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._read_paused = False
+        self._write_paused = False
+        self._draining = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.connections is not None:
+            self.connections.add(self)
+
+    def connection_lost(self, exc):
+        if self.connections is not None:
+            self.connections.discard(self)
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self.transport = None
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        try:
+            frames = split_frames(self._buffer)
+        except ProtocolError as e:
+            self._fail(e)
+            return
+        for kind, stream, payload in frames:
+            if kind != ROUTE and kind != ROUTE_TIMED:
+                self._fail(ProtocolError(f"Unexpected frame kind {kind}"))
+                return
+            self._route(stream, payload, kind == ROUTE_TIMED)
+        self._flow()
+
+    def pause_writing(self):
+        # Client is not reading its answers; stop taking new requests
+        self._write_paused = True
+        self._flow()
+
+    def resume_writing(self):
+        self._write_paused = False
+        self._flow()
+
+    def drain(self):
+        """Answer the requests in flight, then close the connection."""
+        self._draining = True
+        self._flow()
+
+    # -- request handling ------------------------------------------------
+
+    def _route(self, stream: int, payload: bytes, timed: bool = False) -> None:
+        try:
+            result = self.handler(decode_request(payload, timed))
+        except RouteRejected as e:
+            self._answer(stream, ERROR, encode_error(e.status, e.message, e.retry_after))
+            return
+        except Exception as e:
+            logger.error(f"Error handling binary route request: {e}")
+            self._answer(stream, ERROR, encode_error(500, str(e)))
+            return
+
+        if not asyncio.isfuture(result) and not asyncio.iscoroutine(result):
+            self._answer(stream, RESULT, encode_result(result))
+            return
+
+        future = asyncio.ensure_future(result)
+        self._pending[stream] = future
+        future.add_done_callback(lambda f: self._finished(stream, f))
+
+    def _finished(self, stream: int, future: asyncio.Future) -> None:
+        if self._pending.pop(stream, None) is None or future.cancelled():
+            return
+        try:
+            self._answer(stream, RESULT, encode_result(future.result()))
+        except RouteRejected as e:
+            self._answer(stream, ERROR, encode_error(e.status, e.message, e.retry_after))
+        except Exception as e:
+            logger.error(f"Error handling binary route request: {e}")
+            self._answer(stream, ERROR, encode_error(500, str(e)))
+        self._flow()
+
+    def _answer(self, stream: int, kind: int, payload: bytes) -> None:
+        if self.transport and not self.transport.is_closing():
+            self.transport.write(frame(kind, stream, payload))
+
+    def _fail(self, error: Exception) -> None:
+        logger.warning(f"Closing binary route connection: {error}")
+        self._answer(0, ERROR, encode_error(400, str(error)))
+        self.transport.close()
+
+    def _flow(self) -> None:
+        """Pause reading while too much is in flight; close once drained."""
+        if self.transport is None or self.transport.is_closing():
+            return
+        if self._draining:
+            if not self._pending:
+                self.transport.close()
+            return
+        pause = self._write_paused or len(self._pending) >= MAX_PENDING
+        if pause != self._read_paused:
+            self._read_paused = pause
+            if pause:
+                self.transport.pause_reading()
+            else:
+                self.transport.resume_reading()
+
+
+def bind_unix_socket(path: str, backlog: int = 4096) -> socket.socket:
+    """Listening Unix socket at path, replacing a stale socket file."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock.bind(path)
+    sock.listen(backlog)
+    return sock
+
+
+async def serve(handler: RouteHandler, host: str = "", port: Optional[int] = None,
+                path: Optional[str] = None, sock=None, reuse_port: bool = False,
+                connections: Optional[set] = None) -> asyncio.AbstractServer:
+    """
+    Start a binary route server on a TCP port, a Unix socket path, or an
+    already-listening socket. Live connections are tracked in connections,
+    if given, so async_server.drain() can close them gracefully.
+    """
+    loop = asyncio.get_running_loop()
+    factory = lambda: RouteProtocol(handler, connections)
+    if sock is not None:
+        if sock.family == socket.AF_UNIX:
+            return await loop.create_unix_server(factory, sock=sock)
+        return await loop.create_server(factory, sock=sock)
+    if path is not None:
+        return await loop.create_unix_server(factory, path=path)
+    return await loop.create_server(
+        factory, host=host or None, port=port,
+        reuse_address=True, reuse_port=reuse_port or None,
+    )
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Routing Rules
+================================
+🚂 Payload-aware routing rules compiled into a decision index (852 Hz)
+
+Rules are declared in JSON and evaluated first-match-wins in file order:
+
+    {
+      "rules": [
+        {
+          "name": "gpu-compute",
+          "match": {
+            "type": "compute",
+            "payload.accelerator": "gpu",
+            "priority": {"gte": 5}
+          },
+          "vertex": "transformation"
+        },
+        {
+          "name": "bulk-store",
+          "match": {"type": {"in": ["store", "archive"]}, "size": {"gt": 1048576}},
+          "vertex": "storage"
+        }
+      ]
+    }
+
+Match fields:
+- type, source   request type value and source (hash-indexed, see below)
+- priority       request priority
+- size           size in bytes of the JSON-encoded payload (as received,
+                 for a payload spooled to disk)
+- payload.<key>  payload value, dotted keys walk nested objects
+
+A bare value means equality. Operator objects support eq, ne, in, not_in,
+gt, gte, lt, lte, exists, prefix and regex; several operators in one object
+must all hold.
+
+At load time the rule list is compiled into a hash table keyed on the
+discriminating fields (type, source). Each slot holds only the rules that can
+apply to that key, already in file order, so routing cost depends on the few
+candidate predicates and not on the total number of rules.
+"""
+
+import heapq
+import json
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Fields used as hash keys; everything else is an ordered predicate
+INDEXED_FIELDS = ("type", "source")
+# Values an indexed field can hash; JSON lists and objects can't be keys
+_SCALARS = (str, int, float, bool, type(None))
+
+_MISSING = object()
+
+# predicate(request, memo) -> bool
+Predicate = Callable[[Any, Dict[str, Any]], bool]
+
+
+class RuleError(ValueError):
+    """Raised when a routing rule file is malformed."""
+
+
+class Rule:
+    """One compiled routing rule."""
+
+    __slots__ = ("name", "order", "target", "keys", "predicates")
+
+    def __init__(self, name: str, order: int, target: Any,
+                 keys: Dict[str, Optional[Tuple]], predicates: List[Predicate]):
+        self.name = name
+        self.order = order
+        self.target = target
+        # Indexed field -> accepted values (None = any)
+        self.keys = keys
+        self.predicates = predicates
+
+    def matches(self, request: Any, memo: Dict[str, Any]) -> bool:
+        for predicate in self.predicates:
+            if not predicate(request, memo):
+                return False
+        return True
+
+
+# -- field access ------------------------------------------------------------
+
+def _payload_size(request: Any, memo: Dict[str, Any]) -> int:
+    size = memo.get("size")
+    if size is None:
+        # A spooled payload knows its size (as received, whitespace included)
+        size = getattr(request.payload, "size", None)
+    if size is None:
+        size = len(json.dumps(request.payload, separators=(",", ":")))
+        memo["size"] = size
+    return size
+
+
+def _field_getter(field: str) -> Callable[[Any, Dict[str, Any]], Any]:
+    if field == "type":
+        return lambda request, memo: request.type.value
+    if field == "source":
+        return lambda request, memo: request.source
+    if field == "priority":
+        return lambda request, memo: request.priority
+    if field == "size":
+        return _payload_size
+    if field.startswith("payload."):
+        path = field[len("payload."):].split(".")
+
+        def get_payload(request, memo):
+            value = request.payload
+            for key in path:
+                if not isinstance(value, dict):
+                    return _MISSING
+                value = value.get(key, _MISSING)
+                if value is _MISSING:
+                    return _MISSING
+            return value
+
+        return get_payload
+    raise RuleError(f"Unknown match field: {field}")
+
+
+# -- predicate compilation ---------------------------------------------------
+
+def _compare(op: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    def check(value, operand):
+        if value is _MISSING or value is None:
+            return False
+        try:
+            return op(value, operand)
+        except TypeError:
+            return False
+    return check
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": lambda value, operand: value == operand,
+    "ne": lambda value, operand: value != operand,
+    "in": lambda value, operand: value in operand,
+    "not_in": lambda value, operand: value not in operand,
+    "gt": _compare(lambda value, operand: value > operand),
+    "gte": _compare(lambda value, operand: value >= operand),
+    "lt": _compare(lambda value, operand: value < operand),
+    "lte": _compare(lambda value, operand: value <= operand),
+    "exists": lambda value, operand: (value is not _MISSING) == bool(operand),
+    "prefix": lambda value, operand: isinstance(value, str) and value.startswith(operand),
+    "regex": lambda value, operand: isinstance(value, str) and operand.search(value) is not None,
+}
+
+
+def _compile_condition(field: str, spec: Any) -> Predicate:
+    getter = _field_getter(field)
+
+    if not isinstance(spec, dict):
+        return lambda request, memo: getter(request, memo) == spec
+
+    checks = []
+    for op_name, operand in spec.items():
+        op = _OPERATORS.get(op_name)
+        if op is None:
+            raise RuleError(f"Unknown operator '{op_name}' for field {field}")
+        if op_name in ("in", "not_in"):
+            if not isinstance(operand, list):
+                raise RuleError(f"'{op_name}' for field {field} needs a list")
+            try:
+                operand = frozenset(operand)
+            except TypeError:
+                operand = tuple(operand)
+        elif op_name == "regex":
+            try:
+                operand = re.compile(operand)
+            except (re.error, TypeError) as e:
+                raise RuleError(f"Bad regex for field {field}: {e}")
+        checks.append((op, operand))
+
+    if len(checks) == 1:
+        op, operand = checks[0]
+        return lambda request, memo: op(getter(request, memo), operand)
+
+    def predicate(request, memo):
+        value = getter(request, memo)
+        return all(op(value, operand) for op, operand in checks)
+
+    return predicate
+
+
+def _index_values(field: str, spec: Any) -> Optional[Tuple]:
+    """Hash-key values for an indexed field, or None if it can't be indexed."""
+    if isinstance(spec, list):
+        raise RuleError(f"{field} value is a list; use {{\"in\": [...]}} to match any of it")
+    if not isinstance(spec, dict):
+        values = (spec,)
+    elif set(spec) == {"eq"}:
+        values = (spec["eq"],)
+    elif set(spec) == {"in"} and isinstance(spec["in"], list):
+        values = spec["in"]
+    else:
+        return None
+    for value in values:
+        if not isinstance(value, _SCALARS):
+            raise RuleError(f"{field} values must be strings or numbers, got {value!r}")
+    return tuple(dict.fromkeys(values))
+
+
+# -- rule set ----------------------------------------------------------------
+
+class RuleSet:
+    """Compiled routing rules with a (type, source) decision index."""
+
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules = list(rules)
+        self._types = set()
+        self._sources = set()
+        for rule in self.rules:
+            if rule.keys["type"] is not None:
+                self._types.update(rule.keys["type"])
+            if rule.keys["source"] is not None:
+                self._sources.update(rule.keys["source"])
+        self._index = self._build_index()
+
+    def _build_index(self) -> Dict[Tuple[Any, Any], Tuple[Rule, ...]]:
+        """
+        One slot per (type, source) key seen in the rules, plus wildcard
+        slots (None) for values no rule names. Each slot lists, in rule
+        order, every rule whose indexed fields accept that key.
+        """
+        buckets: Dict[Tuple[Any, Any], List[Rule]] = {}
+        for rule in self.rules:
+            for type_key in rule.keys["type"] or (None,):
+                for source_key in rule.keys["source"] or (None,):
+                    buckets.setdefault((type_key, source_key), []).append(rule)
+
+        index = {}
+        for type_key in list(self._types) + [None]:
+            for source_key in list(self._sources) + [None]:
+                merged = heapq.merge(*(
+                    buckets.get(key, ())
+                    for key in {(type_key, source_key), (type_key, None),
+                                (None, source_key), (None, None)}
+                ), key=lambda rule: rule.order)
+                index[(type_key, source_key)] = tuple(merged)
+        return index
+
+    def candidates(self, request: Any) -> Tuple[Rule, ...]:
+        """Rules that could match this request, in evaluation order."""
+        type_key = request.type.value
+        if type_key not in self._types:
+            type_key = None
+        source_key = request.source
+        if source_key not in self._sources:
+            source_key = None
+        return self._index[(type_key, source_key)]
+
+    def match(self, request: Any) -> Optional[Rule]:
+        """Return the first rule matching the request, or None."""
+        memo: Dict[str, Any] = {}
+        for rule in self.candidates(request):
+            if rule.matches(request, memo):
+                return rule
+        return None
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+def compile_rules(spec: Dict[str, Any],
+                  resolve_target: Callable[[Any], Any] = lambda target: target
+                  ) -> RuleSet:
+    """Validate and compile a rule document into a RuleSet."""
+    if not isinstance(spec, dict) or not isinstance(spec.get("rules"), list):
+        raise RuleError("Routing rules must be an object with a 'rules' list")
+
+    compiled = []
+    for order, entry in enumerate(spec["rules"]):
+        if not isinstance(entry, dict):
+            raise RuleError(f"Rule #{order} is not an object")
+        name = entry.get("name", f"rule-{order}")
+        match = entry.get("match", {})
+        if not isinstance(match, dict):
+            raise RuleError(f"Rule '{name}': 'match' must be an object")
+        if "vertex" not in entry:
+            raise RuleError(f"Rule '{name}' has no 'vertex'")
+        try:
+            target = resolve_target(entry["vertex"])
+        except (KeyError, ValueError) as e:
+            raise RuleError(f"Rule '{name}': unknown vertex {entry['vertex']!r}") from e
+
+        keys: Dict[str, Optional[Tuple]] = {field: None for field in INDEXED_FIELDS}
+        predicates = []
+        for field, condition in match.items():
+            if field in INDEXED_FIELDS:
+                try:
+                    keys[field] = _index_values(field, condition)
+                except RuleError as e:
+                    raise RuleError(f"Rule #{order} ('{name}'): {e}") from None
+                if keys[field] is not None:
+                    continue
+            predicates.append(_compile_condition(field, condition))
+
+        compiled.append(Rule(name, order, target, keys, predicates))
+
+    return RuleSet(compiled)
+
+
+def load_rules(path: Path,
+               resolve_target: Callable[[Any], Any] = lambda target: target
+               ) -> RuleSet:
+    """Load and compile a JSON rule file."""
+    try:
+        with open(path) as f:
+            spec = json.load(f)
+    except json.JSONDecodeError as e:
+        raise RuleError(f"Invalid JSON in {path}: {e}") from e
+    return compile_rules(spec, resolve_target)
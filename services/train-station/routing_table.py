@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Routing Table
+================================
+🚂 Versioned, hot-swappable routing configuration (852 Hz)
+
+A routing config document extends the routing rules file with per-type
+routes that override the built-in type → vertex map:
+
+    {
+      "version": 12,
+      "routes": {"compute": "storage", "ml_training": "transformation"},
+      "rules": [ ... see routing_rules.py ... ],
+      "limits": { ... see rate_limiter.py ... }
+    }
+
+Every key is optional. Types not named in "routes" keep their default
+vertex; "version" is assigned automatically when left out.
+
+With a config file, the file holds the latest version and is the counter
+every prefork worker takes the next one from. update() and reload() take
+an flock on ``<file>.lock`` (when the file's directory allows one)
+around reading and writing it. A reload compares the file's content,
+not just its version, with the live document. So a hand edit is picked
+up even if it kept the version the server wrote. Such an edit gets the
+next version, which is written back so that every worker agrees on it.
+
+A document is validated and compiled into an immutable RoutingTable before
+it is published, so a bad document never replaces a good one. Publishing
+is a single attribute assignment on RoutingConfig: request handlers read
+``config.current`` once per request and use that table for the whole
+handshake, with no lock. Only reloaders take a lock, to serialize each
+other and to keep versions increasing.
+
+Sources of new tables:
+- RoutingConfig.update(spec)    a document from the admin endpoint; saved
+                                back to the config file when there is one
+- RoutingConfig.reload()        re-read the config file
+- RoutingConfig.watch(interval) poll the file's mtime in the background,
+                                so every prefork worker picks up a change
+                                written by any one of them
+"""
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+from rate_limiter import LimitPolicy, compile_limits
+from routing_rules import Rule, RuleError, RuleSet, compile_rules
+
+
+logger = logging.getLogger(__name__)
+
+CONFIG_KEYS = {"version", "routes", "rules", "limits"}
+
+
+class VersionConflict(RuleError):
+    """Raised when an update names a version that is not newer than the live one."""
+
+
+class RoutingTable:
+    """One immutable, compiled routing configuration."""
+
+    __slots__ = ("version", "routes", "rules", "limits", "spec", "loaded_at", "source")
+
+    def __init__(self, version: int, routes: Mapping[Any, Any],
+                 rules: Optional[RuleSet], spec: Dict[str, Any],
+                 source: str, limits: Optional[LimitPolicy] = None):
+        self.version = version
+        # Request type -> vertex, defaults merged with the document's routes
+        self.routes = dict(routes)
+        self.rules = rules
+        # Rate limits checked in VALIDATE; None admits everything
+        self.limits = limits
+        self.spec = spec
+        self.loaded_at = datetime.now().isoformat()
+        self.source = source
+
+    def select(self, request: Any) -> Tuple[Any, Optional[Rule]]:
+        """Target vertex for the request (None if none) and the rule that chose it."""
+        rule = self.rules.match(request) if self.rules else None
+        return (rule.target if rule else self.routes.get(request.type)), rule
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "source": self.source,
+            "rules": len(self.rules) if self.rules else 0,
+            "rate_limited": self.limits is not None,
+        }
+
+
+def compile_table(spec: Dict[str, Any], version: int, defaults: Mapping[Any, Any],
+                  resolve_type: Callable[[str], Any],
+                  resolve_target: Callable[[Any], Any],
+                  source: str = "api") -> RoutingTable:
+    """Validate and compile a routing config document."""
+    if not isinstance(spec, dict):
+        raise RuleError("Routing config must be a JSON object")
+    unknown = set(spec) - CONFIG_KEYS
+    if unknown:
+        raise RuleError(f"Unknown routing config keys: {', '.join(sorted(unknown))}")
+
+    routes = dict(defaults)
+    overrides = spec.get("routes", {})
+    if not isinstance(overrides, dict):
+        raise RuleError("'routes' must be an object of request type -> vertex")
+    for type_name, target in overrides.items():
+        try:
+            request_type = resolve_type(type_name)
+        except (KeyError, ValueError):
+            raise RuleError(f"Unknown request type {type_name!r} in routes") from None
+        try:
+            routes[request_type] = resolve_target(target)
+        except (KeyError, ValueError):
+            raise RuleError(f"Unknown vertex {target!r} for type {type_name!r}") from None
+
+    rules = compile_rules(spec, resolve_target) if "rules" in spec else None
+    limits = compile_limits(spec["limits"], resolve_type) if "limits" in spec else None
+    return RoutingTable(version, routes, rules, spec, source, limits)
+
+
+class RoutingConfig:
+    """The live RoutingTable, and the ways to replace it."""
+
+    def __init__(self, defaults: Mapping[Any, Any],
+                 resolve_type: Callable[[str], Any],
+                 resolve_target: Callable[[Any], Any],
+                 path: Optional[Path] = None,
+                 rules: Optional[RuleSet] = None):
+        self.defaults = dict(defaults)
+        self.resolve_type = resolve_type
+        self.resolve_target = resolve_target
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.failures = 0
+
+        # Read on every request; replaced, never mutated
+        self.current = RoutingTable(0, self.defaults, rules, {}, "defaults")
+        if path is not None and path.exists():
+            # A bad file at startup is fatal, later ones are only logged
+            self._mtime = os.stat(path).st_mtime
+            self._publish(self._compile(self._read(), str(path)))
+
+    def _compile(self, spec: Dict[str, Any], source: str,
+                 latest: Optional[int] = None) -> RoutingTable:
+        """
+        Compile spec with its version, or the one after latest (the live
+        version by default) if it names none.
+        """
+        if latest is None:
+            latest = self.current.version
+        version = spec.get("version") if isinstance(spec, dict) else None
+        if version is None:
+            version = latest + 1
+        elif not isinstance(version, int) or isinstance(version, bool) or version <= latest:
+            raise VersionConflict(
+                f"Version {version!r} is not newer than live version {latest}"
+            )
+        return compile_table(spec, version, self.defaults, self.resolve_type,
+                             self.resolve_target, source)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Serialize reading and writing the config file across processes."""
+        try:
+            lock = open(self.path.with_name(self.path.name + ".lock"), "ab")
+        except OSError:
+            # A read-only directory (e.g. the Nix store): nobody writes there
+            yield
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _file_version(self) -> int:
+        """The version in the config file (0 if it has none)."""
+        try:
+            version = self._read().get("version")
+        except (OSError, ValueError, AttributeError):
+            return 0
+        return version if isinstance(version, int) and not isinstance(version, bool) else 0
+
+    def _publish(self, table: RoutingTable) -> None:
+        self.current = table
+        self.reloads += 1
+        logger.info(f"Routing config version {table.version} live ({table.source})")
+
+    def update(self, spec: Dict[str, Any]) -> Tuple[RoutingTable, bool]:
+        """
+        Compile and publish a new document. Returns the table and whether it
+        was saved to the config file (so other workers load it too).
+        """
+        with self._lock:
+            if self.path is None:
+                table = self._compile(spec, "api")
+                self._publish(table)
+                return table, False
+            with self._file_lock():
+                # Another worker may have saved a newer version than ours
+                latest = max(self.current.version, self._file_version())
+                table = self._compile(spec, "api", latest)
+                persisted = False
+                document = dict(spec, version=table.version)
+                try:
+                    self._write(document)
+                    table.spec = document
+                    persisted = True
+                except OSError as e:
+                    logger.warning(f"Routing config not saved to {self.path}: {e}")
+                self._publish(table)
+                return table, persisted
+
+    def _read(self) -> Any:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            raise RuleError(f"Invalid JSON in {self.path}: {e}") from e
+
+    def _write(self, document: Dict[str, Any]) -> None:
+        directory = self.path.parent
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(document, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._mtime = os.stat(self.path).st_mtime
+
+    def reload(self, force: bool = True) -> bool:
+        """
+        Re-read the config file; returns True if a new table was published.
+        Without force, the file is only read when its mtime changed.
+        """
+        if self.path is None:
+            return False
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                return False
+            if not force and mtime == self._mtime:
+                return False
+            with self._file_lock():
+                self._mtime = mtime
+                try:
+                    spec = self._read()
+                    if spec == self.current.spec:
+                        # Already live, e.g. written by this process
+                        return False
+                    version = spec.get("version") if isinstance(spec, dict) else None
+                    edited = isinstance(spec, dict) and ((version is None or isinstance(version, int))
+                              and not (isinstance(version, int)
+                                       and version > self.current.version))
+                    if edited:
+                        # Edited by hand without a newer version: number it
+                        latest = max(self.current.version, version or 0)
+                        spec = {key: value for key, value in spec.items() if key != "version"}
+                        table = self._compile(spec, str(self.path), latest)
+                    else:
+                        table = self._compile(spec, str(self.path))
+                except (OSError, ValueError) as e:
+                    # RuleError and JSON errors are ValueErrors; keep the live table
+                    self.failures += 1
+                    logger.error(f"Routing config {self.path} rejected: {e}")
+                    return False
+                if edited:
+                    table.spec = dict(spec, version=table.version)
+                    try:
+                        self._write(table.spec)
+                    except OSError as e:
+                        logger.warning(f"Routing config version not saved to {self.path}: {e}")
+                self._publish(table)
+                return True
+
+    def watch(self, interval: float) -> None:
+        """Poll the config file every interval seconds on a daemon thread."""
+        if self.path is None or interval <= 0 or self._watcher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload(force=False)
+                except Exception as e:
+                    logger.error(f"Routing config watcher: {e}")
+
+        self._watcher = threading.Thread(target=run, name="routing-config-watch", daemon=True)
+        self._watcher.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.current.describe(), reloads=self.reloads, failures=self.failures,
+                    path=str(self.path) if self.path else None)
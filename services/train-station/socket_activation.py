@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Socket Activation
+====================================
+🚂 Listening sockets that outlive the process: systemd activation and re-exec (852 Hz)
+
+A process started by systemd socket activation (or by the Train Station
+re-executing itself) finds its listening sockets already open, passed the
+sd_listen_fds way: descriptors 3, 4, ... are listening sockets,
+``LISTEN_FDS`` says how many, ``LISTEN_PID`` which process they are meant
+for and ``LISTEN_FDNAMES`` (optional) names them, colon-separated.
+
+Sockets are asked for by name: ``http`` for the HTTP API, ``binary`` for
+the binary route protocol port and ``binary-unix`` for its Unix socket. A
+single inherited socket under any other name is taken as the ``http`` one.
+A socket that was not inherited is bound here instead.
+
+Listeners keeps every socket open until the process exits or re-executes,
+and servers get duplicates of them: stopping a server stops accepting
+without closing the port, so connections that arrive during a restart
+wait in the listen backlog instead of being refused.
+
+reexec() replaces the process with a fresh interpreter running the same
+command line, passing the sockets on. The PID does not change, so systemd
+keeps tracking the service.
+"""
+
+import fcntl
+import logging
+import os
+import socket
+import sys
+from typing import Dict, List, Mapping, MutableMapping, NoReturn, Optional
+
+from route_protocol import bind_unix_socket
+
+
+logger = logging.getLogger(__name__)
+
+# First descriptor passed by systemd (SD_LISTEN_FDS_START)
+LISTEN_FDS_START = 3
+
+
+def inherited_sockets(environ: MutableMapping[str, str] = os.environ) -> Dict[str, socket.socket]:
+    """
+    Sockets passed to this process, by name, and consume the LISTEN_*
+    variables so they are not mistaken for ours by anything we start.
+    """
+    count = environ.pop("LISTEN_FDS", None)
+    pid = environ.pop("LISTEN_PID", None)
+    names = environ.pop("LISTEN_FDNAMES", "")
+    if count is None or pid != str(os.getpid()):
+        return {}
+    names = names.split(":") if names else []
+    sockets = {}
+    for i in range(int(count)):
+        fd = LISTEN_FDS_START + i
+        os.set_inheritable(fd, False)
+        name = names[i] if i < len(names) else f"fd{fd}"
+        sockets[name] = socket.socket(fileno=fd)
+    if len(sockets) == 1 and "http" not in sockets:
+        sockets = {"http": sockets.popitem()[1]}
+    return sockets
+
+
+class Listeners:
+    """The process's listening sockets, inherited or bound, by name."""
+
+    def __init__(self, environ: MutableMapping[str, str] = os.environ):
+        self._inherited = inherited_sockets(environ)
+        self._sockets: Dict[str, socket.socket] = {}
+
+    def inherited(self, name: str) -> bool:
+        """Whether a socket called name was passed to this process."""
+        return name in self._inherited
+
+    def has(self, name: str) -> bool:
+        """Whether a socket called name is open (inherited or bound)."""
+        return name in self._sockets
+
+    def _take(self, name: str) -> Optional[socket.socket]:
+        sock = self._inherited.pop(name, None)
+        if sock is not None:
+            logger.info(f"Using inherited {name} socket {sock.getsockname()}")
+            self._sockets[name] = sock
+        return sock
+
+    def tcp(self, name: str, port: int, host: str = "", backlog: int = 4096,
+            reuse_port: bool = False) -> socket.socket:
+        """The listening TCP socket called name, bound to port if not inherited."""
+        sock = self._take(name)
+        if sock is None:
+            # No host: every interface, IPv6 too where the kernel allows
+            dualstack = not host and socket.has_dualstack_ipv6()
+            family = socket.AF_INET6 if dualstack or ":" in host else socket.AF_INET
+            sock = socket.create_server((host, port), family=family, backlog=backlog,
+                                        reuse_port=reuse_port, dualstack_ipv6=dualstack)
+            self._sockets[name] = sock
+        return sock
+
+    def unix(self, name: str, path: str, backlog: int = 4096) -> socket.socket:
+        """The listening Unix socket called name, bound at path if not inherited."""
+        sock = self._take(name)
+        if sock is None:
+            sock = bind_unix_socket(path, backlog)
+            self._sockets[name] = sock
+        return sock
+
+    def duplicate(self, name: str) -> socket.socket:
+        """A server's own handle on the socket; closing it leaves the port open."""
+        return self._sockets[name].dup()
+
+    def close_unused(self) -> None:
+        """Close inherited sockets nobody asked for."""
+        for name, sock in self._inherited.items():
+            logger.warning(f"Closing unused inherited socket {name}")
+            sock.close()
+        self._inherited.clear()
+
+    def environment(self) -> Dict[str, str]:
+        """
+        Move the sockets to descriptors 3, 4, ... (inheritable) and return
+        the LISTEN_* variables describing them. Only for use right before
+        exec: descriptors that were there are overwritten.
+        """
+        names: List[str] = list(self._sockets)
+        count = len(names)
+        # Out of the way first, so moving one cannot overwrite another
+        spare = [fcntl.fcntl(self._sockets[name].fileno(), fcntl.F_DUPFD_CLOEXEC,
+                             LISTEN_FDS_START + count)
+                 for name in names]
+        for i, fd in enumerate(spare):
+            os.dup2(fd, LISTEN_FDS_START + i, inheritable=True)
+            os.close(fd)
+        return {
+            "LISTEN_FDS": str(count),
+            "LISTEN_PID": str(os.getpid()),
+            "LISTEN_FDNAMES": ":".join(names),
+        }
+
+    def reexec(self, argv: Optional[List[str]] = None,
+               environ: Mapping[str, str] = os.environ) -> NoReturn:
+        """Replace this process with a new one on the same command line and sockets."""
+        argv = argv or [sys.executable] + sys.orig_argv[1:]
+        env = dict(environ)
+        env.update(self.environment())
+        logger.info(f"Re-executing {' '.join(argv)} with {env['LISTEN_FDNAMES']}")
+        logging.shutdown()
+        os.execve(argv[0], argv, env)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Stats Store
+==============================
+🚂 Request counters and latency histograms that survive restarts (852 Hz)
+
+Two files in the state directory:
+
+- ``train-station.stats``          snapshot of every counter and histogram
+                                   bucket, written to a temporary file and
+                                   renamed over the previous one, so it is
+                                   always whole
+- ``train-station.stats.journal``  one record a second (journal_interval)
+                                   with what changed since the last one
+
+Every snapshot (once a minute) empties the journal. On startup the store
+reads one snapshot and at most a snapshot interval of journal records and
+adds them to the live counters, so recovery takes the same time however
+long the Train Station has been running.
+
+Journal records are numbered and the snapshot stores the number of the
+last one it includes: records left behind by a crash between writing a
+snapshot and emptying the journal are skipped, not counted twice. A record
+torn by a crash fails its CRC and is cut off, with anything after it.
+
+Both files hold little-endian binary. Counters and histograms are written
+sparse: a name (or a (phase, type, vertex) key) followed by (index, value)
+pairs for the non-zero values only.
+
+Writing reads the counters without locks, off the request path (on the
+store's thread, or in the prefork supervisor's loop via tick()), so
+routing never waits for the disk.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from latency_metrics import BUCKET_COUNT, LatencyHistograms, SeriesKey
+from shared_counters import CounterBlock
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"TSST"
+FORMAT_VERSION = 1
+
+# magic, version, histogram buckets, last journal seq, counting since
+_SNAPSHOT_HEADER = struct.Struct("<4sHHQd")
+# payload length, payload CRC32
+_RECORD_FRAME = struct.Struct("<II")
+# seq, written at, histogram buckets
+_RECORD_HEADER = struct.Struct("<QdH")
+_COUNT = struct.Struct("<I")
+_ENTRY = struct.Struct("<Hq")
+_CRC = struct.Struct("<I")
+
+Counters = Dict[str, int]
+Histograms = Dict[SeriesKey, List[int]]
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_str(data: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+
+def _pack_values(values: List[int]) -> bytes:
+    entries = [(i, v) for i, v in enumerate(values) if v]
+    return (struct.pack("<H", len(entries))
+            + b"".join(_ENTRY.pack(i, v) for i, v in entries))
+
+
+def encode_state(counters: Counters, histograms: Histograms) -> bytes:
+    """Counters and histograms, sparse (zero values are left out)."""
+    parts = [_COUNT.pack(len(counters))]
+    for name, value in counters.items():
+        parts.append(_pack_str(name) + struct.pack("<q", value))
+    parts.append(_COUNT.pack(len(histograms)))
+    for key, values in histograms.items():
+        parts.append(b"".join(_pack_str(part) for part in key) + _pack_values(values))
+    return b"".join(parts)
+
+
+def decode_state(data: bytes, offset: int = 0) -> Tuple[Counters, Histograms, int]:
+    """The counters and histograms encoded at offset, and the offset after them."""
+    counters: Counters = {}
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    for _ in range(count):
+        name, offset = _unpack_str(data, offset)
+        (counters[name],) = struct.unpack_from("<q", data, offset)
+        offset += 8
+    histograms: Histograms = {}
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    for _ in range(count):
+        key = []
+        for _ in range(3):
+            part, offset = _unpack_str(data, offset)
+            key.append(part)
+        (entries,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        values = [0] * (BUCKET_COUNT + 1)
+        for _ in range(entries):
+            index, value = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            if index < len(values):
+                values[index] = value
+        histograms[tuple(key)] = values
+    return counters, histograms, offset
+
+
+def difference(current: Tuple[Counters, Histograms],
+               previous: Tuple[Counters, Histograms]) -> Tuple[Counters, Histograms]:
+    """What changed from previous to current, leaving out what did not."""
+    counters = {}
+    for name, value in current[0].items():
+        delta = value - previous[0].get(name, 0)
+        if delta:
+            counters[name] = delta
+    histograms = {}
+    for key, values in current[1].items():
+        before = previous[1].get(key)
+        if before is None:
+            histograms[key] = values
+        elif values != before:
+            histograms[key] = [v - b for v, b in zip(values, before)]
+    return counters, histograms
+
+
+def _add(state: Tuple[Counters, Histograms],
+         counters: Counters, histograms: Histograms) -> None:
+    for name, value in counters.items():
+        state[0][name] = state[0].get(name, 0) + value
+    for key, values in histograms.items():
+        total = state[1].get(key)
+        if total is None:
+            state[1][key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                total[i] += value
+
+
+class StatsStore:
+    """Snapshot plus delta journal of a CounterBlock and LatencyHistograms."""
+
+    def __init__(self, path: Path, counters: CounterBlock,
+                 latency: Optional[LatencyHistograms] = None,
+                 snapshot_interval: float = 60.0,
+                 journal_interval: float = 1.0):
+        """
+        Load what earlier processes saved at path and add it to counters
+        (this process's row) and latency. Call start() to save from a
+        thread of its own, or tick() regularly.
+        """
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.counters = counters
+        self.latency = latency
+        self.snapshot_interval = snapshot_interval
+        self.journal_interval = journal_interval
+
+        self.snapshots = 0
+        self.journal_records = 0
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        self._seq = 0
+        self.since = time.time()
+        saved = self._load()
+        self.recovery_ms = (time.perf_counter() - started) * 1000
+
+        for name, value in saved[0].items():
+            if name in counters.names:
+                counters.add(counters.names.index(name), value)
+        if latency is not None and saved[1]:
+            latency.restore(saved[1])
+        # What is on disk; the first journal record holds everything since
+        self._saved = saved
+        self._journal = open(self.journal_path, "ab")
+        now = time.monotonic()
+        self._snapshot_due = now + snapshot_interval
+        self._journal_due = now + journal_interval
+        logger.info(
+            f"Stats restored from {self.path}: {saved[0].get('requests', 0)} requests "
+            f"counted since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.since))}"
+            f" ({self.recovery_ms:.1f} ms)"
+        )
+
+    # -- loading -------------------------------------------------------------
+
+    def _load(self) -> Tuple[Counters, Histograms]:
+        state: Tuple[Counters, Histograms] = ({}, {})
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            data = None
+        if data is not None:
+            try:
+                state = self._read_snapshot(data)
+            except (ValueError, struct.error, UnicodeDecodeError) as e:
+                logger.error(f"Ignoring unreadable stats snapshot {self.path}: {e}")
+                self.errors += 1
+        self._replay_journal(state, first=data is None)
+        return state
+
+    def _read_snapshot(self, data: bytes) -> Tuple[Counters, Histograms]:
+        if len(data) < _SNAPSHOT_HEADER.size + _CRC.size:
+            raise ValueError("truncated")
+        (crc,) = _CRC.unpack_from(data, len(data) - _CRC.size)
+        if zlib.crc32(data[:-_CRC.size]) != crc:
+            raise ValueError("checksum mismatch")
+        magic, version, buckets, seq, since = _SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"not a version {FORMAT_VERSION} stats snapshot")
+        counters, histograms, _ = decode_state(data, _SNAPSHOT_HEADER.size)
+        self._seq, self.since = seq, since
+        return counters, self._histograms(histograms, buckets)
+
+    def _histograms(self, histograms: Histograms, buckets: int) -> Histograms:
+        if buckets == BUCKET_COUNT:
+            return histograms
+        if histograms:
+            logger.warning("Saved latency histograms use another bucket layout; dropped")
+        return {}
+
+    def _replay_journal(self, state: Tuple[Counters, Histograms], first: bool) -> None:
+        """Add the journal's records newer than the snapshot to state."""
+        try:
+            data = self.journal_path.read_bytes()
+        except FileNotFoundError:
+            return
+        offset = 0
+        while offset + _RECORD_FRAME.size <= len(data):
+            length, crc = _RECORD_FRAME.unpack_from(data, offset)
+            start = offset + _RECORD_FRAME.size
+            payload = data[start:start + length]
+            if len(payload) < max(length, _RECORD_HEADER.size) or zlib.crc32(payload) != crc:
+                break
+            seq, written, buckets = _RECORD_HEADER.unpack_from(payload)
+            offset = start + length
+            if seq <= self._seq:
+                continue
+            if first:
+                # No snapshot yet: counting started around the first record
+                self.since, first = written - self.journal_interval, False
+            counters, histograms, _ = decode_state(payload, _RECORD_HEADER.size)
+            _add(state, counters, self._histograms(histograms, buckets))
+            self._seq = seq
+        if offset < len(data):
+            logger.warning(f"Cutting torn record off {self.journal_path} at {offset}")
+            os.truncate(self.journal_path, offset)
+
+    # -- saving --------------------------------------------------------------
+
+    def _current(self) -> Tuple[Counters, Histograms]:
+        counters = dict(zip(self.counters.names, self.counters.totals()))
+        histograms = self.latency.snapshot() if self.latency is not None else {}
+        return counters, histograms
+
+    def _buckets(self) -> int:
+        return BUCKET_COUNT if self.latency is not None else 0
+
+    def journal(self) -> None:
+        """Append what changed since the last record or snapshot."""
+        with self._lock:
+            current = self._current()
+            counters, histograms = difference(current, self._saved)
+            if not counters and not histograms:
+                return
+            payload = (_RECORD_HEADER.pack(self._seq + 1, time.time(), self._buckets())
+                       + encode_state(counters, histograms))
+            self._journal.write(_RECORD_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._seq += 1
+            self._saved = current
+            self.journal_records += 1
+
+    def snapshot(self) -> None:
+        """Write every value to a new snapshot and empty the journal."""
+        with self._lock:
+            current = self._current()
+            data = (_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, FORMAT_VERSION, self._buckets(),
+                                          self._seq, self.since)
+                    + encode_state(*current))
+            data += _CRC.pack(zlib.crc32(data))
+            temporary = self.path.with_name(self.path.name + ".tmp")
+            with open(temporary, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+            directory = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+            # Records up to _seq are in the snapshot now; a crash before
+            # this point leaves them to be skipped on load
+            self._journal.truncate(0)
+            os.fsync(self._journal.fileno())
+            self._saved = current
+            self.snapshots += 1
+
+    def tick(self) -> None:
+        """Write a snapshot or journal record if one is due."""
+        now = time.monotonic()
+        try:
+            if now >= self._snapshot_due:
+                self._snapshot_due = now + self.snapshot_interval
+                self._journal_due = now + self.journal_interval
+                self.snapshot()
+            elif now >= self._journal_due:
+                self._journal_due = now + self.journal_interval
+                self.journal()
+        except OSError as e:
+            # Nothing is lost: the next write covers everything since
+            self.errors += 1
+            logger.error(f"Failed to save stats to {self.path}: {e}")
+
+    def start(self) -> None:
+        """Save from a thread of the store's own."""
+        self._thread = threading.Thread(
+            target=self._run, name="train-station-stats", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(min(self.journal_interval, self.snapshot_interval)):
+            self.tick()
+
+    def stats(self) -> Dict[str, Any]:
+        """For /status."""
+        return {
+            "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.since)),
+            "recovery_ms": round(self.recovery_ms, 3),
+            "snapshots": self.snapshots,
+            "journal_records": self.journal_records,
+            "errors": self.errors,
+        }
+
+    def close(self) -> None:
+        """Stop the thread and write a final snapshot."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.snapshot()
+        except OSError as e:
+            self.errors += 1
+            logger.error(f"Failed to save stats to {self.path}: {e}")
+        self._journal.close()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Status Stream
+================================
+🚂 Server-sent event feed of live statistics (852 Hz)
+
+One ticker computes a statistics snapshot per interval, however many
+clients are subscribed, and fans the encoded event out to all of them:
+
+    event: snapshot        full statistics, sent first to every subscriber
+    data: {...}
+
+    event: delta           only the values that changed since the last tick;
+    id: 42                 nested objects are merged key by key
+    data: {...}
+
+Ticks with no change send nothing, apart from a ``: keep-alive`` comment
+every heartbeat seconds so proxies keep the connection open. Each
+subscriber has a small bounded backlog; one that falls behind (a slow
+dashboard) has its backlog replaced by a fresh snapshot instead of
+holding events in memory or slowing the others down.
+
+The ticker runs on the event loop and only while someone is subscribed.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/event-stream"
+KEEPALIVE = b": keep-alive\n\n"
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Keys of new whose values differ from old, recursing into objects."""
+    changed = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changed[key] = nested
+        elif value != previous or key not in old:
+            changed[key] = value
+    return changed
+
+
+def encode_event(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> bytes:
+    """One SSE event; the JSON is compact so it fits one data: line."""
+    head = f"event: {event}\n"
+    if event_id is not None:
+        head += f"id: {event_id}\n"
+    return (head + "data: " + json.dumps(data, separators=(",", ":")) + "\n\n").encode("utf-8")
+
+
+class StatusStream:
+    """Shared ticker and fan-out of statistics events."""
+
+    def __init__(self, snapshot: Callable[[], Dict[str, Any]],
+                 interval: float = 1.0, heartbeat: float = 15.0,
+                 backlog: int = 8):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.backlog = backlog
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._ticker: Optional[asyncio.Task] = None
+        self._last: Optional[Dict[str, Any]] = None
+        self._last_event = b""
+        self._sequence = 0
+        self._closed = False
+        self.ticks = 0
+        self.resyncs = 0
+
+    def _full_event(self) -> bytes:
+        if not self._last_event:
+            self._last_event = encode_event("snapshot", self._last, self._sequence)
+        return self._last_event
+
+    def _tick(self) -> None:
+        """Compute one snapshot and queue its delta for every subscriber."""
+        current = self.snapshot()
+        self.ticks += 1
+        if self._last is None:
+            changed = current
+        else:
+            changed = diff(self._last, current)
+        self._last = current
+        if not changed:
+            event = b""
+        else:
+            self._sequence += 1
+            self._last_event = b""
+            event = encode_event("delta", changed, self._sequence)
+
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind for deltas to catch up; start it over
+                self.resyncs += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._full_event())
+
+    async def _run(self) -> None:
+        try:
+            while self._subscribers:
+                await asyncio.sleep(self.interval)
+                try:
+                    self._tick()
+                except Exception as e:
+                    logger.error(f"Status stream snapshot failed: {e}")
+        finally:
+            self._ticker = None
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Events for one client, starting with a full snapshot."""
+        if self._closed:
+            return
+        queue: asyncio.Queue = asyncio.Queue(self.backlog)
+        if self._last is None or self._ticker is None:
+            # Nobody was subscribed, so the last snapshot is stale
+            self._last = self.snapshot()
+            self._last_event = b""
+        self._subscribers.add(queue)
+        if self._ticker is None:
+            self._ticker = asyncio.get_running_loop().create_task(self._run())
+        loop = asyncio.get_running_loop()
+        quiet_since = loop.time()
+        try:
+            yield self._full_event()
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                if event:
+                    quiet_since = loop.time()
+                elif loop.time() - quiet_since >= self.heartbeat:
+                    quiet_since = loop.time()
+                    event = KEEPALIVE
+                # Empty ticks are yielded too, so the server can notice a drain
+                yield event
+        finally:
+            self._subscribers.discard(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "interval_seconds": self.interval,
+            "ticks": self.ticks,
+            "events": self._sequence,
+            "resyncs": self.resyncs,
+        }
+
+    def close(self) -> None:
+        """End every subscription."""
+        self._closed = True
+        for queue in self._subscribers:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
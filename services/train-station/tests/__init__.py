@@ -0,0 +1,7 @@
+"""Train Station test suite initialization."""
+
+import sys
+import os
+
+# Add the train-station directory to path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,157 @@
+"""
+Tests for the asyncio HTTP/1.1 Train Station server.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+
+def http_request(method, path, body=b"", close=False):
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+    if close:
+        head += "Connection: close\r\n"
+    return head.encode() + b"\r\n" + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = dict(
+        (k.lower(), v.strip()) for k, _, v in
+        (line.partition(":") for line in lines[1:] if line)
+    )
+    body = await reader.readexactly(int(headers["content-length"]))
+    return status, headers, json.loads(body)
+
+
+def run_with_server(tmp_path, client):
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+
+    async def _main():
+        server = await async_server.serve(
+            TrainStationAPI(orchestrator), host="127.0.0.1", port=0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await client(port)
+
+    return orchestrator, asyncio.run(_main())
+
+
+def test_keepalive_pipelining_in_order(tmp_path):
+    """Test several pipelined requests on one connection answer in order."""
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        types = ["build", "compute", "store", "monitor"]
+        writer.write(b"".join(
+            http_request("POST", "/route",
+                         json.dumps({"id": f"p{i}", "type": t}).encode())
+            for i, t in enumerate(types)
+        ))
+        results = [await read_response(reader) for _ in types]
+
+        writer.write(http_request("GET", "/health", close=True))
+        results.append(await read_response(reader))
+        assert await reader.read() == b""
+        writer.close()
+        return results
+
+    orchestrator, results = run_with_server(tmp_path, client)
+    assert [r[2]["request_id"] for r in results[:4]] == ["p0", "p1", "p2", "p3"]
+    assert [r[2]["vertex"] for r in results[:4]] == [
+        "transformation", "compute", "storage", "monitoring"
+    ]
+    assert all(r[1]["connection"] == "keep-alive" for r in results[:4])
+    assert results[4][1]["connection"] == "close"
+    assert orchestrator.request_count == 4
+
+
+def test_request_split_across_reads(tmp_path):
+    """Test a request arriving in fragments is parsed once complete."""
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        raw = http_request("POST", "/route", b'{"type": "webhook"}')
+        for i in range(0, len(raw), 7):
+            writer.write(raw[i:i + 7])
+            await writer.drain()
+            await asyncio.sleep(0)
+        result = await read_response(reader)
+        writer.close()
+        return result
+
+    _, (status, _, data) = run_with_server(tmp_path, client)
+    assert status == 200
+    assert data["vertex"] == "communication"
+
+
+async def read_chunked(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    body = b""
+    while True:
+        size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+        chunk = await reader.readexactly(size + 2)
+        if size == 0:
+            return head.decode(), body
+        body += chunk[:-2]
+
+
+def test_batch_route_streams_ndjson_results(tmp_path):
+    """Test /route/batch streams results in order, then keeps the connection."""
+    items = [{"id": f"b{i}", "type": t}
+             for i, t in enumerate(["build", "compute", "bogus", "archive"] * 50)]
+    body = json.dumps(items).encode()
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        raw = http_request("POST", "/route/batch", body)
+        for i in range(0, len(raw), 1000):
+            writer.write(raw[i:i + 1000])
+            await writer.drain()
+        head, payload = await read_chunked(reader)
+
+        writer.write(http_request("GET", "/health", close=True))
+        health = await read_response(reader)
+        writer.close()
+        return head, payload, health
+
+    orchestrator, (head, payload, health) = run_with_server(tmp_path, client)
+    assert "Transfer-Encoding: chunked" in head
+    results = [json.loads(line) for line in payload.decode().splitlines()]
+    assert [r["request_id"] for r in results] == [item["id"] for item in items]
+    assert [r["success"] for r in results[:4]] == [True, True, False, True]
+    assert health[0] == 200
+    assert orchestrator.request_count == 200
+
+
+def test_drain_closes_idle_keepalive_connections(tmp_path):
+    """Test drain answers nothing new and closes idle keep-alive connections."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+
+    async def _main():
+        connections = set()
+        server = await async_server.serve(
+            TrainStationAPI(orchestrator), host="127.0.0.1", port=0,
+            connections=connections,
+        )
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(http_request("GET", "/health"))
+        status, headers, _ = await read_response(reader)
+        assert len(connections) == 1
+
+        await async_server.drain(server, connections, timeout=2)
+        assert not connections
+        assert await reader.read() == b""
+        writer.close()
+        return status
+
+    assert asyncio.run(_main()) == 200
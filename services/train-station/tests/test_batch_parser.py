@@ -0,0 +1,69 @@
+"""
+Tests for the incremental /route/batch body parser.
+"""
+
+import json
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from batch_parser import BatchParser, BatchItemError
+
+
+ITEMS = [{"id": f"r{i}", "type": "compute", "payload": {"n": i * 1009, "s": "é" * i}}
+         for i in range(100)]
+
+
+def parse_in_chunks(body, size):
+    parser = BatchParser()
+    items = []
+    for i in range(0, len(body), size):
+        items += parser.feed(body[i:i + size])
+    return items + parser.close()
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 100000])
+def test_json_array_any_chunking(size):
+    """Test array bodies parse identically however they are split."""
+    body = json.dumps(ITEMS).encode("utf-8")
+    assert parse_in_chunks(body, size) == ITEMS
+
+
+@pytest.mark.parametrize("size", [1, 13, 100000])
+def test_ndjson_any_chunking(size):
+    """Test NDJSON bodies parse identically however they are split."""
+    body = "".join(json.dumps(item) + "\n" for item in ITEMS).encode("utf-8")
+    assert parse_in_chunks(body, size) == ITEMS
+
+
+def test_bad_items_are_reported_in_place():
+    """Test invalid items become BatchItemError without stopping the batch."""
+    items = parse_in_chunks(b'{"id": "a"}\nnot json\n[1]\n{"id": "b"}', 5)
+    assert items[0] == {"id": "a"}
+    assert isinstance(items[1], BatchItemError)
+    assert isinstance(items[2], BatchItemError)
+    assert items[3] == {"id": "b"}
+
+
+def test_empty_and_malformed_arrays():
+    """Test empty arrays and broken array syntax."""
+    assert parse_in_chunks(b" [ ] ", 1) == []
+    with pytest.raises(ValueError):
+        parse_in_chunks(b'[{"id": "a"} {"id": "b"}]', 4)
+    with pytest.raises(ValueError):
+        parse_in_chunks(b'[{"id": "a"},', 4)
+
+
+@pytest.mark.parametrize("ndjson", [True, False])
+def test_large_item_in_small_chunks_is_linear(ndjson):
+    """Test a multi-megabyte item sent 512 bytes at a time is not re-copied per chunk."""
+    item = {"id": "big", "type": "compute", "payload": {"blob": "x" * (2 << 20)}}
+    body = json.dumps(item).encode() + b"\n" if ndjson else json.dumps([item, item]).encode()
+    began = time.perf_counter()
+    items = parse_in_chunks(body, 512)
+    # Re-copying the buffer per chunk takes seconds here; appending, milliseconds
+    assert time.perf_counter() - began < 1.0
+    assert items == [item] if ndjson else [item, item]
@@ -0,0 +1,131 @@
+"""
+Tests for streamed request bodies: chunked uploads, caps and payload spooling.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import async_server
+from body_reader import BodyLimits, BodyRejected, RouteBodyParser
+from orchestrator import SPOOL_TYPES, TrainStationOrchestrator, TrainStationAPI, Vertex
+from vertex_proxy import VertexProxy
+from .test_async_server import http_request, read_response
+
+LIMITS = BodyLimits(SPOOL_TYPES, max_inline=1024, max_spool=256 * 1024, spool_memory=4096)
+
+
+def chunked_request(path, body, piece=100):
+    head = f"POST {path} HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n"
+    chunks = b"".join(b"%x\r\n%s\r\n" % (len(body[i:i + piece]), body[i:i + piece])
+                      for i in range(0, len(body), piece))
+    return head.encode() + chunks + b"0\r\n\r\n"
+
+
+def serve(tmp_path, client, backends=None):
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+
+    async def _main():
+        servers, proxy = [], None
+        if backends:
+            urls = {}
+            for vertex, app in backends.items():
+                backend = await async_server.serve(app, host="127.0.0.1", port=0)
+                servers.append(backend)
+                urls[vertex] = f"http://127.0.0.1:{backend.sockets[0].getsockname()[1]}/"
+            proxy = VertexProxy(urls)
+        server = await async_server.serve(
+            TrainStationAPI(orchestrator, proxy, body_limits=LIMITS),
+            host="127.0.0.1", port=0
+        )
+        async with server:
+            result = await client(server.sockets[0].getsockname()[1])
+        for backend in servers:
+            backend.close()
+        return result
+
+    result = asyncio.run(_main())
+    orchestrator.close()
+    return result
+
+
+def test_chunked_uploads_and_early_rejection(tmp_path):
+    """Test chunked bodies route, and oversized or badly framed ones are refused."""
+    doc = {"id": "c1", "type": "build", "source": "x,y:{}",
+           "payload": {"k": "v\\\"}", "nested": [1, {"z": "]"}]}}
+    raw = json.dumps(doc).encode()
+    for step in (1, 2, 3, 7, len(raw)):
+        parser = RouteBodyParser()
+        for i in range(0, len(raw), step):
+            parser.feed(raw[i:i + step])
+        fields, payload = parser.close()
+        assert payload == doc["payload"] and fields["source"] == "x,y:{}"
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        # Chunked, then a pipelined Content-Length request
+        writer.write(chunked_request("/route", raw, piece=5)
+                     + http_request("POST", "/route", b'{"id": "c2", "type": "deploy"}'))
+        results = [await read_response(reader), await read_response(reader)]
+
+        # A large payload of a type that may not spool: refused mid-body
+        writer.write(chunked_request(
+            "/route", b'{"type": "build", "payload": "' + b"x" * 4000 + b'"}'))
+        results.append(await read_response(reader))
+        assert await reader.read() == b""  # and the connection closed
+
+        rejected = []
+        for head in (b"Content-Length: 999999999\r\n",
+                     b"Transfer-Encoding: gzip\r\n",
+                     b"Transfer-Encoding: chunked\r\nContent-Length: 5\r\n"):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /route HTTP/1.1\r\nHost: test\r\n" + head + b"\r\n")
+            rejected.append((await read_response(reader))[0])
+            writer.close()
+        return results, rejected
+
+    results, rejected = serve(tmp_path, client)
+    assert [r[2]["request_id"] for r in results[:2]] == ["c1", "c2"]
+    assert results[0][2]["vertex"] == "transformation"
+    assert results[2][0] == 413 and "build" in results[2][2]["error"]
+    assert rejected == [413, 501, 400]
+
+    with pytest.raises(BodyRejected) as e:
+        LIMITS.parser().feed(b'{"type": "store", "payload": "' + b"x" * 300 * 1024)
+    assert e.value.status == 413
+
+
+def test_spooled_payload_is_forwarded_byte_exact(tmp_path):
+    """Test a store payload past the inline cap is spooled and sent on unchanged."""
+    payload = json.dumps({"rows": [{"n": i, "s": "é\\\"]}"} for i in range(4000)]},
+                         ensure_ascii=False).encode()
+    assert len(payload) > 64 * 1024
+    body = b'{"id": "big", "payload": ' + payload + b', "type": "store"}'
+    received = []
+
+    def storage_backend(method, path, data):
+        received.append(data)
+        return 200, {"stored": len(data)}
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(chunked_request("/route", body, piece=8192))
+        # Known length over the inline cap takes the same path
+        writer.write(http_request("POST", "/route", body.replace(b"big", b"big2")))
+        results = [await read_response(reader), await read_response(reader)]
+        writer.close()
+        return results
+
+    results = serve(tmp_path, client, {Vertex.BOTTOM_174: storage_backend})
+    assert [r[0] for r in results] == [200, 200]
+    assert "x-request-id" in results[0][1]
+    assert len(received) == 2
+    for data in received:
+        assert payload in data
+        forwarded = json.loads(data)
+        assert forwarded["type"] == "store" and forwarded["payload"] == json.loads(payload)
+    assert [json.loads(d)["id"] for d in received] == ["big", "big2"]
@@ -0,0 +1,130 @@
+"""
+Tests for request deadlines: expiry in the handshake and earliest-deadline-first queues.
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from fair_scheduler import FairScheduler
+from orchestrator import (
+    TrainStationOrchestrator, TrainStationAPI, Vertex, parse_deadline, parse_request,
+)
+from route_protocol import RouteRejected
+
+
+def test_expired_requests_are_dropped_and_not_deduped(tmp_path):
+    """Test a request past its deadline gets 504 at the phase it missed."""
+    assert parse_deadline({"id": "x"}) is None
+    now = time.monotonic()
+    assert now + 0.4 < parse_deadline({"timeout_ms": 500}) <= time.monotonic() + 0.5
+    # The earlier of the two wins
+    both = parse_deadline({"timeout_ms": 100, "deadline": time.time() + 10})
+    assert both <= time.monotonic() + 0.1
+
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    api = TrainStationAPI(orchestrator)
+    late = {"id": "d1", "type": "compute", "deadline": time.time() - 1}
+    status, data = api.handle("POST", "/route", json.dumps(late).encode())
+    assert status == 504 and data["expired"] is True
+    assert data["message"] == "Deadline exceeded before capture"
+    assert orchestrator.request_count == 0
+
+    # The retry with time left is routed, not replayed as a duplicate
+    retry = {"id": "d1", "type": "compute", "timeout_ms": 5000}
+    status, data = api.handle("POST", "/route", json.dumps(retry).encode())
+    assert status == 200 and data["duplicate"] is False
+    assert data["vertex"] == "compute"
+
+    # A slow capture uses up the budget: dropped before validate, and logged
+    capture = orchestrator.capture
+
+    def slow_capture(request, log_batch=None):
+        request.deadline = time.monotonic() - 0.001
+        return capture(request, log_batch)
+
+    orchestrator.capture = slow_capture
+    result = orchestrator.route_request(parse_request(
+        {"id": "d2", "type": "compute", "timeout_ms": 5000}))
+    assert result.expired and result.message == "Deadline exceeded before validate"
+    assert orchestrator.request_count == 2
+
+    # Forwarding needs the backend's expected latency left over
+    request = parse_request({"id": "d3", "type": "compute", "timeout_ms": 50})
+    assert orchestrator.check_deadline(request, "forward") is None
+    assert orchestrator.check_deadline(request, "forward", reserve=0.2).expired
+
+    assert orchestrator.expired == {"capture": 1, "validate": 1, "route": 0, "forward": 1}
+    assert 'train_station_expired_total{phase="validate"} 1' in orchestrator.metrics()
+    orchestrator.close()
+    records = [json.loads(line) for line in (tmp_path / "ts.log").read_text().splitlines()]
+    assert [r["data"]["phase"] for r in records
+            if r["data"].get("reason") == "deadline_exceeded"] == ["validate", "forward"]
+
+
+def test_queues_run_earliest_deadline_first(tmp_path):
+    """Test queued jobs run by deadline, and those queued too long expire."""
+    order = []
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        scheduler = FairScheduler(max_concurrent=1, horizon=2.0)
+        blocker = asyncio.Event()
+        scheduler.submit("a", blocker.wait)
+        await asyncio.sleep(0)
+        now = loop.time()
+        futures = [
+            scheduler.submit("a", lambda: order.append("late"), deadline=now + 3),
+            scheduler.submit("a", lambda: order.append("none1")),
+            scheduler.submit("a", lambda: order.append("soon"), deadline=now + 0.5),
+            scheduler.submit("a", lambda: order.append("none2")),
+            scheduler.submit("a", lambda: order.append("sooner"), deadline=now + 0.1),
+        ]
+        blocker.set()
+        await asyncio.gather(*futures)
+
+    asyncio.run(main())
+    # Without a deadline: due after the horizon, and first come first served
+    assert order == ["sooner", "soon", "none1", "none2", "late"]
+
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    scheduler = FairScheduler(max_concurrent=1)
+    api = TrainStationAPI(orchestrator, scheduler=scheduler)
+
+    async def queued():
+        blocker = asyncio.Event()
+        scheduler.submit(Vertex.SOUTH_741, blocker.wait)
+        await asyncio.sleep(0)
+        results = [api.handle("POST", "/route", json.dumps(body).encode()) for body in (
+            {"id": "q1", "type": "compute", "timeout_ms": 20},
+            {"id": "q2", "type": "compute", "timeout_ms": 5000},
+        )]
+        await asyncio.sleep(0.05)
+        blocker.set()
+        return [await r for r in results]
+
+    responses = asyncio.run(queued())
+    orchestrator.close()
+    assert [r[0] for r in responses] == [504, 200]
+    assert orchestrator.expired["capture"] == 1
+
+
+def test_non_finite_deadlines_are_rejected(tmp_path):
+    """Test NaN, infinite or non-numeric deadlines get 400, not 500 or instant expiry."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    api = TrainStationAPI(orchestrator)
+    for bad in ('{"timeout_ms": NaN}', '{"timeout_ms": "soon"}', '{"deadline": Infinity}',
+                '{"deadline": [1]}', '{"timeout_ms": true}'):
+        status, data = api.handle("POST", "/route", b'{"type": "compute", ' + bad[1:].encode())
+        assert status == 400 and "finite number" in data["error"], bad
+    assert orchestrator.request_count == 0
+
+    with pytest.raises(RouteRejected) as rejected:
+        api.route_message({"type": "compute", "timeout_ms": float("nan")})
+    assert rejected.value.status == 400
+    orchestrator.close()
@@ -0,0 +1,74 @@
+"""
+Tests for the request id dedup cache.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dedup_cache import DedupCache, ENTRY_OVERHEAD
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex, parse_request
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    """Test entries are replayed within the TTL and dropped after it."""
+    clock = FakeClock()
+    cache = DedupCache(ttl=10, clock=clock)
+    cache.put("a", 1)
+    clock.now += 5
+    cache.put("b", 2)
+
+    clock.now += 4
+    assert cache.get("a") == 1 and cache.get("b") == 2
+    clock.now += 2
+    assert cache.get("a") is None and cache.get("b") == 2
+    clock.now += 10
+    assert cache.get("b") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"]) == (3, 2, 2)
+    assert stats["entries"] == 0 and stats["bytes"] == 0
+
+
+def test_memory_budget_evicts_oldest():
+    """Test the byte budget holds however many ids go through the cache."""
+    cost = len("id-00000") + ENTRY_OVERHEAD
+    cache = DedupCache(ttl=3600, max_bytes=100 * cost)
+    for i in range(10000):
+        cache.put(f"id-{i:05d}", i)
+
+    assert len(cache) == 100
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.stats()["evicted"] == 9900
+    assert cache.get("id-09899") is None and cache.get("id-09900") == 9900
+
+
+def test_retries_replay_the_stored_result(tmp_path):
+    """Test a retried id is answered from the cache and not counted again."""
+    orchestrator = TrainStationOrchestrator(
+        log_path=tmp_path / "ts.log", dedup=DedupCache(ttl=60)
+    )
+    api = TrainStationAPI(orchestrator)
+
+    first = api.handle('POST', '/route', b'{"id": "job-1", "type": "compute"}')
+    retry = api.handle('POST', '/route', b'{"id": "job-1", "type": "compute"}')
+    assert first[1]["vertex"] == retry[1]["vertex"] == "compute"
+    assert (first[1]["duplicate"], retry[1]["duplicate"]) == (False, True)
+
+    # Ids made up by the Train Station are never treated as retries
+    for _ in range(2):
+        orchestrator.route_request(parse_request({"type": "compute"}))
+
+    assert orchestrator.request_count == 3
+    assert orchestrator.vertex_counts[Vertex.SOUTH_741] == 3
+    dedup = api.handle('GET', '/status', b'')[1]["statistics"]["dedup"]
+    assert (dedup["hits"], dedup["misses"], dedup["entries"]) == (1, 1, 1)
+    assert 'train_station_dedup_lookups_total{result="hit"} 1' in orchestrator.metrics()
@@ -0,0 +1,87 @@
+"""
+Tests for per-vertex queues and weighted fair dispatch.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from fair_scheduler import FairScheduler, QueueFull
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex
+
+
+def test_weighted_round_robin_order():
+    """Test a heavier queue gets proportionally more dispatch turns."""
+    order = []
+
+    async def main():
+        scheduler = FairScheduler({"fast": 2}, max_concurrent=1)
+
+        def job(key, i):
+            async def run():
+                order.append(key)
+                await asyncio.sleep(0)
+            return run
+
+        futures = [scheduler.submit("bulk", job("bulk", i)) for i in range(6)]
+        futures += [scheduler.submit("fast", job("fast", i)) for i in range(4)]
+        await asyncio.gather(*futures)
+
+    asyncio.run(main())
+    assert order == ["bulk", "fast", "fast", "bulk", "fast", "fast",
+                     "bulk", "bulk", "bulk", "bulk"]
+
+
+def test_full_queue_rejects_with_retry_after():
+    """Test submissions beyond capacity fail fast with QueueFull."""
+
+    async def main():
+        scheduler = FairScheduler(capacity=2, max_concurrent=1)
+        blocker = asyncio.Event()
+        scheduler.submit("a", blocker.wait)
+        await asyncio.sleep(0)  # first job starts and holds the only slot
+        scheduler.submit("a", lambda: 1)
+        scheduler.submit("a", lambda: 2)
+        with pytest.raises(QueueFull) as excinfo:
+            scheduler.submit("a", lambda: 3)
+        # Other queues are unaffected
+        other = scheduler.submit("b", lambda: "b")
+        blocker.set()
+        assert await other == "b"
+        return excinfo.value, scheduler.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.retry_after >= 1
+    assert stats["queues"]["a"]["rejected"] == 1
+    assert stats["queues"]["a"]["completed"] == 3
+
+
+def test_health_checks_not_starved_by_build_flood(tmp_path):
+    """Test a health check admitted behind a build flood dispatches early."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    scheduler = FairScheduler({Vertex.TOP_963: 4}, capacity=8, max_concurrent=1)
+    api = TrainStationAPI(orchestrator, scheduler=scheduler)
+    order = []
+
+    async def main():
+        bodies = [{"id": f"b{i}", "type": "build"} for i in range(10)]
+        bodies.append({"id": "h1", "type": "health_check"})
+        results = []
+        for body in bodies:
+            result = api.handle("POST", "/route", json.dumps(body).encode())
+            if asyncio.isfuture(result):
+                result.add_done_callback(lambda f, id=body["id"]: order.append(id))
+            results.append(result)
+        return [await r if asyncio.isfuture(r) else r for r in results]
+
+    responses = asyncio.run(main())
+    orchestrator.close()
+
+    assert [r[0] for r in responses] == [200] * 8 + [503] * 2 + [200]
+    assert responses[8][2] == {"Retry-After": "1"}
+    assert responses[10][1]["vertex"] == "monitoring"
+    assert order.index("h1") <= 1
@@ -0,0 +1,86 @@
+"""
+Tests for the timer wheel and delayed / recurring jobs.
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+from datetime import datetime
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from job_scheduler import CronExpression, JobScheduler, TimerWheel
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+
+def test_wheel_fires_on_time_across_levels():
+    """Test timers fire at their exact tick after cascading, and cancel works anywhere."""
+    start = 1_700_000_000_123
+    wheel = TimerWheel(start)
+    delays = [1, 255, 256, 257, 65_535, 65_536, 70_000, 16_777_217, 5_000_000_000]
+    for delay in delays:
+        wheel.add(delay, start + delay)
+    wheel.add("cancelled", start + 300_000)
+    wheel.add("past", start - 50)
+    assert wheel.cancel("cancelled") and not wheel.cancel("cancelled")
+    assert len(wheel) == len(delays) + 1
+
+    fired = []
+    while len(wheel):
+        tick = wheel.next_expiry()
+        for expires, key, _ in wheel.advance(tick):
+            # Overdue timers fire on the next tick
+            assert tick == max(expires, start + 1)
+            fired.append(key)
+    # Same tick: in the order they were added
+    assert fired == [1, "past"] + delays[1:]
+
+    cron = CronExpression("*/15 9-17 * * 1-5")
+    friday = datetime(2026, 10, 16, 17, 50).timestamp()
+    assert datetime.fromtimestamp(cron.next_after(friday)) == datetime(2026, 10, 19, 9, 0)
+
+
+def test_schedule_routes_due_jobs_and_survives_restart(tmp_path):
+    """Test POST /schedule jobs are routed when due and pending ones outlive a restart."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    journal = tmp_path / "jobs.journal"
+
+    def post(api, job):
+        return api.handle("POST", "/schedule", json.dumps(job).encode())
+
+    async def first_run():
+        jobs = JobScheduler(journal, fsync=False)
+        api = TrainStationAPI(orchestrator, jobs=jobs)
+        jobs.start(api.route_job)
+        soon = time.time() + 0.05
+        status, once = post(api, {"id": "once", "run_at": soon,
+                                  "request": {"type": "compute", "source": "cron"}})
+        assert status == 201 and abs(once["next_run"] - soon) < 0.002
+        assert post(api, {"id": "tick", "interval_ms": 20,
+                          "request": {"type": "store"}})[0] == 201
+        assert post(api, {"id": "later", "run_at": time.time() + 3600,
+                          "request": {"type": "build"}})[0] == 201
+        assert post(api, {"id": "gone", "run_at": soon, "request": {}})[0] == 201
+        assert api.handle("DELETE", "/schedule/gone", b"")[0] == 200
+        assert post(api, {"cron": "0 0 30 2 *", "request": {}})[0] == 400
+        await asyncio.sleep(0.2)
+        stats = api.status()[1]["jobs"]
+        jobs.close()
+        return stats
+
+    stats = asyncio.run(first_run())
+    assert stats["pending"] == 2 and stats["failed"] == 0
+    assert 5 <= stats["fired"] <= 11
+    counts = orchestrator.vertex_counts
+    assert sum(n for vertex, n in counts.items() if vertex.vertex_name == "compute") == 1
+
+    jobs = JobScheduler(journal, fsync=False)
+    api = TrainStationAPI(orchestrator, jobs=jobs)
+    assert sorted(jobs.jobs) == ["later", "tick"]
+    assert api.handle("GET", "/schedule/later", b"")[1]["request"] == {"type": "build"}
+    assert api.handle("GET", "/schedule/once", b"")[0] == 404
+    listed = api.handle("GET", "/schedule?limit=1", b"")[1]
+    assert listed["count"] == 2 and listed["truncated"]
+    jobs.close()
+    orchestrator.close()
@@ -0,0 +1,72 @@
+"""
+Tests for the per-phase latency histograms and the /metrics endpoint.
+"""
+
+import threading
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from latency_metrics import (
+    LatencyHistograms, BUCKET_COUNT, bucket_index, bucket_upper_bound,
+)
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+
+def test_buckets_are_contiguous_and_log_linear():
+    """Test every value lands in a bucket at most 25% wider than itself."""
+    for value in list(range(2048)) + [2 ** k + d for k in range(11, 39) for d in (-1, 0, 1)]:
+        index = bucket_index(value)
+        assert value < bucket_upper_bound(index)
+        assert index == 0 or value >= bucket_upper_bound(index - 1)
+        if value >= 8:
+            assert bucket_upper_bound(index) <= value * 1.25 + 1
+    assert bucket_index(2 ** 60) == BUCKET_COUNT - 1
+
+
+def test_percentiles_and_thread_shards():
+    """Test observations from several threads merge into one series."""
+    histograms = LatencyHistograms()
+    key = ("route", "compute", "compute")
+
+    def record():
+        for _ in range(980):
+            histograms.observe(key, 1_000)        # 1 µs
+        for _ in range(20):
+            histograms.observe(key, 50_000_000)   # 50 ms
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = histograms.summary()["route"]
+    assert summary["count"] == 4000
+    assert summary["p50_ms"] <= 0.00125
+    assert 50 <= summary["p99_ms"] <= 50 * 1.25
+
+
+def test_metrics_endpoint_and_status_percentiles(tmp_path):
+    """Test /metrics exposes phase histograms and /status their percentiles."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    api = TrainStationAPI(orchestrator)
+    for i in range(3):
+        api.handle("POST", "/route", b'{"type": "build"}')
+    api.handle("POST", "/route", b'{"type": "teleport"}')
+
+    status, text, headers = api.handle("GET", "/metrics", b"")
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert "train_station_requests_total 4" in text
+    assert ('train_station_phase_duration_seconds_count'
+            '{phase="route",type="build",vertex="transformation"} 3') in text
+    assert ('train_station_phase_duration_seconds_bucket'
+            '{phase="validate",type="unknown",vertex="none",le="+Inf"} 1') in text
+
+    _, data = api.handle("GET", "/status", b"")
+    latency = data["latency"]
+    assert set(latency["phases"]) == {"capture", "validate", "route", "handshake", "respond"}
+    assert latency["vertices"]["transformation"]["count"] == 3
+    assert latency["types"]["build"]["p99_ms"] >= latency["types"]["build"]["p50_ms"]
+    orchestrator.close()
@@ -0,0 +1,95 @@
+"""
+Tests for the columnar log converter and its group-by queries.
+"""
+
+import csv
+import io
+import json
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import log_columns
+from log_columns import ColumnStore, convert, parse_bucket, parse_time
+from log_segments import SegmentStore
+from log_writer import LogWriter, FsyncPolicy
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+
+def test_convert_segments_and_count_routes(tmp_path):
+    """Test routes per vertex and type match what the orchestrator counted."""
+    path = tmp_path / "ts.log"
+    segments = SegmentStore(path, max_bytes=2048)
+    # Rotation starts once the (empty) index has loaded
+    while not segments.ready:
+        time.sleep(0.001)
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE, segments=segments)
+    orchestrator = TrainStationOrchestrator(log_path=path, log_writer=writer)
+    api = TrainStationAPI(orchestrator)
+    types = ["build", "compute", "store", "webhook", "bogus"]
+    for i in range(200):
+        body = {"id": f"c{i}", "type": types[i % 5], "source": f"dojo-{i % 3}"}
+        api.handle("POST", "/route", json.dumps(body).encode())
+        if i % 20 == 19:
+            assert writer.flush(timeout=5)
+    orchestrator.close()
+
+    result = convert(path, active=True)
+    assert result["partitions"] > 3 and result["rows"] == 200 + 200 + 160
+    # Sealed segments are converted once; only the active file again
+    sealed = len(list(tmp_path.glob("ts.log.segments/*.meta.json")))
+    assert sealed > 3
+    assert convert(path, active=True)["skipped"] == sealed
+
+    store = ColumnStore([tmp_path / "ts.log.columns"])
+    assert store.rows == 560
+    routes = store.count(by=["vertex"], where={"phase": ["route"]})
+    assert routes == {(vertex.vertex_name,): count
+                      for vertex, count in orchestrator.vertex_counts.items() if count}
+    by_type = store.count(by=["type", "source"], where={"phase": ["route"], "type": ["build"]})
+    assert by_type == {("build", "dojo-0"): 14, ("build", "dojo-1"): 13, ("build", "dojo-2"): 13}
+    failed = store.count(by=["reason"], where={"phase": ["validate"]})
+    assert failed == {("",): 160, ("unknown_request_type",): 40}
+    # Columns are bare arrays of the smallest dtype that fits
+    partition = store.partitions[0]
+    assert partition.column("ts").dtype == np.int64
+    assert partition.column("vertex").dtype == np.uint8
+
+
+def test_time_buckets_and_cli(tmp_path, capsys):
+    """Test per-minute buckets with since/until, through the query command."""
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE)
+    for i in range(180):
+        ts = f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}.250000"
+        writer.write_many([
+            {"timestamp": ts, "data": {"phase": "capture", "request_id": f"r{i}",
+                                       "type": "compute", "source": "dojo"}},
+            {"timestamp": ts, "data": {"phase": "route", "request_id": f"r{i}",
+                                       "vertex": "compute" if i % 3 else "storage"}},
+        ])
+    writer.close()
+    log_columns.main(["convert", str(path), "--active"])
+    capsys.readouterr()
+
+    assert parse_bucket("5m") == 300_000_000
+    with pytest.raises(ValueError):
+        parse_bucket("5 minutes")
+    log_columns.main(["query", str(tmp_path / "ts.log.columns"), "--where", "phase=route",
+                      "--by", "vertex", "--bucket", "1m", "--format", "csv",
+                      "--since", "2026-01-01T00:00:30", "--until", "2026-01-01T00:02:00"])
+    rows = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+    assert rows == [
+        ["time", "vertex", "count"],
+        ["2026-01-01T00:00:00", "compute", "20"],
+        ["2026-01-01T00:00:00", "storage", "10"],
+        ["2026-01-01T00:01:00", "compute", "40"],
+        ["2026-01-01T00:01:00", "storage", "20"],
+    ]
+    store = ColumnStore([tmp_path / "ts.log.columns"])
+    assert store.count(since=parse_time("2026-01-01T00:02:59")) == {(): 2}
@@ -0,0 +1,123 @@
+"""
+Tests for rotating, compressed, indexed log segments.
+"""
+
+import gzip
+import json
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from log_segments import SegmentStore, Compression
+from log_writer import LogWriter, FsyncPolicy
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+
+def write_handshakes(writer, count, start=0):
+    for i in range(start, start + count):
+        request_id = f"req-{i}"
+        writer.write_many([
+            {"timestamp": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}",
+             "data": {"phase": "capture", "request_id": request_id}},
+            {"timestamp": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}",
+             "data": {"phase": "route", "request_id": request_id,
+                      "vertex": "compute" if i % 2 else "storage"}},
+        ])
+        if i % 10 == 9:
+            assert writer.flush(timeout=5)
+    assert writer.flush(timeout=5)
+
+
+@pytest.mark.parametrize("compression", list(Compression))
+def test_rotation_lookup_and_reopen(tmp_path, compression):
+    """Test sealed segments stay searchable, also after a restart."""
+    path = tmp_path / "ts.log"
+    store = SegmentStore(path, max_bytes=4096, compression=compression)
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE, segments=store)
+    write_handshakes(writer, 300)
+    writer.close()
+
+    sealed = sorted(store.directory.glob("*.meta.json"))
+    assert len(sealed) > 5
+    assert not list(store.directory.glob("*.jsonl"))
+    if compression is Compression.GZIP:
+        # Block-compressed segments are still ordinary gzip files
+        first = store.directory / json.loads(sealed[0].read_text())["file"]
+        assert gzip.decompress(first.read_bytes()).startswith(b'{"timestamp"')
+
+    reopened = SegmentStore(path, max_bytes=4096, compression=compression)
+    for i in (0, 150, 299):
+        records = reopened.lookup(f"req-{i}")
+        assert [r["data"]["phase"] for r in records] == ["capture", "route"]
+    assert reopened.lookup("req-missing") == []
+    assert reopened.stats()["sealed_records"] + reopened.stats()["active_records"] == 600
+    reopened.close()
+
+
+def test_query_since_and_vertex(tmp_path):
+    """Test time/vertex queries return matching records in order."""
+    path = tmp_path / "ts.log"
+    store = SegmentStore(path, max_bytes=2048)
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE, segments=store)
+    write_handshakes(writer, 120)
+
+    records, truncated = store.query(since="2026-01-01T00:01:50", vertex="compute")
+    assert not truncated
+    assert [r["data"]["request_id"] for r in records] == [
+        "req-111", "req-113", "req-115", "req-117", "req-119"
+    ]
+    records, truncated = store.query(limit=10)
+    assert truncated and len(records) == 10
+    assert records[0]["data"]["request_id"] == "req-0"
+    writer.close()
+
+
+def test_requests_endpoints(tmp_path):
+    """Test /requests/{id} and /requests?since=&vertex= use the index."""
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, segments=SegmentStore(path, max_bytes=1024))
+    orchestrator = TrainStationOrchestrator(log_path=path, log_writer=writer)
+    api = TrainStationAPI(orchestrator)
+    for i in range(20):
+        api.handle("POST", "/route", json.dumps({"id": f"r{i}", "type": "store"}).encode())
+    assert writer.flush(timeout=5)
+
+    status, data = api.handle("GET", "/requests/r7", b"")
+    assert status == 200
+    assert [r["data"]["phase"] for r in data["records"]] == ["capture", "validate", "route"]
+    assert api.handle("GET", "/requests/nope", b"")[0] == 404
+
+    status, data = api.handle("GET", "/requests?since=0&vertex=BOTTOM_174&limit=5", b"")
+    assert status == 200
+    assert data["count"] == 5 and data["truncated"] is True
+    assert {r["data"]["vertex"] for r in data["records"]} == {"storage"}
+    assert api.handle("GET", "/requests?vertex=nowhere", b"")[0] == 400
+    orchestrator.close()
+
+
+def test_index_loads_in_background(tmp_path, monkeypatch):
+    """Test writes go on while the index loads, and are indexed once it has."""
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE)
+    write_handshakes(writer, 10)
+    writer.close()
+    with open(path, "ab") as f:
+        f.write(b'{"timestamp": "2026-01-01T00:00:10", "da')  # torn by a crash
+
+    gate = threading.Event()
+    load = SegmentStore._load
+    monkeypatch.setattr(SegmentStore, "_load", lambda self: gate.wait(5) and load(self))
+    store = SegmentStore(path, max_bytes=1 << 20)
+    assert not store.ready and store.stats()["loading"] is True
+    assert path.read_bytes().endswith(b"\n")
+
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE, segments=store)
+    write_handshakes(writer, 5, start=10)
+    gate.set()
+    assert [r["data"]["phase"] for r in store.lookup("req-3")] == ["capture", "route"]
+    assert [r["data"]["phase"] for r in store.lookup("req-12")] == ["capture", "route"]
+    assert store.ready and store.stats()["active_records"] == 30
+    writer.close()
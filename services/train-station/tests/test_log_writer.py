@@ -0,0 +1,70 @@
+"""
+Tests for the group-commit Train Station log writer.
+"""
+
+import json
+import threading
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from log_writer import LogWriter, FsyncPolicy, OverflowPolicy
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_records_group_committed_in_order(tmp_path):
+    """Test records from one burst land in few appends, in order."""
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, flush_interval=0.05, fsync=FsyncPolicy.BATCH)
+    for i in range(1000):
+        writer.write({"n": i})
+    assert writer.flush(timeout=5)
+
+    assert [r["n"] for r in read_records(path)] == list(range(1000))
+    assert writer.batches_written < 10
+    writer.close()
+
+
+def test_close_flushes_pending_records(tmp_path):
+    """Test close() writes everything still queued."""
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, flush_interval=60, fsync=FsyncPolicy.NONE)
+    writer.write_many({"n": i} for i in range(10))
+    writer.close()
+
+    assert len(read_records(path)) == 10
+    assert writer.write({"late": True}) is False
+
+
+def test_drop_policy_bounds_queue(tmp_path):
+    """Test a full queue drops new records instead of growing."""
+    writer = LogWriter(tmp_path / "ts.log", flush_interval=60,
+                       max_queue=5, overflow=OverflowPolicy.DROP)
+    kept = [writer.write({"n": i}) for i in range(8)]
+    assert kept == [True] * 5 + [False] * 3
+    assert writer.stats()["dropped"] == 3
+    writer.close()
+
+
+def test_block_policy_waits_for_writer(tmp_path):
+    """Test a full queue blocks producers until the writer drains it."""
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, flush_interval=0.01,
+                       max_queue=4, overflow=OverflowPolicy.BLOCK)
+
+    def produce():
+        for i in range(200):
+            writer.write({"n": i})
+
+    threads = [threading.Thread(target=produce) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    writer.close()
+
+    assert len(read_records(path)) == 800
+    assert writer.records_dropped == 0
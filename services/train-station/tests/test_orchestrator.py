@@ -0,0 +1,86 @@
+"""
+Tests for the Train Station orchestrator and its HTTP API.
+"""
+
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from orchestrator import (
+    TrainStationOrchestrator, TrainStationAPI, RequestType, Vertex,
+    parse_request,
+)
+
+
+def make_orchestrator(tmp_path):
+    return TrainStationOrchestrator(log_path=tmp_path / "train-station.log")
+
+
+def test_route_request_uses_routing_map(tmp_path):
+    """Test the triadic handshake routes by request type."""
+    orchestrator = make_orchestrator(tmp_path)
+    request = parse_request({"id": "r1", "type": "compute", "source": "dojo"})
+
+    result = orchestrator.route_request(request)
+    assert result.success is True
+    assert result.vertex == Vertex.SOUTH_741
+    assert orchestrator.request_count == 1
+    assert orchestrator.vertex_counts[Vertex.SOUTH_741] == 1
+
+
+def test_unknown_request_type_fails_validation(tmp_path):
+    """Test unknown request types are rejected in VALIDATE."""
+    orchestrator = make_orchestrator(tmp_path)
+    request = parse_request({"id": "r2", "type": "teleport"})
+    assert request.type == RequestType.UNKNOWN
+
+    result = orchestrator.route_request(request)
+    assert result.success is False
+    assert result.vertex is None
+
+
+def test_api_dispatch(tmp_path):
+    """Test the transport-independent API endpoints."""
+    api = TrainStationAPI(make_orchestrator(tmp_path))
+
+    status, data = api.handle("GET", "/health", b"")
+    assert status == 200 and data["status"] == "healthy"
+
+    body = json.dumps({"id": "r3", "type": "store"}).encode()
+    status, data = api.handle("POST", "/route", body)
+    assert status == 200
+    assert data["vertex"] == "storage"
+
+    status, data = api.handle("GET", "/status?verbose=1", b"")
+    assert status == 200
+    assert data["statistics"]["total_requests"] == 1
+
+    status, _ = api.handle("GET", "/missing", b"")
+    assert status == 404
+
+
+def test_handshake_log_records_flushed_on_close(tmp_path):
+    """Test every handshake phase is written to the log by close()."""
+    orchestrator = make_orchestrator(tmp_path)
+    for i in range(5):
+        orchestrator.route_request(parse_request({"id": f"l{i}", "type": "deploy"}))
+    orchestrator.close()
+
+    lines = (tmp_path / "train-station.log").read_text().splitlines()
+    phases = [json.loads(line)["data"]["phase"] for line in lines]
+    assert phases == ["capture", "validate", "route"] * 5
+
+
+def test_route_batch_commits_one_log_batch(tmp_path):
+    """Test a batch is routed in order with its log records written together."""
+    orchestrator = make_orchestrator(tmp_path)
+    requests = [parse_request({"id": f"b{i}", "type": "api_call"}) for i in range(10)]
+
+    results = orchestrator.route_batch(requests)
+    assert [r.request_id for r in results] == [f"b{i}" for i in range(10)]
+    assert orchestrator.vertex_counts[Vertex.NORTH_639] == 10
+
+    orchestrator.close()
+    assert orchestrator.log_writer.batches_written == 1
+    assert orchestrator.log_writer.records_written == 30
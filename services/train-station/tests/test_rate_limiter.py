@@ -0,0 +1,80 @@
+"""
+Tests for per-source token-bucket rate limiting.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from dedup_cache import DedupCache
+from orchestrator import RequestType, TrainStationOrchestrator, TrainStationAPI
+from rate_limiter import RateLimiter, compile_limits
+from routing_rules import RuleError
+from .test_dedup_cache import FakeClock
+
+
+def test_buckets_refill_lazily_and_evict_idle_sources():
+    """Test refill on access, both bucket scopes and the LRU bound."""
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    policy = compile_limits({
+        "source": {"rate": 2, "burst": 3},
+        "sources": {"trusted": None},
+        "types": {"ml_training": {"rate": 1}},
+        "max_buckets": 1000,
+    }, RequestType)
+
+    assert [limiter.check("a", "build", policy) for _ in range(3)] == [None] * 3
+    scope, wait = limiter.check("a", "build", policy)
+    assert scope == "source" and wait == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.check("a", "build", policy) is None
+    assert limiter.check("a", "build", policy) is not None
+
+    # One ml_training per second per source, within the source's budget
+    assert limiter.check("b", "ml_training", policy) is None
+    assert limiter.check("b", "ml_training", policy)[0] == "source_type"
+    assert limiter.check("b", "build", policy) is None
+    assert all(limiter.check("trusted", "build", policy) is None for _ in range(100))
+
+    for i in range(10000):
+        limiter.check(f"flood-{i}", "build", policy)
+    assert len(limiter) == 1000
+    assert limiter.stats()["evicted"] == 10000 + 3 - 1000
+    assert limiter.stats()["rejected"] == {"source": 2, "source_type": 1}
+
+    with pytest.raises(RuleError, match="rate"):
+        compile_limits({"source": {"rate": 0}}, RequestType)
+    with pytest.raises(RuleError, match="request type"):
+        compile_limits({"types": {"nope": {"rate": 1}}}, RequestType)
+
+
+def test_rate_limited_routes_answer_429(tmp_path):
+    """Test a limited source gets 429 with Retry-After and others still route."""
+    orchestrator = TrainStationOrchestrator(
+        log_path=tmp_path / "ts.log", dedup=DedupCache(ttl=60),
+        rate_limiter=RateLimiter(clock=FakeClock())
+    )
+    api = TrainStationAPI(orchestrator)
+    status, data = api.handle('POST', '/admin/routing',
+                              b'{"limits": {"source": {"rate": 0.5, "burst": 2}}}')
+    assert status == 200 and data["rate_limited"]
+
+    route = b'{"id": "%s", "type": "compute", "source": "%s"}'
+    assert api.handle('POST', '/route', route % (b"r1", b"noisy"))[0] == 200
+    assert api.handle('POST', '/route', route % (b"r2", b"noisy"))[0] == 200
+    status, data, headers = api.handle('POST', '/route', route % (b"r3", b"noisy"))
+    assert status == 429 and headers == {"Retry-After": "2"}
+    assert data["success"] is False and data["retry_after"] == pytest.approx(2.0)
+    assert api.handle('POST', '/route', route % (b"q1", b"quiet"))[0] == 200
+
+    # The rejected id was not routed, so its retry is not a duplicate
+    orchestrator.rate_limiter.clock.now += 2
+    status, data = api.handle('POST', '/route', route % (b"r3", b"noisy"))
+    assert status == 200 and not data["duplicate"]
+
+    assert 'train_station_rate_limited_total{scope="source"} 1' in orchestrator.metrics()
+    assert orchestrator.get_status()["statistics"]["rate_limits"]["buckets"] == 2
+    orchestrator.close()
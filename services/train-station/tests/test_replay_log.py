@@ -0,0 +1,61 @@
+"""
+Tests for the log replay load generator.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.replay_log import (
+    InProcessTarget, compare, load_requests, replay,
+)
+from log_segments import SegmentStore
+from log_writer import LogWriter
+from orchestrator import TrainStationOrchestrator, parse_request
+
+
+def capture_traffic(tmp_path, count):
+    path = tmp_path / "ts.log"
+    writer = LogWriter(path, segments=SegmentStore(path, max_bytes=2048))
+    orchestrator = TrainStationOrchestrator(log_path=path, log_writer=writer)
+    for i in range(count):
+        request = parse_request({"id": f"c{i}", "type": "build" if i % 3 else "monitor",
+                                 "source": f"src-{i % 2}"})
+        orchestrator.route_request(request)
+        if i % 10 == 9:
+            writer.flush(timeout=5)
+    orchestrator.close()
+    return path
+
+
+def test_load_requests_across_segments(tmp_path):
+    """Test the request stream is rebuilt from segments and the active log."""
+    path = capture_traffic(tmp_path, 60)
+    assert list((tmp_path / "ts.log.segments").glob("*.meta.json"))
+
+    requests = load_requests([path])
+    assert [r.id for r in requests] == [f"c{i}" for i in range(60)]
+    assert requests[0].offset == 0.0
+    assert all(a.offset <= b.offset for a, b in zip(requests, requests[1:]))
+    assert {(r.type, r.source) for r in requests[:2]} == {("monitor", "src-0"), ("build", "src-1")}
+
+
+def test_replay_in_process_reports_json(tmp_path):
+    """Test an in-process max-speed replay reports every request."""
+    requests = load_requests([capture_traffic(tmp_path, 30)])
+    target = InProcessTarget(tmp_path / "replay")
+    try:
+        result = asyncio.run(replay(requests, target, speed=0, workers=4, loop_mode="closed"))
+    finally:
+        target.close()
+
+    assert result["requests"] == result["completed"] == 30
+    assert result["errors"] == 0 and result["statuses"] == {"200": 30}
+    assert result["latency_ms"]["p99"] >= result["latency_ms"]["p50"]
+    json.dumps(result)
+
+    slower = dict(result, throughput_rps=result["throughput_rps"] / 2)
+    assert compare(slower, result, tolerance=0.1)
+    assert not compare(result, result, tolerance=0.1)
@@ -0,0 +1,117 @@
+"""
+Tests for replica sets: least-loaded choice and passive ejection.
+"""
+
+import asyncio
+import json
+import random
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex
+from replica_set import ReplicaSet
+from vertex_proxy import VertexProxy
+from .test_async_server import http_request, read_response
+from .test_dedup_cache import FakeClock
+
+
+class FakePool:
+    def __init__(self, name):
+        self.name = name
+        self.in_flight = 0
+
+    def stats(self):
+        return {"backend": self.name, "in_flight": self.in_flight, "requests": 0}
+
+
+def test_choice_prefers_fast_idle_replicas_and_ejects_failing_ones():
+    """Test P2C on load and latency, ejection back-off, probation and panic."""
+    clock = FakeClock()
+    replicas = ReplicaSet([FakePool("a"), FakePool("b"), FakePool("c")],
+                          max_failures=3, ejection_time=5.0, clock=clock,
+                          rng=random.Random(7))
+    a, b, c = replicas.replicas
+    replicas.observe(a, 0.002, ok=True)
+    replicas.observe(b, 0.002, ok=True)
+    replicas.observe(c, 0.050, ok=True)
+    picks = [replicas.choose().pool.name for _ in range(300)]
+    # c only wins when both random picks are c, which P2C never does
+    assert picks.count("c") == 0 and picks.count("a") > 50 and picks.count("b") > 50
+
+    b.pool.in_flight = 30                      # busy: cost 31 x 2ms > 1 x 50ms
+    picks = [replicas.choose().pool.name for _ in range(300)]
+    assert picks.count("b") == 0
+
+    # A slow response raises the EWMA at once; fast ones decay it over time
+    replicas.observe(a, 0.100, ok=True)
+    assert a.ewma == 0.100
+    clock.now += 10
+    replicas.observe(a, 0.002, ok=True)
+    assert 0.002 < a.ewma < 0.05
+
+    for _ in range(3):
+        replicas.observe(c, 0.001, ok=False)
+    assert c.ejected_until == clock.now + 5 and c.ewma is None
+    assert all(replicas.choose() is not c for _ in range(100))
+
+    # Re-admitted on probation: one more failure ejects it for twice as long
+    clock.now += 5
+    replicas.observe(c, 0.001, ok=False)
+    assert c.ejected_until == clock.now + 10
+    clock.now += 10
+    replicas.observe(c, 0.003, ok=True)
+    assert not c.probation and c.ejections == 0 and c.failures == 0
+
+    # Everything ejected: use them all rather than fail
+    for replica in (a, b, c):
+        for _ in range(3):
+            replicas.observe(replica, 0.001, ok=False)
+    assert replicas.choose() in (a, b, c)
+    stats = replicas.stats()
+    assert stats["ejected"] == 3 and stats["in_flight"] == 30
+    assert [r["backend"] for r in stats["replicas"]] == ["a", "b", "c"]
+    assert stats["replicas"][2]["ejections"] == 3
+
+
+def test_failing_replica_is_ejected_from_forwarding(tmp_path):
+    """Test a replica answering 500 stops getting traffic and shows in /status."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    hits = {"good": 0, "bad": 0}
+
+    def backend(name, status):
+        def app(method, path, body):
+            hits[name] += 1
+            return status, {"backend": name}
+        return app
+
+    async def _main():
+        servers = [await async_server.serve(backend(name, status), host="127.0.0.1", port=0)
+                   for name, status in (("good", 200), ("bad", 500))]
+        urls = [f"http://127.0.0.1:{s.sockets[0].getsockname()[1]}/" for s in servers]
+        proxy = VertexProxy({Vertex.SOUTH_741: urls}, max_failures=2, ejection_time=60)
+        api = TrainStationAPI(orchestrator, proxy)
+        server = await async_server.serve(api, host="127.0.0.1", port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            statuses = []
+            for i in range(40):
+                body = json.dumps({"id": f"r{i}", "type": "compute"}).encode()
+                writer.write(http_request("POST", "/route", body))
+                statuses.append((await read_response(reader))[0])
+            writer.close()
+        for s in servers:
+            s.close()
+        proxy.close()
+        return statuses, api.status()[1]["forwarding"]["compute"], proxy.prometheus()
+
+    statuses, stats, metrics = asyncio.run(_main())
+    orchestrator.close()
+    assert hits["bad"] == 2 and statuses.count(500) == 2
+    assert hits["good"] == 38
+    assert stats["ejected"] == 1 and stats["requests"] == 40
+    bad = [r for r in stats["replicas"] if r["ejected"]][0]
+    assert bad["ejections"] == 1 and bad["errors"] == 0
+    assert 'train_station_forward_ejections_total{vertex="compute",backend="' in metrics
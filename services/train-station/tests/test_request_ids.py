@@ -0,0 +1,75 @@
+"""
+Tests for snowflake request ids.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import request_ids
+from log_segments import SegmentStore
+from log_writer import LogWriter, FsyncPolicy
+from orchestrator import parse_request
+from request_ids import EPOCH_MS, IdGenerator, logged_since, parse_id
+
+
+class FakeClock:
+    def __init__(self):
+        self.millis = EPOCH_MS + 86_400_000
+
+    def __call__(self):
+        return self.millis * 1_000_000
+
+
+def test_ids_are_unique_and_time_ordered():
+    """Test ids increase through bursts and clock steps, and sort across workers."""
+    clock = FakeClock()
+    first, second = IdGenerator(1, clock), IdGenerator(2, clock)
+
+    ids = [first() for _ in range(5000)]       # more than one millisecond holds
+    clock.millis -= 10                         # clock stepped back
+    ids += [first() for _ in range(10)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert all(len(i) == 20 and i.startswith("req-") for i in ids)
+    assert parse_id(ids[0]) == (clock.millis + 10, 1, 0)
+    assert parse_id(ids[4096]) == (clock.millis + 11, 1, 0)
+
+    # Later ids from any worker sort after earlier ones
+    clock.millis += 1000
+    later = second()
+    assert later > ids[-1] and parse_id(later)[1:] == (2, 0)
+
+    generated = {parse_request({"type": "compute"}).id for _ in range(10000)}
+    assert len(generated) == 10000
+    request = parse_request({"type": "compute"})
+    assert request.generated_id and parse_id(request.id)[1] == request_ids.new_request_id.worker
+    assert not parse_request({"id": "job-1", "type": "compute"}).generated_id
+
+
+def test_generated_ids_narrow_log_lookups(tmp_path):
+    """Test a lookup by generated id skips sealed segments older than the id."""
+    path = tmp_path / "ts.log"
+    store = SegmentStore(path, max_bytes=512)
+    # Rotation waits for the index to load; each day must get its own segment
+    store.lookup("warm-up")
+    writer = LogWriter(path, fsync=FsyncPolicy.NONE, segments=store)
+    old = "req-0000000000000001"
+    for day in (1, 2):
+        writer.write_many([
+            {"timestamp": f"2025-01-0{day}T00:00:{i:02d}",
+             "data": {"phase": "capture", "request_id": old if i == 0 else f"x-{day}-{i}"}}
+            for i in range(20)
+        ])
+        assert writer.flush(timeout=5)
+    writer.close()
+
+    store = SegmentStore(path, max_bytes=512)
+    assert len(store.lookup(old)) == 2
+    assert len(store.lookup(old, since="2025-01-02")) == 1
+    assert logged_since("job-1") is None
+    assert logged_since(old) < "2024-01-01T01"
+    # Ids only shaped like ours (from the future, or another worker) don't narrow
+    assert logged_since("req-ffffffffffffffff") is None
+    assert logged_since(IdGenerator(worker=5)()) is None
+    assert logged_since(IdGenerator(worker=0)()) is not None
+    store.close()
@@ -0,0 +1,134 @@
+"""
+Tests for the binary route protocol and its client.
+"""
+
+import asyncio
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import route_protocol
+from fair_scheduler import FairScheduler
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex
+from route_client import BlockingRouteClient, RouteClient
+from route_protocol import RouteRejected
+
+
+def test_codec_round_trip():
+    """Test requests and results survive encoding, including None fields."""
+    request = {"id": "r1", "type": "build", "source": "dojo",
+               "priority": -3, "payload": {"code": "λ", "n": [1, 2]}}
+    assert route_protocol.decode_request(route_protocol.encode_request(request)) == request
+    assert "id" not in route_protocol.decode_request(
+        route_protocol.encode_request({"type": "store"}))
+    # A deadline goes out as the time left to it, in a ROUTE_TIMED frame
+    (kind, _, payload), = route_protocol.split_frames(bytearray(route_protocol.request_frame(
+        3, dict(request, timeout_ms=250, deadline=time.time() + 60))))
+    assert kind == route_protocol.ROUTE_TIMED
+    assert route_protocol.decode_request(payload, timed=True) == dict(request, timeout_ms=250)
+
+    result = {"success": False, "vertex": None, "frequency": None, "chakra": None,
+              "message": "No vertex", "request_id": "r1", "rule": None,
+              "duplicate": False, "config_version": None}
+    assert route_protocol.decode_result(route_protocol.encode_result(result)) == result
+
+    buffer = bytearray(route_protocol.frame(route_protocol.ROUTE, 7, b"abc")
+                       + route_protocol.frame(route_protocol.ROUTE, 8, b"de")[:5])
+    assert route_protocol.split_frames(buffer) == [(route_protocol.ROUTE, 7, b"abc")]
+    assert len(buffer) == 5
+
+
+def test_multiplexed_answers_arrive_out_of_order(tmp_path):
+    """Test queued calls answer after later ones on the same connection."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    api = TrainStationAPI(orchestrator)
+    release = None
+
+    def route_message(data):
+        # Hold storage requests until the compute one has been answered
+        if data["type"] == "store":
+            return asyncio.ensure_future(held(data))
+        return api.route_message(data)
+
+    async def held(data):
+        await release.wait()
+        return api.route_message(data)
+
+    async def _main():
+        nonlocal release
+        release = asyncio.Event()
+        server = await route_protocol.serve(route_message, host="127.0.0.1", port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            client = await RouteClient.connect("127.0.0.1", port)
+            order = []
+
+            async def call(**request):
+                result = await client.route(**request)
+                order.append(result["request_id"])
+                if result["request_id"] == "c1":
+                    release.set()
+                return result
+
+            results = await asyncio.gather(
+                call(id="s1", type="store"), call(id="c1", type="compute")
+            )
+            await client.close()
+            return order, results
+
+    order, results = asyncio.run(_main())
+    assert order == ["c1", "s1"]
+    assert [r["vertex"] for r in results] == ["storage", "compute"]
+    assert results[1]["frequency"] == Vertex.SOUTH_741.frequency
+    assert orchestrator.request_count == 2
+
+
+def test_blocking_client_over_unix_socket(tmp_path):
+    """Test pipelined calls and queue-full errors over a Unix socket."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    path = str(tmp_path / "route.sock")
+    started = threading.Event()
+    loop = stop = None
+
+    def run_server():
+        async def _main():
+            nonlocal loop, stop
+            loop = asyncio.get_running_loop()
+            stop = asyncio.Event()
+            # Depth 1 and nothing dispatched before the batch is read in full
+            scheduler = FairScheduler({}, capacity=1, max_concurrent=1)
+            api = TrainStationAPI(orchestrator, scheduler=scheduler)
+            server = await route_protocol.serve(
+                api.route_message, sock=route_protocol.bind_unix_socket(path))
+            started.set()
+            async with server:
+                await stop.wait()
+
+        asyncio.run(_main())
+
+    thread = threading.Thread(target=run_server)
+    thread.start()
+    started.wait(5)
+    try:
+        with BlockingRouteClient.connect_unix(path) as client:
+            answers = client.route_many([
+                {"id": "a", "type": "build"},
+                {"id": "b", "type": "build"},
+                {"id": "c", "type": "monitor"},
+            ])
+            assert answers[0]["vertex"] == "transformation"
+            assert isinstance(answers[1], RouteRejected) and answers[1].status == 503
+            assert answers[1].retry_after >= 1
+            assert answers[2]["vertex"] == "monitoring"
+            assert client.route(id="d", type="store")["vertex"] == "storage"
+            # Past its deadline: dropped, like POST /route with a 504
+            with pytest.raises(RouteRejected) as expired:
+                client.route(id="e", type="store", timeout_ms=0)
+            assert expired.value.status == 504
+    finally:
+        loop.call_soon_threadsafe(stop.set)
+        thread.join(5)
@@ -0,0 +1,92 @@
+"""
+Tests for payload-aware routing rules.
+"""
+
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex, parse_request, resolve_vertex
+from routing_rules import compile_rules, RuleError
+
+
+RULES = {
+    "rules": [
+        {"name": "gpu", "match": {"type": "compute", "payload.hw.accelerator": "gpu"},
+         "vertex": "transformation"},
+        {"name": "urgent-dojo", "match": {"source": "dojo", "priority": {"gte": 8}},
+         "vertex": "TOP_963"},
+        {"name": "bulk", "match": {"type": {"in": ["store", "archive"]},
+                                   "size": {"gt": 100}},
+         "vertex": "transmutation"},
+    ]
+}
+
+
+def request(**fields):
+    return parse_request(fields)
+
+
+def test_first_matching_rule_wins():
+    """Test rules apply in file order across indexed and wildcard slots."""
+    ruleset = compile_rules(RULES, resolve_vertex)
+
+    gpu = request(type="compute", source="dojo", priority=9,
+                  payload={"hw": {"accelerator": "gpu"}})
+    assert ruleset.match(gpu).name == "gpu"
+
+    urgent = request(type="compute", source="dojo", priority=9)
+    assert ruleset.match(urgent).target == Vertex.TOP_963
+
+    assert ruleset.match(request(type="compute", source="dojo", priority=1)) is None
+    assert ruleset.match(request(type="archive", payload={"blob": "x" * 200})).name == "bulk"
+    assert ruleset.match(request(type="archive", payload={"blob": "x"})) is None
+
+
+def test_orchestrator_falls_back_to_routing_map(tmp_path):
+    """Test unmatched requests still route by type and results name the rule."""
+    orchestrator = TrainStationOrchestrator(
+        log_path=tmp_path / "ts.log",
+        routing_rules=compile_rules(RULES, resolve_vertex),
+    )
+    result = orchestrator.route_request(
+        request(type="compute", payload={"hw": {"accelerator": "gpu"}}))
+    assert result.vertex == Vertex.EAST_528 and result.rule == "gpu"
+
+    result = orchestrator.route_request(request(type="compute"))
+    assert result.vertex == Vertex.SOUTH_741 and result.rule is None
+    orchestrator.close()
+
+
+@pytest.mark.parametrize("spec", [
+    {"rules": [{"match": {"type": "build"}}]},
+    {"rules": [{"match": {"type": "build"}, "vertex": "nowhere"}]},
+    {"rules": [{"match": {"colour": "red"}, "vertex": "compute"}]},
+    {"rules": [{"match": {"priority": {"between": 3}}, "vertex": "compute"}]},
+    {"routes": []},
+])
+def test_invalid_rules_rejected(spec):
+    """Test malformed rule documents fail at load time."""
+    with pytest.raises(RuleError):
+        compile_rules(spec, resolve_vertex)
+
+
+@pytest.mark.parametrize("match", [
+    {"type": ["compute", "build"]},
+    {"source": {"eq": {"team": "dojo"}}},
+    {"source": {"in": ["dojo", ["ci"]]}},
+])
+def test_unhashable_index_values_rejected(tmp_path, match):
+    """Test list or object values for type/source are a 400, not a crash."""
+    spec = {"rules": [{"match": {"type": "build"}, "vertex": "compute"},
+                      {"match": match, "vertex": "compute"}]}
+    with pytest.raises(RuleError, match="Rule #1"):
+        compile_rules(spec, resolve_vertex)
+
+    api = TrainStationAPI(TrainStationOrchestrator(log_path=tmp_path / "ts.log"))
+    status, data = api.handle("POST", "/admin/routing", json.dumps(spec).encode())
+    assert status == 400 and "Rule #1" in data["error"]
+    api.orchestrator.close()
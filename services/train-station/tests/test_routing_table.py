@@ -0,0 +1,93 @@
+"""
+Tests for the hot-reloadable routing config.
+"""
+
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from orchestrator import (
+    RequestType, TrainStationOrchestrator, TrainStationAPI, Vertex,
+    parse_request, resolve_vertex,
+)
+from routing_table import RoutingConfig
+
+
+def make_config(path=None):
+    return RoutingConfig(TrainStationOrchestrator.ROUTING_MAP, RequestType,
+                         resolve_vertex, path=path)
+
+
+def test_admin_update_swaps_routes_and_versions_results(tmp_path):
+    """Test POST /admin/routing reroutes a type and stamps the new version."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    api = TrainStationAPI(orchestrator)
+    compute = parse_request({"type": "compute"})
+
+    before = orchestrator.route_request(compute)
+    assert (before.vertex, before.config_version) == (Vertex.SOUTH_741, 0)
+
+    status, data = api.handle('POST', '/admin/routing',
+                              b'{"routes": {"compute": "storage"}}')
+    assert status == 200 and data["version"] == 1 and data["persisted"] is False
+    after = orchestrator.route_request(compute)
+    assert (after.vertex, after.config_version) == (Vertex.BOTTOM_174, 1)
+    assert orchestrator.route_request(parse_request({"type": "build"})).vertex == Vertex.EAST_528
+
+    # Invalid documents and stale versions leave the live table alone
+    status, data = api.handle('POST', '/admin/routing', b'{"routes": {"compute": "nowhere"}}')
+    assert status == 400 and "nowhere" in data["error"]
+    status, data = api.handle('POST', '/admin/routing', b'{"version": 1, "routes": {}}')
+    assert status == 409 and data["version"] == 1
+
+    status, data = api.handle('GET', '/admin/routing', b'')
+    assert data["version"] == 1 and data["config"] == {"routes": {"compute": "storage"}}
+    assert api.handle('GET', '/status', b'')[1]["routing"]["version"] == 1
+    orchestrator.close()
+
+
+def test_saved_config_reaches_other_workers(tmp_path):
+    """Test an update saved by one worker is loaded by another's file check."""
+    path = tmp_path / "routing.json"
+    first, second = make_config(path), make_config(path)
+    assert first.current.version == second.current.version == 0
+
+    table, persisted = first.update({
+        "routes": {"monitor": "compute"},
+        "rules": [{"name": "gpu", "match": {"payload.gpu": True}, "vertex": "transformation"}],
+    })
+    assert persisted and json.loads(path.read_text())["version"] == table.version == 1
+
+    assert second.reload(force=False)
+    assert second.current.version == 1
+    assert second.current.select(parse_request({"type": "monitor"}))[0] == Vertex.SOUTH_741
+    vertex, rule = second.current.select(parse_request({"type": "store", "payload": {"gpu": True}}))
+    assert (vertex, rule.name) == (Vertex.EAST_528, "gpu")
+    assert not first.reload(force=False)
+
+    # A broken edit is rejected and the last good table stays live
+    path.write_text('{"routes": {"monitor": ')
+    os.utime(path, (0, 0))
+    assert not second.reload(force=False)
+    assert second.current.version == 1 and second.failures == 1
+
+
+def test_hand_edits_and_concurrent_updates_get_their_own_versions(tmp_path):
+    """Test an edit keeping the saved version still loads, and workers never reuse one."""
+    path = tmp_path / "routing.json"
+    first, second = make_config(path), make_config(path)
+    assert first.update({"routes": {"compute": "storage"}})[0].version == 1
+    # second has not reloaded yet, but takes the next version from the file
+    table, _ = second.update({"routes": {"compute": "monitoring"}})
+    assert table.version == 2 and json.loads(path.read_text())["version"] == 2
+
+    # Edited by hand, version left as the server wrote it
+    path.write_text(json.dumps({"version": 2, "routes": {"compute": "communication"}}))
+    assert second.reload(force=True)
+    assert second.current.version == 3
+    assert second.current.select(parse_request({"type": "compute"}))[0] == Vertex.NORTH_639
+    assert json.loads(path.read_text()) == {"version": 3, "routes": {"compute": "communication"}}
+    # The other worker loads the same document under the same version
+    assert first.reload(force=False) and first.current.version == 3
+    assert not first.reload(force=True) and not second.reload(force=True)
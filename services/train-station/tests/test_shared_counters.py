@@ -0,0 +1,48 @@
+"""
+Tests for the shared counter block used by prefork workers.
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from orchestrator import TrainStationOrchestrator, Vertex, parse_request
+from shared_counters import CounterBlock
+
+
+def test_counts_from_forked_workers_are_summed():
+    """Test rows written by forked children are visible to the parent."""
+    counters = CounterBlock(["requests", "errors"], slots=3, shared=True)
+    children = []
+    for slot in (1, 2):
+        pid = os.fork()
+        if pid == 0:
+            counters.bind(slot)
+            for _ in range(100 * slot):
+                counters.add(0)
+            counters.add(1, slot)
+            os._exit(0)
+        children.append(pid)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+    counters.add(0)
+    assert counters.totals() == [301, 3]
+    assert counters.row(2) == {"requests": 200, "errors": 2}
+
+
+def test_orchestrator_counts_survive_a_new_worker(tmp_path):
+    """Test a replacement orchestrator keeps adding to the shared totals."""
+    counters = CounterBlock(TrainStationOrchestrator.COUNTERS, slots=2, shared=True)
+    for slot in (0, 1):
+        counters.bind(slot)
+        orchestrator = TrainStationOrchestrator(
+            log_path=tmp_path / f"ts-{slot}.log", counters=counters
+        )
+        orchestrator.route_request(parse_request({"type": "build"}))
+        orchestrator.route_request(parse_request({"type": "monitor"}))
+        orchestrator.close()
+
+    assert orchestrator.request_count == 4
+    counts = orchestrator.vertex_counts
+    assert counts[Vertex.EAST_528] == counts[Vertex.TOP_963] == 2
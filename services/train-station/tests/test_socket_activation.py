@@ -0,0 +1,119 @@
+"""
+Tests for inherited listening sockets and SIGHUP re-exec.
+"""
+
+import http.client
+import json
+import signal
+import socket
+import subprocess
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Runs argv[2:] with the socket at fd argv[1] passed the systemd way, as
+# fd 3; exec keeps the pid, which LISTEN_PID must name
+ACTIVATE = """
+import os, sys
+os.dup2(int(sys.argv[1]), 3)
+os.environ.update(LISTEN_PID=str(os.getpid()), LISTEN_FDS="1", LISTEN_FDNAMES="http")
+os.execv(sys.argv[2], sys.argv[2:])
+"""
+
+CHILD = """
+import json, os, socket, sys
+from socket_activation import Listeners
+listeners = Listeners()
+assert listeners.inherited("http") and "LISTEN_FDS" not in os.environ
+http = listeners.tcp("http", 1)
+unix = listeners.unix("binary-unix", sys.argv[1])
+listeners.close_unused()
+env = listeners.environment()
+moved = [socket.socket(fileno=os.dup(fd)).getsockname() for fd in (3, 4)]
+print(json.dumps({"port": http.getsockname()[1], "env": env, "moved": moved,
+                  "inheritable": [os.get_inheritable(fd) for fd in (3, 4)]}))
+"""
+
+
+def activated(command, sock, **kwargs) -> subprocess.Popen:
+    os.set_inheritable(sock.fileno(), True)
+    return subprocess.Popen([sys.executable, "-c", ACTIVATE, str(sock.fileno())] + command,
+                            pass_fds=[sock.fileno()], cwd=SOURCE, **kwargs)
+
+
+def get(port: int, path: str):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request("GET", path, headers={"Connection": "close"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_listeners_inherit_and_pass_on(tmp_path):
+    """Test an inherited socket is used as is and both move to fd 3.. for exec."""
+    with socket.create_server(("127.0.0.1", 0)) as sock:
+        port = sock.getsockname()[1]
+        child = activated([sys.executable, "-c", CHILD, str(tmp_path / "route.sock")],
+                          sock, stdout=subprocess.PIPE)
+        out, _ = child.communicate(timeout=30)
+    assert child.returncode == 0
+    result = json.loads(out)
+    # Not bound to the port asked for (1): the inherited socket was used
+    assert result["port"] == port
+    assert result["env"]["LISTEN_FDS"] == "2"
+    assert result["env"]["LISTEN_FDNAMES"] == "http:binary-unix"
+    assert result["env"]["LISTEN_PID"] == str(child.pid)
+    assert result["moved"] == [["127.0.0.1", port], str(tmp_path / "route.sock")]
+    assert result["inheritable"] == [True, True]
+
+
+def test_sighup_reexecs_without_refusing_connections(tmp_path):
+    """Test SIGHUP swaps in a new process on the same socket and pid."""
+    sock = socket.create_server(("127.0.0.1", 0), backlog=1024)
+    port = sock.getsockname()[1]
+    station = activated([sys.executable, "-m", "orchestrator", "--server", "asyncio",
+                         "--port", "1", "--log-path", str(tmp_path / "ts.log"),
+                         "--status-stream-interval", "0"],
+                        sock, stderr=subprocess.DEVNULL)
+    # The socket is the station's now; connections queue even before it accepts
+    sock.close()
+    try:
+        status, health = get(port, "/health")
+        assert status == 200
+
+        stop = threading.Event()
+        failures = []
+
+        def client():
+            while not stop.is_set():
+                try:
+                    get(port, "/health")
+                except OSError as e:
+                    failures.append(e)
+
+        clients = [threading.Thread(target=client) for _ in range(4)]
+        for thread in clients:
+            thread.start()
+        time.sleep(0.2)
+        station.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 30
+        while get(port, "/health")[1]["started"] == health["started"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        time.sleep(0.2)
+        stop.set()
+        for thread in clients:
+            thread.join()
+
+        assert failures == []
+        # Re-executed in place: the same process, still running
+        assert station.poll() is None
+    finally:
+        station.terminate()
+        station.wait(timeout=30)
@@ -0,0 +1,82 @@
+"""
+Tests for counters and latency histograms persisted across restarts.
+"""
+
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from latency_metrics import LatencyHistograms
+from shared_counters import CounterBlock
+from stats_store import StatsStore
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+
+NAMES = ["requests", "compute", "storage"]
+
+
+def test_snapshot_journal_and_crash_recovery(tmp_path):
+    """Test a crashed process's journal is replayed once, torn tail cut off."""
+    path = tmp_path / "ts.stats"
+    counters, latency = CounterBlock(NAMES), LatencyHistograms()
+    store = StatsStore(path, counters, latency)
+    counters.add(0, 5)
+    counters.add(1, 3)
+    latency.observe(("handshake", "compute", "compute"), 2_000_000)
+    store.journal()
+    store.snapshot()
+    assert path.exists() and store.journal_path.stat().st_size == 0
+
+    counters.add(0, 2)
+    counters.add(2, 2)
+    store.journal()
+    # Crash between the next snapshot and emptying the journal: the
+    # journal's records are in the snapshot already
+    left_behind = store.journal_path.read_bytes()
+    counters.add(0, 1)
+    store.snapshot()
+    store.journal_path.write_bytes(left_behind)
+    counters.add(2, 10)
+    store.journal()
+    with open(store.journal_path, "ab") as f:
+        f.write(b"\x20\x00\x00\x00torn")
+    # No close(): the process died
+
+    restored, restored_latency = CounterBlock(NAMES), LatencyHistograms()
+    store = StatsStore(path, restored, restored_latency)
+    assert dict(zip(NAMES, restored.totals())) == {"requests": 8, "compute": 3, "storage": 12}
+    assert restored_latency.snapshot() == latency.snapshot()
+    assert not store.journal_path.read_bytes().endswith(b"torn")
+
+    # Counting goes on from there, and close() leaves only a snapshot
+    restored.add(0, 1)
+    store.close()
+    again = CounterBlock(NAMES)
+    StatsStore(path, again).close()
+    assert again.total(0) == 9
+
+
+def test_orchestrator_counts_survive_restart(tmp_path):
+    """Test /status totals and latency carry over to the next process."""
+    def start():
+        orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+        orchestrator.stats_store = StatsStore(
+            tmp_path / "ts.stats", orchestrator.counters, orchestrator.latency
+        )
+        return orchestrator, TrainStationAPI(orchestrator)
+
+    orchestrator, api = start()
+    for i in range(6):
+        body = {"id": f"s{i}", "type": "compute" if i % 2 else "store"}
+        assert api.handle("POST", "/route", json.dumps(body).encode())[0] == 200
+    orchestrator.close()
+
+    orchestrator, api = start()
+    assert api.handle("POST", "/route", b'{"id": "s6", "type": "store"}')[0] == 200
+    status = orchestrator.get_status()
+    assert status["statistics"]["total_requests"] == 7
+    assert status["statistics"]["vertex_routing"]["compute"] == 3
+    assert status["statistics"]["vertex_routing"]["storage"] == 4
+    assert status["latency"]["phases"]["handshake"]["count"] == 7
+    assert status["statistics"]["persisted"]["snapshots"] == 0
+    orchestrator.close()
@@ -0,0 +1,115 @@
+"""
+Tests for the GET /status/stream server-sent event feed.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from orchestrator import TrainStationOrchestrator, TrainStationAPI
+from status_stream import StatusStream, diff
+from .test_async_server import http_request
+
+
+async def read_event(reader):
+    """Next SSE event as (name, data), skipping chunk framing and comments."""
+    event = None
+    while True:
+        line = (await reader.readline()).decode().rstrip("\r\n")
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            return event, json.loads(line[len("data: "):])
+
+
+def test_deltas_and_lagging_subscribers():
+    """Test deltas carry only changes and a stalled subscriber is resynced."""
+    assert diff({"a": 1, "v": {"x": 1, "y": 2}}, {"a": 1, "v": {"x": 1, "y": 3}}) == {"v": {"y": 3}}
+    assert diff({"a": 1}, {"a": 1}) == {}
+
+    state = {"count": 0, "vertex": {"compute": 0, "storage": 0}}
+    calls = []
+
+    def snapshot():
+        calls.append(1)
+        return json.loads(json.dumps(state))
+
+    async def _main():
+        stream = StatusStream(snapshot, interval=3600, backlog=2)
+        fast, slow = stream.subscribe(), stream.subscribe()
+        assert await fast.__anext__() == await slow.__anext__()
+
+        for i in range(1, 5):
+            state["count"] = i
+            state["vertex"]["compute"] = i
+            stream._tick()
+            event = (await fast.__anext__()).decode()
+            assert event.startswith(f"event: delta\nid: {i}\n")
+            assert json.loads(event.split("data: ")[1]) == {"count": i, "vertex": {"compute": i}}
+
+        # The third tick overflowed a backlog of two: a full snapshot
+        # replaced the backlog, and deltas continue after it
+        event = (await slow.__anext__()).decode()
+        assert event.startswith("event: snapshot\nid: 3\n")
+        assert json.loads(event.split("data: ")[1])["count"] == 3
+        assert (await slow.__anext__()).startswith(b"event: delta\nid: 4\n")
+
+        stream._tick()
+        assert await fast.__anext__() == await slow.__anext__() == b""
+        stream.close()
+        for subscriber in (fast, slow):
+            assert [chunk async for chunk in subscriber] == []
+        assert stream.stats()["resyncs"] == 1
+        assert stream.stats()["subscribers"] == 0
+
+    asyncio.run(_main())
+    # One computation per tick, shared by both subscribers (plus the first)
+    assert len(calls) == 6
+
+
+def test_subscribers_share_ticks_and_end_on_drain(tmp_path):
+    """Test several clients receive the same deltas and a drain ends them."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    stream = StatusStream(orchestrator.live_statistics, interval=0.05)
+    ticks = []
+    snapshot = stream.snapshot
+    stream.snapshot = lambda: ticks.append(1) or snapshot()
+
+    async def _main():
+        connections = set()
+        api = TrainStationAPI(orchestrator, status_stream=stream)
+        server = await async_server.serve(api, host="127.0.0.1", port=0,
+                                          connections=connections)
+        port = server.sockets[0].getsockname()[1]
+        clients = [await asyncio.open_connection("127.0.0.1", port) for _ in range(3)]
+        for reader, writer in clients:
+            writer.write(http_request("GET", "/status/stream"))
+            head = (await reader.readuntil(b"\r\n\r\n")).decode().lower()
+            assert "content-type: text/event-stream" in head
+            event, data = await read_event(reader)
+            assert event == "snapshot" and data["request_count"] == 0
+            assert data["vertex_routing"]["compute"] == 0
+
+        api.handle('POST', '/route', b'{"id": "s1", "type": "compute"}')
+        for reader, _ in clients:
+            event, data = await read_event(reader)
+            assert event == "delta"
+            assert data["request_count"] == 1
+            assert data["vertex_routing"] == {"compute": 1}
+            assert data["latency"]["phases"]["handshake"]["count"] == 1
+        assert stream.stats()["subscribers"] == 3
+
+        await asyncio.wait_for(async_server.drain(server, connections, timeout=5), 2)
+        for reader, writer in clients:
+            assert (await reader.read()).endswith(b"0\r\n\r\n")
+            writer.close()
+        return len(ticks)
+
+    tick_count = asyncio.run(_main())
+    orchestrator.close()
+    # Three subscribers, one snapshot per tick (plus the first subscriber's)
+    assert tick_count == stream.ticks + 1
+    assert stream.stats()["subscribers"] == 0
@@ -0,0 +1,99 @@
+"""
+Tests for sampled handshake tracing and traceparent propagation.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from log_writer import FsyncPolicy, LogWriter
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex, parse_request
+from tracing import TraceFormat, Tracer
+from vertex_proxy import VertexProxy
+from .test_async_server import read_response
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+def make_tracer(path, rate, format=TraceFormat.JSONL):
+    return Tracer(LogWriter(path, fsync=FsyncPolicy.NONE), sample_rate=rate, format=format)
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_head_sampling_and_otlp_export(tmp_path):
+    """Test the sampling decision and the OTLP/JSON export layout."""
+    off = make_tracer(tmp_path / "off.jsonl", 0.0)
+    assert off.start() is None
+    assert off.start(f"00-{TRACE_ID}-00f067aa0ba902b7-00") is None
+    assert off.start(PARENT).trace_id == TRACE_ID
+    assert off.start("garbage") is None
+    off.close()
+
+    path = tmp_path / "otlp.jsonl"
+    tracer = make_tracer(path, 1.0, TraceFormat.OTLP)
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log", tracer=tracer)
+    orchestrator.route_batch([parse_request({"id": "b1", "type": "store"})])
+    orchestrator.close()
+
+    (document,) = read_lines(path)
+    spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["capture", "validate", "route", "route_batch_item"]
+    root = spans[-1]
+    assert all(span["parentSpanId"] == root["spanId"] for span in spans[:-1])
+    assert all(int(s["startTimeUnixNano"]) <= int(s["endTimeUnixNano"]) for s in spans)
+    assert {"key": "vertex", "value": {"stringValue": "storage"}} in spans[2]["attributes"]
+
+
+def test_forwarded_call_carries_traceparent(tmp_path):
+    """Test a traced /route continues the caller's trace to the backend."""
+    path = tmp_path / "traces.jsonl"
+    orchestrator = TrainStationOrchestrator(
+        log_path=tmp_path / "ts.log", tracer=make_tracer(path, 0.0)
+    )
+    received = []
+
+    def backend(method, path, body, headers):
+        received.append(headers.get("traceparent"))
+        return 200, {"backend": True}
+    backend.accepts_headers = True
+
+    async def _main():
+        backend_server = await async_server.serve(backend, host="127.0.0.1", port=0)
+        backend_port = backend_server.sockets[0].getsockname()[1]
+        proxy = VertexProxy({Vertex.SOUTH_741: f"http://127.0.0.1:{backend_port}/jobs"})
+        server = await async_server.serve(
+            TrainStationAPI(orchestrator, proxy), host="127.0.0.1", port=0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for traceparent in (PARENT, None):
+                body = b'{"id": "t1", "type": "compute"}'
+                head = f"POST /route HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+                if traceparent:
+                    head += f"traceparent: {traceparent}\r\n"
+                writer.write(head.encode() + b"\r\n" + body)
+                status, _, _ = await read_response(reader)
+                assert status == 200
+            writer.close()
+        proxy.close()
+        backend_server.close()
+
+    asyncio.run(_main())
+    orchestrator.close()
+
+    # Only the request that arrived with a sampled traceparent was traced
+    assert received[1] is None
+    spans = {span["name"]: span for span in read_lines(path)}
+    assert set(spans) == {"capture", "validate", "route", "forward", "POST /route"}
+    assert {span["trace_id"] for span in spans.values()} == {TRACE_ID}
+    assert spans["POST /route"]["parent_span_id"] == "00f067aa0ba902b7"
+    assert received[0] == f"00-{TRACE_ID}-{spans['forward']['span_id']}-01"
+    assert spans["forward"]["attributes"]["http.status_code"] == 200
@@ -0,0 +1,221 @@
+"""
+Tests for forwarding mode and the per-vertex connection pools.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from dedup_cache import DedupCache
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, Vertex
+from vertex_proxy import PoolSaturated, VertexConnectionPool, VertexProxy
+from .test_async_server import http_request, read_response
+
+
+def backend_app(method, path, body):
+    request = json.loads(body)
+    return 200, {"backend": True, "id": request["id"], "type": request["type"]}, {
+        "Cache-Control": "no-store", "Keep-Alive": "timeout=5"}
+
+
+def run_forwarding(tmp_path, client, backend=True, **pool_options):
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+
+    async def _main():
+        backend_server = await async_server.serve(backend_app, host="127.0.0.1", port=0)
+        backend_port = backend_server.sockets[0].getsockname()[1]
+        if not backend:
+            backend_server.close()
+            await backend_server.wait_closed()
+
+        proxy = VertexProxy(
+            {Vertex.SOUTH_741: f"http://127.0.0.1:{backend_port}/jobs"}, **pool_options
+        )
+        server = await async_server.serve(
+            TrainStationAPI(orchestrator, proxy), host="127.0.0.1", port=0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            result = await client(port)
+        proxy.close()
+        backend_server.close()
+        return proxy, result
+
+    return asyncio.run(_main())
+
+
+def test_forwarded_requests_reuse_pooled_connection(tmp_path):
+    """Test routed requests reach the backend over one kept-alive connection."""
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        for i in range(5):
+            body = json.dumps({"id": f"f{i}", "type": "compute"}).encode()
+            writer.write(http_request("POST", "/route", body))
+            responses.append(await read_response(reader))
+        # Vertices without a backend still get the RoutingResult
+        writer.write(http_request("POST", "/route", b'{"id": "s1", "type": "store"}'))
+        responses.append(await read_response(reader))
+        writer.close()
+        return responses
+
+    proxy, responses = run_forwarding(tmp_path, client)
+    forwarded = responses[:5]
+    assert [r[2]["id"] for r in forwarded] == [f"f{i}" for i in range(5)]
+    assert all(r[2]["backend"] for r in forwarded)
+    # The backend's own headers come back, not the ones sent to it
+    headers = forwarded[0][1]
+    assert headers["cache-control"] == "no-store" and headers["x-request-id"] == "f0"
+    assert "keep-alive" not in headers and "x-train-station-vertex" not in headers
+    assert responses[5][2]["vertex"] == "storage"
+
+    stats = proxy.stats()["compute"]
+    assert stats["connects"] == 1 and stats["requests"] == 5
+    assert stats["in_flight"] == 0
+
+
+def test_unreachable_backend_returns_502(tmp_path):
+    """Test a backend that refuses connections yields 502 with routing info."""
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(http_request("POST", "/route", b'{"id": "x", "type": "compute"}'))
+        response = await read_response(reader)
+        writer.close()
+        return response
+
+    proxy, (status, _, data) = run_forwarding(tmp_path, client, backend=False)
+    assert status == 502
+    assert data["routing"]["vertex"] == "compute"
+    assert proxy.stats()["compute"]["open"] == 0
+
+
+def test_retry_after_failed_forward_is_forwarded(tmp_path):
+    """Test a retry of a request the backend never got is forwarded, not replayed."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log",
+                                            dedup=DedupCache(ttl=60))
+
+    async def post(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(http_request("POST", "/route", b'{"id": "r", "type": "compute"}'))
+        response = await read_response(reader)
+        writer.close()
+        return response
+
+    async def _main():
+        backend = await async_server.serve(backend_app, host="127.0.0.1", port=0)
+        backend_port = backend.sockets[0].getsockname()[1]
+        backend.close()
+        await backend.wait_closed()
+        proxy = VertexProxy({Vertex.SOUTH_741: f"http://127.0.0.1:{backend_port}/jobs"})
+        server = await async_server.serve(
+            TrainStationAPI(orchestrator, proxy), host="127.0.0.1", port=0
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            failed = await post(port)
+            backend = await async_server.serve(backend_app, host="127.0.0.1",
+                                               port=backend_port)
+            retried = await post(port)
+            replayed = await post(port)
+        proxy.close()
+        backend.close()
+        return failed, retried, replayed
+
+    failed, retried, replayed = asyncio.run(_main())
+    assert failed[0] == 502
+    assert retried[0] == 200 and retried[2] == {"backend": True, "id": "r", "type": "compute"}
+    # Once delivered, the id is a duplicate
+    assert replayed[0] == 200 and replayed[2]["duplicate"]
+
+
+def test_max_in_flight_rejects_with_retry_after(tmp_path):
+    """Test requests beyond max_in_flight fail fast with 503."""
+
+    async def client(port):
+        conns = [await asyncio.open_connection("127.0.0.1", port) for _ in range(3)]
+        for i, (_, writer) in enumerate(conns):
+            body = json.dumps({"id": f"c{i}", "type": "compute"}).encode()
+            writer.write(http_request("POST", "/route", body))
+        responses = [await read_response(reader) for reader, _ in conns]
+        for _, writer in conns:
+            writer.close()
+        return responses
+
+    _, responses = run_forwarding(tmp_path, client, size=1, max_in_flight=1)
+    statuses = sorted(r[0] for r in responses)
+    assert statuses[0] == 200
+    assert 503 in statuses
+    rejected = next(r for r in responses if r[0] == 503)
+    assert rejected[1]["retry-after"] == "1"
+
+
+def test_bodyless_and_stalled_responses_release_the_connection():
+    """Test a 204 without a length ends at its head, and a stalled body times out."""
+    answers = [b"HTTP/1.1 204 No Content\r\n\r\n",
+               b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nsho"]
+
+    async def backend(reader, writer):
+        # Keep-alive: both answers on one connection, the second never finished
+        for answer in answers:
+            await reader.readuntil(b"\r\n\r\n")
+            await reader.readexactly(2)
+            writer.write(answer)
+        await reader.read()
+
+    async def _main():
+        server = await asyncio.start_server(backend, "127.0.0.1", 0)
+        pool = VertexConnectionPool(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/",
+                                    response_timeout=0.2)
+        status, _, body = await pool.request("POST", b"{}")
+        assert status == 204 and [chunk async for chunk in body] == []
+        status, _, body = await pool.request("POST", b"{}")
+        chunks = [chunk async for chunk in body]
+        stats = pool.stats()
+        pool.close()
+        server.close()
+        return status, chunks, stats
+
+    status, chunks, stats = asyncio.run(asyncio.wait_for(_main(), 5))
+    assert status == 200 and chunks == [b"sho"]
+    # One connection served both; the stalled one is dropped, not reused
+    assert stats["connects"] == 1 and stats["errors"] == 1
+    assert stats["in_flight"] == 0 and stats["open"] == 0
+
+
+def test_saturated_choice_falls_back_to_the_other_replica():
+    """Test a full pool sends the request to the second of the two choices."""
+
+    async def _main():
+        backends = [await async_server.serve(backend_app, host="127.0.0.1", port=0)
+                    for _ in range(2)]
+        proxy = VertexProxy({Vertex.SOUTH_741: [
+            f"http://127.0.0.1:{b.sockets[0].getsockname()[1]}/" for b in backends
+        ]}, max_in_flight=1)
+        first, second = (r.pool for r in proxy.replicas[Vertex.SOUTH_741].replicas)
+        first.in_flight = 1
+        answered = []
+        for i in range(8):
+            response = await proxy.forward(
+                Vertex.SOUTH_741, json.dumps({"id": f"p{i}", "type": "compute"}).encode())
+            answered.append(response.status)
+            [chunk async for chunk in response.body]
+        second.in_flight = 1
+        try:
+            await proxy.forward(Vertex.SOUTH_741, b"{}")
+            saturated = False
+        except PoolSaturated:
+            saturated = True
+        first.in_flight = second.in_flight = 0
+        proxy.close()
+        for backend in backends:
+            backend.close()
+        return answered, second.requests, saturated
+
+    answered, requests, saturated = asyncio.run(_main())
+    assert answered == [200] * 8 and requests == 8
+    assert saturated
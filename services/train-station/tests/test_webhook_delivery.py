@@ -0,0 +1,191 @@
+"""
+Tests for webhook fan-out delivery from the outbox.
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import async_server
+from orchestrator import TrainStationOrchestrator, TrainStationAPI, worker_path
+from prefork import partner_slot
+from webhook_delivery import WebhookDelivery
+
+
+class Receiver:
+    """A stand-in webhook receiver answering from a list of statuses."""
+
+    accepts_headers = True
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def __call__(self, method, path, body, headers):
+        self.posts.append((path, headers, json.loads(body)))
+        status = self.statuses.pop(0) if self.statuses else 200
+        return status, {}, {"Retry-After": "0.01"} if status == 503 else {}
+
+    def delivered(self, path):
+        return [d["id"] for p, _, batch in self.posts if p == path for d in batch]
+
+
+async def until(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_routed_webhooks_fan_out_in_batches(tmp_path):
+    """Test a routed WEBHOOK reaches every URL, and a busy endpoint gets batches."""
+    orchestrator = TrainStationOrchestrator(log_path=tmp_path / "ts.log")
+    webhooks = orchestrator.webhooks = WebhookDelivery(
+        tmp_path / "outbox", endpoint_parallel=1, max_batch=10)
+    api = TrainStationAPI(orchestrator)
+    receiver = Receiver()
+
+    def route(body):
+        return api.handle("POST", "/route", json.dumps(body).encode())
+
+    async def main():
+        server = await async_server.serve(receiver, host="127.0.0.1", port=0)
+        base = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        webhooks.start()
+        status, result = route({"id": "w1", "type": "webhook", "payload": {
+            "urls": [f"{base}/a", f"{base}/b?team=1"], "event": {"build": 7},
+            "headers": {"X-Signature": "s3cret"}}})[:2]
+        assert status == 200 and result["vertex"] == "communication"
+        # Without a URL to deliver to, a webhook fails validation
+        assert not route({"id": "w2", "type": "webhook", "payload": {"event": 1}})[1]["success"]
+        assert not route({"type": "webhook", "payload": {
+            "url": f"{base}/a", "event": 1, "headers": {"Host": "x"}}})[1]["success"]
+        await until(lambda: webhooks.delivered == 2)
+        # While the first batch is in flight, the rest queue up behind it
+        for i in range(25):
+            route({"id": f"n{i}", "type": "webhook",
+                   "payload": {"url": f"{base}/c", "event": i}})
+        await until(lambda: webhooks.delivered == 27)
+        server.close()
+        return webhooks.stats()
+
+    stats = asyncio.run(main())
+    assert receiver.delivered("/a") == ["w1:0"] and receiver.delivered("/b?team=1") == ["w1:1"]
+    headers, batch = next((h, b) for p, h, b in receiver.posts if p == "/a")
+    assert headers["x-signature"] == "s3cret" and headers["x-webhook-batch"] == "1"
+    assert batch[0] == {"id": "w1:0", "request_id": "w1", "event": {"build": 7}}
+    # In order, in fewer requests than deliveries, none over max_batch
+    batches = [len(batch) for p, _, batch in receiver.posts if p == "/c"]
+    assert receiver.delivered("/c") == [f"n{i}:0" for i in range(25)]
+    assert len(batches) < 25 and max(batches) == 10
+    assert stats["pending"] == 0 and stats["dead"] == 0 and stats["in_flight"] == 0
+    assert "train_station_webhook_pending 0" in orchestrator.metrics()
+    orchestrator.close()
+
+
+def test_failed_deliveries_retry_and_outlive_restart(tmp_path):
+    """Test 5xx answers are retried, other 4xx dropped, and the outbox resent on restart."""
+    outbox = tmp_path / "outbox"
+    flaky = Receiver([503, 500])
+    refusing = Receiver([400])
+
+    async def first_run():
+        flaky_server = await async_server.serve(flaky, host="127.0.0.1", port=0)
+        refusing_server = await async_server.serve(refusing, host="127.0.0.1", port=0)
+        webhooks = WebhookDelivery(outbox, backoff_base=0.01)
+        webhooks.start()
+        webhooks.submit("r1", {"url": f"http://127.0.0.1:{flaky_server.sockets[0].getsockname()[1]}/",
+                               "event": "retried"})
+        webhooks.submit("r2", {"url": f"http://127.0.0.1:{refusing_server.sockets[0].getsockname()[1]}/",
+                               "event": "refused"})
+        await until(lambda: webhooks.delivered == 1 and webhooks.dead == 1)
+        # Nothing listens here: this delivery stays in the outbox
+        webhooks.submit("r3", {"url": "http://127.0.0.1:1/", "event": "unsent"})
+        await asyncio.sleep(0.05)
+        stats = webhooks.stats()
+        webhooks.close()
+        flaky_server.close()
+        refusing_server.close()
+        return stats
+
+    stats = asyncio.run(first_run())
+    assert [batch for _, _, batch in flaky.posts] == [[{"id": "r1:0", "request_id": "r1",
+                                                        "event": "retried"}]] * 3
+    assert len(refusing.posts) == 1
+    assert stats["retried"] >= 3 and stats["pending"] == 1
+
+    webhooks = WebhookDelivery(outbox)
+    assert list(webhooks.pending) == ["r3:0"]
+    assert webhooks.pending["r3:0"].event == "unsent"
+    webhooks.close()
+
+
+def test_replacement_worker_adopts_outbox_after_old_one_exits(tmp_path):
+    """Test a prefork replacement sends what its partner slot's outbox holds, once free."""
+    outbox = tmp_path / "webhooks.outbox"
+    receiver = Receiver()
+
+    async def main():
+        server = await async_server.serve(receiver, host="127.0.0.1", port=0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/hook"
+        # The old worker in slot 0 never got to send this one
+        old = WebhookDelivery(worker_path(outbox, 0))
+        old.submit("left", {"url": url, "event": "over"})
+        replacement = WebhookDelivery(worker_path(outbox, partner_slot(0, 1)),
+                                      adopt=worker_path(outbox, 0), adopt_interval=0.02)
+        replacement.start()
+        # Not while the old worker still drains
+        await asyncio.sleep(0.1)
+        assert replacement.stats()["adopted"] == 0 and not receiver.posts
+        old.close()
+        await until(lambda: replacement.delivered == 1)
+        stats = replacement.stats()
+        replacement.close()
+        server.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["adopted"] == 1 and stats["pending"] == 0
+    assert receiver.delivered("/hook") == ["left:0"]
+    # Neither outbox has anything left to resend
+    for slot in (0, 1):
+        webhooks = WebhookDelivery(worker_path(outbox, slot))
+        assert not webhooks.pending
+        webhooks.close()
+
+
+def test_no_content_answers_deliver_on_a_kept_alive_connection(tmp_path):
+    """Test 204 answers without a length deliver their batch and free the connection."""
+    posts = []
+
+    async def receiver(reader, writer):
+        while not reader.at_eof():
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+            posts.append(json.loads(await reader.readexactly(length)))
+            writer.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(receiver, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/hook"
+        webhooks = WebhookDelivery(tmp_path / "outbox", endpoint_parallel=1, pool_size=1)
+        webhooks.start()
+        for i in range(5):
+            webhooks.submit(f"e{i}", {"url": url, "event": i})
+            await asyncio.sleep(0.01)
+        await until(lambda: webhooks.delivered == 5)
+        stats = webhooks.stats()
+        webhooks.close()
+        server.close()
+        return stats
+
+    stats = asyncio.run(main())
+    assert [d["id"] for batch in posts for d in batch] == [f"e{i}:0" for i in range(5)]
+    assert stats["in_flight"] == 0 and stats["pools"][0]["connects"] == 1
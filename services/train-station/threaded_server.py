@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Threaded HTTP Server
+=======================================
+🚂 http.server transport for the Train Station API (852 Hz)
+
+The blocking transport: a socketserver.TCPServer answering one request at
+a time with TrainStationHTTPHandler. Like async_server it knows nothing
+about routing and serves an ``api`` object with the same interface:
+``handle(method, path, body, headers)``, ``open_stream(method, path)`` and
+``open_body(method, path, headers, length)``.
+
+It lives apart from the orchestrator so that http.server, and the email
+and http.client modules it pulls in, are only imported when the threaded
+server is actually used; the asyncio server starts without them.
+"""
+
+import http.server
+import json
+import logging
+import socket
+import socketserver
+from typing import Any, Dict, Optional
+
+from body_reader import (MAX_BODY_BYTES, MAX_STREAM_BODY_BYTES, BodyRejected,
+                         body_length, iter_body)
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrainStationHTTPHandler(http.server.SimpleHTTPRequestHandler):
+    """HTTP handler for Train Station API."""
+
+    # A TrainStationAPI (set before serving)
+    api: Any = None
+
+    def do_GET(self):
+        """Handle GET requests."""
+        self._dispatch('GET', b'')
+
+    def do_POST(self):
+        """Handle POST requests."""
+        api = self.api
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        try:
+            length = body_length(headers)
+            stream = api.open_stream('POST', self.path)
+            if stream:
+                self._stream_response(stream, length)
+                return
+
+            sink = api.open_body('POST', self.path, headers, length)
+            if sink is None:
+                body = b''.join(iter_body(self.rfile, length, MAX_BODY_BYTES))
+                self._dispatch('POST', body)
+                return
+            try:
+                for piece in iter_body(self.rfile, length, sink.limit):
+                    sink.feed(piece)
+                self._send_response(*sink.finish())
+            finally:
+                sink.close()
+        except BodyRejected as e:
+            # The rest of the body is not read; do not reuse the connection
+            self.close_connection = True
+            self._send_response(e.status, {"error": e.message})
+        except Exception as e:
+            logger.error(f"Error reading request body: {e}")
+            self.close_connection = True
+            self._send_response(500, {"error": str(e)})
+
+    def _dispatch(self, method: str, body: bytes):
+        """Hand the request to the shared API and send its response."""
+        status_code, data, *headers = self.api.handle(
+            method, self.path, body,
+            {name.lower(): value for name, value in self.headers.items()}
+        )
+        self._send_response(status_code, data, *headers)
+
+    def _stream_response(self, stream, length: Optional[int]):
+        """Feed the body (length bytes, or chunked) to a streaming handler."""
+        pieces = iter_body(self.rfile, length, MAX_STREAM_BODY_BYTES)
+        # Checks the framing before the response starts
+        first = next(pieces, b'')
+
+        # HTTP/1.0 response: the body ends when the connection closes
+        self.send_response(stream.status)
+        self.send_header('Content-type', stream.content_type)
+        self.end_headers()
+        try:
+            self.wfile.write(stream.feed(first))
+            for chunk in pieces:
+                self.wfile.write(stream.feed(chunk))
+        except BodyRejected as e:
+            logger.error(f"Error reading batch body: {e.message}")
+            return
+        self.wfile.write(stream.finish())
+
+    def _send_response(self, status_code: int, data: Any,
+                       headers: Optional[Dict[str, str]] = None):
+        """Send JSON response (or plain text, for str data)."""
+        headers = dict(headers or {})
+        if isinstance(data, str):
+            content_type = headers.pop('Content-Type', 'text/plain; charset=utf-8')
+            body = data.encode('utf-8')
+        else:
+            content_type = headers.pop('Content-Type', 'application/json')
+            body = json.dumps(data, indent=2).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-type', content_type)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Override to use our logger."""
+        logger.info(f"HTTP: {format % args}")
+
+
+def server(api: Any, sock: socket.socket) -> socketserver.TCPServer:
+    """A TCPServer answering api requests on the already-listening sock."""
+    handler = type("APIHandler", (TrainStationHTTPHandler,), {"api": api})
+    httpd = socketserver.TCPServer(sock.getsockname()[:2], handler,
+                                   bind_and_activate=False)
+    httpd.socket.close()
+    httpd.socket = sock
+    return httpd
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Tracing
+==========================
+🚂 Sampled handshake spans with W3C trace context (852 Hz)
+
+Opt-in. A Tracer decides once per request, at the head, whether the request
+is traced:
+
+- an incoming ``traceparent`` header continues the caller's trace, and its
+  sampled flag decides;
+- otherwise the request is sampled with probability ``sample_rate``.
+
+Unsampled requests get no Trace object at all, so the handshake pays one
+attribute check (and one random() call when the rate is between 0 and 1).
+
+A Trace records spans from perf_counter_ns timestamps the handshake already
+takes for its latency histograms; they are converted to Unix time with one
+offset captured when the Tracer is created, so span durations are monotonic
+and no clock is read per span. Forwarded vertex calls carry a
+``traceparent`` naming their client span, so the vertex backend can join
+the trace.
+
+Finished traces go to a LogWriter used as a batched exporter (its queue,
+group commit and drop-on-overflow policy), in one of two formats:
+- jsonl  one span per line
+- otlp   one OTLP/JSON ExportTraceServiceRequest per trace per line, the
+         layout the OpenTelemetry Collector's otlpjsonfile receiver reads
+"""
+
+import random
+import re
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from log_writer import LogWriter
+
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class TraceFormat(Enum):
+    """Exported span layout."""
+    JSONL = "jsonl"
+    OTLP = "otlp"
+
+
+def new_span_id() -> str:
+    """Random 64-bit span id, as 16 hex digits."""
+    return "%016x" % random.getrandbits(64)
+
+
+class Trace:
+    """Spans of one sampled request."""
+
+    __slots__ = ("tracer", "trace_id", "parent_id", "root_id", "started", "spans")
+
+    def __init__(self, tracer: "Tracer", trace_id: str, parent_id: Optional[str]):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        # Caller's span, from an incoming traceparent
+        self.parent_id = parent_id
+        self.root_id = new_span_id()
+        self.started = time.perf_counter_ns()
+        self.spans: List[Dict[str, Any]] = []
+
+    def span(self, name: str, start_ns: int, end_ns: int,
+             attributes: Optional[Dict[str, Any]] = None,
+             span_id: Optional[str] = None, parent_id: Optional[str] = None,
+             kind: int = SPAN_KIND_INTERNAL) -> str:
+        """Record a finished span (perf_counter_ns timestamps); returns its id."""
+        span_id = span_id or new_span_id()
+        offset = self.tracer.clock_offset
+        self.spans.append({
+            "trace_id": self.trace_id,
+            "span_id": span_id,
+            "parent_span_id": parent_id or self.root_id,
+            "name": name,
+            "kind": kind,
+            "start_time_unix_nano": start_ns + offset,
+            "end_time_unix_nano": end_ns + offset,
+            "attributes": attributes or {},
+        })
+        return span_id
+
+    def finish(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Record the root span, from the sampling decision until now, as a
+        child of the caller's span, and hand every span to the exporter.
+        """
+        self.span(name, self.started, time.perf_counter_ns(), attributes,
+                  span_id=self.root_id, parent_id=self.parent_id or "",
+                  kind=SPAN_KIND_SERVER)
+        self.tracer.export(self.spans)
+
+    def traceparent(self, span_id: str) -> str:
+        """W3C traceparent header naming span_id as the parent."""
+        return f"00-{self.trace_id}-{span_id}-01"
+
+
+class Tracer:
+    """Head-based sampler and exporter of handshake traces."""
+
+    def __init__(self, writer: LogWriter, sample_rate: float = 0.01,
+                 format: TraceFormat = TraceFormat.JSONL,
+                 service_name: str = "train-station"):
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.format = format
+        self.service_name = service_name
+        # perf_counter_ns -> Unix nanoseconds
+        self.clock_offset = time.time_ns() - time.perf_counter_ns()
+        self.sampled = 0
+        self._random = random.random
+
+    def start(self, traceparent: Optional[str] = None) -> Optional[Trace]:
+        """Sampling decision for a new request; a Trace if it is sampled."""
+        if traceparent:
+            match = TRACEPARENT.match(traceparent.strip().lower())
+            if match:
+                trace_id, parent_id, flags = match.groups()
+                if not int(flags, 16) & 1 or trace_id == "0" * 32:
+                    return None
+                self.sampled += 1
+                return Trace(self, trace_id, parent_id)
+        rate = self.sample_rate
+        if rate <= 0 or (rate < 1 and self._random() >= rate):
+            return None
+        self.sampled += 1
+        return Trace(self, "%032x" % random.getrandbits(128), None)
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        if not spans:
+            return
+        if self.format is TraceFormat.JSONL:
+            self.writer.write_many(spans)
+        else:
+            self.writer.write(self._otlp(spans))
+
+    def _otlp(self, spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "train-station"},
+                "spans": [{
+                    "traceId": span["trace_id"],
+                    "spanId": span["span_id"],
+                    "parentSpanId": span["parent_span_id"],
+                    "name": span["name"],
+                    "kind": span["kind"],
+                    "startTimeUnixNano": str(span["start_time_unix_nano"]),
+                    "endTimeUnixNano": str(span["end_time_unix_nano"]),
+                    "attributes": [_attribute(key, value)
+                                   for key, value in span["attributes"].items()],
+                } for span in spans],
+            }],
+        }]}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "format": self.format.value,
+            "sampled": self.sampled,
+            "exporter": self.writer.stats(),
+        }
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Vertex Proxy
+===============================
+🚂 Forwarding mode: deliver routed requests to vertex backends (852 Hz)
+
+Each vertex backend gets a pool of persistent HTTP/1.1 connections:
+- size            maximum open connections to the backend
+- idle_timeout    idle connections older than this are closed, not reused
+- max_in_flight   requests admitted at once (in use + waiting for a
+                  connection); beyond it forward() tries the other replica
+                  it chose (see below), then fails fast with PoolSaturated
+                  instead of queueing without bound
+- response_timeout  seconds to wait for the response head, and for each
+                  read of its body
+
+The backend's response body is streamed back to the caller as it arrives,
+with its status and end-to-end headers, and the connection returns to the
+pool once that body is fully read.
+Runs on the asyncio server's event loop.
+
+A vertex may have several backend replicas, each with its own pool; every
+request goes to the least loaded of two of them, and failing replicas are
+ejected for a while (see replica_set).
+
+A request body may be bytes or a body_reader.StreamedBody (a request with a
+spooled payload), which is written piece by piece as the backend reads it.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+from async_server import StreamingResponse
+from body_reader import StreamedBody
+from replica_set import EJECTION_TIME, MAX_FAILURES, ReplicaSet
+
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 64 * 1024
+# Backend response headers not passed on: hop-by-hop ones (RFC 9110 7.6.1)
+# and the ones the async server writes itself
+HOP_BY_HOP = frozenset({"connection", "keep-alive", "proxy-connection", "te",
+                        "trailer", "transfer-encoding", "upgrade",
+                        "content-type", "content-length"})
+
+
+class UpstreamError(Exception):
+    """The vertex backend could not be reached or answered badly."""
+
+
+class PoolSaturated(UpstreamError):
+    """The backend pool already has max_in_flight requests."""
+
+
+class _Connection:
+    __slots__ = ("reader", "writer", "last_used", "reused")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = 0.0
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class _ResponseBody:
+    """
+    Async iterator over one upstream response body. The pool connection is
+    released when the body is exhausted or the iterator is closed, even if it
+    was never iterated.
+    """
+
+    def __init__(self, pool: "VertexConnectionPool", conn: _Connection,
+                 headers: Dict[str, str], empty: bool = False):
+        self.pool = pool
+        self.conn = conn
+        self.headers = headers
+        # A response that has no body whatever its headers say (RFC 9112 6.3)
+        self.empty = empty
+        self._chunks = self._read()
+        self._released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        return await self._chunks.__anext__()
+
+    async def aclose(self) -> None:
+        await self._chunks.aclose()
+        self._release(False)
+
+    def _release(self, reusable: bool) -> None:
+        if not self._released:
+            self._released = True
+            self.pool.in_flight -= 1
+            self.pool._release(self.conn, reusable)
+
+    async def _read(self) -> AsyncIterator[bytes]:
+        headers = self.headers
+        reader = self.conn.reader
+        # Each read gets response_timeout, as the response head does
+        timeout = self.pool.response_timeout
+        reusable = False
+        try:
+            if self.empty:
+                reusable = True
+            elif "content-length" in headers:
+                remaining = int(headers["content-length"])
+                while remaining > 0:
+                    chunk = await asyncio.wait_for(
+                        reader.read(min(remaining, READ_CHUNK)), timeout)
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    remaining -= len(chunk)
+                    yield chunk
+                reusable = True
+            elif headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+                    size = int(line.split(b";")[0], 16)
+                    if size == 0:
+                        # no trailers expected
+                        await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+                        break
+                    data = await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+                    yield data[:-2]
+                reusable = True
+            else:
+                # Body delimited by connection close
+                while True:
+                    chunk = await asyncio.wait_for(reader.read(READ_CHUNK), timeout)
+                    if not chunk:
+                        break
+                    yield chunk
+            if headers.get("connection", "").lower() == "close":
+                reusable = False
+        except (OSError, ValueError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError) as e:
+            self.pool.errors += 1
+            logger.error(f"Error reading response from {self.pool.url}: {e!r}")
+        finally:
+            self._release(reusable)
+
+
+class VertexConnectionPool:
+    """
+    Persistent keep-alive connections to one vertex backend (or any HTTP
+    origin: a request may name another path on the same host).
+    """
+
+    def __init__(self, url: str, size: int = 8, idle_timeout: float = 30.0,
+                 max_in_flight: int = 256, connect_timeout: float = 5.0,
+                 response_timeout: float = 30.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Vertex backend must be an http:// or https:// URL: {url}")
+        self.url = url
+        self.host = parsed.hostname
+        self.tls = parsed.scheme == "https"
+        self.port = parsed.port or (443 if self.tls else 80)
+        self.path = parsed.path or "/"
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.connect_timeout = connect_timeout
+        self.response_timeout = response_timeout
+
+        self._idle: deque = deque()
+        self._waiters: deque = deque()
+        self._open = 0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.connects = 0
+
+    # -- connection management -------------------------------------------
+
+    async def _acquire(self) -> _Connection:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._idle:
+            conn = self._idle.pop()  # most recently used first
+            if now - conn.last_used > self.idle_timeout or conn.reader.at_eof():
+                conn.close()
+                self._open -= 1
+                continue
+            conn.reused = True
+            return conn
+
+        if self._open < self.size:
+            self._open += 1
+            return await self._connect_in_slot()
+
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            conn = await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result(), reusable=True)
+            raise
+        if conn is None:
+            # A slot was freed by a broken connection; open a fresh one
+            return await self._connect_in_slot()
+        conn.reused = True
+        return conn
+
+    async def _connect_in_slot(self) -> _Connection:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.tls or None),
+                self.connect_timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            self._release(None, reusable=False)
+            raise UpstreamError(f"Cannot connect to {self.url}: {e}") from e
+        except asyncio.CancelledError:
+            self._release(None, reusable=False)
+            raise
+        self.connects += 1
+        return _Connection(reader, writer)
+
+    def _release(self, conn: Optional[_Connection], reusable: bool) -> None:
+        """Return a connection (or its slot) to the pool."""
+        if conn is not None and not reusable:
+            conn.close()
+            conn = None
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(conn)
+                return
+        if conn is None:
+            self._open -= 1
+        else:
+            conn.last_used = asyncio.get_running_loop().time()
+            self._idle.append(conn)
+
+    # -- requests ----------------------------------------------------------
+
+    async def request(self, method: str, body: Union[bytes, StreamedBody],
+                      headers: Optional[Dict[str, str]] = None,
+                      path: Optional[str] = None
+                      ) -> Tuple[int, Dict[str, str], AsyncIterator[bytes]]:
+        """
+        Send one request, to path or the pool URL's path; return (status,
+        headers, body iterator). The connection is released when the body
+        iterator finishes.
+        """
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise PoolSaturated(f"{self.url} has {self.in_flight} requests in flight")
+
+        self.in_flight += 1
+        self.requests += 1
+        conn = None
+        try:
+            conn = await self._acquire()
+            try:
+                status, resp_headers = await self._exchange(conn, method, body, headers, path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not conn.reused:
+                    raise
+                # The backend closed an idle keep-alive connection before
+                # reading our request; retry once on a fresh connection
+                self._release(conn, reusable=False)
+                conn = None
+                conn = await self._acquire()
+                status, resp_headers = await self._exchange(conn, method, body, headers, path)
+        except UpstreamError:
+            self.errors += 1
+            self.in_flight -= 1
+            raise
+        except (OSError, ValueError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError) as e:
+            self.errors += 1
+            self.in_flight -= 1
+            if conn is not None:
+                self._release(conn, reusable=False)
+            raise UpstreamError(f"Bad response from {self.url}: {e!r}") from e
+        except asyncio.CancelledError:
+            self.in_flight -= 1
+            if conn is not None:
+                self._release(conn, reusable=False)
+            raise
+
+        empty = method == "HEAD" or status < 200 or status in (204, 304)
+        return status, resp_headers, _ResponseBody(self, conn, resp_headers, empty)
+
+    async def _exchange(self, conn: _Connection, method: str,
+                        body: Union[bytes, StreamedBody],
+                        headers: Optional[Dict[str, str]],
+                        path: Optional[str] = None
+                        ) -> Tuple[int, Dict[str, str]]:
+        head = (
+            f"{method} {path or self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+        )
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        if isinstance(body, bytes):
+            conn.writer.write(head.encode("latin-1") + b"\r\n" + body)
+        else:
+            conn.writer.write(head.encode("latin-1") + b"\r\n")
+            for chunk in body.chunks():
+                conn.writer.write(chunk)
+                await conn.writer.drain()
+
+        raw = await asyncio.wait_for(
+            conn.reader.readuntil(b"\r\n\r\n"), self.response_timeout
+        )
+        lines = raw.decode("latin-1").split("\r\n")
+        _version, status, _reason = (lines[0].split(" ", 2) + [""])[:3]
+        resp_headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                resp_headers[name.strip().lower()] = value.strip()
+        return int(status), resp_headers
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool counters for the status endpoint."""
+        return {
+            "backend": self.url,
+            "open": self._open,
+            "idle": len(self._idle),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "connects": self.connects,
+        }
+
+    def close(self) -> None:
+        """Close idle connections."""
+        while self._idle:
+            self._idle.pop().close()
+            self._open -= 1
+
+
+def response_headers(backend_headers: Dict[str, str],
+                     request_headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    The backend response's end-to-end headers, to pass on to the client,
+    plus the X-Request-Id the request was forwarded with. Hop-by-hop
+    headers (and any the backend's Connection header names) are dropped,
+    as are the ones the server writes itself.
+    """
+    dropped = HOP_BY_HOP | {
+        name.strip().lower() for name in backend_headers.get("connection", "").split(",")
+    }
+    headers = {name: value for name, value in backend_headers.items()
+               if name not in dropped}
+    request_id = (request_headers or {}).get("X-Request-Id")
+    if request_id is not None and "x-request-id" not in headers:
+        headers["X-Request-Id"] = request_id
+    return headers
+
+
+class VertexProxy:
+    """Per-vertex replica sets of connection pools, and response streaming."""
+
+    def __init__(self, backends: Dict[Any, Union[str, Sequence[str]]],
+                 max_failures: int = MAX_FAILURES,
+                 ejection_time: float = EJECTION_TIME, **pool_options):
+        # A vertex maps to one backend URL or a list of replica URLs
+        self.replicas = {
+            vertex: ReplicaSet(
+                [VertexConnectionPool(url, **pool_options)
+                 for url in ([urls] if isinstance(urls, str) else urls)],
+                max_failures=max_failures, ejection_time=ejection_time,
+            )
+            for vertex, urls in backends.items()
+        }
+
+    def has(self, vertex: Any) -> bool:
+        return vertex in self.replicas
+
+    def expected_latency(self, vertex: Any) -> float:
+        """Seconds a forward to the vertex is expected to take."""
+        return self.replicas[vertex].expected_latency()
+
+    async def forward(self, vertex: Any, body: Union[bytes, StreamedBody],
+                      headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+        """Send body to a replica of the vertex backend and stream its response back."""
+        replicas = self.replicas[vertex]
+        replica, fallback = replicas.choose_two()
+        start = time.monotonic()
+        try:
+            try:
+                status, resp_headers, chunks = await replica.pool.request("POST", body, headers)
+            except PoolSaturated:
+                # Nothing was sent; the other replica of the two may have room
+                if fallback is None:
+                    raise
+                replica = fallback
+                status, resp_headers, chunks = await replica.pool.request("POST", body, headers)
+        except PoolSaturated:
+            raise
+        except UpstreamError:
+            replicas.observe(replica, time.monotonic() - start, ok=False)
+            raise
+        replicas.observe(replica, time.monotonic() - start, ok=status < 500)
+        length = resp_headers.get("content-length")
+        return StreamingResponse(
+            status,
+            chunks,
+            content_type=resp_headers.get("content-type", "application/json"),
+            headers=response_headers(resp_headers, headers),
+            content_length=int(length) if length is not None else None,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            getattr(vertex, "vertex_name", str(vertex)): replicas.stats()
+            for vertex, replicas in self.replicas.items()
+        }
+
+    def prometheus(self) -> str:
+        """Pool counters in Prometheus text format."""
+        lines = []
+        for metric, kind, field, help_text in (
+            ("train_station_forward_requests_total", "counter", "requests",
+             "Requests forwarded to the vertex backend."),
+            ("train_station_forward_errors_total", "counter", "errors",
+             "Forwarding failures."),
+            ("train_station_forward_rejected_total", "counter", "rejected",
+             "Requests rejected because the pool was saturated."),
+            ("train_station_forward_in_flight", "gauge", "in_flight",
+             "Requests currently forwarded."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for vertex, stats in self.stats().items():
+                lines.append(f'{metric}{{vertex="{vertex}"}} {stats[field]}')
+        metric = "train_station_forward_ejections_total"
+        lines.append(f"# HELP {metric} Times a backend replica was ejected after failures.")
+        lines.append(f"# TYPE {metric} counter")
+        for vertex, stats in self.stats().items():
+            for replica in stats["replicas"]:
+                lines.append(f'{metric}{{vertex="{vertex}",backend="{replica["backend"]}"}} '
+                             f'{replica["ejections"]}')
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        for replicas in self.replicas.values():
+            for replica in replicas.replicas:
+                replica.pool.close()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+SOMA Train Station Webhook Delivery
+===================================
+🚂 Fan-out delivery of WEBHOOK requests for the communication vertex (639 Hz)
+
+A WEBHOOK request routed to NORTH_639 says in its payload what to deliver
+and where:
+
+    {"url": "http://...",   or   "urls": ["http://...", ...],
+     "event": <any JSON>,
+     "headers": {"X-Signature": "..."}}            (optional)
+
+Each destination URL gets a delivery of its own (fan-out), with the id
+``<request id>:<n>``. Deliveries are POSTed in batches: a JSON array of
+``{"id", "request_id", "event"}`` objects, with ``X-Webhook-Batch`` set to
+how many. An endpoint (a URL with its headers) has at most
+endpoint_parallel batches in flight; deliveries arriving meanwhile wait
+and go out together in its next batch, up to max_batch, so a busy
+endpoint gets fewer, larger requests and an idle one gets each event at
+once. At most max_parallel batches are in flight across all endpoints.
+Connections are kept alive in a pool per origin (scheme, host and port;
+vertex_proxy.VertexConnectionPool).
+
+A 2xx answer delivers the batch. A 408, 429 or 5xx answer, or no answer
+at all, is retried: the endpoint backs off for a random time up to
+backoff_base * 2^(failures - 1) seconds (full jitter), capped at
+backoff_max, or for as long as a Retry-After header asks, and its
+deliveries keep their order. Other 4xx answers, and deliveries that have
+failed max_attempts times, are dead: logged and dropped.
+
+Every delivery goes into the outbox (a json_journal) when its request is
+routed, and is marked done there once delivered or dead. The outbox is
+fsynced once per event loop turn, before that turn's deliveries are sent;
+on startup the deliveries not marked done are sent again. A delivery may
+so arrive twice (after a crash between sending it and marking it done),
+but is not lost; receivers drop repeats by id.
+
+A prefork worker's outbox belongs to its slot, and its replacement starts
+in the partner slot. So each worker also adopts the partner slot's
+outbox: as soon as no process holds that outbox's lock (its worker has
+exited, or there is none), the pending deliveries in it move into the
+worker's own outbox, fsynced before the adopted one is emptied, and are
+sent from there.
+
+Runs on the asyncio loop, which also routes the requests, so submit()
+needs no locks.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from json_journal import JsonJournal
+from vertex_proxy import UpstreamError, VertexConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+MAX_FANOUT = 64
+# Set by the delivery engine; a webhook's own headers may not override them
+RESERVED_HEADERS = frozenset({"host", "content-type", "content-length",
+                              "transfer-encoding", "connection", "x-webhook-batch"})
+RETRY_STATUSES = frozenset({408, 429})
+
+
+class _Delivery:
+    __slots__ = ("id", "request_id", "url", "headers", "event", "created", "attempts")
+
+    def __init__(self, delivery_id: str, request_id: str, url: str,
+                 headers: Dict[str, str], event: Any, created: float):
+        self.id = delivery_id
+        self.request_id = request_id
+        self.url = url
+        self.headers = headers
+        self.event = event
+        self.created = created
+        self.attempts = 0
+
+    def record(self) -> Dict[str, Any]:
+        """The outbox record of this delivery."""
+        return {"op": "add", "id": self.id, "request_id": self.request_id,
+                "url": self.url, "headers": self.headers, "event": self.event,
+                "created": self.created}
+
+
+class _Endpoint:
+    """Deliveries waiting for one URL (with one set of headers)."""
+
+    def __init__(self, key: Tuple, url: str, headers: Dict[str, str],
+                 pool: VertexConnectionPool):
+        parsed = urlparse(url)
+        self.key = key
+        self.url = url
+        self.path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        self.headers = headers
+        self.pool = pool
+        self.queue: Deque[_Delivery] = deque()
+        self.in_flight = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        # Queued in WebhookDelivery._ready for a free batch slot
+        self.ready = False
+
+
+def _replay(journal: JsonJournal) -> Dict[str, _Delivery]:
+    """The deliveries an outbox holds that are not marked done."""
+    pending: Dict[str, _Delivery] = {}
+    for record in journal.replay():
+        try:
+            if record["op"] == "add":
+                delivery = _Delivery(record["id"], record["request_id"], record["url"],
+                                     record["headers"], record["event"], record["created"])
+                pending[delivery.id] = delivery
+            elif record["op"] == "done":
+                pending.pop(record["id"], None)
+        except (KeyError, TypeError) as e:
+            logger.error(f"Skipping unreadable outbox record in {journal.path}: {e!r}")
+    return pending
+
+
+def parse_webhook(request_id: str, payload: Any, created: float) -> List[_Delivery]:
+    """The deliveries of a WEBHOOK request's payload; ValueError if it has none."""
+    if not isinstance(payload, dict) or "event" not in payload:
+        raise ValueError("payload needs 'event' and 'url' or 'urls'")
+    urls = payload["urls"] if "urls" in payload else [payload.get("url")]
+    if not isinstance(urls, list) or not 1 <= len(urls) <= MAX_FANOUT:
+        raise ValueError(f"'urls' must list 1-{MAX_FANOUT} URLs")
+    for url in urls:
+        parsed = urlparse(url) if isinstance(url, str) else None
+        if parsed is None or parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"not an http:// or https:// URL: {url!r}")
+    headers = payload.get("headers") or {}
+    if not isinstance(headers, dict):
+        raise ValueError("'headers' must be an object")
+    for name, value in headers.items():
+        if (not isinstance(value, str) or name.lower() in RESERVED_HEADERS
+                or any(c in name + value for c in "\r\n") or ":" in name):
+            raise ValueError(f"header not allowed: {name!r}")
+    return [_Delivery(f"{request_id}:{n}", request_id, url, headers, payload["event"], created)
+            for n, url in enumerate(urls)]
+
+
+class WebhookDelivery:
+    """
+    Batched, retried webhook delivery from a durable outbox (see the module
+    docstring). The outbox is replayed in the constructor; sending starts
+    once start() has been called on the event loop.
+    """
+
+    def __init__(self, outbox: Path, max_parallel: int = 64, endpoint_parallel: int = 2,
+                 max_batch: int = 100, max_attempts: int = 12,
+                 backoff_base: float = 0.5, backoff_max: float = 300.0,
+                 pool_size: int = 4, timeout: float = 10.0,
+                 adopt: Optional[Path] = None, adopt_interval: float = 1.0):
+        self.max_parallel = max_parallel
+        self.endpoint_parallel = endpoint_parallel
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Another worker's outbox to take over once it is unlocked
+        self.adopt = Path(adopt) if adopt is not None else None
+        self.adopt_interval = adopt_interval
+
+        self.pending: Dict[str, _Delivery] = {}
+        self._endpoints: Dict[Tuple, _Endpoint] = {}
+        self._pools: Dict[str, VertexConnectionPool] = {}
+        # Endpoints with deliveries waiting for max_parallel to allow a batch
+        self._ready: Deque[_Endpoint] = deque()
+        # Endpoints given deliveries since the outbox was last synced, in
+        # the order they were given them (a dict as an ordered set)
+        self._unsynced: Dict[_Endpoint, None] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._running = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_scheduled = False
+
+        self.accepted = 0
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.batches = 0
+        self.adopted = 0
+        self.latency_ms_max = 0.0
+        self._latency_ms_total = 0.0
+
+        self.outbox = JsonJournal(outbox, fsync=False)
+        # Waits only while a worker adopting this outbox moves it
+        self.outbox.lock()
+        self.pending.update(_replay(self.outbox))
+        if self.outbox.needs_compaction(len(self.pending)):
+            self.compact()
+        for delivery in self.pending.values():
+            self._endpoint(delivery).queue.append(delivery)
+        if self.pending:
+            logger.info(f"Webhook outbox {outbox}: {len(self.pending)} deliveries to resend")
+
+    # -- queueing ----------------------------------------------------------
+
+    def _endpoint(self, delivery: _Delivery) -> _Endpoint:
+        key = (delivery.url, tuple(sorted(delivery.headers.items())))
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            parsed = urlparse(delivery.url)
+            origin = f"{parsed.scheme}://{parsed.netloc}"
+            pool = self._pools.get(origin)
+            if pool is None:
+                pool = self._pools[origin] = VertexConnectionPool(
+                    origin, size=self.pool_size, max_in_flight=self.max_parallel,
+                    connect_timeout=self.timeout, response_timeout=self.timeout,
+                )
+            endpoint = self._endpoints[key] = _Endpoint(key, delivery.url,
+                                                        delivery.headers, pool)
+        return endpoint
+
+    def submit(self, request_id: str, payload: Any) -> int:
+        """
+        Queue a routed WEBHOOK request's deliveries; returns how many.
+        Raises ValueError for a payload without any (see parse_webhook).
+        """
+        deliveries = parse_webhook(request_id, payload, time.time())
+        for delivery in deliveries:
+            if self._queue(delivery):
+                self.accepted += 1
+        if self._loop is not None and not self._sync_scheduled:
+            self._sync_scheduled = True
+            self._loop.call_soon(self._sync)
+        return len(deliveries)
+
+    def _queue(self, delivery: _Delivery) -> bool:
+        """Journal and queue a new delivery; False if it is already pending."""
+        if delivery.id in self.pending:
+            return False
+        self.outbox.append(delivery.record())
+        self.pending[delivery.id] = delivery
+        endpoint = self._endpoint(delivery)
+        endpoint.queue.append(delivery)
+        self._unsynced[endpoint] = None
+        return True
+
+    def _adopt(self) -> None:
+        """Move the adopted outbox's deliveries into ours, once it is unlocked."""
+        if self._loop is None or not self.adopt.exists():
+            return
+        journal = JsonJournal(self.adopt, fsync=False)
+        try:
+            if not journal.lock(wait=False):
+                # Its worker is still draining; try again later
+                self._loop.call_later(self.adopt_interval, self._adopt)
+                return
+            adopted = sum(self._queue(delivery) for delivery in _replay(journal).values())
+            # Ours must be on disk before theirs is emptied
+            self.outbox.sync()
+            journal.rewrite([])
+        finally:
+            journal.close()
+        if adopted:
+            self.adopted += adopted
+            logger.info(f"Adopted {adopted} webhook deliveries from {self.adopt}")
+        self._sync()
+
+    def _sync(self) -> None:
+        """fsync this loop turn's deliveries, then send them."""
+        self._sync_scheduled = False
+        self.outbox.sync()
+        endpoints, self._unsynced = self._unsynced, {}
+        for endpoint in endpoints:
+            self._kick(endpoint)
+
+    def _kick(self, endpoint: _Endpoint) -> None:
+        """Start as many batches for endpoint as the limits allow."""
+        while endpoint.queue and endpoint.in_flight < self.endpoint_parallel:
+            if endpoint.retry_at > self._loop.time():
+                return  # backing off; a timer kicks it again
+            if self._running >= self.max_parallel:
+                if not endpoint.ready:
+                    endpoint.ready = True
+                    self._ready.append(endpoint)
+                return
+            queue = endpoint.queue
+            batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch))]
+            endpoint.in_flight += 1
+            self._running += 1
+            task = self._loop.create_task(self._send(endpoint, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    # -- sending -----------------------------------------------------------
+
+    async def _post(self, endpoint: _Endpoint, batch: List[_Delivery]
+                    ) -> Tuple[Optional[int], Optional[float], str]:
+        """POST one batch: (status or None, Retry-After seconds, error text)."""
+        body = json.dumps([{"id": d.id, "request_id": d.request_id, "event": d.event}
+                           for d in batch]).encode("utf-8")
+        headers = dict(endpoint.headers)
+        headers["X-Webhook-Batch"] = str(len(batch))
+        try:
+            status, response_headers, response = await endpoint.pool.request(
+                "POST", body, headers, path=endpoint.path)
+            # The answer's body is not used, but must be read (in time) for
+            # the connection to go back to the pool
+            await asyncio.wait_for(self._discard(response), self.timeout)
+        except UpstreamError as e:
+            return None, None, str(e)
+        except asyncio.TimeoutError:
+            return None, None, "timed out reading the response"
+        retry_after = None
+        if status in (429, 503):
+            try:
+                retry_after = float(response_headers.get("retry-after", ""))
+            except ValueError:
+                pass
+        return status, retry_after, f"HTTP {status}"
+
+    @staticmethod
+    async def _discard(response) -> None:
+        async for _ in response:
+            pass
+
+    async def _send(self, endpoint: _Endpoint, batch: List[_Delivery]) -> None:
+        # Cancelled at shutdown: the batch is still in the outbox and is
+        # sent again on restart
+        status, retry_after, error = await self._post(endpoint, batch)
+        self.batches += 1
+        endpoint.in_flight -= 1
+        self._running -= 1
+        if status is not None and 200 <= status < 300:
+            endpoint.failures = 0
+            now = time.time()
+            for delivery in batch:
+                self._done(delivery)
+                latency = (now - delivery.created) * 1000
+                self._latency_ms_total += latency
+                self.latency_ms_max = max(self.latency_ms_max, latency)
+            self.delivered += len(batch)
+        elif status is None or status in RETRY_STATUSES or status >= 500:
+            endpoint.failures += 1
+            self.retried += 1
+            retry = []
+            for delivery in batch:
+                delivery.attempts += 1
+                if delivery.attempts >= self.max_attempts:
+                    self._dead(delivery, f"{error} after {delivery.attempts} attempts")
+                else:
+                    retry.append(delivery)
+            endpoint.queue.extendleft(reversed(retry))
+            if retry_after is None:
+                retry_after = random.uniform(0, min(
+                    self.backoff_max, self.backoff_base * 2 ** (endpoint.failures - 1)))
+            endpoint.retry_at = self._loop.time() + retry_after
+            self._loop.call_later(retry_after, self._kick, endpoint)
+            logger.warning(f"Webhook delivery to {endpoint.url} failed ({error}); "
+                           f"retrying {len(retry)} in {retry_after:.2f}s")
+        else:
+            for delivery in batch:
+                self._dead(delivery, error)
+
+        if self.outbox.needs_compaction(len(self.pending)):
+            self.compact()
+        self._kick(endpoint)
+        if (not endpoint.queue and not endpoint.in_flight and not endpoint.failures
+                and self._endpoints.get(endpoint.key) is endpoint):
+            del self._endpoints[endpoint.key]
+        while self._ready and self._running < self.max_parallel:
+            waiting = self._ready.popleft()
+            waiting.ready = False
+            self._kick(waiting)
+
+    def _done(self, delivery: _Delivery, dead: bool = False) -> None:
+        del self.pending[delivery.id]
+        record = {"op": "done", "id": delivery.id}
+        if dead:
+            record["dead"] = True
+        self.outbox.append(record)
+
+    def _dead(self, delivery: _Delivery, reason: str) -> None:
+        logger.error(f"Webhook delivery {delivery.id} to {delivery.url} dropped: {reason}")
+        self._done(delivery, dead=True)
+        self.dead += 1
+
+    def compact(self) -> None:
+        """Rewrite the outbox with the pending deliveries only."""
+        self.outbox.rewrite(delivery.record() for delivery in self.pending.values())
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Start sending, on the running loop; resends what the outbox holds,
+        and what the adopted one does once it is free.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._unsynced.update(dict.fromkeys(self._endpoints.values()))
+        self._sync()
+        if self.adopt is not None:
+            self._adopt()
+
+    def close(self) -> None:
+        """Sync and close the outbox; batches in flight are sent again on restart."""
+        self._loop = None
+        self.outbox.close()
+
+    # -- reporting -----------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the status endpoint."""
+        now = self._loop.time() if self._loop else 0.0
+        return {
+            "pending": len(self.pending),
+            "in_flight": self._running,
+            "endpoints": len(self._endpoints),
+            "backing_off": sum(1 for e in self._endpoints.values() if e.retry_at > now),
+            "accepted": self.accepted,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+            "batches": self.batches,
+            "adopted": self.adopted,
+            "latency_ms": {
+                "mean": round(self._latency_ms_total / self.delivered, 3)
+                        if self.delivered else 0.0,
+                "max": round(self.latency_ms_max, 3),
+            },
+            "pools": [pool.stats() for pool in self._pools.values()],
+        }
+
+    def prometheus(self) -> str:
+        """Outbox depth and delivery counters in Prometheus text format."""
+        return "\n".join([
+            "# HELP train_station_webhook_pending Webhook deliveries in the outbox.",
+            "# TYPE train_station_webhook_pending gauge",
+            f"train_station_webhook_pending {len(self.pending)}",
+            "# HELP train_station_webhook_deliveries_total Webhook deliveries by outcome.",
+            "# TYPE train_station_webhook_deliveries_total counter",
+            f'train_station_webhook_deliveries_total{{result="delivered"}} {self.delivered}',
+            f'train_station_webhook_deliveries_total{{result="dead"}} {self.dead}',
+            "# HELP train_station_webhook_batches_total Webhook batches sent, and retried.",
+            "# TYPE train_station_webhook_batches_total counter",
+            f'train_station_webhook_batches_total{{result="sent"}} {self.batches}',
+            f'train_station_webhook_batches_total{{result="retried"}} {self.retried}',
+        ]) + "\n"